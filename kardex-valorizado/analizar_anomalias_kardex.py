@@ -0,0 +1,52 @@
+"""
+Lista los episodios de stock negativo y las salidas con costo atípico de todo el
+historial de movimientos, con el documento que los origina.
+
+Uso: python analizar_anomalias_kardex.py [empresa_id] [umbral_costo]
+     umbral_costo: desviación relativa respecto del costo promedio (0.5 = 50%)
+"""
+import sys
+import os
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from utils.config import Config
+from utils.anomalias_kardex import AnalizadorAnomaliasKardex
+
+try:
+    db_url = Config.get_db_url()
+except:
+    db_url = 'sqlite:///kardex.db'
+
+empresa_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+umbral_costo = float(sys.argv[2]) if len(sys.argv) > 2 else None
+
+engine = create_engine(db_url)
+session = sessionmaker(bind=engine)()
+
+try:
+    inicio = time.perf_counter()
+    reporte = AnalizadorAnomaliasKardex(session).escanear(empresa_id, umbral_costo)
+    duracion = time.perf_counter() - inicio
+except Exception as e:
+    print(f"Error al analizar el kardex: {e}")
+    sys.exit(1)
+finally:
+    session.close()
+
+episodios = reporte['episodios_negativos']
+print(f"=== Episodios de stock negativo: {len(episodios)} ===")
+for ep in episodios:
+    fin = f"{ep['hasta']} ({ep['documento_fin']})" if ep['hasta'] else "sigue en negativo"
+    print(f"Producto {ep['producto_id']} / almacén {ep['almacen_id']}: desde {ep['desde']} "
+          f"({ep['documento_inicio']}) hasta {fin}; mínimo {ep['saldo_minimo']:,.2f} "
+          f"en {ep['movimientos']} movimientos")
+
+atipicos = reporte['costos_atipicos']
+print(f"\n=== Salidas con costo atípico: {len(atipicos)} ===")
+for mov in atipicos:
+    print(f"Producto {mov['producto_id']} / almacén {mov['almacen_id']}: {mov['fecha']} {mov['documento']} "
+          f"costo {mov['costo_unitario']:,.4f}, promedio {mov['costo_promedio']:,.4f} ({mov['desviacion']:+.0%})")
+
+print(f"\nAnálisis completado en {duracion:.2f} s")
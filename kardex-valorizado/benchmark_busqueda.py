@@ -0,0 +1,97 @@
+"""
+Benchmark: búsqueda de la ventana de productos, LIKE '%texto%' contra el índice de búsqueda.
+
+Sobre una base SQLite temporal con N productos se mide, por término buscado, la consulta que
+arma ProductosWindow (productos activos con su categoría, primera página de LectorPaginado
+ordenada por nombre) y el COUNT de la misma búsqueda:
+- "LIKE": el filtro anterior, ilike('%texto%') sobre código, nombre y categoría.
+- "Índice": condicion_busqueda() (FTS5 trigram, utils/busqueda.py).
+
+Uso: python benchmark_busqueda.py [productos]
+"""
+import sys
+import time
+import random
+import tempfile
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from sqlalchemy import insert, or_
+from sqlalchemy.orm import sessionmaker, joinedload
+from models.database_model import Base, Categoria, Producto
+from utils.busqueda import condicion_busqueda
+from utils.consulta_paginada import LectorPaginado
+from utils.motor_db import crear_engine
+
+PALABRAS = ["Cemento", "Cañería", "Tubería", "Codo", "Válvula", "Perno", "Tuerca", "Arandela",
+            "Cable", "Interruptor", "Pintura", "Lija", "Clavo", "Alambre", "Ladrillo", "Yeso",
+            "Fierro", "Malla", "Teja", "Caño", "Unión", "Niple", "Brida", "Tapón"]
+TERMINOS = ["caneria", "VÁLV", "ladrillo 3", "PRD-001234", "xyz sin resultados", "pe"]
+REPETICIONES = 20
+
+
+def poblar(engine, productos, semilla=42):
+    rnd = random.Random(semilla)
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        categorias = [Categoria(nombre=nombre) for nombre in ("Gasfitería", "Eléctricos", "Construcción")]
+        session.add_all(categorias)
+        session.flush()
+        filas = [{
+            'codigo': f"PRD-{i:06d}",
+            'nombre': f"{rnd.choice(PALABRAS)} {rnd.choice(PALABRAS).lower()} {rnd.randint(1, 99)}",
+            'categoria_id': rnd.choice(categorias).id,
+            'unidad_medida': "UND",
+            'activo': True,
+        } for i in range(productos)]
+        session.execute(insert(Producto), filas)
+        session.commit()
+
+
+def filtro_like(query, texto):
+    patron = f"%{texto}%"
+    return query.join(Categoria).filter(or_(Producto.codigo.ilike(patron), Producto.nombre.ilike(patron),
+                                            Categoria.nombre.ilike(patron)))
+
+
+def filtro_indice(query, texto):
+    return query.filter(condicion_busqueda(query, Producto, texto))
+
+
+def medir(Session, filtro, texto):
+    tiempos = []
+    for _ in range(REPETICIONES):
+        with Session() as session:
+            query = session.query(Producto).options(joinedload(Producto.categoria)).filter_by(activo=True)
+            lector = LectorPaginado(filtro(query, texto).statement, Producto.id, (Producto.nombre,), session=session)
+            inicio = time.perf_counter()
+            pagina = lector.siguiente_pagina()
+            total = lector.contar(session)
+            tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return tiempos[len(tiempos) // 2] * 1000, len(pagina), total
+
+
+def main():
+    productos = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    with tempfile.TemporaryDirectory() as carpeta:
+        engine = crear_engine(f"sqlite:///{carpeta}/busqueda.db")
+        Base.metadata.create_all(engine)
+        inicio = time.perf_counter()
+        poblar(engine, productos)
+        print(f"{productos} productos cargados (con el índice) en {time.perf_counter() - inicio:.1f} s\n")
+
+        Session = sessionmaker(bind=engine)
+        print(f"{'Término':<22}{'LIKE (ms)':>11}{'Índice (ms)':>13}{'Filas':>8}{'Total':>8}")
+        for texto in TERMINOS:
+            ms_like, _, total_like = medir(Session, filtro_like, texto)
+            ms_indice, filas, total = medir(Session, filtro_indice, texto)
+            print(f"{texto:<22}{ms_like:>11.1f}{ms_indice:>13.1f}{filas:>8}{total:>8}"
+                  + ("" if total == total_like else f"  (LIKE: {total_like})"))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark: recálculo PEPS/UEPS con la cola de lotes (deque + saldos acumulados)
+frente a la implementación anterior (lista con pop(0) y suma de todos los lotes
+en cada movimiento).
+
+Escenario: N entradas seguidas de salidas mixtas (parciales y que agotan varios
+lotes), es decir, miles de lotes abiertos a la vez. La versión anterior es
+cuadrática, por eso se mide con una muestra más pequeña.
+
+Uso: python benchmark_cola_lotes.py [entradas] [entradas_muestra_anterior]
+"""
+import sys
+import time
+import random
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from utils.kardex_manager import KardexManager
+
+
+def generar_movimientos(entradas, semilla=42):
+    rnd = random.Random(semilla)
+    movimientos = []
+    stock = 0.0
+    for _ in range(entradas):
+        cantidad = float(rnd.randint(1, 50))
+        stock += cantidad
+        movimientos.append(SimpleNamespace(cantidad_entrada=cantidad, cantidad_salida=0.0,
+                                           costo_unitario=round(rnd.uniform(1, 50), 4), costo_total=0.0))
+    while stock > 0:
+        # Salidas mixtas: la mayoría parciales, algunas consumen decenas de lotes
+        cantidad = float(rnd.randint(1, 20) if rnd.random() < 0.9 else rnd.randint(200, 1000))
+        cantidad = min(cantidad, stock)
+        stock -= cantidad
+        movimientos.append(SimpleNamespace(cantidad_entrada=0.0, cantidad_salida=cantidad,
+                                           costo_unitario=0.0, costo_total=0.0))
+    return movimientos
+
+
+def calcular_peps_anterior(movimientos):
+    """Implementación previa a ColaLotes, conservada solo como referencia."""
+    lotes = []
+    for mov in movimientos:
+        if mov.cantidad_entrada > 0:
+            lotes.append({
+                'cantidad': Decimal(str(mov.cantidad_entrada)),
+                'costo_unitario': Decimal(str(mov.costo_unitario))
+            })
+        else:
+            cantidad_pendiente = Decimal(str(mov.cantidad_salida))
+            costo_total_salida = Decimal('0')
+
+            while cantidad_pendiente > 0 and lotes:
+                lote = lotes[0]
+                cantidad_a_tomar = min(cantidad_pendiente, lote['cantidad'])
+
+                costo_total_salida += cantidad_a_tomar * lote['costo_unitario']
+                lote['cantidad'] -= cantidad_a_tomar
+                cantidad_pendiente -= cantidad_a_tomar
+
+                if lote['cantidad'] == 0:
+                    lotes.pop(0)
+
+            if mov.cantidad_salida > 0:
+                mov.costo_unitario = float(costo_total_salida / Decimal(str(mov.cantidad_salida)))
+                mov.costo_total = float(costo_total_salida)
+
+        saldo_cantidad = sum(l['cantidad'] for l in lotes)
+        saldo_valor = sum(l['cantidad'] * l['costo_unitario'] for l in lotes)
+        mov.saldo_cantidad = float(saldo_cantidad)
+        mov.saldo_costo_total = float(saldo_valor)
+
+
+def copiar(movimientos):
+    return [SimpleNamespace(**vars(m)) for m in movimientos]
+
+
+def medir(funcion, movimientos):
+    inicio = time.perf_counter()
+    funcion(movimientos)
+    return time.perf_counter() - inicio
+
+
+def main():
+    entradas = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    entradas_muestra = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000
+    manager = KardexManager(None)
+
+    movimientos = generar_movimientos(entradas)
+    print(f"Escenario completo: {entradas:,} entradas + {len(movimientos) - entradas:,} salidas")
+    for nombre, funcion in (("PEPS", manager._calcular_peps), ("UEPS", manager._calcular_ueps)):
+        t = medir(funcion, copiar(movimientos))
+        print(f"  Cola de lotes {nombre}: {t:8.3f} s  ({t / len(movimientos) * 1e6:.2f} µs/movimiento)")
+
+    muestra = generar_movimientos(entradas_muestra)
+    print(f"\nMuestra comparativa: {entradas_muestra:,} entradas + {len(muestra) - entradas_muestra:,} salidas")
+    nuevo, anterior = copiar(muestra), copiar(muestra)
+    t_nuevo = medir(manager._calcular_peps, nuevo)
+    t_anterior = medir(calcular_peps_anterior, anterior)
+    print(f"  Cola de lotes PEPS:    {t_nuevo:8.3f} s")
+    print(f"  Implementación previa: {t_anterior:8.3f} s  ({t_anterior / t_nuevo:.1f}x más lenta)")
+
+    diferencias = max(
+        max(abs(a.costo_total - b.costo_total), abs(a.saldo_costo_total - b.saldo_costo_total),
+            abs(a.saldo_cantidad - b.saldo_cantidad))
+        for a, b in zip(nuevo, anterior)
+    )
+    print(f"  Diferencia máxima entre ambas: {diferencias:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark: escrituras por segundo del motor de base de datos según su perfil.
+
+Dos mediciones por perfil, con un commit por documento como al guardar una compra:
+- "Documentos": KardexManager.registrar_movimientos completo (lecturas de saldo, ORM y
+  saldo_actual), el rendimiento que ve el usuario.
+- "Inserciones": solo el INSERT de las líneas y el commit, donde pesa la sincronización del
+  journal que cambian los PRAGMAs.
+
+Perfiles:
+- SQLite sin PRAGMAs (journal de rollback, synchronous=FULL)
+- SQLite con el perfil de utils/motor_db.py (WAL, synchronous=NORMAL, mmap, caché...)
+- PostgreSQL con el pool del perfil, si se indica su URL (base vacía de pruebas:
+  se crean y eliminan las tablas)
+
+Uso: python benchmark_escritura_db.py [documentos] [lineas_por_documento] [url_postgresql]
+"""
+import sys
+import os
+import time
+import random
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+from models.database_model import (Base, Empresa, Almacen, Categoria, Producto, TipoMovimiento,
+                                   MovimientoStock)
+from utils.kardex_manager import KardexManager
+from utils.motor_db import crear_engine
+
+PRODUCTOS = 50
+
+
+def preparar(session):
+    empresa = Empresa(ruc="20000000001", razon_social="Benchmark")
+    session.add(empresa)
+    session.flush()
+    almacen = Almacen(empresa_id=empresa.id, codigo="ALM01", nombre="Principal")
+    categoria = Categoria(nombre="Benchmark")
+    session.add_all([almacen, categoria])
+    session.flush()
+    productos = [Producto(codigo=f"BENCH-{i:06d}", nombre=f"Producto {i}", categoria_id=categoria.id,
+                          unidad_medida="UND") for i in range(PRODUCTOS)]
+    session.add_all(productos)
+    session.commit()
+    return empresa.id, almacen.id, [p.id for p in productos]
+
+
+def generar_documentos(empresa_id, almacen_id, producto_ids, documentos, lineas, semilla=42):
+    rnd = random.Random(semilla)
+    fecha = date(2024, 1, 1)
+    for numero in range(documentos):
+        fecha += timedelta(days=rnd.random() < 0.1)
+        movimientos = []
+        for _ in range(lineas):
+            cantidad = float(rnd.randint(1, 20))
+            costo = round(rnd.uniform(1, 50), 2)
+            movimientos.append(dict(
+                empresa_id=empresa_id, producto_id=rnd.choice(producto_ids), almacen_id=almacen_id,
+                tipo=TipoMovimiento.COMPRA, cantidad_entrada=cantidad, cantidad_salida=0,
+                costo_unitario=costo, costo_total=round(cantidad * costo, 2),
+                numero_documento=f"B-{numero}", fecha_documento=fecha
+            ))
+        yield movimientos
+
+
+def medir(engine, documentos, lineas):
+    """Returns: (segundos con KardexManager, segundos solo con INSERT y commit)."""
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        claves = preparar(session)
+        manager = KardexManager(session)
+        inicio = time.perf_counter()
+        for movimientos in generar_documentos(*claves, documentos, lineas):
+            manager.registrar_movimientos(movimientos)
+            session.commit()
+        t_documentos = time.perf_counter() - inicio
+
+        with engine.connect() as conn:
+            inicio = time.perf_counter()
+            for movimientos in generar_documentos(*claves, documentos, lineas, semilla=7):
+                conn.execute(insert(MovimientoStock), [dict(m, saldo_cantidad=0, saldo_costo_total=0)
+                                                       for m in movimientos])
+                conn.commit()
+            t_inserciones = time.perf_counter() - inicio
+        return t_documentos, t_inserciones
+    finally:
+        session.close()
+        if engine.dialect.name != 'sqlite':
+            Base.metadata.drop_all(engine)
+        engine.dispose()
+
+
+def main():
+    documentos = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    lineas = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    url_postgresql = sys.argv[3] if len(sys.argv) > 3 else None
+
+    print(f"{documentos:,} documentos de {lineas} líneas, un commit por documento\n")
+    resultados = []
+    with tempfile.TemporaryDirectory() as carpeta:
+        for nombre, pragmas in (("SQLite sin PRAGMAs", {}), ("SQLite con perfil", None)):
+            url = f"sqlite:///{os.path.join(carpeta, nombre.replace(' ', '_') + '.db')}"
+            resultados.append((nombre, medir(crear_engine(url, pragmas=pragmas), documentos, lineas)))
+    if url_postgresql:
+        resultados.append(("PostgreSQL con perfil", medir(crear_engine(url_postgresql), documentos, lineas)))
+
+    print(f"{'':24s} {'Documentos':>24s}   {'Inserciones':>24s}")
+    base_documentos, base_inserciones = resultados[0][1]
+    for nombre, (t_documentos, t_inserciones) in resultados:
+        print(f"{nombre:24s} {documentos / t_documentos:8,.0f} doc/s ({base_documentos / t_documentos:4.1f}x)"
+              f"   {documentos * lineas / t_inserciones:8,.0f} mov/s ({base_inserciones / t_inserciones:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
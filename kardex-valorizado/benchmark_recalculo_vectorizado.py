@@ -0,0 +1,71 @@
+"""
+Benchmark: motor Decimal vs motor vectorizado (NumPy) de Promedio Ponderado.
+Genera movimientos sintéticos en memoria (sin base de datos) y mide solo el cálculo.
+
+Uso: python benchmark_recalculo_vectorizado.py [cantidad_movimientos] [cantidad_productos]
+"""
+import sys
+import time
+import random
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+import numpy as np
+from utils.kardex_manager import KardexManager
+from utils import kardex_vectorizado
+
+
+def generar_movimientos(total, productos, semilla=42):
+    rnd = random.Random(semilla)
+    por_producto = {p: [] for p in range(productos)}
+    for _ in range(total):
+        p = rnd.randrange(productos)
+        if rnd.random() < 0.2:
+            cantidad = round(rnd.uniform(10, 100), 2)
+            costo = round(rnd.uniform(1, 50), 4)
+            mov = SimpleNamespace(cantidad_entrada=cantidad, cantidad_salida=0.0,
+                                  costo_unitario=costo, costo_total=round(cantidad * costo, 2))
+        else:
+            mov = SimpleNamespace(cantidad_entrada=0.0, cantidad_salida=round(rnd.uniform(0.5, 15), 2),
+                                  costo_unitario=0.0, costo_total=0.0)
+        por_producto[p].append(mov)
+    return por_producto
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    productos = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+
+    print(f"Generando {total:,} movimientos para {productos:,} productos...")
+    por_producto = generar_movimientos(total, productos)
+
+    filas = [(p, m) for p, movs in por_producto.items() for m in movs]
+    producto_ids = np.array([p for p, _ in filas])
+    columnas = [np.array([getattr(m, campo) for _, m in filas], dtype=np.float64)
+                for campo in ("cantidad_entrada", "cantidad_salida", "costo_unitario", "costo_total")]
+    inicio_grupo = np.concatenate(([True], np.diff(producto_ids) != 0))
+
+    inicio = time.perf_counter()
+    cu, ct, saldo_cant, saldo_val = kardex_vectorizado.calcular_promedio_ponderado(*columnas, inicio_grupo=inicio_grupo)
+    t_numpy = time.perf_counter() - inicio
+    print(f"Motor NumPy:   {t_numpy:8.3f} s")
+
+    manager = KardexManager(None)
+    inicio = time.perf_counter()
+    for movs in por_producto.values():
+        manager._calcular_promedio_ponderado(movs)
+    t_decimal = time.perf_counter() - inicio
+    print(f"Motor Decimal: {t_decimal:8.3f} s")
+    print(f"Aceleración:   {t_decimal / t_numpy:8.1f}x")
+
+    diferencia_valor = max(abs(saldo_val[i] - m.saldo_costo_total) for i, (_, m) in enumerate(filas))
+    diferencia_costo = max(abs(cu[i] - m.costo_unitario) for i, (_, m) in enumerate(filas))
+    print(f"Máx. diferencia saldo valor: {diferencia_valor:.2e} (tolerancia 0.01)")
+    print(f"Máx. diferencia costo unit.: {diferencia_costo:.2e} (tolerancia 0.000001)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Fusiona en el movimiento original las reversiones y ajustes que dejaron las ediciones de
+compras y ventas, para que movimientos_stock tenga una fila por línea de documento.
+
+Uso: python fusionar_reversiones.py [empresa_id] [--aplicar]
+     Sin --aplicar solo muestra lo que se fusionaría.
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from utils.config import Config
+from utils.fusion_reversiones import FusionReversiones
+
+try:
+    db_url = Config.get_db_url()
+except:
+    db_url = 'sqlite:///kardex.db'
+
+argumentos = [a for a in sys.argv[1:] if not a.startswith('--')]
+empresa_id = int(argumentos[0]) if argumentos else None
+aplicar = '--aplicar' in sys.argv
+
+engine = create_engine(db_url)
+session = sessionmaker(bind=engine)()
+
+try:
+    reporte = FusionReversiones(session).fusionar(empresa_id, aplicar=aplicar)
+except Exception as e:
+    print(f"Error al fusionar reversiones: {e}")
+    sys.exit(1)
+finally:
+    session.close()
+
+print(f"Documentos con ediciones: {reporte['documentos']}")
+print(f"Pares {'fusionados' if aplicar else 'a fusionar'}: {len(reporte['pares_fusionados'])}")
+print(f"Movimientos {'eliminados' if aplicar else 'a eliminar'}: {reporte['movimientos_eliminados']}")
+for (producto_id, almacen_id, documento), motivo in reporte['pares_omitidos'].items():
+    print(f"  Omitido producto {producto_id} / almacén {almacen_id} ({documento}): {motivo}")
+if not aplicar:
+    print("\nNo se modificó la base. Ejecute con --aplicar para fusionar.")
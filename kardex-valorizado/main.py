@@ -16,6 +16,7 @@ sys.path.insert(0, str(Path(__file__).parent / 'src'))
 
 from utils.app_context import app_context
 from services.backup_scheduler import BackupScheduler
+from services.recalculo_scheduler import RecalculoScheduler
 from utils.theme_manager import ThemeManager
 
 # --- Integración para actualización automática ---
@@ -26,19 +27,20 @@ from utils.logger import setup_logger
 from utils.exception_handler import setup_exception_hook
 
 # --- MODIFICADO: Añadida función de migración de BD ---
-from sqlalchemy import create_engine, inspect, text
+from sqlalchemy import inspect, text
+from utils.motor_db import crear_engine
 from models.database_model import AnioContable, EstadoAnio, Compra, TipoEquipo
 from datetime import datetime
 from collections import defaultdict
 
-def verificar_y_actualizar_db(db_url='sqlite:///kardex.db'):
+def verificar_y_actualizar_db(db_url=None):
     """
     Verifica y actualiza la estructura de la base de datos.
     - Añade la columna 'activo' a 'tipo_cambio' si no existe.
     - Crea la tabla 'anio_contable' si no existe.
     - Inserta el año actual si la tabla de años está vacía.
     """
-    engine = create_engine(db_url)
+    engine = crear_engine(db_url)
     inspector = inspect(engine)
 
     # 1. Verificar columna 'activo' en 'tipo_cambio'
@@ -338,6 +340,58 @@ def verificar_y_actualizar_db(db_url='sqlite:///kardex.db'):
     except Exception as e:
         print(f"❌ Error al crear o migrar las tablas del módulo de rental: {e}")
 
+    # 12.5 Verificar tablas de soporte del motor de Kardex
+    try:
+        from models.database_model import (MovimientoStock, CheckpointKardex, CapaCosto, SaldoActual,
+                                           RecalculoPendiente, CierreKardex, CierreKardexCapa,
+                                           VerificacionKardex)
+
+        # Índices compuestos de movimientos_stock (antes de poblar las tablas que los usan)
+        indices_existentes = {ix['name'] for ix in inspector.get_indexes('movimientos_stock')}
+        for indice in MovimientoStock.__table__.indexes:
+            if indice.name not in indices_existentes:
+                print(f"⚠️  Índice '{indice.name}' de movimientos_stock no encontrado. Creándolo...")
+                indice.create(engine)
+                print(f"✓  Índice '{indice.name}' creado exitosamente.")
+
+        tablas_kardex = {
+            'kardex_checkpoints': CheckpointKardex,
+            'kardex_capas_costo': CapaCosto,
+            'saldo_actual': SaldoActual,
+            'kardex_recalculo_pendiente': RecalculoPendiente,
+            'kardex_cierres': CierreKardex,
+            'kardex_cierres_capas': CierreKardexCapa,
+            'kardex_verificacion': VerificacionKardex
+        }
+        for nombre_tabla, modelo_tabla in tablas_kardex.items():
+            if not inspector.has_table(nombre_tabla):
+                print(f"⚠️  Tabla '{nombre_tabla}' del motor de kardex no encontrada. Creándola...")
+                modelo_tabla.__table__.create(engine)
+                print(f"✓  Tabla '{nombre_tabla}' creada exitosamente.")
+
+                if nombre_tabla == 'saldo_actual':
+                    # Poblar el saldo materializado a partir de los movimientos existentes
+                    from sqlalchemy.orm import sessionmaker
+                    from utils.kardex_manager import KardexManager
+                    with sessionmaker(bind=engine)() as session:
+                        KardexManager(session).reconstruir_saldo_actual()
+                        session.commit()
+                    print("✓  Saldo actual generado desde los movimientos.")
+    except Exception as e:
+        print(f"❌ Error al crear las tablas del motor de kardex: {e}")
+
+    # 12.6 Verificar columna 'ambito_promedio' en 'empresas'
+    try:
+        columns = [col['name'] for col in inspector.get_columns('empresas')]
+        if 'ambito_promedio' not in columns:
+            print("⚠️  Detectado modelo de 'empresas' sin ámbito de promedio. Actualizando BD...")
+            with engine.connect() as connection:
+                connection.execute(text("ALTER TABLE empresas ADD COLUMN ambito_promedio VARCHAR(7) DEFAULT 'ALMACEN' NOT NULL"))
+                connection.commit()
+            print("✓  Columna 'ambito_promedio' añadida a 'empresas' exitosamente.")
+    except Exception as e:
+        print(f"🔷 Info: Tabla 'empresas' probablemente no existe aún. Se creará más tarde. ({e})")
+
     # 13. Lógica de Siembra y Migración de Datos
     try:
         from models.database_model import usuario_empresa, Usuario, Empresa, Rol, Permiso
@@ -450,6 +504,10 @@ class KardexMainWindow(QMainWindow):
         # Iniciar Scheduler de Backups
         self.backup_scheduler = BackupScheduler()
         self.backup_scheduler.start()
+
+        # Iniciar procesador de la cola de recálculos de kardex
+        self.recalculo_scheduler = RecalculoScheduler()
+        self.recalculo_scheduler.start()
         
         self.current_theme = "light"
         self.init_ui()
@@ -20,8 +20,14 @@ sys.path.insert(0, dirname(dirname(abspath(__file__))))
 sys.path.insert(0, dirname(dirname(abspath(__file__))) + "/src")
 
 from src.models.database_model import Base
+from utils.busqueda import es_tabla_busqueda
 target_metadata = Base.metadata
 
+
+def include_object(objeto, nombre, tipo, reflejado, comparado):
+    # Las tablas FTS5 de búsqueda no están en el modelo: que autogenerate no las borre
+    return not (tipo == "table" and reflejado and comparado is None and es_tabla_busqueda(nombre))
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -47,6 +53,7 @@ def run_migrations_offline() -> None:
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
         render_as_batch=True,
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -69,7 +76,7 @@ def run_migrations_online() -> None:
     with connectable.connect() as connection:
         context.configure(
             connection=connection, target_metadata=target_metadata,
-            render_as_batch=True
+            render_as_batch=True, include_object=include_object
         )
 
         with context.begin_transaction():
@@ -0,0 +1,43 @@
+"""Kardex checkpoints
+
+Revision ID: 3f1c2a9d7b40
+Revises: 957462537052
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9d7b40'
+down_revision: Union[str, Sequence[str], None] = '957462537052'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('kardex_checkpoints',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('producto_id', sa.Integer(), nullable=False),
+        sa.Column('almacen_id', sa.Integer(), nullable=False),
+        sa.Column('movimiento_id', sa.Integer(), nullable=False),
+        sa.Column('fecha_documento', sa.Date(), nullable=False),
+        sa.Column('saldo_cantidad', sa.Float(), nullable=False),
+        sa.Column('saldo_costo_total', sa.Float(), nullable=False),
+        sa.Column('fecha_registro', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['producto_id'], ['productos.id'], ),
+        sa.ForeignKeyConstraint(['almacen_id'], ['almacenes.id'], ),
+        sa.ForeignKeyConstraint(['movimiento_id'], ['movimientos_stock.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('movimiento_id')
+    )
+    op.create_index('idx_checkpoint_prod_alm_fecha', 'kardex_checkpoints',
+                    ['producto_id', 'almacen_id', 'fecha_documento', 'movimiento_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_checkpoint_prod_alm_fecha', table_name='kardex_checkpoints')
+    op.drop_table('kardex_checkpoints')
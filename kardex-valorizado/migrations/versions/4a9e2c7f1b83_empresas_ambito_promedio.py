@@ -0,0 +1,29 @@
+"""Ambito del costo promedio por empresa
+
+Revision ID: 4a9e2c7f1b83
+Revises: 7d3b9f1e4c60
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4a9e2c7f1b83'
+down_revision: Union[str, Sequence[str], None] = '7d3b9f1e4c60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('empresas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('ambito_promedio', sa.Enum('ALMACEN', 'EMPRESA', name='ambitopromedio'),
+                                      nullable=False, server_default='ALMACEN'))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('empresas', schema=None) as batch_op:
+        batch_op.drop_column('ambito_promedio')
@@ -0,0 +1,30 @@
+"""Indices del orden de las tablas CRUD
+
+Revision ID: 4c8e2a6f1d37
+Revises: 9b5f1d7e3a26
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c8e2a6f1d37'
+down_revision: Union[str, Sequence[str], None] = '9b5f1d7e3a26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Páginas de las tablas de BaseCRUDView: keyset sobre su orden, desempatado por id
+    op.create_index('idx_proveedor_razon_social', 'proveedores', ['razon_social', 'id'], unique=False)
+    op.create_index('idx_cliente_razon_social', 'clientes', ['razon_social', 'id'], unique=False)
+    op.create_index('idx_proyecto_fecha_inicio', 'proyectos', ['fecha_inicio', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_proyecto_fecha_inicio', table_name='proyectos')
+    op.drop_index('idx_cliente_razon_social', table_name='clientes')
+    op.drop_index('idx_proveedor_razon_social', table_name='proveedores')
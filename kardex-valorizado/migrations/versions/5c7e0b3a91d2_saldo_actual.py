@@ -0,0 +1,57 @@
+"""Saldo actual materializado por producto y almacen
+
+Revision ID: 5c7e0b3a91d2
+Revises: 8a4d6e21c5f3
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c7e0b3a91d2'
+down_revision: Union[str, Sequence[str], None] = '8a4d6e21c5f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('saldo_actual',
+        sa.Column('empresa_id', sa.Integer(), nullable=False),
+        sa.Column('producto_id', sa.Integer(), nullable=False),
+        sa.Column('almacen_id', sa.Integer(), nullable=False),
+        sa.Column('cantidad', sa.Float(), nullable=False),
+        sa.Column('valor_total', sa.Float(), nullable=False),
+        sa.Column('ultimo_movimiento_id', sa.Integer(), nullable=True),
+        sa.Column('fecha_ultimo_movimiento', sa.Date(), nullable=True),
+        sa.Column('fecha_actualizacion', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['empresa_id'], ['empresas.id'], ),
+        sa.ForeignKeyConstraint(['producto_id'], ['productos.id'], ),
+        sa.ForeignKeyConstraint(['almacen_id'], ['almacenes.id'], ),
+        sa.ForeignKeyConstraint(['ultimo_movimiento_id'], ['movimientos_stock.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('empresa_id', 'producto_id', 'almacen_id')
+    )
+    op.create_index('idx_saldo_actual_producto', 'saldo_actual', ['producto_id', 'almacen_id'], unique=False)
+
+    # Carga inicial: último movimiento cronológico de cada (producto, almacén)
+    op.execute("""
+        INSERT INTO saldo_actual (empresa_id, producto_id, almacen_id, cantidad, valor_total,
+                                  ultimo_movimiento_id, fecha_ultimo_movimiento, fecha_actualizacion)
+        SELECT empresa_id, producto_id, almacen_id, COALESCE(saldo_cantidad, 0), COALESCE(saldo_costo_total, 0),
+               id, fecha_documento, CURRENT_TIMESTAMP
+        FROM (
+            SELECT m.*, ROW_NUMBER() OVER (
+                PARTITION BY producto_id, almacen_id ORDER BY fecha_documento DESC, id DESC
+            ) AS orden
+            FROM movimientos_stock m
+        ) ultimos
+        WHERE orden = 1
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_saldo_actual_producto', table_name='saldo_actual')
+    op.drop_table('saldo_actual')
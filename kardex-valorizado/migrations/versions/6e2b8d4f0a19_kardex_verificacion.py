@@ -0,0 +1,37 @@
+"""Estado del verificador incremental del kardex
+
+Revision ID: 6e2b8d4f0a19
+Revises: 4a9e2c7f1b83
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e2b8d4f0a19'
+down_revision: Union[str, Sequence[str], None] = '4a9e2c7f1b83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('kardex_verificacion',
+        sa.Column('producto_id', sa.Integer(), nullable=False),
+        sa.Column('almacen_id', sa.Integer(), nullable=False),
+        sa.Column('empresa_id', sa.Integer(), nullable=False),
+        sa.Column('ultimo_movimiento_id', sa.Integer(), nullable=False),
+        sa.Column('checksum_cantidad', sa.BigInteger(), nullable=False),
+        sa.Column('fecha_verificacion', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['producto_id'], ['productos.id'], ),
+        sa.ForeignKeyConstraint(['almacen_id'], ['almacenes.id'], ),
+        sa.ForeignKeyConstraint(['empresa_id'], ['empresas.id'], ),
+        sa.PrimaryKeyConstraint('producto_id', 'almacen_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('kardex_verificacion')
@@ -0,0 +1,60 @@
+"""Cierres anuales de kardex
+
+Revision ID: 7d3b9f1e4c60
+Revises: e41b7d9c2a58
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d3b9f1e4c60'
+down_revision: Union[str, Sequence[str], None] = 'e41b7d9c2a58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('kardex_cierres',
+        sa.Column('anio', sa.Integer(), nullable=False),
+        sa.Column('producto_id', sa.Integer(), nullable=False),
+        sa.Column('almacen_id', sa.Integer(), nullable=False),
+        sa.Column('empresa_id', sa.Integer(), nullable=False),
+        sa.Column('cantidad', sa.Float(), nullable=False),
+        sa.Column('valor_total', sa.Float(), nullable=False),
+        sa.Column('ultimo_movimiento_id', sa.Integer(), nullable=True),
+        sa.Column('fecha_ultimo_movimiento', sa.Date(), nullable=True),
+        sa.Column('fecha_registro', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['producto_id'], ['productos.id'], ),
+        sa.ForeignKeyConstraint(['almacen_id'], ['almacenes.id'], ),
+        sa.ForeignKeyConstraint(['empresa_id'], ['empresas.id'], ),
+        sa.PrimaryKeyConstraint('anio', 'producto_id', 'almacen_id')
+    )
+    op.create_table('kardex_cierres_capas',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('anio', sa.Integer(), nullable=False),
+        sa.Column('producto_id', sa.Integer(), nullable=False),
+        sa.Column('almacen_id', sa.Integer(), nullable=False),
+        sa.Column('orden', sa.Integer(), nullable=False),
+        sa.Column('movimiento_id', sa.Integer(), nullable=False),
+        sa.Column('fecha_documento', sa.Date(), nullable=False),
+        sa.Column('cantidad', sa.Float(), nullable=False),
+        sa.Column('costo_unitario', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['anio', 'producto_id', 'almacen_id'],
+                                ['kardex_cierres.anio', 'kardex_cierres.producto_id', 'kardex_cierres.almacen_id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['movimiento_id'], ['movimientos_stock.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_cierre_capa_par', 'kardex_cierres_capas',
+                    ['anio', 'producto_id', 'almacen_id', 'orden'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_cierre_capa_par', table_name='kardex_cierres_capas')
+    op.drop_table('kardex_cierres_capas')
+    op.drop_table('kardex_cierres')
@@ -0,0 +1,29 @@
+"""Indices de busqueda de texto (FTS5 / pg_trgm)
+
+Revision ID: 7d3f9b1e5a42
+Revises: 4c8e2a6f1d37
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from utils.busqueda import crear_indices_busqueda, borrar_indices_busqueda
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d3f9b1e5a42'
+down_revision: Union[str, Sequence[str], None] = '4c8e2a6f1d37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Productos, equipos, clientes y proveedores: tabla FTS5 con triggers (SQLite) o índice
+    # GIN pg_trgm (PostgreSQL), cargados con las filas existentes (ver utils/busqueda.py)
+    crear_indices_busqueda(op.get_bind())
+
+
+def downgrade() -> None:
+    borrar_indices_busqueda(op.get_bind())
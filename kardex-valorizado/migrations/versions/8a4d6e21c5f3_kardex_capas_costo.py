@@ -0,0 +1,44 @@
+"""Kardex capas de costo PEPS/UEPS
+
+Revision ID: 8a4d6e21c5f3
+Revises: 3f1c2a9d7b40
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4d6e21c5f3'
+down_revision: Union[str, Sequence[str], None] = '3f1c2a9d7b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('kardex_capas_costo',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('empresa_id', sa.Integer(), nullable=False),
+        sa.Column('producto_id', sa.Integer(), nullable=False),
+        sa.Column('almacen_id', sa.Integer(), nullable=False),
+        sa.Column('movimiento_id', sa.Integer(), nullable=False),
+        sa.Column('fecha_documento', sa.Date(), nullable=False),
+        sa.Column('cantidad_restante', sa.Float(), nullable=False),
+        sa.Column('costo_unitario', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['empresa_id'], ['empresas.id'], ),
+        sa.ForeignKeyConstraint(['producto_id'], ['productos.id'], ),
+        sa.ForeignKeyConstraint(['almacen_id'], ['almacenes.id'], ),
+        sa.ForeignKeyConstraint(['movimiento_id'], ['movimientos_stock.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('movimiento_id')
+    )
+    op.create_index('idx_capa_prod_alm_orden', 'kardex_capas_costo',
+                    ['producto_id', 'almacen_id', 'fecha_documento', 'movimiento_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_capa_prod_alm_orden', table_name='kardex_capas_costo')
+    op.drop_table('kardex_capas_costo')
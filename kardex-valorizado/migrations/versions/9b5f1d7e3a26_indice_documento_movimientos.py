@@ -0,0 +1,27 @@
+"""Indice por documento en movimientos_stock
+
+Revision ID: 9b5f1d7e3a26
+Revises: 6e2b8d4f0a19
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b5f1d7e3a26'
+down_revision: Union[str, Sequence[str], None] = '6e2b8d4f0a19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Movimientos de un documento, para revertirlos al editar o eliminar una compra
+    op.create_index('idx_mov_documento', 'movimientos_stock',
+                    ['numero_documento', 'tipo_documento', 'tipo', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_mov_documento', table_name='movimientos_stock')
@@ -0,0 +1,29 @@
+"""Fecha hasta en la cola de recalculo de kardex
+
+Revision ID: a6e0c4f8b213
+Revises: 7d3f9b1e5a42
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6e0c4f8b213'
+down_revision: Union[str, Sequence[str], None] = '7d3f9b1e5a42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Vacía en las entradas existentes: se recalculan hasta el final del par
+    with op.batch_alter_table('kardex_recalculo_pendiente', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fecha_hasta', sa.Date(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('kardex_recalculo_pendiente', schema=None) as batch_op:
+        batch_op.drop_column('fecha_hasta')
@@ -0,0 +1,35 @@
+"""Indices compuestos de movimientos_stock
+
+Revision ID: c2e8f4a6d013
+Revises: 5c7e0b3a91d2
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2e8f4a6d013'
+down_revision: Union[str, Sequence[str], None] = '5c7e0b3a91d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Historial de un (producto, almacén) en orden cronológico y su último saldo
+    op.create_index('idx_mov_prod_alm_fecha_id', 'movimientos_stock',
+                    ['producto_id', 'almacen_id', 'fecha_documento', 'id'], unique=False)
+    # Último movimiento registrado de un par y pares por empresa
+    op.create_index('idx_mov_emp_prod_alm_id', 'movimientos_stock',
+                    ['empresa_id', 'producto_id', 'almacen_id', 'id'], unique=False)
+    # Recorrido por producto en orden cronológico (recálculos globales y por producto)
+    op.create_index('idx_mov_prod_fecha_id', 'movimientos_stock',
+                    ['producto_id', 'fecha_documento', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_mov_prod_fecha_id', table_name='movimientos_stock')
+    op.drop_index('idx_mov_emp_prod_alm_id', table_name='movimientos_stock')
+    op.drop_index('idx_mov_prod_alm_fecha_id', table_name='movimientos_stock')
@@ -0,0 +1,35 @@
+"""Cola de recalculo de kardex
+
+Revision ID: e41b7d9c2a58
+Revises: c2e8f4a6d013
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41b7d9c2a58'
+down_revision: Union[str, Sequence[str], None] = 'c2e8f4a6d013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('kardex_recalculo_pendiente',
+        sa.Column('producto_id', sa.Integer(), nullable=False),
+        sa.Column('almacen_id', sa.Integer(), nullable=False),
+        sa.Column('fecha_desde', sa.Date(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('fecha_encolado', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['producto_id'], ['productos.id'], ),
+        sa.ForeignKeyConstraint(['almacen_id'], ['almacenes.id'], ),
+        sa.PrimaryKeyConstraint('producto_id', 'almacen_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('kardex_recalculo_pendiente')
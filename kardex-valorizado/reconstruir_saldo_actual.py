@@ -0,0 +1,37 @@
+"""
+Regenera la tabla saldo_actual (stock vigente por empresa, producto y almacén)
+a partir de los movimientos de stock.
+
+Uso: python reconstruir_saldo_actual.py [empresa_id]
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models.database_model import Base
+from utils.config import Config
+from utils.kardex_manager import KardexManager
+
+try:
+    db_url = Config.get_db_url()
+except:
+    db_url = 'sqlite:///kardex.db'
+
+empresa_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+
+engine = create_engine(db_url)
+Base.metadata.create_all(engine, tables=[Base.metadata.tables['saldo_actual']])
+session = sessionmaker(bind=engine)()
+
+try:
+    filas = KardexManager(session).reconstruir_saldo_actual(empresa_id)
+    session.commit()
+    alcance = f"empresa {empresa_id}" if empresa_id else "todas las empresas"
+    print(f"saldo_actual regenerado ({alcance}): {filas} filas")
+except Exception as e:
+    session.rollback()
+    print(f"Error al regenerar saldo_actual: {e}")
+    sys.exit(1)
+finally:
+    session.close()
@@ -0,0 +1,38 @@
+"""
+Simula un recálculo global del kardex (opcionalmente con otro método de valuación) sobre
+una copia en memoria de la base de datos y muestra cuánto cambiaría el valor de cada
+producto y almacén. La base de producción no se modifica.
+
+Uso: python simular_recalculo.py empresa_id [PROMEDIO_PONDERADO|PEPS|UEPS] [filas]
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+from models.database_model import MetodoValuacion
+from utils.simulacion_kardex import SimulacionKardex
+
+if len(sys.argv) < 2:
+    print(__doc__)
+    sys.exit(1)
+
+empresa_id = int(sys.argv[1])
+metodo = MetodoValuacion[sys.argv[2].upper()] if len(sys.argv) > 2 else None
+limite = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+try:
+    reporte = SimulacionKardex().simular(empresa_id, metodo=metodo)
+except Exception as e:
+    print(f"Error en la simulación: {e}")
+    sys.exit(1)
+
+print(f"Método actual: {reporte['metodo_actual'].value}  ->  simulado: {reporte['metodo_simulado'].value}")
+print(f"{'Código':<14} {'Producto':<30} {'Almacén':<20} {'Actual':>14} {'Simulado':>14} {'Diferencia':>14}")
+for fila in reporte['filas'][:limite]:
+    if abs(fila['diferencia']) < 0.005:
+        break
+    print(f"{fila['codigo']:<14} {fila['producto'][:30]:<30} {fila['almacen'][:20]:<20} "
+          f"{fila['valor_actual']:>14,.2f} {fila['valor_simulado']:>14,.2f} {fila['diferencia']:>+14,.2f}")
+
+print(f"\nTotal actual:   {reporte['total_actual']:,.2f}")
+print(f"Total simulado: {reporte['total_simulado']:,.2f}")
+print(f"Diferencia:     {reporte['diferencia_total']:+,.2f}")
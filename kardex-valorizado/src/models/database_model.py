@@ -1,13 +1,15 @@
 """
 Modelo de Base de Datos Completo - Sistema Kardex Valorizado
-SQLAlchemy ORM con SQLite
+SQLAlchemy ORM con SQLite (o PostgreSQL en red)
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, Date, Enum, Table, Index
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, Boolean, Text, ForeignKey, Date, Enum, Table, Index, ForeignKeyConstraint, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from datetime import datetime
 import enum
+from utils.motor_db import crear_engine, crear_engine_lectura
+from utils.busqueda import crear_indices_busqueda
 
 Base = declarative_base()
 
@@ -20,6 +22,10 @@ class MetodoValuacion(enum.Enum):
     UEPS = "UEPS"  # LIFO
     PROMEDIO_PONDERADO = "PROMEDIO_PONDERADO"
 
+class AmbitoPromedio(enum.Enum):
+    ALMACEN = "ALMACEN"  # Costo promedio de cada almacén
+    EMPRESA = "EMPRESA"  # Costo promedio global del producto en la empresa
+
 class TipoMovimiento(enum.Enum):
     COMPRA = "COMPRA"
     DEVOLUCION_COMPRA = "DEVOLUCION_COMPRA"
@@ -148,6 +154,7 @@ class Empresa(Base):
     
     # Configuración
     metodo_valuacion = Column(Enum(MetodoValuacion), default=MetodoValuacion.PROMEDIO_PONDERADO)
+    ambito_promedio = Column(Enum(AmbitoPromedio), default=AmbitoPromedio.ALMACEN, nullable=False)
     
     # Relaciones
     almacenes = relationship("Almacen", back_populates="empresa")
@@ -412,6 +419,11 @@ class Proveedor(Base):
     activo = Column(Boolean, default=True)
     fecha_registro = Column(DateTime, default=datetime.now)
     
+    # Orden de la tabla de proveedores (lectura por páginas)
+    __table_args__ = (
+        Index('idx_proveedor_razon_social', 'razon_social', 'id'),
+    )
+
     # Relaciones
     ordenes_compra = relationship("OrdenCompra", back_populates="proveedor")
     compras = relationship("Compra", back_populates="proveedor")
@@ -431,6 +443,11 @@ class Cliente(Base):
     activo = Column(Boolean, default=True)
     fecha_registro = Column(DateTime, default=datetime.now)
     
+    # Orden de la tabla de clientes (lectura por páginas)
+    __table_args__ = (
+        Index('idx_cliente_razon_social', 'razon_social', 'id'),
+    )
+
     # Relaciones
     proyectos = relationship("Proyecto", back_populates="cliente")
     ventas = relationship("Venta", back_populates="cliente")
@@ -782,6 +799,199 @@ class MovimientoStock(Base):
     producto = relationship("Producto", back_populates="movimientos")
     almacen = relationship("Almacen", back_populates="movimientos")
 
+    # Índices compuestos para los accesos del Kardex (ver tests/test_planes_consulta.py):
+    # - historial de un par en orden cronológico y su último saldo (fecha desc, id desc)
+    # - último movimiento registrado de un par y pares por empresa
+    # - recorrido por producto en orden cronológico (recálculos globales y por producto)
+    # - movimientos de un documento (edición y eliminación de compras)
+    __table_args__ = (
+        Index('idx_mov_prod_alm_fecha_id', 'producto_id', 'almacen_id', 'fecha_documento', 'id'),
+        Index('idx_mov_emp_prod_alm_id', 'empresa_id', 'producto_id', 'almacen_id', 'id'),
+        Index('idx_mov_prod_fecha_id', 'producto_id', 'fecha_documento', 'id'),
+        Index('idx_mov_documento', 'numero_documento', 'tipo_documento', 'tipo', 'id'),
+    )
+
+# ============================================
+# TABLA: CHECKPOINTS DE KARDEX
+# ============================================
+
+class CheckpointKardex(Base):
+    """
+    Saldo confirmado de un (producto, almacén) inmediatamente después de un movimiento.
+    Lo escribe el recálculo cada cierto número de movimientos para acotar los recálculos posteriores.
+    """
+    __tablename__ = 'kardex_checkpoints'
+
+    id = Column(Integer, primary_key=True)
+    producto_id = Column(Integer, ForeignKey('productos.id'), nullable=False)
+    almacen_id = Column(Integer, ForeignKey('almacenes.id'), nullable=False)
+    movimiento_id = Column(Integer, ForeignKey('movimientos_stock.id', ondelete='CASCADE'), nullable=False, unique=True)
+    fecha_documento = Column(Date, nullable=False)
+
+    saldo_cantidad = Column(Float, nullable=False)
+    saldo_costo_total = Column(Float, nullable=False)
+
+    fecha_registro = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index('idx_checkpoint_prod_alm_fecha', 'producto_id', 'almacen_id', 'fecha_documento', 'movimiento_id'),
+    )
+
+# ============================================
+# TABLA: CAPAS DE COSTO (PEPS / UEPS)
+# ============================================
+
+class CapaCosto(Base):
+    """
+    Lote abierto de un (producto, almacén) para la valuación PEPS/UEPS.
+    Cada entrada agrega una capa; las salidas consumen capas desde el inicio (PEPS)
+    o desde el final (UEPS). Las capas agotadas se eliminan.
+    """
+    __tablename__ = 'kardex_capas_costo'
+
+    id = Column(Integer, primary_key=True)
+    empresa_id = Column(Integer, ForeignKey('empresas.id'), nullable=False)
+    producto_id = Column(Integer, ForeignKey('productos.id'), nullable=False)
+    almacen_id = Column(Integer, ForeignKey('almacenes.id'), nullable=False)
+    movimiento_id = Column(Integer, ForeignKey('movimientos_stock.id', ondelete='CASCADE'), nullable=False, unique=True)
+    fecha_documento = Column(Date, nullable=False)
+
+    cantidad_restante = Column(Float, nullable=False)
+    costo_unitario = Column(Float, nullable=False)
+
+    movimiento = relationship("MovimientoStock")
+
+    __table_args__ = (
+        Index('idx_capa_prod_alm_orden', 'producto_id', 'almacen_id', 'fecha_documento', 'movimiento_id'),
+    )
+
+# ============================================
+# TABLA: SALDO ACTUAL (MATERIALIZADO)
+# ============================================
+
+class SaldoActual(Base):
+    """
+    Saldo vigente de cada (empresa, producto, almacén): el del último movimiento en orden
+    cronológico. Lo mantienen KardexManager.registrar_movimiento y los recálculos, para que
+    las consultas de stock no busquen el último movimiento de cada par.
+    """
+    __tablename__ = 'saldo_actual'
+
+    empresa_id = Column(Integer, ForeignKey('empresas.id'), primary_key=True)
+    producto_id = Column(Integer, ForeignKey('productos.id'), primary_key=True)
+    almacen_id = Column(Integer, ForeignKey('almacenes.id'), primary_key=True)
+
+    cantidad = Column(Float, nullable=False, default=0)
+    valor_total = Column(Float, nullable=False, default=0)
+
+    ultimo_movimiento_id = Column(Integer, ForeignKey('movimientos_stock.id', ondelete='SET NULL'), nullable=True)
+    fecha_ultimo_movimiento = Column(Date, nullable=True)
+    fecha_actualizacion = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    ultimo_movimiento = relationship("MovimientoStock")
+
+    __table_args__ = (
+        Index('idx_saldo_actual_producto', 'producto_id', 'almacen_id'),
+    )
+
+# ============================================
+# TABLA: COLA DE RECÁLCULO DE KARDEX
+# ============================================
+
+class RecalculoPendiente(Base):
+    """
+    Rango pendiente de recálculo de un (producto, almacén): desde fecha_desde hasta el final.
+    Las ediciones de documentos lo registran en su transacción y un proceso en segundo plano
+    lo recalcula; varias ediciones del mismo par se fusionan conservando la fecha más antigua
+    en fecha_desde y la más reciente en fecha_hasta.
+    """
+    __tablename__ = 'kardex_recalculo_pendiente'
+
+    producto_id = Column(Integer, ForeignKey('productos.id'), primary_key=True)
+    almacen_id = Column(Integer, ForeignKey('almacenes.id'), primary_key=True)
+    fecha_desde = Column(Date, nullable=False)
+    # Última fecha editada: hasta ella el recálculo no se detiene en un checkpoint coincidente
+    # (vacía en las entradas anteriores a la columna: se recalcula hasta el final)
+    fecha_hasta = Column(Date, nullable=True)
+    # Se incrementa en cada registro: el recálculo solo elimina la entrada que leyó
+    version = Column(Integer, nullable=False, default=1)
+    fecha_encolado = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+# ============================================
+# TABLAS: CIERRE ANUAL DEL KARDEX
+# ============================================
+
+class CierreKardex(Base):
+    """
+    Saldo de un (producto, almacén) al 31 de diciembre de un año cerrado, con sus capas
+    abiertas en PEPS/UEPS. Los recálculos y el kardex parten de aquí en lugar de recorrer
+    los movimientos de los años cerrados. Reabrir un año elimina sus cierres y los de los
+    años siguientes.
+    """
+    __tablename__ = 'kardex_cierres'
+
+    anio = Column(Integer, primary_key=True)
+    producto_id = Column(Integer, ForeignKey('productos.id'), primary_key=True)
+    almacen_id = Column(Integer, ForeignKey('almacenes.id'), primary_key=True)
+    empresa_id = Column(Integer, ForeignKey('empresas.id'), nullable=False)
+
+    cantidad = Column(Float, nullable=False, default=0)
+    valor_total = Column(Float, nullable=False, default=0)
+
+    # Último movimiento del par hasta el cierre (orden de las aperturas)
+    ultimo_movimiento_id = Column(Integer, nullable=True)
+    fecha_ultimo_movimiento = Column(Date, nullable=True)
+    fecha_registro = Column(DateTime, default=datetime.now)
+
+    capas = relationship("CierreKardexCapa", cascade="all, delete-orphan", order_by="CierreKardexCapa.orden")
+
+
+class CierreKardexCapa(Base):
+    """Capa abierta (PEPS/UEPS) de un CierreKardex, en el orden en que ingresó."""
+    __tablename__ = 'kardex_cierres_capas'
+
+    id = Column(Integer, primary_key=True)
+    anio = Column(Integer, nullable=False)
+    producto_id = Column(Integer, nullable=False)
+    almacen_id = Column(Integer, nullable=False)
+    orden = Column(Integer, nullable=False)
+
+    # Movimiento de entrada que originó la capa
+    movimiento_id = Column(Integer, ForeignKey('movimientos_stock.id', ondelete='CASCADE'), nullable=False)
+    fecha_documento = Column(Date, nullable=False)
+    cantidad = Column(Float, nullable=False)
+    costo_unitario = Column(Float, nullable=False)
+
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ['anio', 'producto_id', 'almacen_id'],
+            ['kardex_cierres.anio', 'kardex_cierres.producto_id', 'kardex_cierres.almacen_id'],
+            ondelete='CASCADE'
+        ),
+        Index('idx_cierre_capa_par', 'anio', 'producto_id', 'almacen_id', 'orden'),
+    )
+
+# ============================================
+# TABLA: VERIFICACIÓN DE INTEGRIDAD DEL KARDEX
+# ============================================
+
+class VerificacionKardex(Base):
+    """
+    Estado del verificador de integridad de un (producto, almacén): hasta qué movimiento (id)
+    se comprobó la cadena de saldos y el stock que esos movimientos deberían dejar (checksum
+    acumulado de entradas menos salidas, en millonésimas). Cada verificación revisa solo los
+    movimientos posteriores a ultimo_movimiento_id; 0 obliga a revisar el par completo.
+    """
+    __tablename__ = 'kardex_verificacion'
+
+    producto_id = Column(Integer, ForeignKey('productos.id'), primary_key=True)
+    almacen_id = Column(Integer, ForeignKey('almacenes.id'), primary_key=True)
+    empresa_id = Column(Integer, ForeignKey('empresas.id'), nullable=False)
+
+    ultimo_movimiento_id = Column(Integer, nullable=False, default=0)
+    checksum_cantidad = Column(BigInteger, nullable=False, default=0)
+    fecha_verificacion = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
 # ============================================
 # TABLAS: ROLES Y PERMISOS
 # ============================================
@@ -898,7 +1108,12 @@ class Proyecto(Base):
     
     presupuesto_estimado = Column(Float, default=0.0)
     costo_real = Column(Float, default=0.0)
-    
+
+    # Orden de la tabla de proyectos, recientes primero (lectura por páginas)
+    __table_args__ = (
+        Index('idx_proyecto_fecha_inicio', 'fecha_inicio', 'id'),
+    )
+
     # Relaciones
     empresa = relationship("Empresa", back_populates="proyectos")
     cliente = relationship("Cliente", back_populates="proyectos")
@@ -1130,16 +1345,52 @@ class TipoCambio(Base):
 # CONFIGURACIÓN DE BASE DE DATOS
 # ============================================
 
-# Crear el motor de base de datos
-engine = create_engine('sqlite:///kardex.db', echo=False, pool_size=20, max_overflow=30, pool_recycle=3600)
-
-# Crear la sesión
-Session = sessionmaker(bind=engine)
+# Los motores se crean al primer uso, no al importar los modelos: leer la URL de Config
+# puede crear config.json, y las pruebas y Alembic no deben tocarlo
+_engine = None
+_engine_lectura = None
+
+Session = sessionmaker()
+SessionLectura = sessionmaker(autoflush=False)
+
+def obtener_engine():
+    """Motor de la aplicación: URL de Config y perfil de SQLite o PostgreSQL (utils/motor_db.py)"""
+    global _engine
+    if _engine is None:
+        _engine = crear_engine()
+        Session.configure(bind=_engine)
+    return _engine
+
+def obtener_engine_lectura():
+    """Motor de solo lectura para reportes, con su propio pool (con una base en memoria, el mismo motor)"""
+    global _engine_lectura
+    if _engine_lectura is None:
+        _engine_lectura = crear_engine_lectura() or obtener_engine()
+        SessionLectura.configure(bind=_engine_lectura)
+    return _engine_lectura
 
 def obtener_session():
     """Retorna una nueva sesión de base de datos"""
+    obtener_engine()
     return Session()
 
+def obtener_session_lectura():
+    """Retorna una sesión de solo lectura: sus consultas leen una misma instantánea hasta el commit"""
+    obtener_engine_lectura()
+    return SessionLectura()
+
+def __getattr__(nombre):
+    # `from models.database_model import engine` sigue funcionando (scripts de mantenimiento)
+    if nombre == 'engine':
+        return obtener_engine()
+    if nombre == 'engine_lectura':
+        return obtener_engine_lectura()
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+# Índices de búsqueda de texto (FTS5 en SQLite, pg_trgm en PostgreSQL), ver utils/busqueda.py
+event.listen(Base.metadata, 'after_create',
+             lambda _metadata, conexion, **_kw: crear_indices_busqueda(conexion))
+
 def init_db():
     """Inicializa la base de datos creando las tablas"""
-    Base.metadata.create_all(engine)
+    Base.metadata.create_all(obtener_engine())
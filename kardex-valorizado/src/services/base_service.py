@@ -1,15 +1,28 @@
 from sqlalchemy.orm import Session
-from models.database_model import obtener_session
+from models.database_model import obtener_session, obtener_session_lectura
 
 class BaseService:
     """
     Clase base para todos los servicios.
-    Maneja la sesión de base de datos.
+    Maneja la sesión de base de datos y la de solo lectura para reportes.
     """
-    def __init__(self, session: Session = None):
+    def __init__(self, session: Session = None, session_lectura: Session = None):
         self.session = session or obtener_session()
+        # Con una sesión explícita (y sin otra de lectura), los reportes leen con esa misma
+        self._session_lectura = session_lectura or session
+        self._lectura_propia = False
+
+    @property
+    def session_lectura(self) -> Session:
+        """Sesión de solo lectura (obtener_session_lectura), creada al primer uso"""
+        if self._session_lectura is None:
+            self._session_lectura = obtener_session_lectura()
+            self._lectura_propia = True
+        return self._session_lectura
 
     def close(self):
         """Cierra la sesión si fue creada internamente"""
         if self.session:
             self.session.close()
+        if self._lectura_propia:
+            self._session_lectura.close()
@@ -1,8 +1,9 @@
-from sqlalchemy import func, and_, case
-from sqlalchemy.orm import aliased
-from models.database_model import Producto, MovimientoStock, Categoria, Almacen, Empresa
+from sqlalchemy import func, and_, case, select
+from models.database_model import (Producto, MovimientoStock, Categoria, Almacen, Empresa, SaldoActual, MetodoValuacion,
+                                   AmbitoPromedio)
 from services.base_service import BaseService
-from decimal import Decimal
+from utils.kardex_manager import KardexManager
+from utils.kardex_multialmacen import valorizar_multialmacen
 
 class InventoryService(BaseService):
     """
@@ -22,78 +23,57 @@ class InventoryService(BaseService):
         Returns:
             List[dict]: Lista de diccionarios con datos de valorización
         """
-        # Alias para subconsultas
-        ms = aliased(MovimientoStock)
-        
-        # 1. Subconsulta para obtener el último movimiento por producto (y almacén si aplica)
-        # Si se selecciona un almacén específico, agrupamos por producto y ese almacén
-        # Si es "Todos los almacenes", necesitamos el último movimiento global por almacén para sumar
-        
-        if almacen_id:
-            # Caso 1: Un almacén específico
-            # Subconsulta: Max ID por producto en ese almacén
-            subquery = (
-                self.session.query(
-                    func.max(ms.id).label('max_id')
-                )
-                .filter(ms.empresa_id == empresa_id)
-                .filter(ms.almacen_id == almacen_id)
-                .group_by(ms.producto_id)
-                .subquery()
-            )
-        else:
-            # Caso 2: Todos los almacenes
-            # Subconsulta: Max ID por producto Y almacén (para tener el saldo de cada almacén)
-            subquery = (
-                self.session.query(
-                    func.max(ms.id).label('max_id')
-                )
-                .filter(ms.empresa_id == empresa_id)
-                .group_by(ms.producto_id, ms.almacen_id)
-                .subquery()
+        # Se lee con la sesión de solo lectura: el reporte no retiene bloqueos de escritura
+        session = self.session_lectura
+
+        # 1. Stock vigente materializado en saldo_actual, sumado por producto
+        # Si se selecciona un almacén, solo su fila; si es "Todos", se suman los almacenes.
+        # La agregación recorre la clave primaria (empresa, producto, almacén) en orden.
+        saldos = (
+            session.query(
+                SaldoActual.producto_id,
+                func.sum(SaldoActual.cantidad).label('total_cantidad'),
+                func.sum(SaldoActual.valor_total).label('total_valor')
             )
+            .filter(SaldoActual.empresa_id == empresa_id)
+        )
+        if almacen_id:
+            saldos = saldos.filter(SaldoActual.almacen_id == almacen_id)
+        saldos = saldos.group_by(SaldoActual.producto_id)
 
-        # 2. Consulta Principal
-        # Unimos Productos con los Movimientos encontrados en la subconsulta
+        # Filtro de stock (Having porque es sobre agregación sum)
+        if solo_stock:
+            saldos = saldos.having(func.sum(SaldoActual.cantidad) > 0)
+        saldos = saldos.subquery()
+
+        # 2. Consulta Principal: datos del producto para cada saldo
         query = (
-            self.session.query(
+            session.query(
                 Producto.codigo,
                 Producto.nombre,
                 Categoria.nombre.label('categoria_nombre'),
                 Producto.unidad_medida,
-                func.sum(MovimientoStock.saldo_cantidad).label('total_cantidad'),
-                func.sum(MovimientoStock.saldo_costo_total).label('total_valor'),
-                # Si es un solo almacén, el costo unitario es directo. 
+                saldos.c.total_cantidad,
+                saldos.c.total_valor,
+                # Si es un solo almacén, el costo unitario es directo.
                 # Si son todos, se calcula promedio ponderado después o en la app.
                 # Aquí sumamos costos totales y cantidades.
             )
             .join(Categoria, Producto.categoria_id == Categoria.id)
-            .join(MovimientoStock, MovimientoStock.producto_id == Producto.id)
-            .join(subquery, MovimientoStock.id == subquery.c.max_id) # Join con el último movimiento
+            .join(saldos, saldos.c.producto_id == Producto.id)
             .filter(Producto.activo == True)
         )
 
         # Filtros adicionales
         if categoria_id:
             query = query.filter(Producto.categoria_id == categoria_id)
-            
-        # Agrupamos por producto para sumar saldos de diferentes almacenes (si aplica)
-        query = query.group_by(
-            Producto.id, 
-            Producto.codigo, 
-            Producto.nombre, 
-            Categoria.nombre, 
-            Producto.unidad_medida
-        )
-
-        # Filtro de stock (Having porque es sobre agregación sum)
-        if solo_stock:
-            query = query.having(func.sum(MovimientoStock.saldo_cantidad) > 0)
 
         # Ordenar
         query = query.order_by(Categoria.nombre, Producto.nombre)
 
         results = query.all()
+        # Cierra la transacción de lectura: el próximo reporte parte de una instantánea nueva
+        session.commit()
         
         # Formatear resultados
         datos = []
@@ -121,117 +101,105 @@ class InventoryService(BaseService):
 
     def get_stock_producto(self, producto_id: int, almacen_id: int = None):
         """Obtiene el stock actual de un producto"""
-        query = self.session.query(MovimientoStock).filter(
-            MovimientoStock.producto_id == producto_id
+        query = self.session.query(func.sum(SaldoActual.cantidad)).filter(
+            SaldoActual.producto_id == producto_id
         )
-        
+
+        # Sin almacén: suma de los saldos vigentes de todos los almacenes
         if almacen_id:
-            query = query.filter(MovimientoStock.almacen_id == almacen_id)
-            last_mov = query.order_by(MovimientoStock.id.desc()).first()
-            return last_mov.saldo_cantidad if last_mov else 0
-        else:
-            # Suma de últimos movimientos por almacén
-            subquery = (
-                self.session.query(
-                    func.max(MovimientoStock.id).label('max_id')
-                )
-                .filter(MovimientoStock.producto_id == producto_id)
-                .group_by(MovimientoStock.almacen_id)
-                .subquery()
-            )
-            
-            total = self.session.query(func.sum(MovimientoStock.saldo_cantidad)).join(
-                subquery, MovimientoStock.id == subquery.c.max_id
-            ).scalar()
-            
-            return total or 0
+            query = query.filter(SaldoActual.almacen_id == almacen_id)
+
+        return query.scalar() or 0
 
     def recalculate_kardex(self, producto_id: int, empresa_id: int):
         """
         Recalcula todos los saldos y costos promedios de un producto desde cero.
         Crítico para mantener la integridad de datos.
+
+        Los movimientos se recorren una sola vez: se escriben los saldos del ámbito de
+        promedio configurado en la empresa y se informa cuánto difiere el otro modelo.
+
+        Returns:
+            dict: Divergencia entre modelos (ver valorizar_multialmacen), con 'producto_id'.
         """
-        # 1. Obtener todos los movimientos ordenados cronológicamente
-        movimientos = self.session.query(MovimientoStock).filter(
-            MovimientoStock.producto_id == producto_id,
-            MovimientoStock.empresa_id == empresa_id
-        ).order_by(
-            MovimientoStock.fecha_documento,
-            MovimientoStock.fecha_registro,
-            MovimientoStock.id
-        ).all()
-        
-        # Diccionario para mantener estado por almacén
-        # saldo_almacen[almacen_id] = {'cantidad': 0.0, 'costo_total': 0.0}
-        saldos_almacen = {} 
-        
-        # Variables globales del producto (para costo promedio ponderado si es global)
-        # Asumiremos costo promedio ponderado GLOBAL por empresa (común en Perú)
-        # O costo promedio por almacén. El modelo actual parece sugerir saldo por movimiento.
-        # Vamos a recalcular basándonos en el flujo cronológico.
-        
-        saldo_global_cantidad = Decimal('0')
-        saldo_global_costo = Decimal('0')
-        
-        for mov in movimientos:
-            # Inicializar saldo almacén si no existe
-            if mov.almacen_id not in saldos_almacen:
-                saldos_almacen[mov.almacen_id] = Decimal('0')
-
-            cant_entrada = Decimal(str(mov.cantidad_entrada))
-            cant_salida = Decimal(str(mov.cantidad_salida))
-            costo_unitario_mov = Decimal(str(mov.costo_unitario))
-            
-            # Lógica de Costo Promedio Ponderado
-            # Si es entrada, aumenta saldo y recálcula costo promedio
-            if cant_entrada > 0:
-                # Nuevo saldo global
-                nuevo_saldo_cantidad = saldo_global_cantidad + cant_entrada
-                nuevo_saldo_costo = saldo_global_costo + (cant_entrada * costo_unitario_mov)
-                
-                saldo_global_cantidad = nuevo_saldo_cantidad
-                saldo_global_costo = nuevo_saldo_costo
-                
-                # Actualizar saldo almacén
-                saldos_almacen[mov.almacen_id] += cant_entrada
-                
-            # Si es salida, disminuye saldo y usa costo promedio actual
-            elif cant_salida > 0:
-                # El costo de salida DEBE ser el costo promedio actual
-                # Si no hay saldo, usamos el costo del movimiento (o 0)
-                costo_promedio = Decimal('0')
-                if saldo_global_cantidad > 0:
-                    costo_promedio = saldo_global_costo / saldo_global_cantidad
-                
-                # Actualizar costo unitario y total de la salida en el registro
-                # NOTA: Esto modifica el histórico para corregir costos de salida mal calculados
-                mov.costo_unitario = float(costo_promedio)
-                mov.costo_total = float(cant_salida * costo_promedio)
-                
-                # Actualizar saldos globales
-                saldo_global_cantidad -= cant_salida
-                saldo_global_costo -= (cant_salida * costo_promedio)
-                
-                # Actualizar saldo almacén
-                saldos_almacen[mov.almacen_id] -= cant_salida
-
-            # Actualizar los saldos finales del registro (snapshot)
-            # En este modelo, saldo_cantidad parece ser el saldo DEL ALMACÉN después del movimiento
-            # O el saldo GLOBAL? Revisando database_model, no es explícito, pero usualmente Kardex es por almacén.
-            # Sin embargo, para valoración promedio ponderado, se suele usar el global.
-            # Asumiremos que saldo_cantidad en la tabla es el saldo en ESE almacén para control de stock físico.
-            
-            mov.saldo_cantidad = float(saldos_almacen[mov.almacen_id])
-            
-            # El saldo_costo_total en la tabla es ambiguo. ¿Es el valor del inventario total o solo de ese almacén?
-            # Para consistencia con ValorizacionWindow (que suma saldos), debe ser el valor en ese almacén.
-            # Si usamos costo promedio global: Valor Almacen = Cantidad Almacen * Costo Promedio Global
-            
-            costo_promedio_actual = 0
-            if saldo_global_cantidad > 0:
-                costo_promedio_actual = saldo_global_costo / saldo_global_cantidad
-                
-            mov.saldo_costo_total = float(saldos_almacen[mov.almacen_id] * costo_promedio_actual)
+        empresa = self.session.get(Empresa, empresa_id)
+        ambito = empresa.ambito_promedio if empresa else AmbitoPromedio.ALMACEN
+
+        # 1. Obtener los movimientos posteriores al último cierre anual ordenados
+        #    cronológicamente, como filas planas, precedidos por los saldos del cierre
+        kardex = KardexManager(self.session)
+        movimientos = self._movimientos_valorizacion(kardex, empresa_id, [producto_id]).get(producto_id, [])
+
+        reporte = self.valorizar_movimientos(movimientos, ambito)
+        reporte['producto_id'] = producto_id
+
+        # 2. Escribir solo los movimientos que cambiaron (executemany por lotes)
+        kardex.escribir_valorizacion_masiva(kardex.filas_modificadas(movimientos))
+        kardex.actualizar_saldo_actual({(mov.producto_id, mov.almacen_id) for mov in movimientos})
 
         # Commit de todos los cambios
         self.session.commit()
+        return reporte
+
+    def comparar_modelos_promedio(self, empresa_id: int, producto_ids=None):
+        """
+        Divergencia entre el promedio por almacén y el promedio global de la empresa, sin
+        escribir nada: una sola lectura de los movimientos, valorizados en memoria.
+
+        Args:
+            producto_ids: Productos a comparar (None = todos los que tienen movimientos en la empresa).
+
+        Returns:
+            List[dict]: Una divergencia por producto (con 'producto_id'), de mayor a menor
+                        diferencia en el costo de ventas.
+        """
+        kardex = KardexManager(self.session)
+        reportes = []
+        for producto_id, movimientos in self._movimientos_valorizacion(kardex, empresa_id, producto_ids).items():
+            reporte = self.valorizar_movimientos(movimientos)
+            reporte['producto_id'] = producto_id
+            reportes.append(reporte)
+
+        reportes.sort(key=lambda r: r['diferencia_costo_ventas'], reverse=True)
+        return reportes
+
+    def _movimientos_valorizacion(self, kardex, empresa_id, producto_ids=None):
+        """
+        Movimientos planos de la empresa posteriores al último cierre, agrupados por producto
+        en orden cronológico y precedidos por las aperturas del cierre.
+
+        Returns:
+            dict: {producto_id: [movimientos]}
+        """
+        anio_cierre = kardex.ultimo_cierre()
+        consulta = select(*KardexManager.COLUMNAS_VALORIZACION).where(MovimientoStock.empresa_id == empresa_id)
+        if producto_ids is not None:
+            consulta = consulta.where(MovimientoStock.producto_id.in_(list(producto_ids)))
+        if anio_cierre is not None:
+            consulta = consulta.where(MovimientoStock.fecha_documento > kardex.fecha_cierre(anio_cierre))
+        filas = self.session.execute(
+            consulta.order_by(MovimientoStock.producto_id, MovimientoStock.fecha_documento, MovimientoStock.id)
+        ).all()
+
+        cierres = kardex.leer_cierres(self.session, anio_cierre, producto_ids, empresa_id=empresa_id)
+        por_producto = {}
+        for mov in kardex.a_movimientos_planos(filas):
+            if mov.producto_id not in por_producto:
+                por_producto[mov.producto_id] = kardex.movimientos_apertura(
+                    cierres.get(mov.producto_id, []), MetodoValuacion.PROMEDIO_PONDERADO
+                )
+            por_producto[mov.producto_id].append(mov)
+        return por_producto
+
+    @staticmethod
+    def valorizar_movimientos(movimientos, ambito=AmbitoPromedio.EMPRESA):
+        """
+        Aplica el Costo Promedio Ponderado del ámbito indicado (por defecto, el global de la
+        empresa) a una lista de movimientos de UN producto, ya ordenados cronológicamente.
+        Solo modifica los atributos de cada movimiento; no accede a la base de datos (se
+        reutiliza en la regeneración paralela).
+
+        Returns:
+            dict: Divergencia entre el promedio por almacén y el global (valorizar_multialmacen).
+        """
+        return valorizar_multialmacen(movimientos, ambito)
@@ -0,0 +1,44 @@
+from apscheduler.schedulers.background import BackgroundScheduler
+from utils.sesiones import sesion_de_hilo
+from utils.cola_recalculo import ColaRecalculo
+from utils.kardex_manager import KardexManager
+from utils.config import Config
+import atexit
+
+class RecalculoScheduler:
+    """
+    Procesa en segundo plano la cola de recálculos del Kardex: un recálculo por
+    (producto, almacén) pendiente, cada uno en su propia transacción.
+    """
+    def __init__(self, intervalo=None):
+        self.scheduler = BackgroundScheduler()
+        intervalo = intervalo or Config.get("INTERVALO_RECALCULO_SEGUNDOS") or 5
+        self.scheduler.add_job(self.procesar_cola, 'interval', seconds=intervalo,
+                               max_instances=1, coalesce=True)
+
+    def start(self):
+        try:
+            self.scheduler.start()
+            print("📅 Procesador de recálculos de kardex iniciado.")
+            atexit.register(lambda: self.scheduler.shutdown())
+        except Exception as e:
+            print(f"Error al iniciar el procesador de recálculos: {e}")
+
+    def procesar_cola(self):
+        procesados = 0
+        # Sesión del hilo del planificador, retirada al terminar la pasada
+        with sesion_de_hilo() as session:
+            kardex = KardexManager(session)
+            for entrada in ColaRecalculo(session).pendientes():
+                par = (entrada.producto_id, entrada.almacen_id)
+                try:
+                    procesados += kardex.procesar_recalculos_pendientes({par})
+                    session.commit()
+                except Exception as e:
+                    # La entrada sigue en la cola y se reintenta en la siguiente pasada
+                    session.rollback()
+                    print(f"❌ Error al recalcular kardex {par}: {e}")
+
+        if procesados:
+            print(f"✅ Kardex recalculado para {procesados} producto(s)/almacén(es) pendientes.")
+        return procesados
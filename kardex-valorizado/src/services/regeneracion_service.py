@@ -0,0 +1,199 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sqlalchemy import select, func
+from sqlalchemy.pool import NullPool
+from models.database_model import MovimientoStock, Empresa, MetodoValuacion, AmbitoPromedio, CheckpointKardex
+from services.base_service import BaseService
+from services.inventory_service import InventoryService
+from utils.kardex_manager import KardexManager
+from utils.config import Config
+from utils.motor_db import crear_engine
+
+# Tareas que sabe ejecutar un proceso trabajador
+TAREA_KARDEX_GLOBAL = 'KARDEX_GLOBAL'        # Igual que KardexManager.recalcular_saldos_globales
+TAREA_SALDOS_EMPRESA = 'SALDOS_EMPRESA'      # Igual que InventoryService.recalculate_kardex
+
+def _valorizar_particion(db_url, tarea, empresa_id, metodo, producto_ids, anio_cierre=None, ambito=None):
+    """
+    Proceso trabajador: lee los movimientos de su partición con una conexión propia,
+    los valoriza con las mismas rutinas que el recálculo serial y devuelve solo las filas
+    que cambiaron. No escribe en la base de datos.
+    Con anio_cierre solo lee los movimientos posteriores a ese cierre y parte de sus saldos.
+    ambito es el valor de AmbitoPromedio de la empresa (solo TAREA_SALDOS_EMPRESA).
+    """
+    engine = crear_engine(db_url, poolclass=NullPool)
+    try:
+        consulta = select(*KardexManager.COLUMNAS_VALORIZACION).where(MovimientoStock.producto_id.in_(producto_ids))
+        if tarea == TAREA_SALDOS_EMPRESA:
+            consulta = consulta.where(MovimientoStock.empresa_id == empresa_id)
+        if anio_cierre is not None:
+            consulta = consulta.where(MovimientoStock.fecha_documento > KardexManager.fecha_cierre(anio_cierre))
+        # Orden servido por idx_mov_prod_fecha_id
+        consulta = consulta.order_by(
+            MovimientoStock.producto_id, MovimientoStock.fecha_documento, MovimientoStock.id
+        )
+
+        with engine.connect() as conn:
+            filas = conn.execute(consulta).all()
+            aperturas = KardexManager.leer_cierres(
+                conn, anio_cierre, producto_ids,
+                empresa_id=empresa_id if tarea == TAREA_SALDOS_EMPRESA else None
+            )
+    finally:
+        engine.dispose()
+
+    # Los saldos por empresa (InventoryService) son siempre Promedio Ponderado
+    metodo_apertura = MetodoValuacion(metodo) if metodo else MetodoValuacion.PROMEDIO_PONDERADO
+    por_producto = {}
+    for mov in KardexManager.a_movimientos_planos(filas):
+        if mov.producto_id not in por_producto:
+            por_producto[mov.producto_id] = KardexManager.movimientos_apertura(
+                aperturas.get(mov.producto_id, []), metodo_apertura
+            )
+        por_producto[mov.producto_id].append(mov)
+
+    manager = KardexManager(None)
+    resultado = []
+    for movimientos in por_producto.values():
+        if tarea == TAREA_SALDOS_EMPRESA:
+            InventoryService.valorizar_movimientos(movimientos, AmbitoPromedio(ambito))
+        elif metodo == MetodoValuacion.PROMEDIO_PONDERADO.value:
+            manager._calcular_promedio_ponderado(movimientos)
+        elif metodo == MetodoValuacion.PEPS.value:
+            manager._calcular_peps(movimientos)
+        elif metodo == MetodoValuacion.UEPS.value:
+            manager._calcular_ueps(movimientos)
+
+        resultado.extend(KardexManager.filas_modificadas(movimientos))
+
+    return len(producto_ids), resultado
+
+
+class RegeneracionService(BaseService):
+    """
+    Regeneración de saldos en paralelo, particionada por producto.
+    Los movimientos de cada producto son independientes: varios procesos leen y valorizan
+    particiones distintas y un único escritor (esta sesión) aplica los resultados en
+    transacciones por lotes, de modo que SQLite nunca recibe escrituras concurrentes.
+    El resultado es idéntico al recálculo serial porque se usan las mismas rutinas.
+    """
+
+    # Particiones por proceso: más particiones reparten mejor la carga y el progreso
+    PARTICIONES_POR_PROCESO = 4
+
+    def regenerar_kardex_global(self, empresa_id: int, procesos: int = None, progreso=None):
+        """
+        Versión paralela de KardexManager.recalcular_saldos_globales (todos los productos,
+        con el método de valuación de la empresa).
+
+        Returns:
+            int: Cantidad de productos regenerados.
+        """
+        empresa = self.session.get(Empresa, empresa_id)
+        if not empresa:
+            raise ValueError("Empresa no encontrada")
+
+        conteos = self.session.query(
+            MovimientoStock.producto_id, func.count(MovimientoStock.id)
+        ).group_by(MovimientoStock.producto_id).all()
+
+        return self._ejecutar(TAREA_KARDEX_GLOBAL, empresa_id, empresa.metodo_valuacion.value,
+                              conteos, procesos, progreso)
+
+    def regenerar_saldos_empresa(self, empresa_id: int, producto_ids=None, procesos: int = None, progreso=None):
+        """
+        Versión paralela de InventoryService.recalculate_kardex para varios productos de una empresa.
+
+        Args:
+            producto_ids: Productos a regenerar (None = todos los que tienen movimientos en la empresa).
+
+        Returns:
+            int: Cantidad de productos regenerados.
+        """
+        query = self.session.query(
+            MovimientoStock.producto_id, func.count(MovimientoStock.id)
+        ).filter(MovimientoStock.empresa_id == empresa_id)
+
+        if producto_ids is not None:
+            query = query.filter(MovimientoStock.producto_id.in_(list(producto_ids)))
+
+        conteos = query.group_by(MovimientoStock.producto_id).all()
+
+        empresa = self.session.get(Empresa, empresa_id)
+        ambito = empresa.ambito_promedio if empresa else AmbitoPromedio.ALMACEN
+        return self._ejecutar(TAREA_SALDOS_EMPRESA, empresa_id, None, conteos, procesos, progreso, ambito.value)
+
+    def _ejecutar(self, tarea, empresa_id, metodo, conteos, procesos, progreso, ambito=None):
+        procesos = self._resolver_procesos(procesos)
+        particiones = self._particionar(conteos, procesos * self.PARTICIONES_POR_PROCESO)
+        if not particiones:
+            return 0
+
+        db_url = self.session.get_bind().url.render_as_string(hide_password=False)
+        manager = KardexManager(self.session)
+        # Los años cerrados no se recalculan: los trabajadores parten del último cierre
+        anio_cierre = manager.ultimo_cierre()
+        total = len(particiones)
+        productos = 0
+
+        # Los checkpoints de recálculo incremental dejan de ser válidos tras regenerar
+        if tarea == TAREA_KARDEX_GLOBAL:
+            self.session.query(CheckpointKardex).delete(synchronize_session=False)
+            self.session.commit()
+
+        def aplicar(cantidad_productos, filas):
+            manager.escribir_valorizacion_masiva(filas)
+            self.session.commit()
+            return cantidad_productos
+
+        if procesos == 1:
+            for terminadas, particion in enumerate(particiones, start=1):
+                productos += aplicar(*_valorizar_particion(
+                    db_url, tarea, empresa_id, metodo, particion, anio_cierre, ambito
+                ))
+                if progreso:
+                    progreso(terminadas, total)
+        else:
+            # 'spawn' evita heredar hilos de Qt o conexiones abiertas del proceso principal
+            contexto = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as pool:
+                futuros = [
+                    pool.submit(_valorizar_particion, db_url, tarea, empresa_id, metodo, particion, anio_cierre, ambito)
+                    for particion in particiones
+                ]
+                for terminadas, futuro in enumerate(as_completed(futuros), start=1):
+                    productos += aplicar(*futuro.result())
+                    if progreso:
+                        progreso(terminadas, total)
+
+        # Stock vigente materializado a partir de los saldos regenerados
+        manager.reconstruir_saldo_actual(empresa_id)
+        self.session.commit()
+
+        self.session.expire_all()
+        return productos
+
+    @staticmethod
+    def _resolver_procesos(procesos):
+        """Cantidad de procesos: argumento, luego config.json (0 = automático), luego CPUs."""
+        if not procesos:
+            procesos = Config.get("PROCESOS_REGENERACION") or os.cpu_count() or 1
+        return max(1, int(procesos))
+
+    @staticmethod
+    def _particionar(conteos, cantidad):
+        """
+        Reparte los productos en particiones de carga similar (cantidad de movimientos),
+        asignando cada producto, de mayor a menor, a la partición menos cargada.
+        """
+        cantidad = max(1, min(cantidad, len(conteos)))
+        particiones = [[] for _ in range(cantidad)]
+        cargas = [0] * cantidad
+
+        for producto_id, movimientos in sorted(conteos, key=lambda c: c[1], reverse=True):
+            destino = cargas.index(min(cargas))
+            particiones[destino].append(producto_id)
+            cargas[destino] += movimientos
+
+        return [p for p in particiones if p]
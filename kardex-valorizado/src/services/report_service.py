@@ -8,11 +8,12 @@ from datetime import datetime
 import os
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from models.database_model import Producto, MovimientoStock, Venta, Compra, Proveedor, Cliente
+from models.database_model import obtener_session_lectura, Producto, MovimientoStock, Venta, Compra, Proveedor, Cliente
 
 class ReportService:
-    def __init__(self, session: Session):
-        self.session = session
+    def __init__(self, session: Session = None):
+        # Por defecto, sesión de solo lectura: un reporte largo no demora las ventas
+        self.session = session or obtener_session_lectura()
         self.styles = getSampleStyleSheet()
         self.title_style = self.styles['Heading1']
         self.normal_style = self.styles['Normal']
@@ -56,6 +57,9 @@ class ReportService:
                 "Total Valorizado": total
             })
 
+        # Datos leídos: se libera la instantánea antes de escribir el archivo
+        self.session.commit()
+
         df = pd.DataFrame(data)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"inventario_valorizado_{timestamp}"
@@ -86,6 +90,8 @@ class ReportService:
                 "Total": v.total
             })
         
+        self.session.commit()
+
         df = pd.DataFrame(data)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"reporte_ventas_{timestamp}"
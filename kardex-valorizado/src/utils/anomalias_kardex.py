@@ -0,0 +1,145 @@
+"""
+Búsqueda de anomalías en todo el historial de movimientos de stock.
+Archivo: src/utils/anomalias_kardex.py
+
+Los motores de recálculo recortan a cero un saldo que quedaría negativo, de modo que el
+kardex guardado no muestra cuándo se vendió o consumió sin stock. Aquí el saldo se
+reconstruye con funciones de ventana (SUM ... OVER por producto y almacén, en orden de
+fecha e id) en una sola pasada por movimientos_stock, sin cargar objetos del ORM: la base
+de datos solo devuelve las filas anómalas y Python agrupa los episodios de stock negativo.
+
+En la misma pasada se marcan las salidas cuyo costo unitario se aleja del costo promedio
+vigente (el saldo valorizado del movimiento anterior).
+"""
+
+from sqlalchemy import select, func, case, and_, or_
+from models.database_model import MovimientoStock
+
+
+class AnalizadorAnomaliasKardex:
+
+    # Cantidades menores se consideran cero (redondeo)
+    TOLERANCIA = 0.01
+    # Desviación relativa del costo de una salida respecto del promedio vigente (0.5 = 50%)
+    UMBRAL_COSTO = 0.5
+
+    def __init__(self, session):
+        self.session = session
+
+    def _consulta(self, empresa_id, umbral_costo):
+        m = MovimientoStock
+        # Una misma ventana (con marco ROWS) para las tres funciones: SQLite las resuelve en
+        # un solo recorrido, y el marco por filas evita buscar "pares" de igual orden
+        ventana = {
+            'partition_by': (m.producto_id, m.almacen_id),
+            'order_by': (m.fecha_documento, m.id),
+            'rows': (None, 0),
+        }
+        delta = func.coalesce(m.cantidad_entrada, 0) - func.coalesce(m.cantidad_salida, 0)
+
+        base = select(
+            m.id, m.producto_id, m.almacen_id, m.fecha_documento, m.tipo, m.tipo_documento,
+            m.numero_documento, m.cantidad_salida, m.costo_unitario,
+            delta.label('delta'),
+            func.sum(delta).over(**ventana).label('acumulado'),
+            func.lag(m.saldo_cantidad).over(**ventana).label('saldo_previo'),
+            func.lag(m.saldo_costo_total).over(**ventana).label('valor_previo'),
+        )
+        if empresa_id is not None:
+            # Se filtra por empresa, nunca por fecha: el acumulado necesita todo el historial
+            base = base.where(m.empresa_id == empresa_id)
+        base = base.subquery('acumulados')
+
+        negativo = base.c.acumulado < -self.TOLERANCIA
+        previo_negativo = (base.c.acumulado - base.c.delta) < -self.TOLERANCIA
+        promedio = base.c.valor_previo / base.c.saldo_previo
+        atipico = and_(
+            base.c.cantidad_salida > 0,
+            base.c.saldo_previo > self.TOLERANCIA,
+            base.c.valor_previo > 0,
+            func.abs(base.c.costo_unitario - promedio) > promedio * umbral_costo,
+        )
+
+        return select(
+            base.c.id, base.c.producto_id, base.c.almacen_id, base.c.fecha_documento, base.c.tipo,
+            base.c.tipo_documento, base.c.numero_documento, base.c.costo_unitario, base.c.acumulado,
+            negativo.label('negativo'),
+            case((atipico, promedio), else_=None).label('promedio_atipico'),
+        ).where(
+            # Filas en negativo, la que devuelve el saldo a cero o más, y las salidas atípicas
+            or_(negativo, previo_negativo, atipico)
+        ).order_by(base.c.producto_id, base.c.almacen_id, base.c.fecha_documento, base.c.id)
+
+    def escanear(self, empresa_id=None, umbral_costo=None):
+        """
+        Recorre todos los movimientos (o los de una empresa) una sola vez.
+
+        Returns:
+            dict: {
+                'episodios_negativos': [{
+                    'producto_id', 'almacen_id', 'desde', 'saldo_minimo', 'movimientos',
+                    'movimiento_inicio_id', 'documento_inicio',
+                    'hasta', 'movimiento_fin_id', 'documento_fin'   # None si sigue en negativo
+                }],
+                'costos_atipicos': [{
+                    'movimiento_id', 'producto_id', 'almacen_id', 'fecha', 'documento',
+                    'costo_unitario', 'costo_promedio', 'desviacion'
+                }],
+            }
+        """
+        umbral_costo = self.UMBRAL_COSTO if umbral_costo is None else umbral_costo
+        episodios = []
+        atipicos = []
+        abierto = None
+
+        for fila in self.session.execute(self._consulta(empresa_id, umbral_costo)):
+            par = (fila.producto_id, fila.almacen_id)
+            if abierto is not None and abierto['par'] != par:
+                # El par anterior terminó en negativo
+                episodios.append(self._cerrar(abierto, None))
+                abierto = None
+
+            if fila.negativo:
+                if abierto is None:
+                    abierto = {'par': par, 'desde': fila.fecha_documento, 'saldo_minimo': fila.acumulado,
+                               'movimientos': 0, 'movimiento_inicio_id': fila.id,
+                               'documento_inicio': self._documento(fila)}
+                abierto['movimientos'] += 1
+                abierto['saldo_minimo'] = min(abierto['saldo_minimo'], fila.acumulado)
+            elif abierto is not None:
+                episodios.append(self._cerrar(abierto, fila))
+                abierto = None
+
+            if fila.promedio_atipico is not None:
+                atipicos.append({
+                    'movimiento_id': fila.id,
+                    'producto_id': fila.producto_id,
+                    'almacen_id': fila.almacen_id,
+                    'fecha': fila.fecha_documento,
+                    'documento': self._documento(fila),
+                    'costo_unitario': fila.costo_unitario,
+                    'costo_promedio': fila.promedio_atipico,
+                    'desviacion': (fila.costo_unitario - fila.promedio_atipico) / fila.promedio_atipico,
+                })
+
+        if abierto is not None:
+            episodios.append(self._cerrar(abierto, None))
+
+        return {'episodios_negativos': episodios, 'costos_atipicos': atipicos}
+
+    @staticmethod
+    def _cerrar(abierto, fila):
+        producto_id, almacen_id = abierto.pop('par')
+        return {
+            'producto_id': producto_id,
+            'almacen_id': almacen_id,
+            **abierto,
+            'hasta': fila.fecha_documento if fila else None,
+            'movimiento_fin_id': fila.id if fila else None,
+            'documento_fin': AnalizadorAnomaliasKardex._documento(fila) if fila else None,
+        }
+
+    @staticmethod
+    def _documento(fila):
+        tipo_documento = fila.tipo_documento.value if fila.tipo_documento else fila.tipo.value
+        return f"{tipo_documento} {fila.numero_documento or ''}".strip()
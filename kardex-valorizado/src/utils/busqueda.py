@@ -0,0 +1,192 @@
+"""
+Índices de búsqueda de texto de las tablas CRUD (productos, equipos, clientes, proveedores).
+Archivo: src/utils/busqueda.py
+
+Un LIKE '%texto%' no puede usar un índice B-tree y recorre la tabla en cada búsqueda. En su
+lugar cada tabla tiene un índice de trigramas, que encuentra una subcadena de 3 o más
+caracteres en cualquier posición:
+
+- SQLite: una tabla FTS5 <tabla>_busqueda (tokenizer trigram, rowid = id de la fila) con las
+  columnas de búsqueda ya plegadas, incluido el nombre de la categoría de los productos. La
+  mantienen triggers, así que también la actualizan las escrituras que no pasan por el ORM
+  (scripts, importaciones).
+- PostgreSQL: un índice GIN pg_trgm sobre la expresión plegada de las columnas de la tabla;
+  la categoría se busca aparte (son pocas filas).
+
+Plegar: minúsculas y sin tildes (Ñ -> n, Á -> a...), igual en SQL y en Python, para que
+"cañeria", "CANERÍA" y "caneria" encuentren lo mismo.
+
+Los índices se crean con create_all (evento after_create de Base.metadata, ver
+database_model) y con la migración de Alembic correspondiente.
+"""
+
+from sqlalchemy import func, literal_column, or_, select, text, table, column, Integer
+
+# Columnas de búsqueda de cada tabla
+COLUMNAS_BUSQUEDA = {
+    'productos': ('codigo', 'nombre'),
+    'equipos': ('codigo', 'codigo_unico', 'nombre', 'marca', 'modelo', 'serie'),
+    'clientes': ('numero_documento', 'razon_social', 'contacto'),
+    'proveedores': ('ruc', 'razon_social', 'contacto', 'email'),
+}
+
+# Columnas de otra tabla que también se buscan: columna del índice -> (tabla, clave foránea, columna)
+COLUMNAS_RELACIONADAS = {
+    'productos': {'categoria': ('categorias', 'categoria_id', 'nombre')},
+}
+
+CON_TILDE = 'áéíóúüñÁÉÍÓÚÜÑ'
+SIN_TILDE = 'aeiouunaeiouun'
+_PLIEGUE = str.maketrans(CON_TILDE, SIN_TILDE)
+
+# El tokenizer trigram solo indexa subcadenas de 3 caracteres o más
+MINIMO_TRIGRAMA = 3
+
+
+def plegar(texto):
+    """Texto en minúsculas y sin tildes."""
+    return (texto or '').translate(_PLIEGUE).lower()
+
+
+def plegar_sql(expresion):
+    """plegar() como expresión SQL (replace + lower, válida en SQLite y PostgreSQL)."""
+    for con, sin in zip(CON_TILDE, SIN_TILDE):
+        expresion = func.replace(expresion, con, sin)
+    return func.lower(expresion)
+
+
+def tabla_busqueda(tabla):
+    return f"{tabla}_busqueda"
+
+
+def es_tabla_busqueda(nombre):
+    """True para las tablas FTS5 de búsqueda y sus tablas internas (_data, _idx...)."""
+    return any(nombre == tabla_busqueda(t) or nombre.startswith(tabla_busqueda(t) + '_')
+               for t in COLUMNAS_BUSQUEDA)
+
+
+def _columnas_indice(tabla):
+    return COLUMNAS_BUSQUEDA[tabla] + tuple(COLUMNAS_RELACIONADAS.get(tabla, {}))
+
+
+def _plegar_sqlite(expresion):
+    for con, sin in zip(CON_TILDE, SIN_TILDE):
+        expresion = f"replace({expresion}, '{con}', '{sin}')"
+    return f"lower({expresion})"
+
+
+def _expresion_postgresql(tabla, prefijo=''):
+    """Expresión indexada en PostgreSQL: columnas unidas y plegadas (translate es inmutable)."""
+    unidas = " || ' ' || ".join(f"coalesce({prefijo}{c}, '')" for c in COLUMNAS_BUSQUEDA[tabla])
+    return f"translate(lower({unidas}), '{CON_TILDE}', '{SIN_TILDE}')"
+
+
+def _sentencias_sqlite(tabla):
+    fts = tabla_busqueda(tabla)
+    columnas = _columnas_indice(tabla)
+    relacionadas = COLUMNAS_RELACIONADAS.get(tabla, {})
+
+    def valores(fila):
+        propias = [_plegar_sqlite(f"{fila}.{c}") for c in COLUMNAS_BUSQUEDA[tabla]]
+        ajenas = [_plegar_sqlite(f"(SELECT {col} FROM {otra} WHERE id = {fila}.{clave})")
+                  for otra, clave, col in relacionadas.values()]
+        return ', '.join(propias + ajenas)
+
+    insertar = f"INSERT INTO {fts}(rowid, {', '.join(columnas)}) VALUES (new.id, {valores('new')});"
+    borrar = f"DELETE FROM {fts} WHERE rowid = old.id;"
+    vigiladas = ('id',) + COLUMNAS_BUSQUEDA[tabla] + tuple(clave for _, clave, _ in relacionadas.values())
+    sentencias = [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({', '.join(columnas)}, tokenize='trigram')",
+        f"INSERT INTO {fts}(rowid, {', '.join(columnas)}) SELECT id, {valores(tabla)} FROM {tabla}",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {tabla} BEGIN {insertar} END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {tabla} BEGIN {borrar} END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {', '.join(vigiladas)} ON {tabla} "
+        f"BEGIN {borrar} {insertar} END",
+    ]
+    # Al renombrar la fila relacionada (p. ej. una categoría) se actualizan sus filas
+    for nombre, (otra, clave, col) in relacionadas.items():
+        sentencias.append(
+            f"CREATE TRIGGER {fts}_{otra}_au AFTER UPDATE OF {col} ON {otra} BEGIN "
+            f"UPDATE {fts} SET {nombre} = {_plegar_sqlite(f'new.{col}')} "
+            f"WHERE rowid IN (SELECT id FROM {tabla} WHERE {clave} = new.id); END")
+    return sentencias
+
+
+def crear_indices_busqueda(conexion):
+    """
+    Crea los índices de búsqueda que falten y carga en ellos las filas existentes.
+    Se puede llamar de nuevo sin efecto (create_all lo hace en cada inicio).
+    """
+    dialecto = conexion.dialect.name
+    if dialecto == 'sqlite':
+        existentes = set(conexion.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table'").scalars())
+        for tabla in COLUMNAS_BUSQUEDA:
+            if tabla in existentes and tabla_busqueda(tabla) not in existentes:
+                for sentencia in _sentencias_sqlite(tabla):
+                    conexion.exec_driver_sql(sentencia)
+    elif dialecto == 'postgresql':
+        conexion.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for tabla in COLUMNAS_BUSQUEDA:
+            conexion.exec_driver_sql(
+                f"CREATE INDEX IF NOT EXISTS idx_{tabla}_busqueda_trgm ON {tabla} "
+                f"USING gin (({_expresion_postgresql(tabla)}) gin_trgm_ops)")
+
+
+def borrar_indices_busqueda(conexion):
+    dialecto = conexion.dialect.name
+    for tabla in COLUMNAS_BUSQUEDA:
+        fts = tabla_busqueda(tabla)
+        if dialecto == 'sqlite':
+            # Los triggers están en las tablas de origen: no se van con la tabla FTS
+            triggers = [f"{fts}_{sufijo}" for sufijo in ('ai', 'ad', 'au')]
+            triggers += [f"{fts}_{otra}_au" for otra, _, _ in COLUMNAS_RELACIONADAS.get(tabla, {}).values()]
+            for trigger in triggers:
+                conexion.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+            conexion.exec_driver_sql(f"DROP TABLE IF EXISTS {fts}")
+        elif dialecto == 'postgresql':
+            conexion.exec_driver_sql(f"DROP INDEX IF EXISTS idx_{tabla}_busqueda_trgm")
+
+
+def _patron_like(texto):
+    return '%' + texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def condicion_busqueda(query, modelo, texto):
+    """
+    Condición "alguna columna de búsqueda de `modelo` contiene `texto`", resuelta con el
+    índice de búsqueda del motor de la consulta, sin distinguir mayúsculas ni tildes.
+
+    En SQLite un texto de menos de 3 caracteres no puede usar el índice: se busca con ILIKE
+    sobre las columnas (recorre la tabla, sin plegar tildes), como antes del índice.
+
+    Args:
+        query: Query ORM a filtrar (de su sesión se toma el motor).
+        modelo: clase del modelo; su tabla debe estar en COLUMNAS_BUSQUEDA.
+    """
+    tabla = modelo.__tablename__
+    texto = texto.strip()
+    plegado = plegar(texto)
+    dialecto = query.session.get_bind().dialect.name
+
+    if dialecto == 'sqlite' and len(plegado) >= MINIMO_TRIGRAMA:
+        fts = tabla_busqueda(tabla)
+        # Frase entre comillas: la subcadena exacta, con sus espacios y signos
+        coincidencias = text(f"SELECT rowid FROM {fts} WHERE {fts} MATCH :frase").bindparams(
+            frase='"' + plegado.replace('"', '""') + '"')
+        return modelo.id.in_(coincidencias.columns(column('rowid', Integer)))
+
+    if dialecto == 'postgresql':
+        patron = _patron_like(plegado)
+        condiciones = [literal_column(_expresion_postgresql(tabla, f"{tabla}.")).like(patron, escape='\\')]
+        comparar = lambda expresion: plegar_sql(expresion).like(patron, escape='\\')
+    else:
+        patron = _patron_like(texto)
+        comparar = lambda expresion: expresion.ilike(patron, escape='\\')
+        condiciones = [comparar(getattr(modelo, c)) for c in COLUMNAS_BUSQUEDA[tabla]]
+
+    for otra, clave, col in COLUMNAS_RELACIONADAS.get(tabla, {}).values():
+        relacionada = table(otra, column('id'), column(col))
+        condiciones.append(getattr(modelo, clave).in_(
+            select(relacionada.c.id).where(comparar(relacionada.c[col]))))
+    return or_(*condiciones)
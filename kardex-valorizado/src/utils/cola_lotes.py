@@ -0,0 +1,76 @@
+"""
+Cola de lotes abiertos para la valuación PEPS (FIFO) y UEPS (LIFO).
+Archivo: src/utils/cola_lotes.py
+
+Los lotes se guardan en un deque y los saldos de cantidad y valor se llevan
+acumulados, de modo que cada movimiento cuesta O(1) amortizado: una entrada
+agrega un lote y una salida solo toca los lotes que consume.
+"""
+
+from collections import deque
+from decimal import Decimal
+from models.database_model import MetodoValuacion
+
+
+class ColaLotes:
+    """
+    Lotes abiertos de un producto con saldos acumulados.
+    PEPS consume desde el lote más antiguo; UEPS desde el más reciente.
+    """
+
+    def __init__(self, metodo=MetodoValuacion.PEPS):
+        self.ueps = metodo == MetodoValuacion.UEPS
+        self._lotes = deque()  # [cantidad, costo_unitario, referencia]
+        self.cantidad = Decimal('0')
+        self.valor = Decimal('0')
+
+    def agregar(self, cantidad, costo_unitario, referencia=None):
+        """Agrega un lote (entrada). `referencia` identifica el movimiento que lo originó."""
+        cantidad = Decimal(str(cantidad))
+        costo_unitario = Decimal(str(costo_unitario))
+        self._lotes.append([cantidad, costo_unitario, referencia])
+        self.cantidad += cantidad
+        self.valor += cantidad * costo_unitario
+
+    def consumir(self, cantidad):
+        """
+        Retira `cantidad` de los lotes en el orden del método.
+        Si no alcanza, consume lo disponible: la parte faltante no tiene costo.
+
+        Returns:
+            Decimal: Costo total de lo retirado.
+        """
+        pendiente = Decimal(str(cantidad))
+        costo_total = Decimal('0')
+
+        while pendiente > 0 and self._lotes:
+            lote = self._lotes[-1] if self.ueps else self._lotes[0]
+            tomar = min(pendiente, lote[0])
+            costo = tomar * lote[1]
+
+            costo_total += costo
+            self.cantidad -= tomar
+            self.valor -= costo
+            lote[0] -= tomar
+            pendiente -= tomar
+
+            if lote[0] == 0:
+                if self.ueps:
+                    self._lotes.pop()
+                else:
+                    self._lotes.popleft()
+
+        if not self._lotes:
+            # Sin lotes el saldo es exactamente cero
+            self.cantidad = Decimal('0')
+            self.valor = Decimal('0')
+
+        return costo_total
+
+    def __len__(self):
+        return len(self._lotes)
+
+    def __iter__(self):
+        """Recorre los lotes abiertos del más antiguo al más reciente: (referencia, cantidad, costo_unitario)."""
+        for cantidad, costo_unitario, referencia in self._lotes:
+            yield referencia, cantidad, costo_unitario
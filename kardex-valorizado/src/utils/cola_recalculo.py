@@ -0,0 +1,109 @@
+"""
+Cola persistente de recálculos pendientes del Kardex.
+Archivo: src/utils/cola_recalculo.py
+
+Guardar una compra, venta, requisición o ajuste solo registra aquí el rango afectado
+(producto, almacén, fechas más antigua y más reciente) en la misma transacción del documento; el recálculo
+lo hace después RecalculoScheduler, una vez por par aunque se hayan editado varios documentos.
+Quien necesite costos exactos de un par puede forzarlo con
+KardexManager.procesar_recalculos_pendientes(pares).
+"""
+
+from sqlalchemy import select, delete, case
+from models.database_model import RecalculoPendiente
+
+
+class ColaRecalculo:
+    def __init__(self, session):
+        self.session = session
+
+    def encolar(self, pares, fecha_desde, fecha_hasta=None):
+        """
+        Registra los pares (producto, almacén) como pendientes desde fecha_desde. Si un par ya
+        estaba pendiente se conserva la fecha más antigua, se extiende fecha_hasta a la más
+        reciente y se incrementa su versión.
+
+        Args:
+            fecha_hasta: última fecha con movimientos modificados (por defecto fecha_desde).
+        """
+        fecha_hasta = max(fecha_desde, fecha_hasta or fecha_desde)
+        filas = [
+            {'producto_id': prod_id, 'almacen_id': alm_id, 'fecha_desde': fecha_desde,
+             'fecha_hasta': fecha_hasta, 'version': 1}
+            for prod_id, alm_id in pares
+        ]
+        if not filas:
+            return
+
+        # INSERT ... ON CONFLICT: dos ediciones simultáneas del mismo par no chocan por la clave
+        if self.session.get_bind().dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        tabla = RecalculoPendiente.__table__
+        sentencia = insert(tabla)
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=[tabla.c.producto_id, tabla.c.almacen_id],
+            set_={
+                'fecha_desde': case(
+                    (sentencia.excluded.fecha_desde < tabla.c.fecha_desde, sentencia.excluded.fecha_desde),
+                    else_=tabla.c.fecha_desde
+                ),
+                # Vacía (entrada antigua) sigue vacía: sin detención anticipada
+                'fecha_hasta': case(
+                    (tabla.c.fecha_hasta.is_(None), None),
+                    (sentencia.excluded.fecha_hasta > tabla.c.fecha_hasta, sentencia.excluded.fecha_hasta),
+                    else_=tabla.c.fecha_hasta
+                ),
+                'version': tabla.c.version + 1,
+                'fecha_encolado': sentencia.excluded.fecha_encolado,
+            }
+        )
+        self.session.execute(sentencia, filas)
+
+    def pendientes(self, pares=None):
+        """
+        Entradas pendientes (producto_id, almacen_id, fecha_desde, fecha_hasta, version), todas o solo las de
+        `pares`, en el orden en que se registraron.
+        """
+        if pares is not None:
+            entradas = []
+            for prod_id, alm_id in pares:
+                entrada = self.session.execute(
+                    self._consulta().where(
+                        RecalculoPendiente.producto_id == prod_id,
+                        RecalculoPendiente.almacen_id == alm_id
+                    )
+                ).first()
+                if entrada:
+                    entradas.append(entrada)
+            return entradas
+
+        return self.session.execute(
+            self._consulta().order_by(RecalculoPendiente.fecha_encolado)
+        ).all()
+
+    def descartar(self, entrada):
+        """
+        Elimina la entrada ya recalculada, salvo que se haya vuelto a registrar mientras tanto
+        (otra versión): en ese caso queda pendiente para la siguiente pasada.
+        """
+        self.session.execute(
+            delete(RecalculoPendiente).where(
+                RecalculoPendiente.producto_id == entrada.producto_id,
+                RecalculoPendiente.almacen_id == entrada.almacen_id,
+                RecalculoPendiente.version == entrada.version
+            )
+        )
+
+    def vaciar(self):
+        """Descarta todas las entradas (tras un recálculo global que las cubre)."""
+        self.session.execute(delete(RecalculoPendiente))
+
+    @staticmethod
+    def _consulta():
+        return select(
+            RecalculoPendiente.producto_id, RecalculoPendiente.almacen_id,
+            RecalculoPendiente.fecha_desde, RecalculoPendiente.fecha_hasta, RecalculoPendiente.version
+        )
@@ -4,22 +4,62 @@ Archivo: src/utils/compras_manager.py
 """
 
 
+from collections import Counter
 from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from models.database_model import (
-    Compra, CompraDetalle, Producto, Almacen, MovimientoStock,
+    Compra, CompraDetalle, Producto, Almacen,
     TipoMovimiento, TipoDocumento, Moneda, Proveedor
 )
 from config.settings import IGV_FACTOR, IGV_PORCENTAJE
 from utils.kardex_manager import KardexManager
+from utils.cola_recalculo import ColaRecalculo
 from utils.validation import verificar_estado_anio, AnioCerradoError
 
 from utils.transaction import transaction
 
 class ComprasManager:
+
+    # Al editar, las líneas que conservan producto y almacén en un periodo abierto se corrigen
+    # en su propio movimiento (con auditoría) en lugar de agregar reversiones
+    EDICION_EN_SITIO = True
+
+    # Tipos de movimiento que una compra y sus ediciones registran con el número del documento
+    TIPOS_KARDEX = (TipoMovimiento.COMPRA, TipoMovimiento.DEVOLUCION_COMPRA,
+                    TipoMovimiento.AJUSTE_POSITIVO, TipoMovimiento.AJUSTE_NEGATIVO)
+
     def __init__(self, session: Session):
         self.session = session
         self.kardex_manager = KardexManager(session)
+        self.cola_recalculo = ColaRecalculo(session)
+
+    def _movimientos_originales(self, tipo_documento, numero_documento, detalles_originales):
+        """
+        Movimientos del documento, en una sola consulta.
+
+        Returns:
+            tuple: ({(producto_id, almacen_id): [movimientos COMPRA en orden de id]}, pares
+                   corregibles en sitio). Cada detalle que se revierte toma el último de su par
+                   con pop(). Un par se corrige en sitio si sus filas del documento son solo las
+                   originales, una por detalle: sin reversiones ni ajustes de ediciones anteriores.
+        """
+        por_par = self.kardex_manager.movimientos_documento(self.TIPOS_KARDEX, tipo_documento, numero_documento)
+        lineas = Counter((det.producto_id, det.almacen_id) for det in detalles_originales)
+        originales = {
+            par: [mov for mov in movs if mov.tipo == TipoMovimiento.COMPRA] for par, movs in por_par.items()
+        }
+        en_sitio = {
+            par for par, movs in por_par.items()
+            if len(movs) == lineas[par] and all(mov.tipo == TipoMovimiento.COMPRA for mov in movs)
+        }
+        return originales, en_sitio
+
+    def _empresas_de_almacenes(self, almacen_ids):
+        """{almacen_id: empresa_id} de los almacenes indicados, en una consulta."""
+        return dict(self.session.execute(
+            select(Almacen.id, Almacen.empresa_id).where(Almacen.id.in_(set(almacen_ids)))
+        ).all())
 
     def calcular_totales(self, detalles, incluye_igv, costo_adicional=0):
         """
@@ -51,9 +91,10 @@ class ComprasManager:
 
         return subtotal_general_sin_igv, igv, total, subtotal_productos, costo_adicional_dec
 
-    def guardar_compra(self, datos_cabecera, detalles, compra_id=None):
+    def guardar_compra(self, datos_cabecera, detalles, compra_id=None, usuario_id=None):
         """
         Crea o actualiza una compra, sus detalles y movimientos de kardex.
+        usuario_id: usuario al que se atribuyen las correcciones en sitio en la auditoría.
         """
         # Validaciones previas
         fecha_contable = datos_cabecera['fecha_registro_contable']
@@ -70,17 +111,27 @@ class ComprasManager:
                 # Capturar valores originales para anulación de Kardex
                 orig_tipo_doc = compra.tipo_documento
                 orig_num_doc = compra.numero_documento
+                orig_fecha = compra.fecha
 
                 for key, value in datos_cabecera.items():
                     if hasattr(compra, key):
                         setattr(compra, key, value)
 
                 detalles_originales_obj = self.session.query(CompraDetalle).filter_by(compra_id=compra.id).all()
+                # Movimientos a revertir de todas las líneas, con los valores originales del documento
+                movimientos_originales, pares_en_sitio = self._movimientos_originales(
+                    orig_tipo_doc, orig_num_doc, detalles_originales_obj
+                )
+                # En sitio solo si el documento estaba y sigue en un periodo abierto
+                if not (self.EDICION_EN_SITIO and self.kardex_manager.fecha_editable(orig_fecha)
+                        and self.kardex_manager.fecha_editable(compra.fecha)):
+                    pares_en_sitio = set()
             else:
                 compra = Compra(**datos_cabecera)
                 self.session.add(compra)
                 self.session.flush()
                 detalles_originales_obj = []
+                movimientos_originales, pares_en_sitio = {}, set()
 
             ids_detalles_ui = {det.get('detalle_original_id') for det in detalles if det.get('detalle_original_id')}
             ids_detalles_originales = {det.id for det in detalles_originales_obj}
@@ -89,6 +140,9 @@ class ComprasManager:
             detalles_a_anadir = [det for det in detalles if not det.get('detalle_original_id')]
             detalles_a_modificar = [det for det in detalles if det.get('detalle_original_id') in ids_detalles_originales]
 
+            detalles_originales = {det.id: det for det in detalles_originales_obj}
+            empresas = self._empresas_de_almacenes(det['almacen_id'] for det in detalles)
+
             producto_almacen_afectados = set()
             movimientos_kardex = []
 
@@ -108,26 +162,27 @@ class ComprasManager:
             # A. Eliminar detalles
             if es_edicion and detalles_a_eliminar_ids:
                 for detalle_id in detalles_a_eliminar_ids:
-                    detalle_obj = self.session.get(CompraDetalle, detalle_id)
+                    detalle_obj = detalles_originales.get(detalle_id)
                     if detalle_obj:
-                        producto_almacen_afectados.add((detalle_obj.producto_id, detalle_obj.almacen_id))
-                        # Usar valores originales para encontrar el movimiento a revertir
-                        mov_original = self.session.query(MovimientoStock).filter_by(
-                            tipo=TipoMovimiento.COMPRA,
-                            tipo_documento=orig_tipo_doc,
-                            numero_documento=orig_num_doc,
-                            producto_id=detalle_obj.producto_id, almacen_id=detalle_obj.almacen_id,
-                        ).order_by(MovimientoStock.id.desc()).first()
-
-                        if mov_original:
-                            ajuste_salida = MovimientoStock(
+                        par_original = (detalle_obj.producto_id, detalle_obj.almacen_id)
+                        producto_almacen_afectados.add(par_original)
+                        movs_par = movimientos_originales.get(par_original)
+                        mov_original = movs_par.pop() if movs_par else None
+
+                        if mov_original and par_original in pares_en_sitio:
+                            self.kardex_manager.eliminar_movimiento(
+                                mov_original, usuario_id,
+                                f"Edición de compra ID {compra.id} (Detalle ID {detalle_id} eliminado)"
+                            )
+                        elif mov_original:
+                            ajuste_salida = dict(
                                 empresa_id=mov_original.empresa_id, producto_id=mov_original.producto_id, almacen_id=mov_original.almacen_id,
                                 tipo=TipoMovimiento.DEVOLUCION_COMPRA,
                                 tipo_documento=compra.tipo_documento, numero_documento=compra.numero_documento,
                                 fecha_documento=compra.fecha, proveedor_id=compra.proveedor_id,
                                 cantidad_entrada=0, cantidad_salida=mov_original.cantidad_entrada,
                                 costo_unitario=mov_original.costo_unitario, costo_total=mov_original.costo_total,
-                                saldo_cantidad=0, saldo_costo_total=0, moneda=compra.moneda, tipo_cambio=float(compra.tipo_cambio),
+                                moneda=compra.moneda, tipo_cambio=float(compra.tipo_cambio),
                                 observaciones=f"Ajuste por edición de compra ID {compra.id} (Detalle ID {detalle_id} eliminado)"
                             )
                             movimientos_kardex.append(ajuste_salida)
@@ -170,16 +225,15 @@ class ComprasManager:
                 self.session.add(nuevo_detalle)
                 producto_almacen_afectados.add((det_ui['producto_id'], det_ui['almacen_id']))
 
-                almacen = self.session.get(Almacen, det_ui['almacen_id'])
-                if almacen:
-                    nuevo_movimiento = MovimientoStock(
-                        empresa_id=almacen.empresa_id, producto_id=det_ui['producto_id'], almacen_id=det_ui['almacen_id'],
+                empresa_id = empresas.get(det_ui['almacen_id'])
+                if empresa_id is not None:
+                    nuevo_movimiento = dict(
+                        empresa_id=empresa_id, producto_id=det_ui['producto_id'], almacen_id=det_ui['almacen_id'],
                         tipo=TipoMovimiento.COMPRA,
                         tipo_documento=compra.tipo_documento, numero_documento=compra.numero_documento,
                         fecha_documento=compra.fecha, proveedor_id=compra.proveedor_id,
                         cantidad_entrada=cant_dec, cantidad_salida=0,
                         costo_unitario=float(c_unit_final), costo_total=float(subtotal_final),
-                        saldo_cantidad=0, saldo_costo_total=0,
                         moneda=compra.moneda, tipo_cambio=float(compra.tipo_cambio),
                         observaciones=f"Registro por {'edición (añadido)' if es_edicion else 'nueva compra'} ID {compra.id}"
                     )
@@ -188,7 +242,7 @@ class ComprasManager:
             # C. Modificar detalles existentes
             if es_edicion:
                 for det_ui in detalles_a_modificar:
-                    detalle_obj = self.session.get(CompraDetalle, det_ui['detalle_original_id'])
+                    detalle_obj = detalles_originales.get(det_ui['detalle_original_id'])
                     if not detalle_obj: continue
 
                     producto_id_original = detalle_obj.producto_id
@@ -211,49 +265,57 @@ class ComprasManager:
                     # Si cambió producto o almacén, hay que revertir el anterior y crear uno nuevo
                     if (producto_id_original != detalle_obj.producto_id or almacen_id_original != detalle_obj.almacen_id):
                         # Revertir original usando valores originales
-                        mov_original = self.session.query(MovimientoStock).filter_by(
-                            tipo=TipoMovimiento.COMPRA,
-                            tipo_documento=orig_tipo_doc,
-                            numero_documento=orig_num_doc,
-                            producto_id=producto_id_original, almacen_id=almacen_id_original
-                        ).order_by(MovimientoStock.id.desc()).first()
+                        movs_par = movimientos_originales.get((producto_id_original, almacen_id_original))
+                        mov_original = movs_par.pop() if movs_par else None
 
                         if mov_original:
-                            ajuste_salida = MovimientoStock(
+                            ajuste_salida = dict(
                                 empresa_id=mov_original.empresa_id, producto_id=producto_id_original, almacen_id=almacen_id_original,
                                 tipo=TipoMovimiento.DEVOLUCION_COMPRA,
                                 tipo_documento=compra.tipo_documento, numero_documento=compra.numero_documento,
                                 fecha_documento=compra.fecha, proveedor_id=compra.proveedor_id,
                                 cantidad_entrada=0, cantidad_salida=mov_original.cantidad_entrada,
                                 costo_unitario=mov_original.costo_unitario, costo_total=mov_original.costo_total,
-                                saldo_cantidad=0, saldo_costo_total=0, moneda=compra.moneda, tipo_cambio=float(compra.tipo_cambio),
+                                moneda=compra.moneda, tipo_cambio=float(compra.tipo_cambio),
                                 observaciones=f"Ajuste (salida) por cambio Prod/Alm en edición Compra ID {compra.id}"
                             )
                             movimientos_kardex.append(ajuste_salida)
 
                         # Crear nuevo
-                        almacen_nuevo = self.session.get(Almacen, detalle_obj.almacen_id)
-                        if almacen_nuevo:
-                            ajuste_entrada = MovimientoStock(
-                                empresa_id=almacen_nuevo.empresa_id, producto_id=detalle_obj.producto_id, almacen_id=detalle_obj.almacen_id,
+                        empresa_id = empresas.get(detalle_obj.almacen_id)
+                        if empresa_id is not None:
+                            ajuste_entrada = dict(
+                                empresa_id=empresa_id, producto_id=detalle_obj.producto_id, almacen_id=detalle_obj.almacen_id,
                                 tipo=TipoMovimiento.COMPRA,
                                 tipo_documento=compra.tipo_documento, numero_documento=compra.numero_documento,
                                 fecha_documento=compra.fecha, proveedor_id=compra.proveedor_id,
                                 cantidad_entrada=cant_dec, cantidad_salida=0,
                                 costo_unitario=float(c_unit_final), costo_total=float(subtotal_final),
-                                saldo_cantidad=0, saldo_costo_total=0, moneda=compra.moneda, tipo_cambio=float(compra.tipo_cambio),
+                                moneda=compra.moneda, tipo_cambio=float(compra.tipo_cambio),
                                 observaciones=f"Ajuste (entrada) por cambio Prod/Alm en edición Compra ID {compra.id}"
                             )
                             movimientos_kardex.append(ajuste_entrada)
 
+                    elif (producto_id_original, almacen_id_original) in pares_en_sitio:
+                        # Mismo producto y almacén en un periodo abierto: se corrige el movimiento original
+                        mov_original = movimientos_originales[(producto_id_original, almacen_id_original)].pop()
+                        self.kardex_manager.corregir_movimiento(
+                            mov_original, usuario_id, f"Edición de compra ID {compra.id} (Detalle ID {detalle_obj.id})",
+                            tipo_documento=compra.tipo_documento, numero_documento=compra.numero_documento,
+                            fecha_documento=compra.fecha, proveedor_id=compra.proveedor_id,
+                            cantidad_entrada=float(cant_dec),
+                            costo_unitario=float(c_unit_final), costo_total=float(subtotal_final),
+                            moneda=compra.moneda, tipo_cambio=float(compra.tipo_cambio),
+                        )
+
                     else:
                         # Ajuste por diferencia
                         dif_cantidad = cant_dec - cantidad_original
                         dif_costo = subtotal_final - costo_total_original
 
                         if dif_cantidad != 0 or dif_costo != 0:
-                            almacen = self.session.get(Almacen, detalle_obj.almacen_id)
-                            if almacen:
+                            empresa_id = empresas.get(detalle_obj.almacen_id)
+                            if empresa_id is not None:
                                 tipo_ajuste = TipoMovimiento.AJUSTE_POSITIVO if dif_cantidad >= 0 else TipoMovimiento.AJUSTE_NEGATIVO
                                 cant_ent = max(Decimal('0'), dif_cantidad)
                                 cant_sal = max(Decimal('0'), -dif_cantidad)
@@ -271,26 +333,28 @@ class ComprasManager:
                                 # Pero el Kardex necesita entradas/salidas claras.
                                 # Para simplificar en Manager, replicamos la lógica original:
 
-                                ajuste_mov = MovimientoStock(
-                                    empresa_id=almacen.empresa_id, producto_id=detalle_obj.producto_id, almacen_id=detalle_obj.almacen_id,
+                                ajuste_mov = dict(
+                                    empresa_id=empresa_id, producto_id=detalle_obj.producto_id, almacen_id=detalle_obj.almacen_id,
                                     tipo=tipo_ajuste,
                                     tipo_documento=compra.tipo_documento, numero_documento=compra.numero_documento,
                                     fecha_documento=compra.fecha, proveedor_id=compra.proveedor_id,
                                     cantidad_entrada=cant_ent, cantidad_salida=cant_sal,
                                     costo_unitario=float(abs(dif_costo / dif_cantidad)) if dif_cantidad != 0 else 0,
                                     costo_total=float(dif_costo), # Puede ser negativo si bajó el precio y cantidad igual
-                                    saldo_cantidad=0, saldo_costo_total=0,
                                     moneda=compra.moneda, tipo_cambio=float(compra.tipo_cambio),
                                     observaciones=f"Ajuste por edición Compra ID {compra.id} (Detalle ID {detalle_obj.id})"
                                 )
                                 movimientos_kardex.append(ajuste_mov)
 
-            for mov in movimientos_kardex:
-                self.session.add(mov)
+            # Saldos encadenados entre las líneas del documento, en una sola inserción
+            self.kardex_manager.registrar_movimientos(movimientos_kardex)
 
-            if producto_almacen_afectados:
+            if es_edicion and producto_almacen_afectados:
+                # Las anulaciones y los cambios de fecha alteran los saldos posteriores: el
+                # recálculo se hace en segundo plano desde la fecha más antigua afectada
                 self.session.flush()
-                self.kardex_manager.recalcular_kardex_posterior(producto_almacen_afectados, compra.fecha)
+                self.cola_recalculo.encolar(producto_almacen_afectados, min(orig_fecha, compra.fecha),
+                                            max(orig_fecha, compra.fecha))
 
             return compra
 
@@ -307,23 +371,22 @@ class ComprasManager:
 
             producto_almacen_afectados = set()
             fecha_compra = compra.fecha
-            tipo_doc = compra.tipo_documento
-            num_doc = compra.numero_documento
 
             detalles = self.session.query(CompraDetalle).filter_by(compra_id=compra.id).all()
+            movimientos_originales, _ = self._movimientos_originales(
+                compra.tipo_documento, compra.numero_documento, detalles
+            )
             for det in detalles:
-                producto_almacen_afectados.add((det.producto_id, det.almacen_id))
-
-                mov_original = self.session.query(MovimientoStock).filter_by(
-                    tipo=TipoMovimiento.COMPRA,
-                    tipo_documento=tipo_doc,
-                    numero_documento=num_doc,
-                    producto_id=det.producto_id,
-                    almacen_id=det.almacen_id
-                ).first()
+                par = (det.producto_id, det.almacen_id)
+                producto_almacen_afectados.add(par)
 
+                movs_par = movimientos_originales.get(par)
+                mov_original = movs_par.pop() if movs_par else None
                 if mov_original:
-                    self.session.delete(mov_original)
+                    # También elimina su capa de costo: no debe consumirse antes del recálculo
+                    self.kardex_manager.eliminar_movimiento(
+                        mov_original, motivo=f"Eliminación de compra ID {compra.id}"
+                    )
 
                 self.session.delete(det)
 
@@ -331,4 +394,4 @@ class ComprasManager:
             self.session.flush()
 
             if producto_almacen_afectados:
-                self.kardex_manager.recalcular_kardex_posterior(producto_almacen_afectados, fecha_compra)
+                self.cola_recalculo.encolar(producto_almacen_afectados, fecha_compra)
@@ -2,13 +2,22 @@ import json
 import os
 from pathlib import Path
 
+try:
+    # .env es opcional: sus variables (DB_URL) prevalecen sobre config.json
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
 class Config:
     CONFIG_FILE = "config.json"
     
     # Default settings
     DEFAULT_CONFIG = {
         "DB_URL": "sqlite:///kardex.db",
-        "MEDIA_ROOT": "user_data/media"
+        "MEDIA_ROOT": "user_data/media",
+        "PROCESOS_REGENERACION": 0,  # 0 = según CPUs disponibles
+        "INTERVALO_RECALCULO_SEGUNDOS": 5
     }
     
     _config = None
@@ -50,7 +59,7 @@ class Config:
 
     @classmethod
     def get_db_url(cls):
-        return cls.get("DB_URL")
+        return os.environ.get("DB_URL") or cls.get("DB_URL")
 
     @classmethod
     def get_media_root(cls):
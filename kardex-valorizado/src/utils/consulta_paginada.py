@@ -0,0 +1,131 @@
+"""
+Lectura paginada de las tablas de BaseCRUDView.
+Archivo: src/utils/consulta_paginada.py
+
+La consulta de la ventana (con su búsqueda y sus filtros, aplicados en la base) se lee por
+páginas con keyset sobre su orden: cada página continúa después de la última fila de la
+anterior, sin OFFSET, y se desempata por id. El total sale de un COUNT aparte, que la vista
+pide en otro hilo. No depende de Qt: el modelo (CrudTableModel) pide las páginas desde un
+hilo de trabajo, como LectorKardex.
+"""
+
+from sqlalchemy import func, or_, and_, false
+from sqlalchemy.sql import operators
+from models.database_model import obtener_session_lectura
+from utils.sesiones import congelar
+
+
+def columna_de_orden(expresion):
+    """(columna, descendente) de un elemento del orden: Modelo.campo o Modelo.campo.desc()."""
+    modificador = getattr(expresion, 'modifier', None)
+    if modificador in (operators.desc_op, operators.asc_op):
+        return expresion.element, modificador is operators.desc_op
+    return expresion, False
+
+
+class LectorPaginado:
+    """
+    Filas de una consulta ORM leídas por páginas, congeladas (FilaSoloLectura).
+    Usa su propia sesión de solo lectura (por defecto); las páginas se piden de una en una.
+    """
+
+    TAMANIO_PAGINA = 200
+
+    def __init__(self, consulta, id_columna, orden=(), tamanio_pagina=None, session=None):
+        """
+        Args:
+            consulta: select ORM de la tabla, ya filtrado y sin ORDER BY (Query.statement).
+            id_columna: clave única que desempata el orden (p. ej. Producto.id).
+            orden: columnas del modelo, ascendentes o con .desc(). Si no incluye la clave, se
+                agrega al final ascendente; incluirla con .desc() deja recorrer un índice
+                descendente sin reordenar (p. ej. fecha.desc(), id.desc()).
+        """
+        self._sesion_propia = session is None
+        self.session = session or obtener_session_lectura()
+        self.consulta = consulta
+        self.columnas = [columna_de_orden(expresion) for expresion in orden]
+        if not any(columna is id_columna for columna, _ in self.columnas):
+            self.columnas.append((id_columna, False))
+        self.tamanio_pagina = tamanio_pagina or self.TAMANIO_PAGINA
+        self.posicion = None
+        self.agotado = False
+
+    def _orden(self):
+        orden = []
+        for columna, descendente in self.columnas:
+            if columna.expression.nullable:
+                # Los vacíos al final en cualquier motor (SQLite y PostgreSQL difieren)
+                orden.append(columna.is_(None))
+            orden.append(columna.desc() if descendente else columna)
+        return orden
+
+    def _despues_de(self, posicion):
+        """Condición de las filas que van después de `posicion` en el orden."""
+        condiciones = []
+        iguales = []
+        for (columna, descendente), valor in zip(self.columnas, posicion):
+            if valor is None:
+                # Los vacíos van al final: después de uno solo hay otros vacíos
+                mayor, igual = false(), columna.is_(None)
+            else:
+                mayor = columna < valor if descendente else columna > valor
+                if columna.expression.nullable:
+                    mayor = or_(mayor, columna.is_(None))
+                igual = columna == valor
+            condiciones.append(and_(*iguales, mayor))
+            iguales.append(igual)
+        return or_(*condiciones)
+
+    def siguiente_pagina(self):
+        """
+        Lee la página que sigue a la última leída.
+
+        Returns:
+            list: FilaSoloLectura de la página; vacía al terminar.
+        """
+        if self.agotado:
+            return []
+
+        consulta = self.consulta
+        if self.posicion is not None:
+            consulta = consulta.where(self._despues_de(self.posicion))
+        try:
+            filas = self.session.execute(
+                consulta.order_by(*self._orden()).limit(self.tamanio_pagina)
+            ).unique().scalars().all()
+            pagina = congelar(filas)
+        finally:
+            self._terminar_lectura()
+
+        if len(pagina) < self.tamanio_pagina:
+            self.agotado = True
+        if pagina:
+            ultima = pagina[-1]
+            self.posicion = tuple(getattr(ultima, columna.key) for columna, _ in self.columnas)
+        return pagina
+
+    def contar(self, session=None):
+        """
+        Total de filas de la consulta, en un solo COUNT. Por defecto usa una sesión aparte,
+        para pedirse desde otro hilo mientras se leen las páginas.
+        """
+        propia = session is None
+        session = session or obtener_session_lectura()
+        try:
+            # Solo las tablas de la consulta y sus filtros: sin las cargas de relaciones (joinedload)
+            return session.execute(
+                self.consulta.with_only_columns(func.count(), maintain_column_froms=True).order_by(None)
+            ).scalar()
+        finally:
+            if propia:
+                session.close()
+
+    def _terminar_lectura(self):
+        # Entre página y página no se retiene la transacción de lectura; la de una sesión
+        # recibida es de quien llama (puede tener cambios pendientes) y no se toca
+        if self._sesion_propia:
+            self.session.commit()
+
+    def cerrar(self):
+        if self._sesion_propia:
+            self.session.close()
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session
-from models.database_model import obtener_session
+from models.database_model import obtener_session, obtener_session_lectura
 from services.inventory_service import InventoryService
 from services.audit_service import AuditService
 
@@ -11,6 +11,7 @@ class ServiceContainer:
     
     def __init__(self):
         self._session = None
+        self._session_lectura = None
         self._inventory_service = None
         self._audit_service = None
 
@@ -21,10 +22,17 @@ class ServiceContainer:
             self._session = obtener_session()
         return self._session
 
+    @property
+    def session_lectura(self) -> Session:
+        """Obtiene o crea la sesión de solo lectura de este ámbito, para reportes."""
+        if self._session_lectura is None:
+            self._session_lectura = obtener_session_lectura()
+        return self._session_lectura
+
     def get_inventory_service(self) -> InventoryService:
         """Retorna una instancia de InventoryService."""
         if self._inventory_service is None:
-            self._inventory_service = InventoryService(self.session)
+            self._inventory_service = InventoryService(self.session, self.session_lectura)
         return self._inventory_service
 
     def get_audit_service(self) -> AuditService:
@@ -32,10 +40,13 @@ class ServiceContainer:
         return AuditService
 
     def close_session(self):
-        """Cierra la sesión de base de datos si está abierta."""
+        """Cierra las sesiones de base de datos abiertas."""
         if self._session:
             self._session.close()
             self._session = None
+        if self._session_lectura:
+            self._session_lectura.close()
+            self._session_lectura = None
 
     def __enter__(self):
         return self
@@ -0,0 +1,174 @@
+"""
+Fusión de los pares de reversión que dejaron las ediciones de compras y ventas.
+Archivo: src/utils/fusion_reversiones.py
+
+Antes de la corrección en sitio (ComprasManager/VentasManager.EDICION_EN_SITIO), cada
+edición de un documento agregaba una reversión (DEVOLUCION_COMPRA, DEVOLUCION_VENTA) o un
+ajuste por diferencia, más el movimiento nuevo. Aquí, por cada documento y (producto,
+almacén), esas filas se fusionan en el movimiento original con la cantidad y el valor netos, y
+las demás se eliminan; ambos cambios quedan en la auditoría. Solo se tocan los movimientos
+de periodos abiertos (KardexManager.fecha_editable) y los pares fusionados se encolan para
+recálculo desde su fecha más antigua.
+"""
+
+from sqlalchemy import select
+from models.database_model import MovimientoStock, TipoMovimiento
+from utils.kardex_manager import KardexManager
+from utils.cola_recalculo import ColaRecalculo
+from utils.transaction import transaction
+
+
+class FusionReversiones:
+
+    # Cantidades menores se consideran cero (redondeo)
+    TOLERANCIA = 0.000001
+
+    COMPRAS = 'compras'
+    VENTAS = 'ventas'
+
+    # Por familia de documento: tipo del movimiento original, tipos que registra el documento
+    # con su número, tipos de sus ediciones y texto de sus observaciones
+    FAMILIAS = {
+        COMPRAS: (TipoMovimiento.COMPRA,
+                  (TipoMovimiento.COMPRA, TipoMovimiento.DEVOLUCION_COMPRA,
+                   TipoMovimiento.AJUSTE_POSITIVO, TipoMovimiento.AJUSTE_NEGATIVO),
+                  (TipoMovimiento.DEVOLUCION_COMPRA, TipoMovimiento.AJUSTE_POSITIVO, TipoMovimiento.AJUSTE_NEGATIVO),
+                  '%edición%compra ID%'),
+        VENTAS: (TipoMovimiento.VENTA,
+                 (TipoMovimiento.VENTA, TipoMovimiento.DEVOLUCION_VENTA),
+                 (TipoMovimiento.DEVOLUCION_VENTA,),
+                 '%edición%venta ID%'),
+    }
+
+    def __init__(self, session):
+        self.session = session
+        self.kardex_manager = KardexManager(session)
+
+    def fusionar(self, empresa_id=None, aplicar=True, usuario_id=None):
+        """
+        Fusiona las reversiones de todos los documentos editados (o los de una empresa).
+
+        Args:
+            aplicar: False solo calcula el resultado, sin modificar la base.
+
+        Returns:
+            dict: {
+                'documentos': documentos con ediciones revisados,
+                'pares_fusionados': (producto_id, almacen_id, documento) fusionados,
+                'movimientos_eliminados': filas que se eliminan,
+                'pares_omitidos': {(producto_id, almacen_id, documento): motivo},
+            }
+        """
+        if not aplicar:
+            return self._fusionar(empresa_id, aplicar, usuario_id)
+        with transaction(self.session):
+            return self._fusionar(empresa_id, aplicar, usuario_id)
+
+    def _fusionar(self, empresa_id, aplicar, usuario_id):
+        documentos = self._documentos_editados(empresa_id)
+        editables = {}
+        fusionados, omitidos = [], {}
+        eliminados = 0
+        cola = ColaRecalculo(self.session)
+
+        for familia, tipo_documento, numero_documento in documentos:
+            tipo_base, tipos, _, _ = self.FAMILIAS[familia]
+            por_par = self.kardex_manager.movimientos_documento(tipos, tipo_documento, numero_documento)
+            documento = f"{tipo_documento.value if tipo_documento else ''} {numero_documento}".strip()
+
+            for (producto_id, almacen_id), movs in por_par.items():
+                clave = (producto_id, almacen_id, documento)
+                if empresa_id is not None and movs[0].empresa_id != empresa_id:
+                    continue
+                if len(movs) < 2:
+                    continue
+
+                for mov in movs:
+                    if mov.fecha_documento not in editables:
+                        editables[mov.fecha_documento] = self.kardex_manager.fecha_editable(mov.fecha_documento)
+                motivo = self._motivo_omision(familia, movs, editables)
+                if motivo:
+                    omitidos[clave] = motivo
+                    continue
+
+                base = next(mov for mov in movs if mov.tipo == tipo_base)
+                neto = self._neto(familia, movs)
+                fusionados.append(clave)
+                eliminados += len(movs) - (1 if neto else 0)
+                if not aplicar:
+                    continue
+
+                motivo = f"Fusión de reversiones del documento {documento}"
+                for mov in movs:
+                    if mov is not base or not neto:
+                        self.kardex_manager.eliminar_movimiento(mov, usuario_id, motivo)
+                if neto:
+                    ultimo = movs[-1]
+                    self.kardex_manager.corregir_movimiento(
+                        base, usuario_id, motivo,
+                        fecha_documento=ultimo.fecha_documento, proveedor_id=ultimo.proveedor_id,
+                        cliente_id=ultimo.cliente_id, moneda=ultimo.moneda, tipo_cambio=ultimo.tipo_cambio,
+                        **neto
+                    )
+                self.session.flush()
+                cola.encolar({(producto_id, almacen_id)}, min(mov.fecha_documento for mov in movs),
+                             max(mov.fecha_documento for mov in movs))
+
+        return {
+            'documentos': len(documentos),
+            'pares_fusionados': fusionados,
+            'movimientos_eliminados': eliminados,
+            'pares_omitidos': omitidos,
+        }
+
+    def _documentos_editados(self, empresa_id):
+        """(familia, tipo_documento, numero_documento) de los documentos con reversiones de edición."""
+        documentos = set()
+        for familia, (_, _, tipos_edicion, observaciones) in self.FAMILIAS.items():
+            consulta = select(MovimientoStock.tipo_documento, MovimientoStock.numero_documento).where(
+                MovimientoStock.tipo.in_(tipos_edicion),
+                MovimientoStock.observaciones.like(observaciones),
+            ).distinct()
+            if empresa_id is not None:
+                consulta = consulta.where(MovimientoStock.empresa_id == empresa_id)
+            documentos.update((familia, *fila) for fila in self.session.execute(consulta))
+        return sorted(documentos, key=lambda d: (d[0], d[1].value if d[1] else '', d[2] or ''))
+
+    def _motivo_omision(self, familia, movs, editables):
+        if not any(mov.tipo == self.FAMILIAS[familia][0] for mov in movs):
+            return "Sin movimiento original"
+        if not all(editables[mov.fecha_documento] for mov in movs):
+            return "Periodo cerrado"
+        # El mismo número con otro proveedor o cliente es otro documento
+        if len({mov.proveedor_id if familia == self.COMPRAS else mov.cliente_id for mov in movs}) > 1:
+            return "Varios proveedores o clientes con el mismo documento"
+        if self._cantidad_neta(familia, movs) < -self.TOLERANCIA:
+            return "Cantidad neta negativa"
+        return None
+
+    @staticmethod
+    def _cantidad_neta(familia, movs):
+        neto = sum((mov.cantidad_entrada or 0) - (mov.cantidad_salida or 0) for mov in movs)
+        return neto if familia == FusionReversiones.COMPRAS else -neto
+
+    def _neto(self, familia, movs):
+        """
+        Columnas del movimiento fusionado, o None si la línea se anuló por completo.
+        En compras, los ajustes por diferencia ya guardan el valor con su signo.
+        """
+        cantidad = self._cantidad_neta(familia, movs)
+        if cantidad <= self.TOLERANCIA:
+            return None
+
+        if familia == self.COMPRAS:
+            valor = sum(
+                -(mov.costo_total or 0) if mov.tipo == TipoMovimiento.DEVOLUCION_COMPRA else (mov.costo_total or 0)
+                for mov in movs
+            )
+            return {'cantidad_entrada': cantidad, 'cantidad_salida': 0.0,
+                    'costo_unitario': valor / cantidad, 'costo_total': valor}
+
+        # En ventas el costo de la salida lo fija el recálculo; se parte del último registrado
+        costo_unitario = next(mov.costo_unitario for mov in reversed(movs) if mov.tipo == TipoMovimiento.VENTA)
+        return {'cantidad_entrada': 0.0, 'cantidad_salida': cantidad,
+                'costo_unitario': costo_unitario, 'costo_total': cantidad * costo_unitario}
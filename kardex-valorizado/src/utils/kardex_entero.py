@@ -0,0 +1,144 @@
+"""
+Aritmética de valorización del Kardex en punto fijo (enteros escalados).
+Archivo: src/utils/kardex_entero.py
+
+Cantidades, costos unitarios e importes se representan en millonésimas (6 decimales);
+los importes redondeados (costo de una salida, saldos) quedan en céntimos exactos.
+Las divisiones redondean ROUND_HALF_UP en los mismos puntos en que el cálculo con
+Decimal hace quantize, por lo que ambos producen los mismos valores para datos de
+hasta 6 decimales; la conversión a float ocurre solo al leer y escribir la base.
+
+AritmeticaDecimal conserva el cálculo original con Decimal como modo de referencia
+para verificar resultados.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+ARITMETICA_ENTERA = 'entera'
+ARITMETICA_DECIMAL = 'decimal'
+
+ESCALA = 10 ** 6                  # millonésimas (SEIS_DECIMALES)
+CENTIMO = ESCALA // 100           # un céntimo expresado en millonésimas (DOS_DECIMALES)
+
+DOS_DECIMALES = Decimal('0.01')
+SEIS_DECIMALES = Decimal('0.000001')
+
+
+def dividir_redondeando(numerador, denominador):
+    """División entera con redondeo ROUND_HALF_UP (la mitad se aleja de cero), como Decimal.quantize."""
+    if denominador < 0:
+        numerador, denominador = -numerador, -denominador
+    if numerador >= 0:
+        return (2 * numerador + denominador) // (2 * denominador)
+    return -((-2 * numerador + denominador) // (2 * denominador))
+
+
+def a_entero(valor, escala):
+    """Convierte un float almacenado a entero escalado, redondeando la mitad lejos de cero."""
+    if not valor:
+        return 0
+    if valor > 0:
+        return int(valor * escala + 0.5)
+    return -int(-valor * escala + 0.5)
+
+
+class AritmeticaEntera:
+    """Paso del Promedio Ponderado en enteros escalados (millonésimas)."""
+
+    cero = 0
+
+    @staticmethod
+    def cantidad(valor):
+        return a_entero(valor, ESCALA)
+
+    total = cantidad
+
+    @staticmethod
+    def float_cantidad(valor):
+        return valor / ESCALA
+
+    float_total = float_cantidad
+
+    @staticmethod
+    def paso_promedio(saldo_cantidad, saldo_costo, cantidad_entrada, cantidad_salida, costo_total_entrada):
+        """
+        Aplica un movimiento al saldo de Promedio Ponderado (mismo cálculo que la
+        versión Decimal, en una sola llamada para evitar el costo por operación).
+
+        Returns:
+            tuple: (saldo_cantidad, saldo_costo, saldo_cantidad_redondeado, saldo_costo_redondeado,
+                    costo_unitario_salida, costo_total_salida); los dos últimos en float y None
+                    si el movimiento no es una salida. Los saldos quedan en la escala interna.
+        """
+        entrada = a_entero(cantidad_entrada, ESCALA)
+        salida = a_entero(cantidad_salida, ESCALA)
+        costo_unitario_salida = costo_total_salida = None
+
+        if salida > 0:
+            promedio = dividir_redondeando(saldo_costo * ESCALA, saldo_cantidad) if saldo_cantidad > 0 else 0
+            total = dividir_redondeando(salida * promedio, ESCALA * CENTIMO) * CENTIMO
+            costo_unitario_salida = promedio / ESCALA
+            costo_total_salida = total / ESCALA
+            saldo_costo -= total
+        elif entrada > 0:
+            saldo_costo += a_entero(costo_total_entrada, ESCALA)
+
+        saldo_cantidad += entrada - salida
+        if saldo_cantidad <= 0:
+            saldo_cantidad = saldo_costo = 0
+
+        cantidad_redondeada = dividir_redondeando(saldo_cantidad, CENTIMO) * CENTIMO
+        costo_redondeado = dividir_redondeando(saldo_costo, CENTIMO) * CENTIMO
+        return (saldo_cantidad, saldo_costo, cantidad_redondeada, costo_redondeado,
+                costo_unitario_salida, costo_total_salida)
+
+
+class AritmeticaDecimal:
+    """El mismo paso con Decimal y quantize: modo de referencia."""
+
+    cero = Decimal('0')
+
+    @staticmethod
+    def cantidad(valor):
+        return Decimal(str(valor))
+
+    total = cantidad
+
+    float_cantidad = float
+    float_total = float
+
+    @staticmethod
+    def paso_promedio(saldo_cantidad, saldo_costo, cantidad_entrada, cantidad_salida, costo_total_entrada):
+        """Versión de referencia de AritmeticaEntera.paso_promedio."""
+        entrada = Decimal(str(cantidad_entrada))
+        salida = Decimal(str(cantidad_salida))
+        costo_unitario_salida = costo_total_salida = None
+
+        if salida > 0:
+            promedio = Decimal('0')
+            if saldo_cantidad > 0:
+                promedio = (saldo_costo / saldo_cantidad).quantize(SEIS_DECIMALES, rounding=ROUND_HALF_UP)
+            total = (salida * promedio).quantize(DOS_DECIMALES, rounding=ROUND_HALF_UP)
+            costo_unitario_salida = float(promedio)
+            costo_total_salida = float(total)
+            saldo_costo -= total
+        elif entrada > 0:
+            saldo_costo += Decimal(str(costo_total_entrada))
+
+        saldo_cantidad += entrada - salida
+        if saldo_cantidad <= 0:
+            saldo_cantidad = saldo_costo = Decimal('0')
+
+        return (saldo_cantidad, saldo_costo,
+                saldo_cantidad.quantize(DOS_DECIMALES, rounding=ROUND_HALF_UP),
+                saldo_costo.quantize(DOS_DECIMALES, rounding=ROUND_HALF_UP),
+                costo_unitario_salida, costo_total_salida)
+
+
+def aritmetica(modo):
+    """Devuelve la implementación para ARITMETICA_ENTERA o ARITMETICA_DECIMAL."""
+    if modo == ARITMETICA_DECIMAL:
+        return AritmeticaDecimal
+    if modo == ARITMETICA_ENTERA:
+        return AritmeticaEntera
+    raise ValueError(f"Aritmética de kardex desconocida: {modo}")
@@ -3,15 +3,29 @@ KardexManager - Lógica de negocio centralizada para la gestión de inventario.
 Archivo: src/utils/kardex_manager.py
 """
 
-from decimal import Decimal, ROUND_HALF_UP
+import heapq
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import groupby
+from types import SimpleNamespace
+from sqlalchemy import select, insert, delete, func, or_, and_, bindparam, literal, union_all, Integer
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.orm.session import Session
-from models.database_model import MovimientoStock, TipoMovimiento, Empresa, Producto, MetodoValuacion
+from models.database_model import (MovimientoStock, TipoMovimiento, Empresa, MetodoValuacion,
+                                   Almacen, CheckpointKardex, CapaCosto, SaldoActual, CierreKardex,
+                                   CierreKardexCapa, AnioContable, EstadoAnio)
 
 class AnioCerradoError(Exception):
     """Excepción lanzada cuando se intenta modificar un periodo cerrado."""
     pass
 
 from utils.transaction import transaction
+from utils import kardex_vectorizado, kardex_entero
+from utils.cola_lotes import ColaLotes
+from utils.cola_recalculo import ColaRecalculo
+from services.audit_service import AuditService
 
 class KardexManager:
     """
@@ -19,35 +33,293 @@ class KardexManager:
     cálculos de costos y recálculos.
     """
 
+    # Cada cuántos movimientos recalculados se guarda un checkpoint de saldo
+    INTERVALO_CHECKPOINT = 500
+
+    # Filas por sentencia executemany en las escrituras masivas
+    TAMANIO_LOTE_ESCRITURA = 5000
+
+    MOTOR_DECIMAL = 'decimal'
+    MOTOR_NUMPY = 'numpy'
+    MOTOR_PARALELO = 'paralelo'
+
+    # Pares (producto, almacén) por consulta en obtener_stock_bulk y registrar_movimientos
+    # (SQLite admite hasta 500 SELECT en un UNION ALL)
+    TAMANIO_LOTE_PARES = 400
+
+    # Capas abiertas por lectura al consumirlas en registrar_movimientos
+    TAMANIO_PAGINA_CAPAS = 100
+
+    # Aritmética del recálculo incremental: enteros escalados, o Decimal como referencia
+    ARITMETICA = kardex_entero.ARITMETICA_ENTERA
+
+    # Columnas que leen los recálculos como filas planas (sin instancias ORM)
+    COLUMNAS_VALORIZACION = (
+        MovimientoStock.id,
+        MovimientoStock.producto_id,
+        MovimientoStock.almacen_id,
+        MovimientoStock.fecha_documento,
+        MovimientoStock.cantidad_entrada,
+        MovimientoStock.cantidad_salida,
+        MovimientoStock.costo_unitario,
+        MovimientoStock.costo_total,
+        MovimientoStock.saldo_cantidad,
+        MovimientoStock.saldo_costo_total,
+        MovimientoStock.version_id,
+    )
+
     def __init__(self, session: Session):
         self.session = session
 
-    def recalcular_saldos_globales(self, empresa_id):
+    def recalcular_saldos_globales(self, empresa_id, motor=None, procesos=None, progreso=None):
         """
         Recalcula los saldos de todos los productos para una empresa.
         Este es un proceso intensivo y debe ser usado con precaución.
+
+        Args:
+            motor: MOTOR_NUMPY, MOTOR_PARALELO o MOTOR_DECIMAL. Por defecto se usa el motor
+                   vectorizado para Promedio Ponderado cuando NumPy está instalado, y el
+                   paralelo por producto para PEPS/UEPS cuando la base está en disco o en
+                   servidor; el motor Decimal serial queda como referencia.
+            procesos: Procesos del motor paralelo (None = config.json / CPUs disponibles).
+            progreso: Callback progreso(particiones_terminadas, total) del motor paralelo.
         """
+        if motor is None:
+            motor = self._motor_por_defecto(empresa_id)
+
+        if motor == self.MOTOR_PARALELO:
+            # El motor paralelo confirma por lotes con su propio escritor
+            from services.regeneracion_service import RegeneracionService
+            cola = ColaRecalculo(self.session)
+            # Los rangos pendientes al empezar quedan cubiertos por la regeneración; los que
+            # se registren mientras corre (otra versión) siguen pendientes
+            pendientes = cola.pendientes()
+            self.session.commit()
+            RegeneracionService(self.session).regenerar_kardex_global(
+                empresa_id, procesos=procesos, progreso=progreso
+            )
+            with transaction(self.session):
+                self.reconstruir_capas_costo(self._pares_empresa(empresa_id))
+                for entrada in pendientes:
+                    cola.descartar(entrada)
+            return
+
         with transaction(self.session):
             empresa = self.session.query(Empresa).get(empresa_id)
             if not empresa:
                 raise ValueError("Empresa no encontrada")
 
-            productos = self.session.query(Producto).all() # Simplificado: obtener todos los productos
+            # Los saldos se reescriben por completo: los checkpoints existentes dejan de ser válidos
+            self.session.query(CheckpointKardex).delete(synchronize_session=False)
+
+            # Los años cerrados no se recalculan: se parte de su cierre
+            anio_cierre = self.ultimo_cierre()
+
+            if motor == self.MOTOR_NUMPY and empresa.metodo_valuacion == MetodoValuacion.PROMEDIO_PONDERADO:
+                if not kardex_vectorizado.numpy_disponible():
+                    raise RuntimeError("El motor vectorizado requiere NumPy instalado")
+                self._recalcular_promedio_vectorizado(anio_cierre)
+            else:
+                self._recalcular_global_decimal(empresa, anio_cierre)
 
-            for producto in productos:
-                movimientos = self.session.query(MovimientoStock).filter_by(
-                    producto_id=producto.id
-                ).order_by(MovimientoStock.fecha_documento, MovimientoStock.id).all()
+            self.reconstruir_capas_costo(self._pares_empresa(empresa_id))
+            self.reconstruir_saldo_actual()
+            # Todos los movimientos quedaron recalculados: no hay rangos pendientes
+            ColaRecalculo(self.session).vaciar()
 
-                if not movimientos:
-                    continue
+    def _recalcular_global_decimal(self, empresa, anio_cierre=None):
+        """
+        Recálculo global con los motores Decimal (Promedio Ponderado, PEPS o UEPS).
+        Con anio_cierre solo se leen los movimientos posteriores a ese cierre, y cada
+        producto parte de su saldo (o capas) al 31 de diciembre.
+        """
+        # Lectura en filas planas: el cálculo no marca instancias ORM y solo se
+        # escriben, por lotes, los movimientos cuyo valor cambió
+        consulta = select(*self.COLUMNAS_VALORIZACION)
+        aperturas = {}
+        if anio_cierre is not None:
+            consulta = consulta.where(MovimientoStock.fecha_documento > self.fecha_cierre(anio_cierre))
+            aperturas = self.leer_cierres(self.session, anio_cierre)
+        filas = self.session.execute(
+            consulta.order_by(MovimientoStock.producto_id, MovimientoStock.fecha_documento, MovimientoStock.id)
+        ).all()
+
+        cambios = []
+        for producto_id, filas_producto in groupby(filas, key=lambda f: f.producto_id):
+            movimientos = (self.movimientos_apertura(aperturas.get(producto_id, []), empresa.metodo_valuacion)
+                           + self.a_movimientos_planos(filas_producto))
+
+            if empresa.metodo_valuacion == MetodoValuacion.PROMEDIO_PONDERADO:
+                self._calcular_promedio_ponderado(movimientos)
+            elif empresa.metodo_valuacion == MetodoValuacion.PEPS:
+                self._calcular_peps(movimientos)
+            elif empresa.metodo_valuacion == MetodoValuacion.UEPS:
+                self._calcular_ueps(movimientos)
+
+            cambios.extend(self.filas_modificadas(movimientos))
+            if len(cambios) >= self.TAMANIO_LOTE_ESCRITURA:
+                self.escribir_valorizacion_masiva(cambios)
+                cambios = []
+
+        self.escribir_valorizacion_masiva(cambios)
+
+    def _motor_por_defecto(self, empresa_id):
+        """Elige el motor de recálculo global según el método de valuación y la base de datos."""
+        empresa = self.session.get(Empresa, empresa_id)
+        if (empresa and empresa.metodo_valuacion == MetodoValuacion.PROMEDIO_PONDERADO
+                and kardex_vectorizado.numpy_disponible()):
+            return self.MOTOR_NUMPY
+
+        # Una base SQLite en memoria no es visible desde otros procesos
+        url = self.session.get_bind().url
+        if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+            return self.MOTOR_DECIMAL
+        return self.MOTOR_PARALELO
+
+    def _recalcular_promedio_vectorizado(self, anio_cierre=None):
+        """
+        Equivalente columnar de _calcular_promedio_ponderado para todos los productos:
+        lee los movimientos en una sola consulta, calcula todos los productos con NumPy
+        y escribe los resultados en lotes con executemany.
+        """
+        np = kardex_vectorizado.np
+        consulta = select(
+                MovimientoStock.id,
+                MovimientoStock.producto_id,
+                MovimientoStock.version_id,
+                MovimientoStock.cantidad_entrada,
+                MovimientoStock.cantidad_salida,
+                MovimientoStock.costo_unitario,
+                MovimientoStock.costo_total,
+                MovimientoStock.saldo_cantidad,
+                MovimientoStock.saldo_costo_total
+            )
+        if anio_cierre is not None:
+            consulta = consulta.where(MovimientoStock.fecha_documento > self.fecha_cierre(anio_cierre))
+        filas = self.session.execute(
+            consulta.order_by(MovimientoStock.producto_id, MovimientoStock.fecha_documento, MovimientoStock.id)
+        ).all()
+
+        if not filas:
+            return
+
+        if anio_cierre is not None:
+            # Saldos al cierre como filas de entrada (id -1) al inicio de cada producto;
+            # heapq.merge es estable, así que preceden a los movimientos del mismo producto
+            aperturas = self.leer_cierres(self.session, anio_cierre)
+            virtuales = [
+                (-1, producto_id, 0, m.cantidad_entrada, 0.0, m.costo_unitario, m.costo_total, None, None)
+                for producto_id in sorted(aperturas)
+                for m in self.movimientos_apertura(aperturas[producto_id], MetodoValuacion.PROMEDIO_PONDERADO)
+            ]
+            filas = list(heapq.merge(virtuales, filas, key=lambda f: f[1]))
+
+        columnas = list(zip(*filas))
+        ids, producto_ids, versiones = (np.array(columna, dtype=np.int64) for columna in columnas[:3])
+        # Valores almacenados tal cual (NULL -> nan, que nunca coincide y se reescribe)
+        cu_0, ct_0, saldo_cant_0, saldo_val_0 = (
+            np.array(columna, dtype=np.float64) for columna in (columnas[5], columnas[6], columnas[7], columnas[8])
+        )
+        entradas, salidas = (np.nan_to_num(np.array(c, dtype=np.float64)) for c in (columnas[3], columnas[4]))
 
-                if empresa.metodo_valuacion == MetodoValuacion.PROMEDIO_PONDERADO:
-                    self._calcular_promedio_ponderado(movimientos)
-                elif empresa.metodo_valuacion == MetodoValuacion.PEPS:
-                    self._calcular_peps(movimientos)
-                elif empresa.metodo_valuacion == MetodoValuacion.UEPS:
-                    self._calcular_ueps(movimientos)
+        inicio_producto = np.concatenate(([True], np.diff(producto_ids) != 0))
+        cu, ct, saldo_cant, saldo_val = kardex_vectorizado.calcular_promedio_ponderado(
+            entradas, salidas, np.nan_to_num(cu_0), np.nan_to_num(ct_0), inicio_grupo=inicio_producto
+        )
+
+        # Comparar a la escala del kardex (costo unitario a 6 decimales, importes y saldos a 2):
+        # el ruido de punto flotante frente a un valor que escribió el motor Decimal no es un cambio
+        distinto = lambda nuevo, almacenado, decimales: np.round(nuevo, decimales) != np.round(almacenado, decimales)
+        cambio = (ids >= 0) & (
+            distinto(cu, cu_0, 6) | distinto(ct, ct_0, 2)
+            | distinto(saldo_cant, saldo_cant_0, 2) | distinto(saldo_val, saldo_val_0, 2)
+        )
+        self.escribir_valorizacion_masiva(zip(
+            ids[cambio].tolist(), cu[cambio].tolist(), ct[cambio].tolist(),
+            saldo_cant[cambio].tolist(), saldo_val[cambio].tolist(), versiones[cambio].tolist()
+        ))
+
+    @staticmethod
+    def a_movimientos_planos(filas):
+        """
+        Convierte filas leídas con COLUMNAS_VALORIZACION en objetos simples que los motores
+        de cálculo pueden modificar sin marcar instancias ORM como sucias. Cada objeto
+        conserva sus valores almacenados para detectar después qué cambió.
+        """
+        movimientos = []
+        for fila in filas:
+            mov = SimpleNamespace(**fila._asdict())
+            mov.almacenado = (fila.costo_unitario, fila.costo_total, fila.saldo_cantidad, fila.saldo_costo_total)
+            movimientos.append(mov)
+        return movimientos
+
+    @staticmethod
+    def filas_modificadas(movimientos):
+        """
+        Tuplas (id, costo_unitario, costo_total, saldo_cantidad, saldo_costo_total, version_id)
+        de los movimientos planos cuyos valores recalculados difieren de los almacenados.
+        Las aperturas de cierre (id None) no se escriben.
+        """
+        return [
+            (m.id, m.costo_unitario, m.costo_total, m.saldo_cantidad, m.saldo_costo_total, m.version_id)
+            for m in movimientos
+            if m.id is not None
+            and (m.costo_unitario, m.costo_total, m.saldo_cantidad, m.saldo_costo_total) != m.almacenado
+        ]
+
+    def escribir_valorizacion_masiva(self, filas):
+        """
+        Escribe costos y saldos recalculados con UPDATE executemany, en lotes de
+        TAMANIO_LOTE_ESCRITURA, sin pasar por las instancias ORM.
+
+        El bloqueo optimista se verifica una vez por lote: cada fila solo se actualiza si
+        conserva la versión leída, y si el lote no actualiza todas sus filas otro proceso
+        las modificó y se lanza StaleDataError, como haría el flush del ORM.
+
+        Args:
+            filas: iterable de tuplas (id, costo_unitario, costo_total, saldo_cantidad,
+                   saldo_costo_total, version_id). Conviene enviar solo las filas que cambiaron.
+
+        Returns:
+            int: Cantidad de filas actualizadas.
+        """
+        tabla = MovimientoStock.__table__
+        sentencia = tabla.update().where(
+            tabla.c.id == bindparam('b_id'),
+            tabla.c.version_id == bindparam('b_version_id')
+        ).values(
+            costo_unitario=bindparam('b_costo_unitario'),
+            costo_total=bindparam('b_costo_total'),
+            saldo_cantidad=bindparam('b_saldo_cantidad'),
+            saldo_costo_total=bindparam('b_saldo_costo_total'),
+            version_id=tabla.c.version_id + 1
+        )
+
+        def aplicar(lote):
+            resultado = self.session.execute(sentencia, lote)
+            if resultado.rowcount != len(lote):
+                raise StaleDataError(
+                    f"Recálculo de kardex: {len(lote) - resultado.rowcount} de {len(lote)} movimientos "
+                    f"fueron modificados por otro proceso."
+                )
+            # Las instancias ORM cargadas de estos movimientos quedan desactualizadas
+            for fila in lote:
+                mov = self.session.identity_map.get(identity_key(MovimientoStock, fila['b_id']))
+                if mov is not None:
+                    self.session.expire(mov)
+            return len(lote)
+
+        escritas = 0
+        lote = []
+        for i, u, t, c, v, version in filas:
+            lote.append({'b_id': i, 'b_version_id': version, 'b_costo_unitario': u, 'b_costo_total': t,
+                         'b_saldo_cantidad': c, 'b_saldo_costo_total': v})
+            if len(lote) >= self.TAMANIO_LOTE_ESCRITURA:
+                escritas += aplicar(lote)
+                lote = []
+        if lote:
+            escritas += aplicar(lote)
+        return escritas
 
     def _calcular_promedio_ponderado(self, movimientos):
         saldo_cantidad = Decimal('0')
@@ -82,136 +354,262 @@ class KardexManager:
             mov.saldo_costo_total = float(saldo_valor)
 
     def _calcular_peps(self, movimientos):
-        lotes = []
-        for mov in movimientos:
-            if mov.cantidad_entrada > 0:
-                lotes.append({
-                    'cantidad': Decimal(str(mov.cantidad_entrada)),
-                    'costo_unitario': Decimal(str(mov.costo_unitario))
-                })
-            else:
-                cantidad_pendiente = Decimal(str(mov.cantidad_salida))
-                costo_total_salida = Decimal('0')
-
-                while cantidad_pendiente > 0 and lotes:
-                    lote = lotes[0]
-                    cantidad_a_tomar = min(cantidad_pendiente, lote['cantidad'])
-
-                    costo_total_salida += cantidad_a_tomar * lote['costo_unitario']
-                    lote['cantidad'] -= cantidad_a_tomar
-                    cantidad_pendiente -= cantidad_a_tomar
-
-                    if lote['cantidad'] == 0:
-                        lotes.pop(0)
-
-                if mov.cantidad_salida > 0:
-                    mov.costo_unitario = float(costo_total_salida / Decimal(str(mov.cantidad_salida)))
-                    mov.costo_total = float(costo_total_salida)
-
-            saldo_cantidad = sum(l['cantidad'] for l in lotes)
-            saldo_valor = sum(l['cantidad'] * l['costo_unitario'] for l in lotes)
-            mov.saldo_cantidad = float(saldo_cantidad)
-            mov.saldo_costo_total = float(saldo_valor)
+        self._calcular_por_lotes(movimientos, MetodoValuacion.PEPS)
 
     def _calcular_ueps(self, movimientos):
-        lotes = []
+        self._calcular_por_lotes(movimientos, MetodoValuacion.UEPS)
+
+    def _calcular_por_lotes(self, movimientos, metodo, lotes=None):
+        # `lotes`: lotes abiertos antes del primer movimiento (recálculo por páginas)
+        lotes = lotes if lotes is not None else ColaLotes(metodo)
         for mov in movimientos:
             if mov.cantidad_entrada > 0:
-                lotes.append({
-                    'cantidad': Decimal(str(mov.cantidad_entrada)),
-                    'costo_unitario': Decimal(str(mov.costo_unitario))
-                })
+                lotes.agregar(mov.cantidad_entrada, mov.costo_unitario)
             else:
-                cantidad_pendiente = Decimal(str(mov.cantidad_salida))
-                costo_total_salida = Decimal('0')
-
-                while cantidad_pendiente > 0 and lotes:
-                    lote = lotes[-1]
-                    cantidad_a_tomar = min(cantidad_pendiente, lote['cantidad'])
-
-                    costo_total_salida += cantidad_a_tomar * lote['costo_unitario']
-                    lote['cantidad'] -= cantidad_a_tomar
-                    cantidad_pendiente -= cantidad_a_tomar
-
-                    if lote['cantidad'] == 0:
-                        lotes.pop()
+                costo_total_salida = lotes.consumir(mov.cantidad_salida)
 
                 if mov.cantidad_salida > 0:
                     mov.costo_unitario = float(costo_total_salida / Decimal(str(mov.cantidad_salida)))
                     mov.costo_total = float(costo_total_salida)
 
-            saldo_cantidad = sum(l['cantidad'] for l in lotes)
-            saldo_valor = sum(l['cantidad'] * l['costo_unitario'] for l in lotes)
-            mov.saldo_cantidad = float(saldo_cantidad)
-            mov.saldo_costo_total = float(saldo_valor)
+            mov.saldo_cantidad = float(lotes.cantidad)
+            mov.saldo_costo_total = float(lotes.valor)
 
-    def recalcular_kardex_posterior(self, producto_almacen_afectados: set, fecha_referencia):
+    def recalcular_kardex_posterior(self, producto_almacen_afectados: set, fecha_referencia, fecha_hasta=None):
         """
         Recalcula los saldos y costos del Kardex para productos/almacenes específicos
-        a partir de una fecha dada. Asume Costo Promedio Ponderado.
+        a partir de una fecha dada, con el método de valuación de la empresa del almacén.
+
+        Cada par se recalcula desde su checkpoint más cercano anterior a la fecha y se
+        detiene en el primer checkpoint posterior a fecha_hasta (por defecto, la misma
+        fecha) cuyo saldo recalculado coincide con el guardado: a partir de ese punto ningún
+        movimiento puede cambiar. Con varias ediciones del par, fecha_hasta es la más reciente.
         """
         print(f"DEBUG: Iniciando recálculo de Kardex para {len(producto_almacen_afectados)} pares desde {fecha_referencia}")
-        DOS_DECIMALES = Decimal('0.01')
-        SEIS_DECIMALES = Decimal('0.000001')
 
         for prod_id, alm_id in producto_almacen_afectados:
-            print(f"DEBUG: Recalculando para Producto ID: {prod_id}, Almacén ID: {alm_id}")
+            self._recalcular_par(prod_id, alm_id, fecha_referencia, fecha_hasta)
+
+        # Un movimiento con fecha anterior cambia el orden en que se consumieron los lotes
+        self.reconstruir_capas_costo(producto_almacen_afectados)
+        self.actualizar_saldo_actual(producto_almacen_afectados)
+
+        print(f"DEBUG: Recálculo de Kardex finalizado.")
+
+    def procesar_recalculos_pendientes(self, pares=None):
+        """
+        Recalcula los rangos pendientes de la cola (todos o solo los de `pares`) en la sesión
+        actual, sin confirmar, y los descarta. Lo usan el proceso en segundo plano y los
+        lectores que necesitan costos exactos de ciertos pares antes de que este llegue.
 
+        Returns:
+            int: número de pares recalculados.
+        """
+        cola = ColaRecalculo(self.session)
+        entradas = cola.pendientes(pares)
+        for entrada in entradas:
+            # Sin fecha_hasta (entrada anterior a la columna) se recalcula hasta el final
+            self.recalcular_kardex_posterior({(entrada.producto_id, entrada.almacen_id)},
+                                             entrada.fecha_desde, entrada.fecha_hasta or date.max)
+            cola.descartar(entrada)
+        return len(entradas)
+
+    def _recalcular_par(self, prod_id, alm_id, fecha_referencia, fecha_hasta=None):
+        """Recalcula un (producto, almacén) por páginas, usando y actualizando sus checkpoints."""
+        ar = kardex_entero.aritmetica(self.ARITMETICA)
+
+        # Los años cerrados no se recalculan: el par parte de su saldo al último cierre
+        anio_cierre = self.ultimo_cierre()
+        corte = date.min
+        if anio_cierre is not None:
+            corte = self.fecha_cierre(anio_cierre)
+            fecha_referencia = max(fecha_referencia, corte + timedelta(days=1))
+        # Solo después de la última fecha editada un checkpoint coincidente permite detenerse
+        fecha_hasta = max(fecha_referencia, fecha_hasta or fecha_referencia)
+        almacen = self.session.get(Almacen, alm_id)
+        metodo = self._metodo_valuacion(almacen.empresa_id) if almacen else MetodoValuacion.PROMEDIO_PONDERADO
+
+        # Los checkpoints de movimientos eliminados ya no representan un saldo válido
+        self.session.query(CheckpointKardex).filter(
+            CheckpointKardex.producto_id == prod_id,
+            CheckpointKardex.almacen_id == alm_id,
+            CheckpointKardex.movimiento_id.notin_(
+                select(MovimientoStock.id).where(
+                    MovimientoStock.producto_id == prod_id,
+                    MovimientoStock.almacen_id == alm_id
+                )
+            )
+        ).delete(synchronize_session=False)
+
+        if metodo in (MetodoValuacion.PEPS, MetodoValuacion.UEPS):
+            self._recalcular_par_lotes(prod_id, alm_id, metodo, anio_cierre, fecha_referencia)
+            return
+
+        checkpoint_inicial = self.session.query(CheckpointKardex).filter(
+            CheckpointKardex.producto_id == prod_id,
+            CheckpointKardex.almacen_id == alm_id,
+            CheckpointKardex.fecha_documento > corte,
+            CheckpointKardex.fecha_documento < fecha_referencia
+        ).order_by(CheckpointKardex.fecha_documento.desc(), CheckpointKardex.movimiento_id.desc()).first()
+
+        if checkpoint_inicial:
+            saldo_cant_actual = ar.cantidad(checkpoint_inicial.saldo_cantidad)
+            saldo_costo_actual = ar.total(checkpoint_inicial.saldo_costo_total)
+            posicion = (checkpoint_inicial.fecha_documento, checkpoint_inicial.movimiento_id)
+            fecha_inicio = checkpoint_inicial.fecha_documento
+        else:
             mov_anterior = self.session.query(MovimientoStock).filter(
                 MovimientoStock.producto_id == prod_id,
                 MovimientoStock.almacen_id == alm_id,
+                MovimientoStock.fecha_documento > corte,
                 MovimientoStock.fecha_documento < fecha_referencia
             ).order_by(MovimientoStock.fecha_documento.desc(), MovimientoStock.id.desc()).first()
 
-            saldo_cant_actual = Decimal(str(mov_anterior.saldo_cantidad)) if mov_anterior else Decimal('0')
-            saldo_costo_actual = Decimal(str(mov_anterior.saldo_costo_total)) if mov_anterior else Decimal('0')
-            print(f"DEBUG: Saldos iniciales - Cant: {saldo_cant_actual}, Costo Total: {saldo_costo_actual}")
-
-            movimientos_a_recalcular = self.session.query(MovimientoStock).filter(
-                MovimientoStock.producto_id == prod_id,
-                MovimientoStock.almacen_id == alm_id,
-                MovimientoStock.fecha_documento >= fecha_referencia
-            ).order_by(MovimientoStock.fecha_documento.asc(), MovimientoStock.id.asc()).all()
-
-            if not movimientos_a_recalcular:
-                print(f"DEBUG: No hay movimientos posteriores para recalcular.")
-                continue
-
-            for mov in movimientos_a_recalcular:
-                cant_entrada = Decimal(str(mov.cantidad_entrada))
-                cant_salida = Decimal(str(mov.cantidad_salida))
-                costo_total_movimiento = Decimal(str(mov.costo_total))
-
-                costo_promedio_anterior = Decimal('0')
-                if saldo_cant_actual > 0:
-                    costo_promedio_anterior = (saldo_costo_actual / saldo_cant_actual).quantize(SEIS_DECIMALES, rounding=ROUND_HALF_UP)
-
-                if cant_salida > 0:
-                    costo_unitario_salida = costo_promedio_anterior
-                    costo_total_salida = (cant_salida * costo_unitario_salida).quantize(DOS_DECIMALES, rounding=ROUND_HALF_UP)
-
-                    mov.costo_unitario = float(costo_unitario_salida)
-                    mov.costo_total = float(costo_total_salida)
-                    costo_total_movimiento = -costo_total_salida
-
-                elif cant_entrada > 0:
-                    costo_total_movimiento = Decimal(str(mov.costo_total))
-                else:
-                    costo_total_movimiento = Decimal('0')
-
-                saldo_cant_actual += cant_entrada - cant_salida
-                saldo_costo_actual += costo_total_movimiento
-
-                if saldo_cant_actual <= 0:
-                    saldo_costo_actual = Decimal('0')
-                    saldo_cant_actual = Decimal('0')
-
-                mov.saldo_cantidad = float(saldo_cant_actual.quantize(DOS_DECIMALES, rounding=ROUND_HALF_UP))
-                mov.saldo_costo_total = float(saldo_costo_actual.quantize(DOS_DECIMALES, rounding=ROUND_HALF_UP))
+            if mov_anterior is None and anio_cierre is not None:
+                cierre = self.session.get(CierreKardex, (anio_cierre, prod_id, alm_id))
+                if cierre is not None:
+                    mov_anterior = SimpleNamespace(saldo_cantidad=cierre.cantidad,
+                                                   saldo_costo_total=cierre.valor_total)
+
+            saldo_cant_actual = ar.cantidad(mov_anterior.saldo_cantidad) if mov_anterior else ar.cero
+            saldo_costo_actual = ar.total(mov_anterior.saldo_costo_total) if mov_anterior else ar.cero
+            posicion = None
+            fecha_inicio = fecha_referencia
+
+        checkpoints = {
+            cp.movimiento_id: cp for cp in self.session.query(CheckpointKardex).filter(
+                CheckpointKardex.producto_id == prod_id,
+                CheckpointKardex.almacen_id == alm_id,
+                CheckpointKardex.fecha_documento >= fecha_inicio
+            )
+        }
+        movimientos_desde_checkpoint = 0
+        cambios = []
+
+        while True:
+            pagina = self._pagina_par(prod_id, alm_id, posicion, fecha_referencia)
+            if not pagina:
+                break
+
+            for indice, mov in enumerate(pagina):
+                (saldo_cant_actual, saldo_costo_actual, saldo_cant_redondeado, saldo_costo_redondeado,
+                 costo_unitario_salida, costo_total_salida) = ar.paso_promedio(
+                    saldo_cant_actual, saldo_costo_actual,
+                    mov.cantidad_entrada, mov.cantidad_salida, mov.costo_total
+                )
+
+                if costo_unitario_salida is not None:
+                    mov.costo_unitario = costo_unitario_salida
+                    mov.costo_total = costo_total_salida
+
+                mov.saldo_cantidad = ar.float_cantidad(saldo_cant_redondeado)
+                mov.saldo_costo_total = ar.float_total(saldo_costo_redondeado)
+                movimientos_desde_checkpoint += 1
+
+                checkpoint = checkpoints.get(mov.id)
+                if checkpoint is not None:
+                    if (mov.fecha_documento > fecha_hasta
+                            and ar.cantidad(checkpoint.saldo_cantidad) == saldo_cant_redondeado
+                            and ar.total(checkpoint.saldo_costo_total) == saldo_costo_redondeado):
+                        cambios.extend(self.filas_modificadas(pagina[:indice + 1]))
+                        self.escribir_valorizacion_masiva(cambios)
+                        return
+
+                    checkpoint.fecha_documento = mov.fecha_documento
+                    checkpoint.saldo_cantidad = mov.saldo_cantidad
+                    checkpoint.saldo_costo_total = mov.saldo_costo_total
+                elif movimientos_desde_checkpoint >= self.INTERVALO_CHECKPOINT:
+                    checkpoint = CheckpointKardex(
+                        producto_id=prod_id,
+                        almacen_id=alm_id,
+                        movimiento_id=mov.id,
+                        fecha_documento=mov.fecha_documento,
+                        saldo_cantidad=mov.saldo_cantidad,
+                        saldo_costo_total=mov.saldo_costo_total
+                    )
+                    self.session.add(checkpoint)
+                    checkpoints[mov.id] = checkpoint
+
+                if checkpoint is not None:
+                    # Un checkpoint es un punto de reinicio: el saldo continúa desde el valor
+                    # guardado, igual que cuando un recálculo posterior arranque desde él.
+                    saldo_cant_actual = saldo_cant_redondeado
+                    saldo_costo_actual = saldo_costo_redondeado
+                    movimientos_desde_checkpoint = 0
+
+            # Solo se envían los movimientos cuyo valor cambió, en lotes executemany
+            cambios.extend(self.filas_modificadas(pagina))
+            if len(cambios) >= self.TAMANIO_LOTE_ESCRITURA:
+                self.escribir_valorizacion_masiva(cambios)
+                cambios = []
+
+            posicion = (pagina[-1].fecha_documento, pagina[-1].id)
+
+        self.escribir_valorizacion_masiva(cambios)
+
+    def _pagina_par(self, prod_id, alm_id, posicion, fecha_referencia):
+        """
+        Siguiente página de movimientos planos del par en orden (fecha, id): los posteriores a
+        `posicion`, o desde fecha_referencia en la primera página.
+        """
+        consulta = select(*self.COLUMNAS_VALORIZACION).where(
+            MovimientoStock.producto_id == prod_id,
+            MovimientoStock.almacen_id == alm_id
+        )
+        if posicion:
+            consulta = consulta.where(or_(
+                MovimientoStock.fecha_documento > posicion[0],
+                and_(MovimientoStock.fecha_documento == posicion[0], MovimientoStock.id > posicion[1])
+            ))
+        else:
+            consulta = consulta.where(MovimientoStock.fecha_documento >= fecha_referencia)
 
-            print(f"DEBUG: Recálculo completado para Producto ID: {prod_id}, Almacén ID: {alm_id}")
+        return self.a_movimientos_planos(self.session.execute(
+            consulta.order_by(
+                MovimientoStock.fecha_documento.asc(), MovimientoStock.id.asc()
+            ).limit(self.INTERVALO_CHECKPOINT)
+        ).all())
 
-        print(f"DEBUG: Recálculo de Kardex finalizado.")
+    def _recalcular_par_lotes(self, prod_id, alm_id, metodo, anio_cierre, fecha_referencia):
+        """
+        Recalcula un par PEPS/UEPS desde fecha_referencia por páginas. Un checkpoint guarda
+        el saldo pero no los lotes: los abiertos al día anterior se rearman del historial
+        (_lotes_par) y las salidas los consumen en el orden del método, igual que
+        reconstruir_capas_costo, así que los saldos coinciden con las capas. Los checkpoints
+        existentes se actualizan; no hay corte anticipado.
+        """
+        lotes = self._lotes_par(prod_id, alm_id, metodo, anio_cierre, hasta=fecha_referencia - timedelta(days=1))
+        checkpoints = {
+            cp.movimiento_id: cp for cp in self.session.query(CheckpointKardex).filter(
+                CheckpointKardex.producto_id == prod_id,
+                CheckpointKardex.almacen_id == alm_id,
+                CheckpointKardex.fecha_documento >= fecha_referencia
+            )
+        }
+        posicion = None
+        cambios = []
+
+        while True:
+            pagina = self._pagina_par(prod_id, alm_id, posicion, fecha_referencia)
+            if not pagina:
+                break
+
+            self._calcular_por_lotes(pagina, metodo, lotes)
+            for mov in pagina:
+                checkpoint = checkpoints.get(mov.id)
+                if checkpoint is not None:
+                    checkpoint.fecha_documento = mov.fecha_documento
+                    checkpoint.saldo_cantidad = mov.saldo_cantidad
+                    checkpoint.saldo_costo_total = mov.saldo_costo_total
+
+            cambios.extend(self.filas_modificadas(pagina))
+            if len(cambios) >= self.TAMANIO_LOTE_ESCRITURA:
+                self.escribir_valorizacion_masiva(cambios)
+                cambios = []
+
+            posicion = (pagina[-1].fecha_documento, pagina[-1].id)
+
+        self.escribir_valorizacion_masiva(cambios)
 
     def registrar_movimiento(self, *, empresa_id, producto_id, almacen_id, tipo,
                              cantidad_entrada, cantidad_salida, costo_unitario,
@@ -219,52 +617,325 @@ class KardexManager:
                              destino_id=None, observaciones=""):
         """
         Busca el último saldo, calcula el nuevo y registra un movimiento de stock.
+        Un movimiento con fecha anterior al último del par deja pendiente el recálculo
+        de los posteriores.
         """
-        ultimo_mov = self.session.query(MovimientoStock).filter_by(
-            empresa_id=empresa_id,
-            producto_id=producto_id,
-            almacen_id=almacen_id
-        ).order_by(MovimientoStock.id.desc()).first()
+        return self.registrar_movimientos([dict(
+            empresa_id=empresa_id, producto_id=producto_id, almacen_id=almacen_id, tipo=tipo,
+            cantidad_entrada=cantidad_entrada, cantidad_salida=cantidad_salida,
+            costo_unitario=costo_unitario, costo_total=costo_total,
+            numero_documento=numero_documento, fecha_documento=fecha_documento,
+            destino_id=destino_id, observaciones=observaciones
+        )])[0]
+
+    def registrar_movimientos(self, movimientos):
+        """
+        Registra las líneas de un documento: el saldo de partida de todos los pares
+        (producto, almacén) se lee en una sola consulta, los saldos se encadenan en memoria
+        línea a línea (varias líneas de un mismo producto continúan una de otra) y las filas
+        se insertan en una sola sentencia. En PEPS/UEPS las salidas consumen las capas
+        abiertas del par y las de las entradas anteriores del mismo documento.
+
+        Args:
+            movimientos: dicts con los argumentos de registrar_movimiento y, opcionalmente,
+                otras columnas de MovimientoStock (tipo_documento, proveedor_id, cliente_id,
+                motivo_ajuste_id, moneda, tipo_cambio, ...). Los saldos los calcula el método.
+
+        Returns:
+            list: Movimientos creados, en el mismo orden.
+        """
+        if not movimientos:
+            return []
+
+        # El saldo de partida debe estar al día
+        self.procesar_recalculos_pendientes({(m['producto_id'], m['almacen_id']) for m in movimientos})
+
+        claves = {(m['empresa_id'], m['producto_id'], m['almacen_id']) for m in movimientos}
+        saldos = self._ultimos_saldos(claves)
+        metodos = {empresa_id: self._metodo_valuacion(empresa_id) for empresa_id, _, _ in claves}
+        capas = self._capas_abiertas({
+            (producto_id, almacen_id): metodos[empresa_id] for empresa_id, producto_id, almacen_id in claves
+            if metodos[empresa_id] in (MetodoValuacion.PEPS, MetodoValuacion.UEPS)
+        })
+
+        filas = []
+        for indice, datos in enumerate(movimientos):
+            clave = (datos['empresa_id'], datos['producto_id'], datos['almacen_id'])
+            cantidad_entrada = datos.get('cantidad_entrada') or 0
+            cantidad_salida = datos.get('cantidad_salida') or 0
+            costo_unitario = datos['costo_unitario']
+            costo_total = datos['costo_total']
+
+            # En PEPS/UEPS la salida consume las capas abiertas y su costo es el de las capas consumidas
+            capas_par = capas.get(clave[1:])
+            if capas_par is not None and cantidad_salida > 0:
+                costo_capas, cantidad_cubierta = self._consumir_capas(capas_par, cantidad_salida)
+                if cantidad_cubierta > 0:
+                    costo_total = costo_capas
+                    costo_unitario = costo_capas / Decimal(str(cantidad_salida))
+            if capas_par is not None and cantidad_entrada > 0:
+                # Capa de la entrada: posterior a las existentes y a las anteriores del documento
+                capas_par.nuevas.append([Decimal(str(cantidad_entrada)), Decimal(str(costo_unitario)), indice])
+
+            saldo_cant, saldo_costo = saldos.get(clave, (Decimal('0'), Decimal('0')))
+            saldo_cant += Decimal(str(cantidad_entrada)) - Decimal(str(cantidad_salida))
+            if cantidad_entrada > 0:
+                saldo_costo += Decimal(str(costo_total))
+            elif cantidad_salida > 0:
+                saldo_costo -= Decimal(str(costo_total))
+            saldos[clave] = (saldo_cant, saldo_costo)
+
+            filas.append({
+                'destino_id': None,
+                'observaciones': "",
+                **datos,
+                'cantidad_entrada': float(cantidad_entrada),
+                'cantidad_salida': float(cantidad_salida),
+                'costo_unitario': float(costo_unitario),
+                'costo_total': float(costo_total),
+                'saldo_cantidad': float(saldo_cant),
+                'saldo_costo_total': float(saldo_costo),
+            })
+
+        creados = self.session.scalars(
+            insert(MovimientoStock).returning(MovimientoStock, sort_by_parameter_order=True), filas
+        ).all()
+
+        for movimiento in creados:
+            if not self._registrar_saldo_actual(movimiento):
+                ColaRecalculo(self.session).encolar(
+                    {(movimiento.producto_id, movimiento.almacen_id)}, movimiento.fecha_documento
+                )
+
+        # Capas: las existentes consumidas se actualizan y las de las entradas se crean
+        for (producto_id, almacen_id), capas_par in capas.items():
+            for restante, _, capa in capas_par.leidas:
+                if restante <= 0:
+                    self.session.delete(capa)
+                elif float(restante) != capa.cantidad_restante:
+                    capa.cantidad_restante = float(restante)
+            for restante, costo_capa, indice in capas_par.nuevas:
+                if restante > 0:
+                    movimiento = creados[indice]
+                    self.session.add(CapaCosto(
+                        empresa_id=movimiento.empresa_id,
+                        producto_id=producto_id,
+                        almacen_id=almacen_id,
+                        movimiento=movimiento,
+                        fecha_documento=movimiento.fecha_documento,
+                        cantidad_restante=float(restante),
+                        costo_unitario=float(costo_capa)
+                    ))
+
+        return creados
+
+    def movimientos_documento(self, tipos, tipo_documento, numero_documento):
+        """
+        Movimientos de los tipos indicados registrados con el documento, en una sola consulta
+        (idx_mov_documento).
 
-        saldo_anterior_cant = Decimal(str(ultimo_mov.saldo_cantidad)) if ultimo_mov else Decimal('0')
-        saldo_anterior_costo = Decimal(str(ultimo_mov.saldo_costo_total)) if ultimo_mov else Decimal('0')
+        Returns:
+            dict: {(producto_id, almacen_id): [movimientos en orden de id]}
+        """
+        por_par = {}
+        for mov in sorted(self.session.scalars(
+            select(MovimientoStock).where(
+                MovimientoStock.numero_documento == numero_documento,
+                MovimientoStock.tipo_documento == tipo_documento,
+                MovimientoStock.tipo.in_(tipos),
+            )
+        ), key=lambda m: m.id):
+            por_par.setdefault((mov.producto_id, mov.almacen_id), []).append(mov)
+        return por_par
+
+    def fecha_editable(self, fecha):
+        """
+        Indica si un movimiento de esa fecha puede corregirse en su propia fila: su año
+        contable está abierto y ningún cierre anual del Kardex lo incluye.
+        """
+        anio_cierre = self.ultimo_cierre()
+        if anio_cierre is not None and fecha <= self.fecha_cierre(anio_cierre):
+            return False
+        estado = self.session.scalar(select(AnioContable.estado).where(AnioContable.anio == fecha.year))
+        return estado == EstadoAnio.ABIERTO
 
-        # Calcular nuevo saldo de cantidad
-        nuevo_saldo_cant = saldo_anterior_cant + Decimal(str(cantidad_entrada)) - Decimal(str(cantidad_salida))
+    def corregir_movimiento(self, movimiento, usuario_id=None, motivo=None, **cambios):
+        """
+        Corrige un movimiento en su propia fila, en lugar de agregar una reversión y un
+        movimiento nuevo, y deja los valores anteriores en la auditoría. Los saldos del par
+        los recalcula quien llama, desde la fecha más antigua entre la anterior y la nueva.
 
-        # Calcular nuevo saldo de costo
-        nuevo_saldo_costo = saldo_anterior_costo
-        if cantidad_entrada > 0:
-            nuevo_saldo_costo += Decimal(str(costo_total))
-        elif cantidad_salida > 0:
-            nuevo_saldo_costo -= Decimal(str(costo_total))
+        Returns:
+            bool: True si cambió algún campo.
+        """
+        diferencias = {
+            campo: [getattr(movimiento, campo), valor]
+            for campo, valor in cambios.items()
+            if getattr(movimiento, campo) != valor
+        }
+        if not diferencias:
+            return False
+
+        for campo, (_, valor) in diferencias.items():
+            setattr(movimiento, campo, valor)
+        AuditService.log_action(self.session, usuario_id, 'UPDATE', MovimientoStock.__tablename__,
+                                movimiento.id, {'cambios': diferencias, 'motivo': motivo})
+        return True
+
+    def eliminar_movimiento(self, movimiento, usuario_id=None, motivo=None):
+        """
+        Elimina un movimiento (una línea quitada de un documento) y deja la fila en la
+        auditoría. Los saldos del par los recalcula quien llama.
+        """
+        AuditService.log_action(self.session, usuario_id, 'DELETE', MovimientoStock.__tablename__, movimiento.id, {
+            'movimiento': {
+                columna.key: getattr(movimiento, columna.key) for columna in MovimientoStock.__table__.columns
+            },
+            'motivo': motivo,
+        })
+        # La capa de una entrada eliminada no debe consumirse antes del recálculo
+        self.session.execute(delete(CapaCosto).where(CapaCosto.movimiento_id == movimiento.id))
+        self.session.delete(movimiento)
+
+    def _ultimos_saldos(self, claves):
+        """
+        Saldo del último movimiento registrado (mayor id) de cada (empresa, producto, almacén),
+        en una consulta por lote de claves.
 
-        # Crear la instancia del movimiento
-        movimiento = MovimientoStock(
-            empresa_id=empresa_id,
-            producto_id=producto_id,
-            almacen_id=almacen_id,
-            tipo=tipo,
-            numero_documento=numero_documento,
-            fecha_documento=fecha_documento,
-            destino_id=destino_id,
-            cantidad_entrada=float(cantidad_entrada),
-            cantidad_salida=float(cantidad_salida),
-            costo_unitario=float(costo_unitario),
-            costo_total=float(costo_total),
-            saldo_cantidad=float(nuevo_saldo_cant),
-            saldo_costo_total=float(nuevo_saldo_costo),
-            observaciones=observaciones
+        Returns:
+            dict: {(empresa_id, producto_id, almacen_id): (cantidad, valor)} en Decimal;
+                  sin entrada para las claves sin movimientos.
+        """
+        claves = list(claves)
+        saldos = {}
+        for inicio in range(0, len(claves), self.TAMANIO_LOTE_PARES):
+            tabla = self._tabla_constantes(
+                claves[inicio:inicio + self.TAMANIO_LOTE_PARES], ('empresa_id', 'producto_id', 'almacen_id')
+            )
+            # Último id de cada clave con idx_mov_emp_prod_alm_id
+            ultimo_id = select(MovimientoStock.id).where(
+                MovimientoStock.empresa_id == tabla.c.empresa_id,
+                MovimientoStock.producto_id == tabla.c.producto_id,
+                MovimientoStock.almacen_id == tabla.c.almacen_id
+            ).order_by(MovimientoStock.id.desc()).limit(1).correlate(tabla).scalar_subquery()
+
+            for fila in self.session.execute(
+                    select(MovimientoStock.empresa_id, MovimientoStock.producto_id, MovimientoStock.almacen_id,
+                           MovimientoStock.saldo_cantidad, MovimientoStock.saldo_costo_total)
+                    .where(MovimientoStock.id.in_(select(ultimo_id).select_from(tabla)))):
+                saldos[(fila.empresa_id, fila.producto_id, fila.almacen_id)] = (
+                    Decimal(str(fila.saldo_cantidad)), Decimal(str(fila.saldo_costo_total))
+                )
+        return saldos
+
+    def _capas_abiertas(self, metodos):
+        """
+        Estado de consumo de las capas de los pares (producto, almacén) para _consumir_capas.
+        No lee nada todavía: las capas existentes se leen por páginas, en el orden del
+        método, solo cuando una salida llega a ellas (como _costo_capas con consumir=True).
+
+        Args:
+            metodos: {par: MetodoValuacion} de los pares valuados con PEPS/UEPS.
+
+        Returns:
+            dict: {par: SimpleNamespace} con las capas leídas y las de las entradas del
+                  documento ([restante, costo_unitario, capa o índice del movimiento]).
+        """
+        return {
+            (producto_id, almacen_id): SimpleNamespace(
+                producto_id=producto_id, almacen_id=almacen_id, metodo=metodo,
+                leidas=[], ultima=None, agotada=False, nuevas=[]
+            )
+            for (producto_id, almacen_id), metodo in metodos.items()
+        }
+
+    def _leer_capas(self, capas_par):
+        """
+        Siguiente página de capas abiertas del par en el orden del método, con
+        idx_capa_prod_alm_orden y posición (fecha, movimiento) de la última leída.
+        """
+        query = self.session.query(CapaCosto).filter_by(
+            producto_id=capas_par.producto_id, almacen_id=capas_par.almacen_id
         )
-        self.session.add(movimiento)
+        ueps = capas_par.metodo == MetodoValuacion.UEPS
+        if capas_par.ultima is not None:
+            fecha, movimiento_id = capas_par.ultima
+            if ueps:
+                query = query.filter(or_(
+                    CapaCosto.fecha_documento < fecha,
+                    and_(CapaCosto.fecha_documento == fecha, CapaCosto.movimiento_id < movimiento_id)
+                ))
+            else:
+                query = query.filter(or_(
+                    CapaCosto.fecha_documento > fecha,
+                    and_(CapaCosto.fecha_documento == fecha, CapaCosto.movimiento_id > movimiento_id)
+                ))
+        if ueps:
+            query = query.order_by(CapaCosto.fecha_documento.desc(), CapaCosto.movimiento_id.desc())
+        else:
+            query = query.order_by(CapaCosto.fecha_documento, CapaCosto.movimiento_id)
 
-    def calcular_costo_salida(self, empresa_id, producto_id, almacen_id, cantidad):
+        pagina = query.limit(self.TAMANIO_PAGINA_CAPAS).all()
+        capas_par.agotada = len(pagina) < self.TAMANIO_PAGINA_CAPAS
+        if pagina:
+            capas_par.ultima = (pagina[-1].fecha_documento, pagina[-1].movimiento_id)
+        leidas = [[Decimal(str(capa.cantidad_restante)), Decimal(str(capa.costo_unitario)), capa] for capa in pagina]
+        capas_par.leidas.extend(leidas)
+        return leidas
+
+    def _capas_en_orden(self, capas_par):
+        """
+        Capas del par en el orden del método: las de las entradas del documento son
+        las más recientes (PEPS las toma al final; UEPS, primero).
+        """
+        if capas_par.metodo == MetodoValuacion.UEPS:
+            yield from reversed(capas_par.nuevas)
+        yield from capas_par.leidas
+        while not capas_par.agotada:
+            yield from self._leer_capas(capas_par)
+        if capas_par.metodo != MetodoValuacion.UEPS:
+            yield from capas_par.nuevas
+
+    def _consumir_capas(self, capas_par, cantidad):
+        """
+        Toma `cantidad` de las capas del par en el orden del método (PEPS: las más
+        antiguas primero; UEPS: las más recientes), como _costo_capas con consumir=True.
+
+        Returns:
+            tuple: (costo_total, cantidad_cubierta) en Decimal.
+        """
+        pendiente = Decimal(str(cantidad))
+        costo_total = Decimal('0')
+        for capa in self._capas_en_orden(capas_par):
+            tomar = min(pendiente, capa[0])
+            if tomar > 0:
+                costo_total += tomar * capa[1]
+                capa[0] -= tomar
+                pendiente -= tomar
+            if pendiente <= 0:
+                break
+        return costo_total, Decimal(str(cantidad)) - pendiente
+
+    def calcular_costo_salida(self, empresa_id, producto_id, almacen_id, cantidad, forzar_recalculo=False):
         """
         Calcula el costo de los bienes vendidos según el método de valuación.
+        PEPS/UEPS se leen de las capas de costo abiertas (sin consumirlas); Promedio
+        Ponderado, del saldo del último movimiento.
+        Con forzar_recalculo=True (al guardar) recalcula antes el rango pendiente del par,
+        si lo hay; las vistas previas no escriben en la base de datos.
         Retorna (costo_unitario, costo_total)
         """
-        # Para simplificar, usamos promedio ponderado.
-        # En producción, se deberían implementar los 3 métodos.
+        if forzar_recalculo:
+            self.procesar_recalculos_pendientes({(producto_id, almacen_id)})
+
+        metodo = self._metodo_valuacion(empresa_id)
+        if metodo in (MetodoValuacion.PEPS, MetodoValuacion.UEPS):
+            costo_total, cantidad_cubierta = self._costo_capas(producto_id, almacen_id, cantidad, metodo)
+            # Sin capas (datos anteriores a las capas de costo) se usa el promedio como respaldo
+            if cantidad_cubierta > 0:
+                cantidad_dec = Decimal(str(cantidad))
+                return float(costo_total / cantidad_dec), float(costo_total)
+
         ultimo_mov = self.session.query(MovimientoStock).filter_by(
             empresa_id=empresa_id,
             producto_id=producto_id,
@@ -280,46 +951,538 @@ class KardexManager:
 
         return float(costo_unitario), float(costo_total)
 
-    def obtener_stock_actual(self, producto_id, almacen_id, fecha=None):
+    def _metodo_valuacion(self, empresa_id):
+        empresa = self.session.get(Empresa, empresa_id)
+        return empresa.metodo_valuacion if empresa else MetodoValuacion.PROMEDIO_PONDERADO
+
+    def _costo_capas(self, producto_id, almacen_id, cantidad, metodo, consumir=False):
         """
-        Obtiene el stock actual de un producto en un almacén.
-        Si se proporciona fecha, obtiene el stock a esa fecha.
+        Costo de tomar `cantidad` de las capas abiertas en el orden del método (PEPS: las más
+        antiguas primero; UEPS: las más recientes). Solo lee las capas que toca.
+        Con consumir=True descuenta las cantidades tomadas y elimina las capas agotadas.
+
+        Returns:
+            tuple: (costo_total, cantidad_cubierta) en Decimal.
         """
-        query = self.session.query(MovimientoStock).filter_by(
-            producto_id=producto_id,
-            almacen_id=almacen_id
+        query = self.session.query(CapaCosto).filter_by(producto_id=producto_id, almacen_id=almacen_id)
+        if metodo == MetodoValuacion.UEPS:
+            query = query.order_by(CapaCosto.fecha_documento.desc(), CapaCosto.movimiento_id.desc())
+        else:
+            query = query.order_by(CapaCosto.fecha_documento, CapaCosto.movimiento_id)
+
+        pendiente = Decimal(str(cantidad))
+        costo_total = Decimal('0')
+        tomadas = []
+        for capa in query.yield_per(100):
+            if pendiente <= 0:
+                break
+            restante = Decimal(str(capa.cantidad_restante))
+            tomar = min(pendiente, restante)
+            costo_total += tomar * Decimal(str(capa.costo_unitario))
+            pendiente -= tomar
+            tomadas.append((capa, restante - tomar))
+
+        if consumir:
+            for capa, restante in tomadas:
+                if restante > 0:
+                    capa.cantidad_restante = float(restante)
+                else:
+                    self.session.delete(capa)
+
+        return costo_total, Decimal(str(cantidad)) - pendiente
+
+    def reconstruir_capas_costo(self, pares):
+        """
+        Reconstruye las capas abiertas de los pares (producto, almacén) recorriendo su historial
+        desde las capas del último cierre anual. Solo actúa sobre empresas valuadas con PEPS/UEPS; se usa tras los recálculos y para
+        generar las capas de datos registrados antes de que existieran.
+        """
+        for prod_id, alm_id in pares:
+            almacen = self.session.get(Almacen, alm_id)
+            if not almacen:
+                continue
+            metodo = self._metodo_valuacion(almacen.empresa_id)
+            if metodo not in (MetodoValuacion.PEPS, MetodoValuacion.UEPS):
+                continue
+
+            self.session.query(CapaCosto).filter_by(
+                producto_id=prod_id, almacen_id=alm_id
+            ).delete(synchronize_session=False)
+
+            lotes = self._lotes_par(prod_id, alm_id, metodo, self.ultimo_cierre())
+
+            self.session.add_all(
+                CapaCosto(
+                    empresa_id=fila.empresa_id,
+                    producto_id=prod_id,
+                    almacen_id=alm_id,
+                    movimiento_id=fila.id,
+                    fecha_documento=fila.fecha_documento,
+                    cantidad_restante=float(restante),
+                    costo_unitario=float(costo_unitario)
+                )
+                for fila, restante, costo_unitario in lotes
+            )
+
+    def _lotes_par(self, prod_id, alm_id, metodo, anio_cierre, hasta=None):
+        """
+        Lotes abiertos de un par tras sus movimientos hasta `hasta` (o todos), partiendo de
+        las capas del cierre `anio_cierre`. La referencia de cada lote es el movimiento de
+        entrada (id, empresa_id, fecha_documento).
+        """
+        lotes = ColaLotes(metodo)
+        filtros = [MovimientoStock.producto_id == prod_id, MovimientoStock.almacen_id == alm_id]
+        if anio_cierre is not None:
+            for cierre in self.leer_cierres(self.session, anio_cierre, [prod_id], almacen_id=alm_id).get(prod_id, []):
+                for capa in cierre.capas:
+                    lotes.agregar(capa.cantidad, capa.costo_unitario, referencia=SimpleNamespace(
+                        id=capa.movimiento_id, empresa_id=cierre.empresa_id, fecha_documento=capa.fecha_documento
+                    ))
+            filtros.append(MovimientoStock.fecha_documento > self.fecha_cierre(anio_cierre))
+        if hasta is not None:
+            filtros.append(MovimientoStock.fecha_documento <= hasta)
+
+        filas = self.session.execute(
+            select(
+                MovimientoStock.id, MovimientoStock.empresa_id, MovimientoStock.fecha_documento,
+                MovimientoStock.cantidad_entrada, MovimientoStock.cantidad_salida,
+                MovimientoStock.costo_unitario
+            ).where(*filtros).order_by(MovimientoStock.fecha_documento, MovimientoStock.id)
+        ).all()
+
+        for fila in filas:
+            if (fila.cantidad_entrada or 0) > 0:
+                lotes.agregar(fila.cantidad_entrada, fila.costo_unitario or 0, referencia=fila)
+            else:
+                lotes.consumir(fila.cantidad_salida or 0)
+        return lotes
+
+    # ==========================================
+    # CIERRES ANUALES (saldos al 31 de diciembre)
+    # ==========================================
+
+    @staticmethod
+    def fecha_cierre(anio):
+        return date(anio, 12, 31)
+
+    def ultimo_cierre(self, antes_de=None):
+        """
+        Último año con cierre de kardex (o el último anterior al año de la fecha `antes_de`).
+        Los movimientos hasta su 31 de diciembre no se vuelven a leer: su saldo está en kardex_cierres.
+        """
+        consulta = select(func.max(CierreKardex.anio))
+        if antes_de is not None:
+            consulta = consulta.where(CierreKardex.anio < antes_de.year)
+        return self.session.execute(consulta).scalar()
+
+    @staticmethod
+    def leer_cierres(conexion, anio, producto_ids=None, empresa_id=None, almacen_id=None):
+        """
+        Cierres de `anio` con sus capas, como objetos simples. Acepta una sesión o una
+        conexión (procesos de regeneración).
+
+        Returns:
+            dict: {producto_id: [cierre, ...]}; cada cierre lleva .capas en orden de ingreso.
+        """
+        if anio is None:
+            return {}
+
+        filtros = [CierreKardex.anio == anio]
+        filtros_capas = [CierreKardexCapa.anio == anio]
+        if producto_ids is not None:
+            filtros.append(CierreKardex.producto_id.in_(list(producto_ids)))
+            filtros_capas.append(CierreKardexCapa.producto_id.in_(list(producto_ids)))
+        if almacen_id is not None:
+            filtros.append(CierreKardex.almacen_id == almacen_id)
+            filtros_capas.append(CierreKardexCapa.almacen_id == almacen_id)
+        if empresa_id is not None:
+            filtros.append(CierreKardex.empresa_id == empresa_id)
+
+        cierres = {}
+        por_par = {}
+        for fila in conexion.execute(select(CierreKardex.__table__).where(*filtros)):
+            cierre = SimpleNamespace(**fila._asdict(), capas=[])
+            cierres.setdefault(cierre.producto_id, []).append(cierre)
+            por_par[(cierre.producto_id, cierre.almacen_id)] = cierre
+
+        if por_par:
+            capas = conexion.execute(
+                select(CierreKardexCapa.__table__).where(*filtros_capas).order_by(
+                    CierreKardexCapa.anio, CierreKardexCapa.producto_id,
+                    CierreKardexCapa.almacen_id, CierreKardexCapa.orden
+                )
+            )
+            for capa in capas:
+                cierre = por_par.get((capa.producto_id, capa.almacen_id))
+                if cierre is not None:
+                    cierre.capas.append(capa)
+        return cierres
+
+    @staticmethod
+    def movimientos_apertura(cierres, metodo):
+        """
+        Entradas que reproducen, al inicio de una cadena de recálculo, el saldo de los cierres
+        de UN producto: una por capa abierta en PEPS/UEPS y, en Promedio Ponderado, una por
+        almacén con su cantidad y valor. Tienen id None, así que filas_modificadas las omite.
+        """
+        aperturas = []
+        for cierre in cierres:
+            if metodo in (MetodoValuacion.PEPS, MetodoValuacion.UEPS):
+                partidas = [(capa.fecha_documento, capa.movimiento_id, capa.cantidad,
+                             Decimal(str(capa.costo_unitario))) for capa in cierre.capas]
+            elif cierre.cantidad > 0:
+                partidas = [(cierre.fecha_ultimo_movimiento, cierre.ultimo_movimiento_id, cierre.cantidad,
+                             Decimal(str(cierre.valor_total)) / Decimal(str(cierre.cantidad)))]
+            else:
+                partidas = []
+
+            for fecha, movimiento_id, cantidad, costo_unitario in partidas:
+                aperturas.append(SimpleNamespace(
+                    id=None, producto_id=cierre.producto_id, almacen_id=cierre.almacen_id,
+                    fecha_documento=fecha, movimiento_origen_id=movimiento_id or 0,
+                    cantidad_entrada=cantidad, cantidad_salida=0.0,
+                    costo_unitario=float(costo_unitario),
+                    costo_total=float(Decimal(str(cantidad)) * costo_unitario),
+                    saldo_cantidad=None, saldo_costo_total=None, version_id=None, almacenado=None
+                ))
+
+        aperturas.sort(key=lambda m: (m.fecha_documento or date.min, m.movimiento_origen_id))
+        return aperturas
+
+    def apertura_kardex(self, empresa_id, producto_id, fecha_desde, almacen_id=None):
+        """
+        Movimientos que llevan el kardex de un producto (de todos los almacenes o de uno)
+        hasta el inicio de fecha_desde: las aperturas del último cierre anterior y los
+        movimientos entre ese cierre y la fecha, como filas planas. No lee años cerrados.
+        """
+        anio_cierre = self.ultimo_cierre(antes_de=fecha_desde)
+        cierres = self.leer_cierres(self.session, anio_cierre, [producto_id],
+                                    empresa_id=empresa_id, almacen_id=almacen_id)
+
+        consulta = select(*self.COLUMNAS_VALORIZACION).where(
+            MovimientoStock.empresa_id == empresa_id,
+            MovimientoStock.producto_id == producto_id,
+            MovimientoStock.fecha_documento < fecha_desde
         )
+        if almacen_id is not None:
+            consulta = consulta.where(MovimientoStock.almacen_id == almacen_id)
+        if anio_cierre is not None:
+            consulta = consulta.where(MovimientoStock.fecha_documento > self.fecha_cierre(anio_cierre))
+
+        return self.movimientos_apertura(
+            cierres.get(producto_id, []), self._metodo_valuacion(empresa_id)
+        ) + self.a_movimientos_planos(self.session.execute(
+            consulta.order_by(MovimientoStock.fecha_documento, MovimientoStock.id)
+        ).all())
+
+    def generar_cierre_anual(self, anio):
+        """
+        Guarda en kardex_cierres el saldo al 31 de diciembre de `anio` de cada (producto, almacén)
+        y, en PEPS/UEPS, sus capas abiertas. Parte del cierre anterior, de modo que solo lee
+        los movimientos del propio año.
 
-        if fecha:
-            query = query.filter(MovimientoStock.fecha_documento <= fecha)
+        Returns:
+            int: cantidad de cierres generados.
+        """
+        # Los saldos del año deben estar recalculados antes de tomarlos
+        self.procesar_recalculos_pendientes()
+        self.session.flush()
+
+        corte = self.fecha_cierre(anio)
+        anio_base = self.ultimo_cierre(antes_de=corte)
+        corte_base = self.fecha_cierre(anio_base) if anio_base is not None else date.min
+        self._eliminar_cierres(CierreKardex.anio == anio, CierreKardexCapa.anio == anio)
+
+        base = {
+            (cierre.producto_id, cierre.almacen_id): cierre
+            for cierres in self.leer_cierres(self.session, anio_base).values() for cierre in cierres
+        }
+
+        # Saldo de cada par tras su último movimiento del año: el vigente si es de este año,
+        # el del cierre anterior si no tuvo movimientos, o el último hasta el corte
+        saldos = {}
+        for saldo in self.session.query(SaldoActual):
+            par = (saldo.producto_id, saldo.almacen_id)
+            fecha = saldo.fecha_ultimo_movimiento
+            if fecha is None or fecha <= corte_base:
+                continue
+            if fecha <= corte:
+                saldos[par] = SimpleNamespace(
+                    empresa_id=saldo.empresa_id, cantidad=saldo.cantidad, valor_total=saldo.valor_total,
+                    ultimo_movimiento_id=saldo.ultimo_movimiento_id, fecha_ultimo_movimiento=fecha
+                )
+                continue
 
-        # Ordenar para obtener el último movimiento relevante
-        ultimo_mov = query.order_by(MovimientoStock.fecha_documento.desc(), MovimientoStock.id.desc()).first()
+            ultimo = self.session.execute(
+                select(
+                    MovimientoStock.id.label('ultimo_movimiento_id'), MovimientoStock.empresa_id,
+                    MovimientoStock.saldo_cantidad.label('cantidad'),
+                    MovimientoStock.saldo_costo_total.label('valor_total'),
+                    MovimientoStock.fecha_documento.label('fecha_ultimo_movimiento')
+                ).where(
+                    MovimientoStock.producto_id == saldo.producto_id,
+                    MovimientoStock.almacen_id == saldo.almacen_id,
+                    MovimientoStock.fecha_documento > corte_base,
+                    MovimientoStock.fecha_documento <= corte
+                ).order_by(MovimientoStock.fecha_documento.desc(), MovimientoStock.id.desc()).limit(1)
+            ).first()
+            if ultimo is not None:
+                saldos[par] = ultimo
+
+        for par, cierre in base.items():
+            saldos.setdefault(par, cierre)
+
+        for (prod_id, alm_id), saldo in saldos.items():
+            cierre = CierreKardex(
+                anio=anio,
+                producto_id=prod_id,
+                almacen_id=alm_id,
+                empresa_id=saldo.empresa_id,
+                cantidad=saldo.cantidad or 0,
+                valor_total=saldo.valor_total or 0,
+                ultimo_movimiento_id=saldo.ultimo_movimiento_id,
+                fecha_ultimo_movimiento=saldo.fecha_ultimo_movimiento
+            )
+            metodo = self._metodo_valuacion(saldo.empresa_id)
+            if metodo in (MetodoValuacion.PEPS, MetodoValuacion.UEPS):
+                lotes = self._lotes_par(prod_id, alm_id, metodo, anio_base, hasta=corte)
+                cierre.capas = [
+                    CierreKardexCapa(
+                        orden=orden,
+                        movimiento_id=referencia.id,
+                        fecha_documento=referencia.fecha_documento,
+                        cantidad=float(cantidad),
+                        costo_unitario=float(costo_unitario)
+                    )
+                    for orden, (referencia, cantidad, costo_unitario) in enumerate(lotes)
+                ]
+            self.session.add(cierre)
+
+        return len(saldos)
+
+    def invalidar_cierres_desde(self, anio):
+        """Elimina los cierres de `anio` y de los años siguientes (al reabrir un año)."""
+        self._eliminar_cierres(CierreKardex.anio >= anio, CierreKardexCapa.anio >= anio)
+
+    def _eliminar_cierres(self, condicion, condicion_capas):
+        self.session.flush()
+        self.session.execute(delete(CierreKardexCapa).where(condicion_capas))
+        self.session.execute(delete(CierreKardex).where(condicion))
+        for objeto in list(self.session.identity_map.values()):
+            if isinstance(objeto, (CierreKardex, CierreKardexCapa)):
+                self.session.expunge(objeto)
+
+    # ==========================================
+    # SALDO ACTUAL (stock vigente materializado)
+    # ==========================================
+
+    def _registrar_saldo_actual(self, movimiento):
+        """
+        Lleva a saldo_actual el saldo del movimiento recién registrado, en la misma
+        transacción. Un movimiento con fecha anterior al último no es el saldo vigente:
+        el recálculo posterior del par actualiza la fila.
 
-        if ultimo_mov:
-            return ultimo_mov.saldo_cantidad
-        return 0.0
+        Returns:
+            bool: False si el movimiento es anterior al último registrado del par.
+        """
+        saldo = self.session.get(
+            SaldoActual, (movimiento.empresa_id, movimiento.producto_id, movimiento.almacen_id)
+        )
+        if saldo is None:
+            saldo = SaldoActual(
+                empresa_id=movimiento.empresa_id,
+                producto_id=movimiento.producto_id,
+                almacen_id=movimiento.almacen_id
+            )
+            self.session.add(saldo)
+        elif saldo.fecha_ultimo_movimiento and movimiento.fecha_documento < saldo.fecha_ultimo_movimiento:
+            return False
+
+        saldo.cantidad = movimiento.saldo_cantidad
+        saldo.valor_total = movimiento.saldo_costo_total
+        saldo.ultimo_movimiento = movimiento
+        saldo.fecha_ultimo_movimiento = movimiento.fecha_documento
+        return True
+
+    def actualizar_saldo_actual(self, pares):
+        """
+        Vuelve a tomar de los movimientos el saldo vigente de los pares (producto, almacén):
+        el del último movimiento en orden cronológico. Elimina la fila si ya no hay movimientos.
+        """
+        for prod_id, alm_id in pares:
+            ultimo = self.session.execute(
+                select(
+                    MovimientoStock.id, MovimientoStock.empresa_id, MovimientoStock.fecha_documento,
+                    MovimientoStock.saldo_cantidad, MovimientoStock.saldo_costo_total
+                ).where(
+                    MovimientoStock.producto_id == prod_id,
+                    MovimientoStock.almacen_id == alm_id
+                ).order_by(MovimientoStock.fecha_documento.desc(), MovimientoStock.id.desc()).limit(1)
+            ).first()
+
+            existentes = self.session.query(SaldoActual).filter_by(producto_id=prod_id, almacen_id=alm_id).all()
+            for saldo in existentes:
+                if ultimo is None or saldo.empresa_id != ultimo.empresa_id:
+                    self.session.delete(saldo)
+            if ultimo is None:
+                continue
 
-    def obtener_stock_global_producto(self, producto_id):
+            saldo = self.session.get(SaldoActual, (ultimo.empresa_id, prod_id, alm_id))
+            if saldo is None:
+                saldo = SaldoActual(empresa_id=ultimo.empresa_id, producto_id=prod_id, almacen_id=alm_id)
+                self.session.add(saldo)
+            saldo.cantidad = ultimo.saldo_cantidad or 0
+            saldo.valor_total = ultimo.saldo_costo_total or 0
+            saldo.ultimo_movimiento_id = ultimo.id
+            saldo.fecha_ultimo_movimiento = ultimo.fecha_documento
+
+    def reconstruir_saldo_actual(self, empresa_id=None):
+        """
+        Regenera saldo_actual desde los movimientos con una sola sentencia
+        INSERT ... SELECT (último movimiento cronológico de cada par, buscado con
+        idx_mov_prod_alm_fecha_id en lugar de ordenar toda la tabla).
+
+        Returns:
+            int: número de filas de saldo generadas.
+        """
+        self.session.flush()
+
+        borrar = delete(SaldoActual)
+        if empresa_id is not None:
+            borrar = borrar.where(SaldoActual.empresa_id == empresa_id)
+        self.session.execute(borrar)
+
+        # Pares con movimientos y, para cada uno, su último movimiento (búsqueda por índice)
+        pares = select(MovimientoStock.producto_id, MovimientoStock.almacen_id).distinct()
+        if empresa_id is not None:
+            pares = pares.where(MovimientoStock.empresa_id == empresa_id)
+        pares = pares.subquery()
+
+        anterior = aliased(MovimientoStock)
+        ultimo_id = select(anterior.id).where(
+            anterior.producto_id == pares.c.producto_id,
+            anterior.almacen_id == pares.c.almacen_id
+        ).order_by(anterior.fecha_documento.desc(), anterior.id.desc()).limit(1).scalar_subquery()
+
+        resultado = self.session.execute(
+            insert(SaldoActual).from_select(
+                ['empresa_id', 'producto_id', 'almacen_id', 'cantidad', 'valor_total',
+                 'ultimo_movimiento_id', 'fecha_ultimo_movimiento', 'fecha_actualizacion'],
+                select(
+                    MovimientoStock.empresa_id, MovimientoStock.producto_id, MovimientoStock.almacen_id,
+                    func.coalesce(MovimientoStock.saldo_cantidad, 0),
+                    func.coalesce(MovimientoStock.saldo_costo_total, 0),
+                    MovimientoStock.id, MovimientoStock.fecha_documento, func.current_timestamp()
+                ).select_from(pares).join(MovimientoStock, MovimientoStock.id == ultimo_id)
+            )
+        )
+        # Las instancias de SaldoActual en la sesión ya no reflejan la tabla
+        for objeto in list(self.session.identity_map.values()):
+            if isinstance(objeto, SaldoActual):
+                self.session.expire(objeto)
+        return resultado.rowcount
+
+    def obtener_saldos_al(self, fecha_corte, empresa_id=None):
+        """
+        Saldos por (empresa, producto, almacén) al cierre de `fecha_corte`. Los pares cuyo
+        saldo vigente es anterior o igual al corte se toman de saldo_actual; para el resto
+        se busca su último movimiento hasta la fecha de corte.
+
+        Returns:
+            dict: {(empresa_id, producto_id, almacen_id): (cantidad, valor_total)}
+        """
+        query = self.session.query(SaldoActual)
+        if empresa_id is not None:
+            query = query.filter_by(empresa_id=empresa_id)
+
+        saldos = {}
+        posteriores = []
+        for saldo in query:
+            clave = (saldo.empresa_id, saldo.producto_id, saldo.almacen_id)
+            if saldo.fecha_ultimo_movimiento and saldo.fecha_ultimo_movimiento <= fecha_corte:
+                saldos[clave] = (saldo.cantidad, saldo.valor_total)
+            else:
+                posteriores.append(clave)
+
+        for clave in posteriores:
+            _, prod_id, alm_id = clave
+            ultimo = self.session.execute(
+                select(MovimientoStock.saldo_cantidad, MovimientoStock.saldo_costo_total).where(
+                    MovimientoStock.producto_id == prod_id,
+                    MovimientoStock.almacen_id == alm_id,
+                    MovimientoStock.fecha_documento <= fecha_corte
+                ).order_by(MovimientoStock.fecha_documento.desc(), MovimientoStock.id.desc()).limit(1)
+            ).first()
+            if ultimo:
+                saldos[clave] = (ultimo.saldo_cantidad or 0, ultimo.saldo_costo_total or 0)
+
+        return saldos
+
+    def _pares_empresa(self, empresa_id):
+        return {
+            (prod_id, alm_id) for prod_id, alm_id in self.session.query(
+                MovimientoStock.producto_id, MovimientoStock.almacen_id
+            ).filter_by(empresa_id=empresa_id).distinct()
+        }
+
+    def obtener_stock_actual(self, producto_id, almacen_id, fecha=None):
         """
-        Obtiene el stock total de un producto sumando todos los almacenes (último saldo de cada uno).
+        Obtiene el stock actual de un producto en un almacén.
+        Si se proporciona fecha, obtiene el stock a esa fecha.
         """
-        # Buscar todos los almacenes que tienen movimientos de este producto
-        almacenes = self.session.query(MovimientoStock.almacen_id).filter_by(
-            producto_id=producto_id
-        ).distinct().all()
+        return self.obtener_stock_bulk([(producto_id, almacen_id)], fecha)[(producto_id, almacen_id)]
 
-        total_stock = 0.0
-        for (alm_id,) in almacenes:
-            ultimo_mov = self.session.query(MovimientoStock).filter_by(
-                producto_id=producto_id,
-                almacen_id=alm_id
-            ).order_by(MovimientoStock.id.desc()).first()
+    def obtener_stock_bulk(self, pares, fecha=None):
+        """
+        Stock de varios pares (producto, almacén) en una sola consulta: el saldo del último
+        movimiento de cada par (hasta `fecha`, si se indica), igual que obtener_stock_actual.
+        Los pares viajan como una tabla derivada (UNION ALL de constantes) y cada uno busca
+        su último movimiento con idx_mov_prod_alm_fecha_id.
 
-            if ultimo_mov:
-                total_stock += ultimo_mov.saldo_cantidad
+        Returns:
+            dict: {(producto_id, almacen_id): cantidad}; 0.0 para los pares sin movimientos.
+        """
+        pares = list(dict.fromkeys(pares))
+        stock = {}
+        for inicio in range(0, len(pares), self.TAMANIO_LOTE_PARES):
+            tabla_pares = self._tabla_constantes(
+                pares[inicio:inicio + self.TAMANIO_LOTE_PARES], ('producto_id', 'almacen_id')
+            )
+
+            ultimo_saldo = select(MovimientoStock.saldo_cantidad).where(
+                MovimientoStock.producto_id == tabla_pares.c.producto_id,
+                MovimientoStock.almacen_id == tabla_pares.c.almacen_id
+            )
+            if fecha:
+                ultimo_saldo = ultimo_saldo.where(MovimientoStock.fecha_documento <= fecha)
+            ultimo_saldo = ultimo_saldo.order_by(
+                MovimientoStock.fecha_documento.desc(), MovimientoStock.id.desc()
+            ).limit(1).scalar_subquery()
+
+            for producto_id, almacen_id, cantidad in self.session.execute(
+                    select(tabla_pares.c.producto_id, tabla_pares.c.almacen_id, ultimo_saldo)):
+                stock[(producto_id, almacen_id)] = cantidad if cantidad is not None else 0.0
+        return stock
+
+    @staticmethod
+    def _tabla_constantes(filas, columnas):
+        """
+        Tabla derivada (CTE) con las tuplas de enteros indicadas, como UNION ALL de
+        SELECT de constantes; cada fila se une luego con los índices de movimientos_stock.
+        """
+        return union_all(*[
+            select(*(literal(valor, Integer).label(columna) for valor, columna in zip(fila, columnas)))
+            for fila in filas
+        ]).cte('pares')
 
-        return total_stock
+    def obtener_stock_global_producto(self, producto_id):
+        """
+        Obtiene el stock total de un producto sumando el saldo vigente de todos los almacenes.
+        """
+        total_stock = self.session.query(func.sum(SaldoActual.cantidad)).filter(
+            SaldoActual.producto_id == producto_id
+        ).scalar()
+        return float(total_stock or 0.0)
 
     def obtener_costo_promedio_actual(self, producto_id, almacen_id, fecha=None):
         """
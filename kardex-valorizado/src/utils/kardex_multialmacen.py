@@ -0,0 +1,131 @@
+"""
+Valorización por Promedio Ponderado de un producto en todos sus almacenes, en una sola pasada.
+Archivo: src/utils/kardex_multialmacen.py
+
+El sistema tiene dos modelos de costo promedio:
+- ALMACEN: cada almacén promedia sus propias entradas (KardexManager.recalcular_kardex_posterior).
+- EMPRESA: un solo promedio por producto en la empresa; el valor de cada almacén es su
+  cantidad por ese promedio (InventoryService.recalculate_kardex).
+
+valorizar_multialmacen recorre los movimientos una vez en orden cronológico llevando el
+estado de ambos modelos, escribe en cada movimiento los saldos del modelo configurado y
+devuelve cuánto difieren, sin necesidad de un segundo recálculo completo.
+"""
+
+from decimal import Decimal
+from models.database_model import AmbitoPromedio
+
+CERO = Decimal('0')
+
+
+def _promedio(cantidad, valor):
+    return valor / cantidad if cantidad > 0 else CERO
+
+
+def valorizar_multialmacen(movimientos, ambito=AmbitoPromedio.ALMACEN):
+    """
+    Valoriza los movimientos de UN producto (todos sus almacenes), ya ordenados
+    cronológicamente. Solo modifica los atributos de cada movimiento con los valores del
+    modelo indicado; no accede a la base de datos.
+
+    Args:
+        movimientos: Movimientos planos (o aperturas de cierre) del producto.
+        ambito: AmbitoPromedio cuyos costos y saldos se escriben en los movimientos.
+
+    Returns:
+        dict: Divergencia entre los modelos:
+            'movimientos': movimientos valorizados (sin aperturas),
+            'costo_ventas': {AmbitoPromedio: costo total de las salidas},
+            'diferencia_costo_ventas': diferencia absoluta entre ambos costos de salida,
+            'diferencia_unitaria_maxima': mayor diferencia en el costo unitario de una salida,
+            'valor_final': {almacen_id: {AmbitoPromedio: valor del saldo final}},
+            'diferencia_valor_final': suma de las diferencias absolutas de valor por almacén.
+    """
+    # Modelo ALMACEN: cantidad y valor de cada almacén
+    saldos_almacen = {}
+    # Modelo EMPRESA: cantidad de cada almacén y cantidad/valor global del producto
+    existencias = {}
+    global_cantidad = CERO
+    global_valor = CERO
+
+    costo_ventas = {AmbitoPromedio.ALMACEN: CERO, AmbitoPromedio.EMPRESA: CERO}
+    diferencia_unitaria = CERO
+    cantidad_movimientos = 0
+
+    for mov in movimientos:
+        if mov.id is not None:
+            cantidad_movimientos += 1
+        saldo = saldos_almacen.setdefault(mov.almacen_id, [CERO, CERO])
+        existencias.setdefault(mov.almacen_id, CERO)
+
+        cant_entrada = Decimal(str(mov.cantidad_entrada))
+        cant_salida = Decimal(str(mov.cantidad_salida))
+        valores = {}
+
+        # --- Modelo ALMACEN (igual que KardexManager._calcular_promedio_ponderado) ---
+        if cant_entrada > 0:
+            saldo[0] += cant_entrada
+            saldo[1] += Decimal(str(mov.costo_total))
+        else:
+            costo_promedio = _promedio(saldo[0], saldo[1])
+            valor_salida = cant_salida * costo_promedio
+            valores[AmbitoPromedio.ALMACEN] = (costo_promedio, valor_salida)
+            saldo[0] -= cant_salida
+            saldo[1] -= valor_salida
+
+        if saldo[0] < 0:
+            saldo[0] = CERO
+            saldo[1] = CERO
+
+        # --- Modelo EMPRESA (promedio global del producto) ---
+        if cant_entrada > 0:
+            global_cantidad += cant_entrada
+            global_valor += cant_entrada * Decimal(str(mov.costo_unitario))
+            existencias[mov.almacen_id] += cant_entrada
+        elif cant_salida > 0:
+            costo_promedio = _promedio(global_cantidad, global_valor)
+            valores[AmbitoPromedio.EMPRESA] = (costo_promedio, cant_salida * costo_promedio)
+            global_cantidad -= cant_salida
+            global_valor -= cant_salida * costo_promedio
+            existencias[mov.almacen_id] -= cant_salida
+
+        if len(valores) == 2 and mov.id is not None:
+            costo_ventas[AmbitoPromedio.ALMACEN] += valores[AmbitoPromedio.ALMACEN][1]
+            costo_ventas[AmbitoPromedio.EMPRESA] += valores[AmbitoPromedio.EMPRESA][1]
+            diferencia_unitaria = max(diferencia_unitaria, abs(
+                valores[AmbitoPromedio.ALMACEN][0] - valores[AmbitoPromedio.EMPRESA][0]
+            ))
+
+        # --- Saldos del modelo configurado ---
+        if ambito == AmbitoPromedio.EMPRESA:
+            if AmbitoPromedio.EMPRESA in valores:
+                mov.costo_unitario = float(valores[AmbitoPromedio.EMPRESA][0])
+                mov.costo_total = float(valores[AmbitoPromedio.EMPRESA][1])
+            mov.saldo_cantidad = float(existencias[mov.almacen_id])
+            mov.saldo_costo_total = float(existencias[mov.almacen_id] * _promedio(global_cantidad, global_valor))
+        else:
+            if AmbitoPromedio.ALMACEN in valores:
+                mov.costo_unitario = float(valores[AmbitoPromedio.ALMACEN][0])
+                mov.costo_total = float(valores[AmbitoPromedio.ALMACEN][1])
+            mov.saldo_cantidad = float(saldo[0])
+            mov.saldo_costo_total = float(saldo[1])
+
+    promedio_global = _promedio(global_cantidad, global_valor)
+    valor_final = {
+        almacen_id: {
+            AmbitoPromedio.ALMACEN: float(saldo[1]),
+            AmbitoPromedio.EMPRESA: float(existencias[almacen_id] * promedio_global),
+        }
+        for almacen_id, saldo in saldos_almacen.items()
+    }
+
+    return {
+        'movimientos': cantidad_movimientos,
+        'costo_ventas': {modelo: float(valor) for modelo, valor in costo_ventas.items()},
+        'diferencia_costo_ventas': float(abs(costo_ventas[AmbitoPromedio.ALMACEN] - costo_ventas[AmbitoPromedio.EMPRESA])),
+        'diferencia_unitaria_maxima': float(diferencia_unitaria),
+        'valor_final': valor_final,
+        'diferencia_valor_final': sum(
+            abs(valores[AmbitoPromedio.ALMACEN] - valores[AmbitoPromedio.EMPRESA]) for valores in valor_final.values()
+        ),
+    }
@@ -0,0 +1,246 @@
+"""
+Lectura paginada del kardex de un producto para KardexWindow.
+Archivo: src/utils/kardex_paginado.py
+
+Los movimientos del periodo se leen por páginas con keyset (fecha_documento, id) y cada
+página se valoriza a continuación de la anterior, partiendo de un saldo inicial que se
+calcula una sola vez. Los totales del periodo salen de una sola consulta agregada.
+No depende de Qt: la vista (KardexTableModel) pide las páginas desde un hilo de trabajo.
+"""
+
+from decimal import Decimal
+from types import SimpleNamespace
+from sqlalchemy import select, func, or_, and_
+from models.database_model import obtener_session_lectura, MovimientoStock, MetodoValuacion
+from utils.cola_lotes import ColaLotes
+from utils.kardex_manager import KardexManager
+
+
+class ValorizadorKardex:
+    """
+    Saldo acumulado del kardex según el método de valuación. Valoriza un movimiento a la
+    vez, de modo que el cálculo continúa de una página a la siguiente.
+    """
+
+    def __init__(self, metodo):
+        self.metodo = metodo
+        self.lotes = ColaLotes(metodo) if metodo in (MetodoValuacion.PEPS, MetodoValuacion.UEPS) else None
+        self.saldo_cantidad = Decimal('0')
+        self.saldo_valor = Decimal('0')
+
+    def aplicar(self, mov):
+        """Asigna al movimiento sus *_calculado y avanza el saldo."""
+        if self.lotes is not None:
+            self._aplicar_por_lotes(mov)
+        else:
+            self._aplicar_promedio_ponderado(mov)
+
+    def _aplicar_promedio_ponderado(self, mov):
+        if mov.cantidad_entrada > 0:
+            # Entrada: agregar al inventario
+            self.saldo_cantidad += Decimal(str(mov.cantidad_entrada))
+            self.saldo_valor += Decimal(str(mov.costo_total))
+
+            # Calcular nuevo costo promedio
+            if self.saldo_cantidad > 0:
+                costo_promedio = self.saldo_valor / self.saldo_cantidad
+            else:
+                costo_promedio = Decimal('0')
+
+            mov.costo_unitario_calculado = float(costo_promedio)
+        else:
+            # Salida: usar costo promedio actual
+            if self.saldo_cantidad > 0:
+                costo_promedio = self.saldo_valor / self.saldo_cantidad
+            else:
+                costo_promedio = Decimal('0')
+
+            cantidad_salida = Decimal(str(mov.cantidad_salida))
+            valor_salida = cantidad_salida * costo_promedio
+
+            self.saldo_cantidad -= cantidad_salida
+            self.saldo_valor -= valor_salida
+
+            if self.saldo_cantidad < 0:
+                self.saldo_cantidad = Decimal('0')
+                self.saldo_valor = Decimal('0')
+
+            mov.costo_unitario_calculado = float(costo_promedio)
+            mov.costo_total_calculado = float(valor_salida)
+
+        mov.saldo_cantidad_calculado = float(self.saldo_cantidad)
+        mov.saldo_valor_calculado = float(self.saldo_valor)
+
+    def _aplicar_por_lotes(self, mov):
+        if mov.cantidad_entrada > 0:
+            # Entrada: agregar nuevo lote
+            self.lotes.agregar(mov.cantidad_entrada, mov.costo_unitario)
+            mov.costo_unitario_calculado = float(mov.costo_unitario)
+        else:
+            # Salida: tomar de los lotes según el método
+            costo_total_salida = self.lotes.consumir(mov.cantidad_salida)
+
+            if mov.cantidad_salida > 0:
+                costo_promedio_salida = costo_total_salida / Decimal(str(mov.cantidad_salida))
+            else:
+                costo_promedio_salida = Decimal('0')
+
+            mov.costo_unitario_calculado = float(costo_promedio_salida)
+            mov.costo_total_calculado = float(costo_total_salida)
+
+        # Saldo actual (acumulado por la cola de lotes)
+        self.saldo_cantidad = self.lotes.cantidad
+        self.saldo_valor = self.lotes.valor
+        mov.saldo_cantidad_calculado = float(self.saldo_cantidad)
+        mov.saldo_valor_calculado = float(self.saldo_valor)
+
+
+class LectorKardex:
+    """
+    Kardex de un producto (de todos los almacenes o de uno) en un periodo, leído por páginas.
+    Usa su propia sesión de solo lectura (por defecto) porque se consulta desde hilos de
+    trabajo; las páginas se piden de una en una, nunca en paralelo.
+    """
+
+    TAMANIO_PAGINA = 500
+
+    # Columnas que muestra y exporta el kardex
+    COLUMNAS = (
+        MovimientoStock.id,
+        MovimientoStock.almacen_id,
+        MovimientoStock.fecha_documento,
+        MovimientoStock.tipo,
+        MovimientoStock.tipo_documento,
+        MovimientoStock.numero_documento,
+        MovimientoStock.proveedor_id,
+        MovimientoStock.destino_id,
+        MovimientoStock.cantidad_entrada,
+        MovimientoStock.cantidad_salida,
+        MovimientoStock.costo_unitario,
+        MovimientoStock.costo_total,
+        MovimientoStock.saldo_cantidad,
+        MovimientoStock.saldo_costo_total,
+    )
+
+    def __init__(self, empresa_id, producto_id, fecha_desde, fecha_hasta, almacen_id=None,
+                 metodo=None, session=None):
+        self._sesion_propia = session is None
+        self.session = session or obtener_session_lectura()
+        self.empresa_id = empresa_id
+        self.producto_id = producto_id
+        self.almacen_id = almacen_id
+        self.fecha_desde = fecha_desde
+        self.fecha_hasta = fecha_hasta
+        if metodo is None:
+            metodo = KardexManager(self.session)._metodo_valuacion(empresa_id)
+            self._terminar_lectura()
+        self.metodo = metodo
+
+        self.valorizador = None
+        self.saldo_inicial = None
+        self.posicion = None
+        self.agotado = False
+
+    def _filtros(self):
+        filtros = [
+            MovimientoStock.empresa_id == self.empresa_id,
+            MovimientoStock.producto_id == self.producto_id,
+            MovimientoStock.fecha_documento >= self.fecha_desde,
+            MovimientoStock.fecha_documento <= self.fecha_hasta,
+        ]
+        if self.almacen_id:
+            filtros.append(MovimientoStock.almacen_id == self.almacen_id)
+        return filtros
+
+    def abrir(self):
+        """
+        Calcula una sola vez el saldo inicial del periodo (cierre anual anterior y
+        movimientos entre ese cierre y fecha_desde).
+
+        Returns:
+            tuple: (cantidad, valor) al inicio del periodo.
+        """
+        self.valorizador = ValorizadorKardex(self.metodo)
+        try:
+            for mov in KardexManager(self.session).apertura_kardex(
+                    self.empresa_id, self.producto_id, self.fecha_desde, almacen_id=self.almacen_id):
+                self.valorizador.aplicar(mov)
+        finally:
+            self._terminar_lectura()
+
+        self.saldo_inicial = (float(self.valorizador.saldo_cantidad), float(self.valorizador.saldo_valor))
+        return self.saldo_inicial
+
+    def siguiente_pagina(self):
+        """
+        Lee la siguiente página de movimientos y la valoriza a continuación de la anterior.
+
+        Returns:
+            list: Movimientos (objetos simples con sus *_calculado); vacía al terminar.
+        """
+        if self.valorizador is None:
+            self.abrir()
+        if self.agotado:
+            return []
+
+        consulta = select(*self.COLUMNAS).where(*self._filtros())
+        if self.posicion:
+            consulta = consulta.where(or_(
+                MovimientoStock.fecha_documento > self.posicion[0],
+                and_(MovimientoStock.fecha_documento == self.posicion[0], MovimientoStock.id > self.posicion[1])
+            ))
+
+        try:
+            filas = self.session.execute(
+                consulta.order_by(MovimientoStock.fecha_documento, MovimientoStock.id).limit(self.TAMANIO_PAGINA)
+            ).all()
+        finally:
+            self._terminar_lectura()
+
+        pagina = [SimpleNamespace(**fila._asdict()) for fila in filas]
+        for mov in pagina:
+            self.valorizador.aplicar(mov)
+
+        if len(pagina) < self.TAMANIO_PAGINA:
+            self.agotado = True
+        if pagina:
+            self.posicion = (pagina[-1].fecha_documento, pagina[-1].id)
+        return pagina
+
+    def recorrer(self):
+        """Recorre todas las páginas restantes (exportaciones)."""
+        while True:
+            pagina = self.siguiente_pagina()
+            if not pagina:
+                return
+            yield from pagina
+
+    def totales(self):
+        """
+        Cantidad de movimientos y totales de entradas y salidas del periodo, en una
+        sola consulta agregada.
+
+        Returns:
+            dict: {'movimientos', 'entradas', 'salidas'}
+        """
+        try:
+            fila = self.session.execute(
+                select(
+                    func.count(MovimientoStock.id),
+                    func.coalesce(func.sum(MovimientoStock.cantidad_entrada), 0),
+                    func.coalesce(func.sum(MovimientoStock.cantidad_salida), 0)
+                ).where(*self._filtros())
+            ).one()
+        finally:
+            self._terminar_lectura()
+        return {'movimientos': fila[0], 'entradas': float(fila[1]), 'salidas': float(fila[2])}
+
+    def _terminar_lectura(self):
+        # Entre página y página no se retiene la transacción de lectura; la de una sesión
+        # recibida es de quien llama (puede tener cambios pendientes) y no se toca
+        if self._sesion_propia:
+            self.session.commit()
+
+    def cerrar(self):
+        if self._sesion_propia:
+            self.session.close()
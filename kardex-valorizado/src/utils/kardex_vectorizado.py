@@ -0,0 +1,110 @@
+"""
+Motor vectorizado (NumPy) para el recálculo de Promedio Ponderado.
+Archivo: src/utils/kardex_vectorizado.py
+
+Entre dos entradas el costo promedio no cambia (una salida al costo promedio lo
+conserva). Los movimientos se dividen en tramos que empiezan en cada entrada:
+un bucle ligero en Python recorre solo los tramos para encadenar el saldo, y
+todo lo que ocurre dentro de cada tramo se resuelve con sumas acumuladas.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Tolerancia para considerar agotado un saldo acumulado en punto flotante
+# (en Decimal 0.1 + 0.2 - 0.3 es exactamente cero; en float no).
+EPSILON_CANTIDAD = 1e-9
+
+
+def numpy_disponible():
+    """Indica si el motor vectorizado puede usarse en esta instalación."""
+    return np is not None
+
+
+def calcular_promedio_ponderado(cantidad_entrada, cantidad_salida, costo_unitario, costo_total, inicio_grupo=None):
+    """
+    Calcula el kardex de Promedio Ponderado con arreglos NumPy.
+    Reproduce KardexManager._calcular_promedio_ponderado, incluido el recorte a cero
+    cuando el saldo se agota.
+
+    Args:
+        cantidad_entrada, cantidad_salida, costo_unitario, costo_total: arreglos float64
+            con los movimientos en orden cronológico.
+        inicio_grupo: arreglo booleano que marca la primera fila de cada producto; el saldo
+            se reinicia en esas filas. Si es None, todas las filas son de un mismo producto.
+
+    Returns:
+        tuple: (costo_unitario, costo_total, saldo_cantidad, saldo_costo_total) recalculados.
+    """
+    cantidad_entrada = np.asarray(cantidad_entrada, dtype=np.float64)
+    cantidad_salida = np.asarray(cantidad_salida, dtype=np.float64)
+    costo_unitario = np.asarray(costo_unitario, dtype=np.float64)
+    costo_total = np.asarray(costo_total, dtype=np.float64)
+
+    n = len(cantidad_entrada)
+    if n == 0:
+        vacio = np.zeros(0, dtype=np.float64)
+        return vacio, vacio.copy(), vacio.copy(), vacio.copy()
+
+    if inicio_grupo is None:
+        inicio_grupo = np.zeros(n, dtype=bool)
+        inicio_grupo[0] = True
+    else:
+        inicio_grupo = np.asarray(inicio_grupo, dtype=bool)
+
+    es_entrada = cantidad_entrada > 0
+    salidas = np.where(es_entrada, 0.0, cantidad_salida)
+
+    # Un tramo empieza en cada entrada y en cada cambio de producto
+    inicio_tramo = es_entrada | inicio_grupo
+    inicios = np.flatnonzero(inicio_tramo)
+    tramo = np.cumsum(inicio_tramo) - 1
+
+    acumulado = np.cumsum(salidas)
+    dentro_tramo = acumulado - (acumulado - salidas)[inicios][tramo]
+    total_tramo = np.add.reduceat(salidas, inicios)
+
+    # Encadenar el saldo de tramo en tramo (única parte secuencial)
+    entrada_tramo = np.where(es_entrada, cantidad_entrada, 0.0)[inicios].tolist()
+    valor_entrada_tramo = np.where(es_entrada, costo_total, 0.0)[inicios].tolist()
+    reinicia = inicio_grupo[inicios].tolist()
+    total = total_tramo.tolist()
+
+    cantidad_inicial = []
+    valor_inicial = []
+    promedio = []
+    cantidad = valor = 0.0
+    for k in range(len(inicios)):
+        if reinicia[k]:
+            cantidad = valor = 0.0
+        cantidad += entrada_tramo[k]
+        valor += valor_entrada_tramo[k]
+        prom = valor / cantidad if cantidad > EPSILON_CANTIDAD else 0.0
+
+        cantidad_inicial.append(cantidad)
+        valor_inicial.append(valor)
+        promedio.append(prom)
+
+        if cantidad - total[k] <= EPSILON_CANTIDAD:
+            cantidad = valor = 0.0
+        else:
+            cantidad -= total[k]
+            valor -= total[k] * prom
+
+    cantidad_fila = np.array(cantidad_inicial)[tramo] - dentro_tramo
+    promedio_fila = np.array(promedio)[tramo]
+    valor_fila = np.array(valor_inicial)[tramo] - dentro_tramo * promedio_fila
+
+    # Desde que el saldo se agota, queda en cero y las salidas siguientes del tramo cuestan 0
+    agotado = (cantidad_fila <= EPSILON_CANTIDAD) & ~es_entrada
+    agotado_antes = np.concatenate(([False], agotado[:-1])) & ~inicio_tramo
+    costo_salida = np.where(agotado & agotado_antes, 0.0, promedio_fila)
+
+    nuevo_costo_unitario = np.where(es_entrada, costo_unitario, costo_salida)
+    nuevo_costo_total = np.where(es_entrada, costo_total, salidas * costo_salida)
+    saldo_cantidad = np.where(agotado, 0.0, cantidad_fila)
+    saldo_valor = np.where(agotado, 0.0, valor_fila)
+
+    return nuevo_costo_unitario, nuevo_costo_total, saldo_cantidad, saldo_valor
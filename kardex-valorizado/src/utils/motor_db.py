@@ -0,0 +1,162 @@
+"""
+Fábrica del motor de base de datos.
+Archivo: src/utils/motor_db.py
+
+La URL sale de Config.get_db_url() (config.json, o la variable DB_URL del entorno/.env).
+Cada motor recibe el perfil de su base:
+
+- SQLite: PRAGMAs de rendimiento aplicados a cada conexión nueva (evento "connect"). WAL
+  deja leer mientras otro escribe; con WAL, synchronous=NORMAL solo sincroniza el disco en
+  los checkpoints y sigue siendo seguro ante una caída de la aplicación.
+- PostgreSQL (instalación en red, docs/GUIA_RED.md): pool acotado por puesto, pre-ping para
+  descartar conexiones que el servidor o la red cerraron, y reciclado periódico.
+
+Los PRAGMAs y los pools pueden ajustarse en config.json con SQLITE_PRAGMAS, POOL_POSTGRESQL y
+POOL_POSTGRESQL_LECTURA.
+
+Los reportes (valorización, dashboard, exportación del kardex) usan un motor aparte,
+crear_engine_lectura(), con su propio pool y conexiones que no pueden escribir:
+
+- SQLite: el archivo se abre con mode=ro y query_only; cada transacción empieza con BEGIN,
+  así todas las consultas de una sesión leen la misma instantánea del WAL sin bloquear al
+  que escribe (ni el que escribe a ellas).
+- PostgreSQL: transacciones REPEATABLE READ READ ONLY.
+"""
+
+from pathlib import Path
+from sqlalchemy import create_engine, event, make_url
+from utils.config import Config
+
+URL_POR_DEFECTO = 'sqlite:///kardex.db'
+
+PRAGMAS_SQLITE = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,   # bytes leídos por mapeo de memoria, sin copiar al caché
+    'cache_size': -64 * 1024,         # negativo = KiB: 64 MB de caché de páginas por conexión
+    'temp_store': 'MEMORY',           # ordenamientos e índices temporales en memoria
+    'busy_timeout': 5000,             # ms de espera ante un bloqueo antes de "database is locked"
+}
+
+POOL_SQLITE = {
+    'pool_size': 20,
+    'max_overflow': 30,
+    'pool_recycle': 3600,
+}
+
+# De los PRAGMAs, los que se aplican a las conexiones de solo lectura: el modo del diario
+# lo fija el que escribe
+PRAGMAS_SQLITE_LECTURA = ('mmap_size', 'cache_size', 'temp_store', 'busy_timeout')
+
+POOL_POSTGRESQL = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_timeout': 30,
+    'pool_recycle': 1800,
+    'pool_pre_ping': True,
+    'pool_use_lifo': True,   # reutiliza las conexiones recientes y deja caducar las ociosas
+}
+
+# Pool de reportes: pocos a la vez por puesto (sobre el perfil POOL_POSTGRESQL)
+POOL_POSTGRESQL_LECTURA = {
+    'pool_size': 2,
+    'max_overflow': 3,
+}
+
+
+def pragmas_sqlite():
+    """PRAGMAs de SQLite: los por defecto con los de config.json (SQLITE_PRAGMAS) encima."""
+    return {**PRAGMAS_SQLITE, **(Config.get('SQLITE_PRAGMAS') or {})}
+
+
+def aplicar_pragmas(conexion_dbapi, pragmas):
+    """Ejecuta los PRAGMAs en una conexión sqlite3."""
+    cursor = conexion_dbapi.cursor()
+    try:
+        for nombre, valor in pragmas.items():
+            cursor.execute(f"PRAGMA {nombre}={valor}")
+    finally:
+        cursor.close()
+
+
+def _url(db_url):
+    return make_url(db_url or Config.get_db_url() or URL_POR_DEFECTO)
+
+
+def _es_memoria(url):
+    return url.database in (None, '', ':memory:')
+
+
+def crear_engine(db_url=None, pragmas=None, **opciones):
+    """
+    Crea el motor para la URL configurada (o `db_url`) con el perfil de su base.
+
+    Args:
+        pragmas: PRAGMAs de SQLite (None = pragmas_sqlite(); {} = ninguno).
+        opciones: argumentos de create_engine, que prevalecen sobre el perfil.
+    """
+    url = _url(db_url)
+    backend = url.get_backend_name()
+
+    if backend == 'sqlite':
+        # Una base en memoria vive en una sola conexión: no admite pool por tamaño
+        perfil = {} if _es_memoria(url) or 'poolclass' in opciones else POOL_SQLITE
+        engine = create_engine(url, **{**perfil, **opciones})
+        pragmas = pragmas_sqlite() if pragmas is None else pragmas
+        if pragmas:
+            event.listen(engine, 'connect', lambda conexion, _registro: aplicar_pragmas(conexion, pragmas))
+        return engine
+
+    if backend == 'postgresql':
+        perfil = {**POOL_POSTGRESQL, **(Config.get('POOL_POSTGRESQL') or {})}
+        if 'poolclass' in opciones:
+            # Otro pool (NullPool en los procesos trabajadores): solo se conserva el pre-ping
+            perfil = {'pool_pre_ping': perfil['pool_pre_ping']}
+        return create_engine(url, **{**perfil, **opciones})
+
+    return create_engine(url, **opciones)
+
+
+def crear_engine_lectura(db_url=None, pragmas=None, **opciones):
+    """
+    Crea el motor de solo lectura para reportes, con un pool separado del de escritura.
+
+    Returns:
+        Engine, o None para una base SQLite en memoria (otra conexión no vería sus datos).
+    """
+    url = _url(db_url)
+    backend = url.get_backend_name()
+
+    if backend == 'sqlite':
+        if _es_memoria(url):
+            return None
+        archivo = url.database if url.query.get('uri') else Path(url.database).resolve().as_uri()
+        url = url.set(database=archivo, query={**url.query, 'mode': 'ro', 'uri': 'true'})
+        perfil = {} if 'poolclass' in opciones else POOL_SQLITE
+        engine = create_engine(url, **{**perfil, **opciones})
+
+        pragmas = pragmas_sqlite() if pragmas is None else pragmas
+        pragmas = {nombre: valor for nombre, valor in pragmas.items() if nombre in PRAGMAS_SQLITE_LECTURA}
+        pragmas['query_only'] = 'ON'
+
+        @event.listens_for(engine, 'connect')
+        def _conectar(conexion_dbapi, _registro):
+            # Sin el BEGIN implícito del módulo sqlite3 (que no lo emite antes de un SELECT)
+            conexion_dbapi.isolation_level = None
+            aplicar_pragmas(conexion_dbapi, pragmas)
+
+        @event.listens_for(engine, 'begin')
+        def _iniciar(conexion):
+            # La instantánea se toma en la primera lectura y dura hasta el commit/rollback
+            conexion.exec_driver_sql('BEGIN')
+
+        return engine
+
+    if backend == 'postgresql':
+        if 'poolclass' not in opciones:
+            opciones = {**POOL_POSTGRESQL_LECTURA, **(Config.get('POOL_POSTGRESQL_LECTURA') or {}), **opciones}
+        opciones.setdefault('isolation_level', 'REPEATABLE READ')
+        opciones['execution_options'] = {'postgresql_readonly': True, **opciones.get('execution_options', {})}
+        return crear_engine(url, **opciones)
+
+    return crear_engine(url, **opciones)
@@ -0,0 +1,135 @@
+"""
+Ámbitos de sesión para la interfaz y los trabajos en segundo plano.
+Archivo: src/utils/sesiones.py
+
+Una sesión de SQLAlchemy no se comparte entre hilos. En lugar de una sesión por ventana
+abierta durante toda su vida:
+
+- sesion_de_hilo(): la sesión propia del hilo actual (scoped_session), para los trabajos de
+  QThreadPool/QThread. Se retira al terminar el trabajo, porque el pool reutiliza sus hilos.
+- unidad_de_trabajo(): una sesión corta para un diálogo o una acción de la ventana; al
+  salir confirma (o revierte si hubo un error) y se cierra.
+- congelar(): copia las filas leídas en FilaSoloLectura, desligadas de la sesión e
+  inmutables, que la interfaz puede usar desde su hilo sin disparar consultas.
+"""
+
+from contextlib import contextmanager
+from sqlalchemy import inspect
+from sqlalchemy.orm import scoped_session
+from models.database_model import obtener_session, obtener_session_lectura
+from utils.transaction import transaction
+
+# Una sesión por hilo para cada motor
+sesiones_hilo = scoped_session(obtener_session)
+sesiones_lectura_hilo = scoped_session(obtener_session_lectura)
+
+
+@contextmanager
+def sesion_de_hilo(lectura=False):
+    """
+    Sesión del hilo actual. Un uso anidado en el mismo hilo recibe la misma sesión; solo
+    el más externo la retira al salir.
+
+    Args:
+        lectura: True usa el motor de solo lectura (obtener_session_lectura).
+    """
+    registro = sesiones_lectura_hilo if lectura else sesiones_hilo
+    propia = not registro.registry.has()
+    try:
+        yield registro()
+    finally:
+        if propia:
+            registro.remove()
+
+
+@contextmanager
+def unidad_de_trabajo(confirmar=True):
+    """
+    Sesión nueva para una sola operación: commit al salir, rollback ante un error, y se cierra.
+
+    Args:
+        confirmar: False para un diálogo, que confirma por su cuenta al guardar; lo que no
+            confirmó (p. ej. al cancelar) se descarta al cerrar la sesión.
+    """
+    session = obtener_session()
+    try:
+        if confirmar:
+            with transaction(session):
+                yield session
+        else:
+            yield session
+    finally:
+        session.close()
+
+
+class FilaSoloLectura:
+    """
+    Copia inmutable de un objeto ORM: sus columnas cargadas y las relaciones que ya venían
+    cargadas (joinedload/selectinload), también congeladas. Las propiedades de Python del
+    modelo (p. ej. Cliente.razon_social_o_nombre) se evalúan sobre la copia.
+    """
+
+    __slots__ = ('_modelo', '_valores')
+
+    def __init__(self, modelo, valores):
+        object.__setattr__(self, '_modelo', modelo)
+        object.__setattr__(self, '_valores', valores)
+
+    def __getattr__(self, nombre):
+        valores = object.__getattribute__(self, '_valores')
+        if nombre in valores:
+            return valores[nombre]
+        modelo = object.__getattribute__(self, '_modelo')
+        atributo = getattr(modelo, nombre, None)
+        if isinstance(atributo, property):
+            return atributo.fget(self)
+        raise AttributeError(f"{modelo.__name__}.{nombre} no se cargó con la fila")
+
+    def __setattr__(self, nombre, valor):
+        raise AttributeError(f"{self._modelo.__name__} es de solo lectura")
+
+    def __delattr__(self, nombre):
+        raise AttributeError(f"{self._modelo.__name__} es de solo lectura")
+
+    def __eq__(self, otra):
+        return (isinstance(otra, FilaSoloLectura) and self._modelo is otra._modelo
+                and self._valores.get('id') is not None and self._valores.get('id') == otra._valores.get('id'))
+
+    def __hash__(self):
+        return hash((self._modelo, self._valores.get('id')))
+
+    def __repr__(self):
+        return f"<{self._modelo.__name__} id={self._valores.get('id')} (solo lectura)>"
+
+
+def congelar(objetos):
+    """Copia una lista de objetos ORM en FilaSoloLectura (ver la clase)."""
+    copias = {}
+    return [_congelar(objeto, copias) for objeto in objetos]
+
+
+def _congelar(objeto, copias):
+    if objeto is None:
+        return None
+    if id(objeto) in copias:
+        return copias[id(objeto)]
+
+    estado = inspect(objeto)
+    mapper = estado.mapper
+    valores = {}
+    # Se registra antes de las relaciones, que pueden volver a este objeto
+    fila = copias[id(objeto)] = FilaSoloLectura(mapper.class_, valores)
+
+    cargado = estado.dict
+    for columna in mapper.column_attrs:
+        if columna.key in cargado:
+            valores[columna.key] = cargado[columna.key]
+    for relacion in mapper.relationships:
+        if relacion.key not in cargado:
+            continue
+        destino = cargado[relacion.key]
+        if relacion.uselist:
+            valores[relacion.key] = tuple(_congelar(o, copias) for o in destino)
+        else:
+            valores[relacion.key] = _congelar(destino, copias)
+    return fila
@@ -0,0 +1,144 @@
+"""
+Simulación de recálculos del Kardex sobre una copia en memoria de la base de datos.
+Archivo: src/utils/simulacion_kardex.py
+
+Antes de un recálculo global o de cambiar Empresa.metodo_valuacion conviene saber cuánto
+cambiará la valorización. La base SQLite se copia a :memory: con la API de backup en
+línea de SQLite, el recálculo se ejecuta en la copia y se compara el valor de cada
+producto y almacén con el de producción.
+
+El archivo de producción se abre en solo lectura y solo se lee mientras dura la copia:
+el recálculo, que es lo que tarda, no lo escribe ni lo bloquea.
+"""
+
+import sqlite3
+from sqlalchemy import create_engine, select, make_url
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from models.database_model import SaldoActual, Empresa, Producto, Almacen
+from utils.config import Config
+from utils.kardex_manager import KardexManager
+
+
+class SimulacionKardex:
+
+    def __init__(self, ruta_db=None):
+        """
+        Args:
+            ruta_db: Archivo SQLite de producción. Por defecto, el de config.json (DB_URL).
+        """
+        if ruta_db is None:
+            url = make_url(Config.get_db_url() or 'sqlite:///kardex.db')
+            if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+                raise ValueError("La simulación requiere una base de datos SQLite en archivo")
+            ruta_db = url.database
+        self.ruta_db = ruta_db
+
+    def _clonar(self):
+        """Copia la base de producción en una conexión :memory: nueva."""
+        destino = sqlite3.connect(':memory:', check_same_thread=False)
+        fuente = sqlite3.connect(f"file:{self.ruta_db}?mode=ro", uri=True)
+        try:
+            # Una sola pasada: el bloqueo de lectura dura lo que tarda la copia de páginas
+            fuente.backup(destino)
+        finally:
+            fuente.close()
+        return destino
+
+    def simular(self, empresa_id, metodo=None, motor=None):
+        """
+        Recalcula el kardex de la empresa en una copia en memoria y compara el valor del
+        saldo de cada producto y almacén con el de producción.
+
+        Args:
+            metodo: MetodoValuacion a simular (None = el configurado en la empresa).
+            motor: Motor de KardexManager.recalcular_saldos_globales (None = por defecto;
+                   en memoria nunca se usa el motor paralelo).
+
+        Returns:
+            dict: {
+                'metodo_actual', 'metodo_simulado',
+                'filas': [{'producto_id', 'codigo', 'producto', 'almacen_id', 'almacen',
+                           'cantidad_actual', 'cantidad_simulada',
+                           'valor_actual', 'valor_simulado', 'diferencia'}],  # mayor diferencia primero
+                'total_actual', 'total_simulado', 'diferencia_total',
+            }
+        """
+        conexion = self._clonar()
+        engine = create_engine('sqlite://', creator=lambda: conexion, poolclass=StaticPool)
+        session = sessionmaker(bind=engine)()
+        try:
+            empresa = session.get(Empresa, empresa_id)
+            if not empresa:
+                raise ValueError("Empresa no encontrada")
+            metodo_actual = empresa.metodo_valuacion
+
+            # La copia es idéntica a producción: el "antes" se lee de ella
+            antes = self._saldos(session, empresa_id)
+            if metodo is not None:
+                empresa.metodo_valuacion = metodo
+                session.commit()
+            KardexManager(session).recalcular_saldos_globales(empresa_id, motor=motor)
+            despues = self._saldos(session, empresa_id)
+
+            nombres = self._nombres(session, set(antes) | set(despues))
+        finally:
+            session.close()
+            engine.dispose()
+            conexion.close()
+
+        filas = []
+        for par in set(antes) | set(despues):
+            cantidad_actual, valor_actual = antes.get(par, (0.0, 0.0))
+            cantidad_simulada, valor_simulado = despues.get(par, (0.0, 0.0))
+            codigo, producto, almacen = nombres.get(par, ('', '', ''))
+            filas.append({
+                'producto_id': par[0],
+                'codigo': codigo,
+                'producto': producto,
+                'almacen_id': par[1],
+                'almacen': almacen,
+                'cantidad_actual': cantidad_actual,
+                'cantidad_simulada': cantidad_simulada,
+                'valor_actual': valor_actual,
+                'valor_simulado': valor_simulado,
+                'diferencia': valor_simulado - valor_actual,
+            })
+        filas.sort(key=lambda f: (-abs(f['diferencia']), f['codigo'], f['almacen_id']))
+
+        total_actual = sum(f['valor_actual'] for f in filas)
+        total_simulado = sum(f['valor_simulado'] for f in filas)
+        return {
+            'metodo_actual': metodo_actual,
+            'metodo_simulado': metodo or metodo_actual,
+            'filas': filas,
+            'total_actual': total_actual,
+            'total_simulado': total_simulado,
+            'diferencia_total': total_simulado - total_actual,
+        }
+
+    @staticmethod
+    def _saldos(session, empresa_id):
+        return {
+            (fila.producto_id, fila.almacen_id): (fila.cantidad, fila.valor_total)
+            for fila in session.execute(
+                select(SaldoActual.producto_id, SaldoActual.almacen_id, SaldoActual.cantidad, SaldoActual.valor_total)
+                .where(SaldoActual.empresa_id == empresa_id)
+            )
+        }
+
+    @staticmethod
+    def _nombres(session, pares):
+        productos = {
+            fila.id: (fila.codigo, fila.nombre)
+            for fila in session.execute(
+                select(Producto.id, Producto.codigo, Producto.nombre).where(Producto.id.in_({p for p, _ in pares}))
+            )
+        }
+        almacenes = dict(session.execute(
+            select(Almacen.id, Almacen.nombre).where(Almacen.id.in_({a for _, a in pares}))
+        ).all())
+        return {
+            (producto_id, almacen_id): (*productos.get(producto_id, ('', '')), almacenes.get(almacen_id, ''))
+            for producto_id, almacen_id in pares
+        }
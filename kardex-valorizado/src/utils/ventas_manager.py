@@ -3,6 +3,7 @@ VentasManager - Lógica de negocio para la gestión de ventas.
 Archivo: src/utils/ventas_manager.py
 """
 
+from collections import Counter
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import date
 from sqlalchemy.orm import Session
@@ -11,14 +12,43 @@ from models.database_model import (
     TipoMovimiento, TipoDocumento, Moneda, Cliente
 )
 from utils.kardex_manager import KardexManager
+from utils.cola_recalculo import ColaRecalculo
 from utils.validation import verificar_estado_anio, AnioCerradoError
 
 from utils.transaction import transaction
 
 class VentasManager:
+
+    # Al editar, las líneas que conservan producto y almacén en un periodo abierto se corrigen
+    # en su propio movimiento (con auditoría) en lugar de agregar reversiones
+    EDICION_EN_SITIO = True
+
+    # Tipos de movimiento que una venta y sus ediciones registran con el número del documento
+    TIPOS_KARDEX = (TipoMovimiento.VENTA, TipoMovimiento.DEVOLUCION_VENTA)
+
     def __init__(self, session: Session):
         self.session = session
         self.kardex_manager = KardexManager(session)
+        self.cola_recalculo = ColaRecalculo(session)
+
+    def _movimientos_originales(self, tipo_documento, numero_documento, detalles_originales):
+        """
+        Movimientos del documento, en una sola consulta.
+
+        Returns:
+            tuple: ({(producto_id, almacen_id): [movimientos VENTA en orden de id]}, pares
+                   corregibles en sitio). Ver ComprasManager._movimientos_originales.
+        """
+        por_par = self.kardex_manager.movimientos_documento(self.TIPOS_KARDEX, tipo_documento, numero_documento)
+        lineas = Counter((det.producto_id, det.almacen_id) for det in detalles_originales)
+        originales = {
+            par: [mov for mov in movs if mov.tipo == TipoMovimiento.VENTA] for par, movs in por_par.items()
+        }
+        en_sitio = {
+            par for par, movs in por_par.items()
+            if len(movs) == lineas[par] and all(mov.tipo == TipoMovimiento.VENTA for mov in movs)
+        }
+        return originales, en_sitio
 
     def obtener_stock_actual(self, producto_id, almacen_id, fecha=None):
         """Delegado al KardexManager."""
@@ -36,8 +66,10 @@ class VentasManager:
             key = (det['producto_id'], det['almacen_id'])
             stock_a_verificar[key] = stock_a_verificar.get(key, 0) + det['cantidad']
 
+        # Stock de todos los pares en una sola consulta
+        stock = self.kardex_manager.obtener_stock_bulk(stock_a_verificar, fecha_doc)
         for (prod_id, alm_id), cantidad_total in stock_a_verificar.items():
-            stock_actual = self.obtener_stock_actual(prod_id, alm_id, fecha_doc)
+            stock_actual = stock[(prod_id, alm_id)]
             if cantidad_total > stock_actual:
                 stock_insuficiente.append(f"Producto ID {prod_id}: Stock {stock_actual}, Solicitado {cantidad_total}")
 
@@ -74,12 +106,13 @@ class VentasManager:
 
         return subtotal_general_sin_igv, igv, total
 
-    def guardar_venta(self, datos_cabecera, detalles, venta_id=None):
+    def guardar_venta(self, datos_cabecera, detalles, venta_id=None, usuario_id=None):
         """
         Crea o actualiza una venta, sus detalles y movimientos de kardex.
         datos_cabecera: dict con las claves correspondientes a los campos de Venta
         detalles: lista de dicts con info de los productos
         venta_id: ID de la venta a editar (None si es nueva)
+        usuario_id: usuario al que se atribuyen las correcciones en sitio en la auditoría
         """
         # Validaciones previas (fuera de transacción para no bloquear innecesariamente)
         fecha_contable = datos_cabecera['fecha_registro_contable']
@@ -93,6 +126,11 @@ class VentasManager:
                  raise ValueError("Stock insuficiente:\n" + "\n".join(errores_stock))
 
         with transaction(self.session):
+            # Los costos de salida se toman del Kardex: deben estar al día para estos pares
+            self.kardex_manager.procesar_recalculos_pendientes(
+                {(det['producto_id'], det['almacen_id']) for det in detalles}
+            )
+
             # 1. Cabecera de Venta
             if es_edicion:
                 venta = self.session.get(Venta, venta_id)
@@ -102,6 +140,7 @@ class VentasManager:
                 # Capturar valores originales para anulación de Kardex
                 orig_tipo_doc = venta.tipo_documento
                 orig_num_doc = venta.numero_documento
+                orig_fecha = venta.fecha
 
                 # Actualizar campos
                 for key, value in datos_cabecera.items():
@@ -110,12 +149,23 @@ class VentasManager:
 
                 # Cargar detalles originales para comparar
                 detalles_originales_obj = self.session.query(VentaDetalle).filter_by(venta_id=venta.id).all()
+                # Movimientos a revertir de todas las líneas, con los valores originales del documento
+                movimientos_originales, pares_en_sitio = self._movimientos_originales(
+                    orig_tipo_doc, orig_num_doc, detalles_originales_obj
+                )
+                # En sitio solo si el documento estaba y sigue en un periodo abierto
+                if not (self.EDICION_EN_SITIO and self.kardex_manager.fecha_editable(orig_fecha)
+                        and self.kardex_manager.fecha_editable(venta.fecha)):
+                    pares_en_sitio = set()
 
             else:
                 venta = Venta(**datos_cabecera)
                 self.session.add(venta)
                 self.session.flush() # Para obtener el ID
                 detalles_originales_obj = []
+                movimientos_originales, pares_en_sitio = {}, set()
+
+            detalles_originales = {det.id: det for det in detalles_originales_obj}
 
             # 2. Procesar Detalles
             ids_detalles_ui = {det.get('detalle_original_id') for det in detalles if det.get('detalle_original_id')}
@@ -134,27 +184,29 @@ class VentasManager:
             # A. Eliminar detalles
             if es_edicion and detalles_a_eliminar_ids:
                 for detalle_id in detalles_a_eliminar_ids:
-                    detalle_obj = self.session.get(VentaDetalle, detalle_id)
+                    detalle_obj = detalles_originales.get(detalle_id)
                     if detalle_obj:
-                        producto_almacen_afectados.add((detalle_obj.producto_id, detalle_obj.almacen_id))
+                        par_original = (detalle_obj.producto_id, detalle_obj.almacen_id)
+                        producto_almacen_afectados.add(par_original)
 
                         # Movimiento de anulación (Devolución)
-                        mov_original = self.session.query(MovimientoStock).filter_by(
-                            tipo=TipoMovimiento.VENTA,
-                            tipo_documento=orig_tipo_doc,
-                            numero_documento=orig_num_doc,
-                            producto_id=detalle_obj.producto_id, almacen_id=detalle_obj.almacen_id,
-                        ).order_by(MovimientoStock.id.desc()).first()
+                        movs_par = movimientos_originales.get(par_original)
+                        mov_original = movs_par.pop() if movs_par else None
 
-                        if mov_original:
-                            ajuste_entrada = MovimientoStock(
+                        if mov_original and par_original in pares_en_sitio:
+                            self.kardex_manager.eliminar_movimiento(
+                                mov_original, usuario_id,
+                                f"Edición de venta ID {venta.id} (Detalle ID {detalle_id} eliminado)"
+                            )
+                        elif mov_original:
+                            ajuste_entrada = dict(
                                 empresa_id=mov_original.empresa_id, producto_id=mov_original.producto_id, almacen_id=mov_original.almacen_id,
                                 tipo=TipoMovimiento.DEVOLUCION_VENTA,
                                 tipo_documento=venta.tipo_documento, numero_documento=venta.numero_documento,
                                 fecha_documento=venta.fecha, cliente_id=venta.cliente_id,
                                 cantidad_entrada=mov_original.cantidad_salida, cantidad_salida=0,
                                 costo_unitario=mov_original.costo_unitario, costo_total=mov_original.costo_total,
-                                saldo_cantidad=0, saldo_costo_total=0, moneda=venta.moneda, tipo_cambio=float(venta.tipo_cambio),
+                                moneda=venta.moneda, tipo_cambio=float(venta.tipo_cambio),
                                 observaciones=f"Ajuste por edición de venta ID {venta.id} (Detalle ID {detalle_id} eliminado)"
                             )
                             movimientos_kardex.append(ajuste_entrada)
@@ -193,7 +245,7 @@ class VentasManager:
 
                 almacen = self.session.get(Almacen, det_ui['almacen_id'])
                 if almacen:
-                    nuevo_movimiento = MovimientoStock(
+                    nuevo_movimiento = dict(
                         empresa_id=almacen.empresa_id, producto_id=det_ui['producto_id'], almacen_id=det_ui['almacen_id'],
                         tipo=TipoMovimiento.VENTA,
                         tipo_documento=venta.tipo_documento, numero_documento=venta.numero_documento,
@@ -201,7 +253,6 @@ class VentasManager:
                         cantidad_entrada=0, cantidad_salida=cantidad_dec,
                         costo_unitario=float(costo_unitario_kardex),
                         costo_total=float(costo_total_kardex),
-                        saldo_cantidad=0, saldo_costo_total=0,
                         moneda=venta.moneda, tipo_cambio=float(venta.tipo_cambio),
                         observaciones=f"Registro por {'edición (añadido)' if es_edicion else 'nueva venta'} ID {venta.id}"
                     )
@@ -210,7 +261,7 @@ class VentasManager:
             # C. Modificar detalles existentes
             if es_edicion:
                 for det_ui in detalles_a_modificar:
-                    detalle_obj = self.session.get(VentaDetalle, det_ui['detalle_original_id'])
+                    detalle_obj = detalles_originales.get(det_ui['detalle_original_id'])
                     if not detalle_obj: continue
 
                     producto_id_original = detalle_obj.producto_id
@@ -241,23 +292,33 @@ class VentasManager:
 
                     producto_almacen_afectados.add((detalle_obj.producto_id, detalle_obj.almacen_id))
 
-                    # 1. Anular movimiento original
-                    mov_original = self.session.query(MovimientoStock).filter_by(
-                        tipo=TipoMovimiento.VENTA,
-                        tipo_documento=orig_tipo_doc,
-                        numero_documento=orig_num_doc,
-                        producto_id=producto_id_original, almacen_id=almacen_id_original
-                    ).order_by(MovimientoStock.id.desc()).first()
+                    par_original = (producto_id_original, almacen_id_original)
+                    movs_par = movimientos_originales.get(par_original)
+                    mov_original = movs_par.pop() if movs_par else None
+
+                    if (mov_original and par_original in pares_en_sitio
+                            and par_original == (detalle_obj.producto_id, detalle_obj.almacen_id)):
+                        # Mismo producto y almacén en un periodo abierto: se corrige el movimiento original
+                        self.kardex_manager.corregir_movimiento(
+                            mov_original, usuario_id, f"Edición de venta ID {venta.id} (Detalle ID {detalle_obj.id})",
+                            tipo_documento=venta.tipo_documento, numero_documento=venta.numero_documento,
+                            fecha_documento=venta.fecha, cliente_id=venta.cliente_id,
+                            cantidad_salida=float(cantidad_dec),
+                            costo_unitario=float(costo_unitario_final), costo_total=float(subtotal_final_det_kardex),
+                            moneda=venta.moneda, tipo_cambio=float(venta.tipo_cambio),
+                        )
+                        continue
 
+                    # 1. Anular movimiento original
                     if mov_original:
-                        ajuste_entrada = MovimientoStock(
+                        ajuste_entrada = dict(
                             empresa_id=mov_original.empresa_id, producto_id=producto_id_original, almacen_id=almacen_id_original,
                             tipo=TipoMovimiento.DEVOLUCION_VENTA,
                             tipo_documento=venta.tipo_documento, numero_documento=venta.numero_documento,
                             fecha_documento=venta.fecha, cliente_id=venta.cliente_id,
                             cantidad_entrada=mov_original.cantidad_salida, cantidad_salida=0,
                             costo_unitario=mov_original.costo_unitario, costo_total=mov_original.costo_total,
-                            saldo_cantidad=0, saldo_costo_total=0, moneda=venta.moneda, tipo_cambio=float(venta.tipo_cambio),
+                            moneda=venta.moneda, tipo_cambio=float(venta.tipo_cambio),
                             observaciones=f"Ajuste (anulación) por edición Venta ID {venta.id} (Detalle ID {detalle_obj.id})"
                         )
                         movimientos_kardex.append(ajuste_entrada)
@@ -265,25 +326,27 @@ class VentasManager:
                     # 2. Crear nuevo movimiento
                     almacen_nuevo = self.session.get(Almacen, detalle_obj.almacen_id)
                     if almacen_nuevo:
-                        ajuste_salida = MovimientoStock(
+                        ajuste_salida = dict(
                             empresa_id=almacen_nuevo.empresa_id, producto_id=detalle_obj.producto_id, almacen_id=detalle_obj.almacen_id,
                             tipo=TipoMovimiento.VENTA,
                             tipo_documento=venta.tipo_documento, numero_documento=venta.numero_documento,
                             fecha_documento=venta.fecha, cliente_id=venta.cliente_id,
                             cantidad_entrada=0, cantidad_salida=cantidad_dec,
                             costo_unitario=float(costo_unitario_final), costo_total=float(subtotal_final_det_kardex),
-                            saldo_cantidad=0, saldo_costo_total=0, moneda=venta.moneda, tipo_cambio=float(venta.tipo_cambio),
+                            moneda=venta.moneda, tipo_cambio=float(venta.tipo_cambio),
                             observaciones=f"Ajuste (nuevo) por edición Venta ID {venta.id} (Detalle ID {detalle_obj.id})"
                         )
                         movimientos_kardex.append(ajuste_salida)
 
-            # 3. Persistir movimientos y recalcular kardex
-            for mov in movimientos_kardex:
-                self.session.add(mov)
+            # 3. Registrar los movimientos: saldos encadenados entre las líneas, una sola inserción
+            self.kardex_manager.registrar_movimientos(movimientos_kardex)
 
-            if producto_almacen_afectados:
+            if es_edicion and producto_almacen_afectados:
+                # Las anulaciones y los cambios de fecha alteran los saldos posteriores: el
+                # recálculo se hace en segundo plano desde la fecha más antigua afectada
                 self.session.flush()
-                self.kardex_manager.recalcular_kardex_posterior(producto_almacen_afectados, venta.fecha)
+                self.cola_recalculo.encolar(producto_almacen_afectados, min(orig_fecha, venta.fecha),
+                                            max(orig_fecha, venta.fecha))
 
             return venta
 
@@ -324,4 +387,4 @@ class VentasManager:
             self.session.flush()
 
             if producto_almacen_afectados:
-                self.kardex_manager.recalcular_kardex_posterior(producto_almacen_afectados, fecha_venta)
+                self.cola_recalculo.encolar(producto_almacen_afectados, fecha_venta)
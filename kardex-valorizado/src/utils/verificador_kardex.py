@@ -0,0 +1,238 @@
+"""
+Verificación incremental de la integridad del Kardex.
+Archivo: src/utils/verificador_kardex.py
+
+Comprueba que el saldo de cada movimiento sea el saldo anterior más entradas menos salidas
+(dentro del redondeo), revisando en cada pasada solo los movimientos posteriores al último
+verificado de cada (producto, almacén). El checksum acumulado del stock esperado de cada par
+se contrasta con saldo_actual: si no coincide, algo ya verificado cambió (un movimiento
+eliminado o editado) y ese par se revisa completo. El resultado indica qué productos
+necesitan recálculo, para no regenerar todo el kardex "por si acaso".
+"""
+
+from datetime import datetime
+from sqlalchemy import select, or_, and_, func
+from models.database_model import (MovimientoStock, SaldoActual, RecalculoPendiente, VerificacionKardex,
+                                   Empresa, AmbitoPromedio)
+from utils.kardex_entero import a_entero, ESCALA
+from utils.kardex_manager import KardexManager
+from utils.transaction import transaction
+
+
+class VerificadorKardex:
+
+    # Diferencia admitida entre un saldo guardado y el esperado (redondeo a céntimos)
+    TOLERANCIA = 0.01
+
+    COLUMNAS = (
+        MovimientoStock.id,
+        MovimientoStock.producto_id,
+        MovimientoStock.almacen_id,
+        MovimientoStock.empresa_id,
+        MovimientoStock.fecha_documento,
+        MovimientoStock.cantidad_entrada,
+        MovimientoStock.cantidad_salida,
+        MovimientoStock.costo_total,
+        MovimientoStock.saldo_cantidad,
+        MovimientoStock.saldo_costo_total,
+    )
+
+    def __init__(self, session):
+        self.session = session
+
+    def verificar(self, empresa_id=None):
+        """
+        Verifica los movimientos nuevos de todos los pares (o los de una empresa) y actualiza
+        su estado de verificación. Los pares con recálculo pendiente se omiten: sus saldos
+        todavía no son definitivos.
+
+        Returns:
+            dict: {
+                'pares_verificados': pares revisados,
+                'movimientos_revisados': movimientos leídos para comprobar su saldo,
+                'pendientes': pares omitidos por tener recálculo pendiente,
+                'a_reparar': {(producto_id, almacen_id): {'empresa_id', 'movimiento_id', 'fecha', 'motivo'}},
+                'productos_a_reparar': ids de producto a recalcular, ordenados,
+            }
+        """
+        with transaction(self.session):
+            return self._verificar(empresa_id)
+
+    def _verificar(self, empresa_id):
+        self.revisados = 0
+        # Tope de la pasada: los movimientos que se registren mientras tanto quedan para la siguiente
+        tope = self.session.scalar(select(func.max(MovimientoStock.id))) or 0
+
+        estados = self.session.query(VerificacionKardex)
+        saldos = select(SaldoActual.producto_id, SaldoActual.almacen_id, SaldoActual.empresa_id, SaldoActual.cantidad)
+        if empresa_id is not None:
+            estados = estados.filter(VerificacionKardex.empresa_id == empresa_id)
+            saldos = saldos.where(SaldoActual.empresa_id == empresa_id)
+        estados = {(e.producto_id, e.almacen_id): e for e in estados}
+        saldos = {(f.producto_id, f.almacen_id): (f.empresa_id, f.cantidad) for f in self.session.execute(saldos)}
+        pendientes = set(self.session.execute(
+            select(RecalculoPendiente.producto_id, RecalculoPendiente.almacen_id)
+        ).all())
+        # El valor de cada saldo solo encadena por almacén con el promedio por almacén
+        con_valor = {
+            e_id: ambito == AmbitoPromedio.ALMACEN
+            for e_id, ambito in self.session.execute(select(Empresa.id, Empresa.ambito_promedio))
+        }
+
+        # Movimientos posteriores al menor id verificado (el de la pasada anterior), en una lectura
+        verificados = [e.ultimo_movimiento_id for e in estados.values() if e.ultimo_movimiento_id]
+        marca = min(verificados, default=tope if estados else 0)
+        consulta = select(*self.COLUMNAS).where(MovimientoStock.id > marca, MovimientoStock.id <= tope)
+        if empresa_id is not None:
+            consulta = consulta.where(MovimientoStock.empresa_id == empresa_id)
+        nuevas = {}
+        for fila in self.session.execute(consulta.order_by(MovimientoStock.id)):
+            nuevas.setdefault((fila.producto_id, fila.almacen_id), []).append(fila)
+
+        a_reparar = {}
+        pares = set(estados) | set(saldos) | set(nuevas)
+        # Los pares sin movimientos nuevos solo contrastan su último saldo (en una consulta)
+        finales = KardexManager(self.session).obtener_stock_bulk([
+            par for par, estado in estados.items()
+            if estado.ultimo_movimiento_id and par not in nuevas and par not in pendientes
+        ])
+        for par in pares - pendientes:
+            estado = estados.get(par)
+            filas = nuevas.get(par, [])
+            empresa_par = estado.empresa_id if estado else (filas[0].empresa_id if filas else saldos[par][0])
+            stock = saldos.get(par, (empresa_par, 0.0))[1]
+
+            if estado is None and marca > 0 or estado is not None and not estado.ultimo_movimiento_id:
+                problema, checksum, ultimo = self._verificar_par(par, stock, con_valor.get(empresa_par), tope)
+            else:
+                if estado is not None:
+                    filas = [f for f in filas if f.id > estado.ultimo_movimiento_id]
+                problema, checksum, ultimo = self._verificar_nuevas(
+                    par, estado, filas, finales.get(par), stock, con_valor.get(empresa_par), tope
+                )
+
+            if problema:
+                problema['empresa_id'] = empresa_par
+                a_reparar[par] = problema
+                # Se vuelve a revisar completo hasta que se repare
+                checksum, ultimo = 0, 0
+            elif ultimo is None and not stock:
+                # Par sin movimientos ni stock: no queda nada que verificar
+                if estado is not None:
+                    self.session.delete(estado)
+                continue
+
+            if estado is None:
+                estado = VerificacionKardex(producto_id=par[0], almacen_id=par[1], empresa_id=empresa_par)
+                self.session.add(estado)
+            estado.ultimo_movimiento_id = tope if ultimo is not None else 0
+            estado.checksum_cantidad = checksum
+            estado.fecha_verificacion = datetime.now()
+
+        return {
+            'pares_verificados': len(pares - pendientes),
+            'movimientos_revisados': self.revisados,
+            'pendientes': pares & pendientes,
+            'a_reparar': a_reparar,
+            'productos_a_reparar': sorted({prod_id for prod_id, _ in a_reparar}),
+        }
+
+    def _verificar_nuevas(self, par, estado, filas, fin, stock, con_valor, tope):
+        """
+        Revisa la cadena desde el primer movimiento nuevo (en orden cronológico) hasta el final
+        y avanza el checksum con las entradas y salidas de los movimientos nuevos. Sin
+        movimientos nuevos, `fin` es el saldo del último movimiento del par.
+        Returns: (problema, checksum, último id revisado o None si el par no tiene movimientos)
+        """
+        checksum = estado.checksum_cantidad if estado else 0
+        if filas:
+            if estado is None:
+                # Primera verificación: la lectura ya trajo todos los movimientos del par
+                previo, cadena = None, sorted(filas, key=lambda f: (f.fecha_documento, f.id))
+            else:
+                inicio = min(filas, key=lambda f: (f.fecha_documento, f.id))
+                previo, cadena = self._tramo(par, inicio, tope)
+
+            problema = self._revisar_cadena(previo, cadena, con_valor)
+            if problema:
+                return problema, checksum, None
+            checksum += sum(a_entero(f.cantidad_entrada or 0, ESCALA) - a_entero(f.cantidad_salida or 0, ESCALA)
+                            for f in filas)
+            fin = cadena[-1].saldo_cantidad
+
+        tolerancia = a_entero(self.TOLERANCIA, ESCALA)
+        if (abs(checksum - a_entero(stock, ESCALA)) > tolerancia
+                or fin is not None and abs(fin - stock) > self.TOLERANCIA):
+            # Cambió algo ya verificado, o el stock materializado: se revisa el par completo
+            return self._verificar_par(par, stock, con_valor, tope)
+        return None, checksum, (tope if filas or estado is not None else None)
+
+    def _verificar_par(self, par, stock, con_valor, tope):
+        """Revisa todos los movimientos del par; el checksum se recalcula desde el saldo final."""
+        previo, cadena = self._tramo(par, None, tope)
+        problema = self._revisar_cadena(previo, cadena, con_valor)
+        if problema:
+            return problema, 0, None
+
+        final = cadena[-1].saldo_cantidad if cadena else 0.0
+        if abs(final - stock) > self.TOLERANCIA:
+            ultimo = cadena[-1] if cadena else None
+            return {
+                'movimiento_id': ultimo.id if ultimo else None,
+                'fecha': ultimo.fecha_documento if ultimo else None,
+                'motivo': f"Stock vigente {stock:,.2f}, kardex {final:,.2f}",
+            }, 0, None
+        return None, a_entero(final, ESCALA), (cadena[-1].id if cadena else None)
+
+    def _tramo(self, par, inicio, tope):
+        """
+        Movimientos del par desde `inicio` (o desde el primero) en orden cronológico, y el
+        movimiento inmediatamente anterior a ese punto, cuyo saldo es el de partida.
+        """
+        producto_id, almacen_id = par
+        del_par = (MovimientoStock.producto_id == producto_id, MovimientoStock.almacen_id == almacen_id)
+        orden = (MovimientoStock.fecha_documento, MovimientoStock.id)
+
+        consulta = select(*self.COLUMNAS).where(*del_par, MovimientoStock.id <= tope)
+        previo = None
+        if inicio is not None:
+            antes = or_(
+                MovimientoStock.fecha_documento < inicio.fecha_documento,
+                and_(MovimientoStock.fecha_documento == inicio.fecha_documento, MovimientoStock.id < inicio.id)
+            )
+            previo = self.session.execute(
+                select(*self.COLUMNAS).where(*del_par, antes)
+                .order_by(*(c.desc() for c in orden)).limit(1)
+            ).first()
+            consulta = consulta.where(~antes)
+
+        cadena = self.session.execute(consulta.order_by(*orden)).all()
+        return previo, cadena
+
+    def _revisar_cadena(self, previo, cadena, con_valor):
+        """
+        Comprueba cada saldo contra el anterior más entradas menos salidas. Un saldo que
+        quedaría negativo se guarda en cero (así lo hacen los motores de cálculo).
+        Returns: None, o el primer movimiento inconsistente {'movimiento_id', 'fecha', 'motivo'}.
+        """
+        cantidad = (previo.saldo_cantidad or 0.0) if previo else 0.0
+        valor = (previo.saldo_costo_total or 0.0) if previo else 0.0
+
+        for fila in cadena:
+            self.revisados += 1
+            entrada, salida = fila.cantidad_entrada or 0.0, fila.cantidad_salida or 0.0
+            esperado_cantidad = cantidad + entrada - salida
+            esperado_valor = valor + ((fila.costo_total or 0.0) if entrada > 0 else -(fila.costo_total or 0.0))
+            if esperado_cantidad < -self.TOLERANCIA:
+                esperado_cantidad = esperado_valor = 0.0
+
+            saldo_cantidad, saldo_valor = fila.saldo_cantidad or 0.0, fila.saldo_costo_total or 0.0
+            if abs(saldo_cantidad - esperado_cantidad) > self.TOLERANCIA:
+                motivo = f"Saldo {saldo_cantidad:,.2f}, esperado {esperado_cantidad:,.2f}"
+            elif con_valor and abs(saldo_valor - esperado_valor) > self.TOLERANCIA:
+                motivo = f"Valor {saldo_valor:,.2f}, esperado {esperado_valor:,.2f}"
+            else:
+                cantidad, valor = saldo_cantidad, saldo_valor
+                continue
+            return {'movimiento_id': fila.id, 'fecha': fila.fecha_documento, 'motivo': motivo}
+        return None
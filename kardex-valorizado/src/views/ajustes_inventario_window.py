@@ -196,6 +196,23 @@ class AjusteInventarioDialog(QDialog):
             QMessageBox.warning(self, "Error", "Seleccione un motivo y agregue al menos un producto.")
             return
 
+        if TipoAjuste(self.cmb_tipo_ajuste.currentText()) == TipoAjuste.SALIDA:
+            # Stock de todas las líneas en una sola consulta
+            solicitado = {}
+            for det in self.detalles_ajuste:
+                par = (det['producto_id'], det['almacen_id'])
+                solicitado[par] = solicitado.get(par, 0) + det['cantidad']
+            stock = self.kardex_manager.obtener_stock_bulk(solicitado, self.date_fecha.date().toPyDate())
+            faltantes = {
+                f"{det['producto_nombre']} ({det['almacen_nombre']}): Stock {stock[par]:,.2f}, Solicitado {solicitado[par]:,.2f}"
+                for det in self.detalles_ajuste
+                for par in [(det['producto_id'], det['almacen_id'])]
+                if solicitado[par] > stock[par]
+            }
+            if faltantes:
+                QMessageBox.warning(self, "Stock Insuficiente", "\n".join(sorted(faltantes)))
+                return
+
         try:
             ajuste = AjusteInventario(
                 motivo_id=self.cmb_motivo.currentData(),
@@ -207,8 +224,10 @@ class AjusteInventarioDialog(QDialog):
             self.session.add(ajuste)
             self.session.flush()
 
-            for det in self.detalles_ajuste:
-                self.crear_detalle_y_movimiento(ajuste, det)
+            # Saldos encadenados entre las líneas, en una sola inserción
+            self.kardex_manager.registrar_movimientos([
+                self.crear_detalle_y_movimiento(ajuste, det) for det in self.detalles_ajuste
+            ])
 
             self.session.commit()
             self.accept()
@@ -217,6 +236,7 @@ class AjusteInventarioDialog(QDialog):
             QMessageBox.critical(self, "Error", f"No se pudo guardar el ajuste:\n{e}")
 
     def crear_detalle_y_movimiento(self, ajuste, det_dict):
+        """Crea el detalle del ajuste y devuelve los datos de su movimiento de stock."""
         es_ingreso = ajuste.tipo == TipoAjuste.INGRESO
         self.session.add(AjusteInventarioDetalle(
             ajuste_id=ajuste.id, producto_id=det_dict['producto_id'],
@@ -224,7 +244,7 @@ class AjusteInventarioDialog(QDialog):
             costo_unitario=det_dict['costo_unitario'] if es_ingreso else None
         ))
         almacen = self.session.get(Almacen, det_dict['almacen_id'])
-        self.kardex_manager.registrar_movimiento(
+        return dict(
             empresa_id=almacen.empresa_id, producto_id=det_dict['producto_id'], almacen_id=det_dict['almacen_id'],
             tipo=TipoMovimiento.AJUSTE_POSITIVO if es_ingreso else TipoMovimiento.AJUSTE_NEGATIVO,
             cantidad_entrada=det_dict['cantidad'] if es_ingreso else 0,
@@ -238,6 +258,7 @@ class AjustesInventarioWindow(QWidget):
     def __init__(self, user_info=None):
         super().__init__()
         self.session = obtener_session()
+        self.kardex_manager = KardexManager(self.session)
         self.user_info = user_info
         self.init_ui()
         self.cargar_ajustes()
@@ -281,10 +302,11 @@ class AjustesInventarioWindow(QWidget):
         if QMessageBox.question(self, "Confirmar", f"¿Eliminar el ajuste '{ajuste.numero_ajuste}'?") != QMessageBox.StandardButton.Yes:
             return
         try:
+            movimientos = []
             for detalle in ajuste.detalles:
                 tipo_reversion = TipoMovimiento.AJUSTE_NEGATIVO if ajuste.tipo == TipoAjuste.INGRESO else TipoMovimiento.AJUSTE_POSITIVO
                 mov_original = self.session.query(MovimientoStock).filter_by(numero_documento=ajuste.numero_ajuste, producto_id=detalle.producto_id, almacen_id=detalle.almacen_id).first()
-                self.kardex_manager.registrar_movimiento(
+                movimientos.append(dict(
                     empresa_id=self.session.get(Almacen, detalle.almacen_id).empresa_id,
                     producto_id=detalle.producto_id, almacen_id=detalle.almacen_id,
                     tipo=tipo_reversion,
@@ -294,7 +316,8 @@ class AjustesInventarioWindow(QWidget):
                     costo_total=mov_original.costo_total if mov_original else 0,
                     numero_documento=ajuste.numero_ajuste, fecha_documento=ajuste.fecha,
                     observaciones=f"Reversión de ajuste {ajuste.numero_ajuste}"
-                )
+                ))
+            self.kardex_manager.registrar_movimientos(movimientos)
             self.session.delete(self.session.get(AjusteInventario, ajuste.id))
             self.session.commit()
             self.cargar_ajustes()
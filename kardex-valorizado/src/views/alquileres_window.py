@@ -9,7 +9,9 @@ import sys
 import os
 from pathlib import Path
 from datetime import date, datetime
+from sqlalchemy.orm import joinedload
 from views.base_crud_view import BaseCRUDView
+from utils.sesiones import sesion_de_hilo, unidad_de_trabajo
 
 from models.database_model import (obtener_session, Alquiler, AlquilerDetalle,
                                    EstadoAlquiler, EstadoEquipo, TipoEquipo,
@@ -503,9 +505,9 @@ class AlquilerDialog(QDialog):
     """Diálogo para crear/editar Alquiler"""
     alquiler_guardado = pyqtSignal()
 
-    def __init__(self, parent=None, alquiler=None, cotizacion_data=None):
+    def __init__(self, parent=None, alquiler=None, cotizacion_data=None, session=None):
         super().__init__(parent)
-        self.session = obtener_session()
+        self.session = session or obtener_session()
         self.alquiler = alquiler
         self.cotizacion_data = cotizacion_data
         self.detalles_temp = [] # Lista de dicts
@@ -1264,16 +1266,15 @@ class AlquileresWindow(BaseCRUDView):
             return
             
         alquiler_id = int(self.tabla.item(selected_row, 0).text())
-        alquiler = self.session.get(Alquiler, alquiler_id)
-        
-        if not alquiler:
-            return
-            
-        file_name, _ = QFileDialog.getSaveFileName(self, "Guardar Contrato PDF", f"Contrato_{alquiler.id}.pdf", "PDF Files (*.pdf)")
+        file_name, _ = QFileDialog.getSaveFileName(self, "Guardar Contrato PDF", f"Contrato_{alquiler_id}.pdf", "PDF Files (*.pdf)")
         if file_name:
             try:
-                service = ContractService()
-                service.generate_contract(alquiler, file_name)
+                with sesion_de_hilo(lectura=True) as session:
+                    alquiler = session.get(Alquiler, alquiler_id)
+                    if not alquiler:
+                        return
+                    service = ContractService()
+                    service.generate_contract(alquiler, file_name)
                 QMessageBox.information(self, "Éxito", f"Contrato generado correctamente en:\n{file_name}")
                 
                 # Open file
@@ -1288,13 +1289,13 @@ class AlquileresWindow(BaseCRUDView):
             return
             
         alquiler_id = int(self.tabla.item(selected_row, 0).text())
-        alquiler = self.session.get(Alquiler, alquiler_id)
-        
-        if not alquiler: return
-        
-        dialog = PartialReturnDialog(self, alquiler)
-        dialog.return_confirmed.connect(self.load_data)
-        dialog.exec()
+        with unidad_de_trabajo(confirmar=False) as session:
+            alquiler = session.get(Alquiler, alquiler_id)
+            if not alquiler: return
+
+            dialog = PartialReturnDialog(self, alquiler)
+            dialog.return_confirmed.connect(self.load_data)
+            dialog.exec()
 
     def open_extension_dialog(self):
         selected_row = self.tabla.currentRow()
@@ -1303,13 +1304,13 @@ class AlquileresWindow(BaseCRUDView):
             return
             
         alquiler_id = int(self.tabla.item(selected_row, 0).text())
-        alquiler = self.session.get(Alquiler, alquiler_id)
-        
-        if not alquiler: return
-        
-        dialog = ExtensionDialog(self, alquiler)
-        dialog.extension_confirmed.connect(self.load_data)
-        dialog.exec()
+        with unidad_de_trabajo(confirmar=False) as session:
+            alquiler = session.get(Alquiler, alquiler_id)
+            if not alquiler: return
+
+            dialog = ExtensionDialog(self, alquiler)
+            dialog.extension_confirmed.connect(self.load_data)
+            dialog.exec()
 
     def generar_acta_entrega(self):
         self._generar_documento("entrega")
@@ -1324,21 +1325,20 @@ class AlquileresWindow(BaseCRUDView):
             return
             
         alquiler_id = int(self.tabla.item(selected_row, 0).text())
-        alquiler = self.session.get(Alquiler, alquiler_id)
-        
-        if not alquiler: return
-        
-        nombre_doc = f"Acta_{tipo.capitalize()}_{alquiler.id}.pdf"
+        nombre_doc = f"Acta_{tipo.capitalize()}_{alquiler_id}.pdf"
         file_name, _ = QFileDialog.getSaveFileName(self, f"Guardar Acta {tipo.capitalize()}", nombre_doc, "PDF Files (*.pdf)")
         
         if file_name:
             try:
-                service = ContractService()
-                if tipo == "entrega":
-                    service.generate_delivery_act(alquiler, file_name)
-                else:
-                    service.generate_return_act(alquiler, file_name)
-                    
+                with sesion_de_hilo(lectura=True) as session:
+                    alquiler = session.get(Alquiler, alquiler_id)
+                    if not alquiler: return
+                    service = ContractService()
+                    if tipo == "entrega":
+                        service.generate_delivery_act(alquiler, file_name)
+                    else:
+                        service.generate_return_act(alquiler, file_name)
+
                 QMessageBox.information(self, "Éxito", f"Documento generado correctamente en:\n{file_name}")
                 os.startfile(file_name)
             except Exception as e:
@@ -1347,6 +1347,10 @@ class AlquileresWindow(BaseCRUDView):
 
 
         
+    def get_base_query(self, session):
+        # El cliente se carga con la fila: la tabla recibe filas congeladas
+        return session.query(Alquiler).options(joinedload(Alquiler.cliente))
+
     def setup_table_columns(self):
         self.tabla.setColumnCount(7)
         self.tabla.setHorizontalHeaderLabels([
@@ -1363,7 +1367,7 @@ class AlquileresWindow(BaseCRUDView):
         self.tabla.setItem(row, 4, QTableWidgetItem(item.fecha_fin_estimada.strftime("%d/%m/%Y") if item.fecha_fin_estimada else "-"))
         self.tabla.setItem(row, 5, QTableWidgetItem(item.estado.value))
 
-    def _open_dialog(self, item=None):
-        dialog = AlquilerDialog(self, alquiler=item)
+    def _open_dialog(self, item=None, session=None):
+        dialog = AlquilerDialog(self, alquiler=item, session=session)
         dialog.alquiler_guardado.connect(self.load_data)
         dialog.exec()
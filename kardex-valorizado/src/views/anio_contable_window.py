@@ -10,14 +10,14 @@ from PyQt6.QtGui import QFont
 import sys
 from pathlib import Path
 from datetime import datetime, date
-from sqlalchemy import extract, and_
-from decimal import Decimal, ROUND_HALF_UP
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from models.database_model import (obtener_session, AnioContable, EstadoAnio,
                                    MovimientoStock, TipoMovimiento, Producto, Almacen)
 from utils.app_context import app_context
+from utils.kardex_manager import KardexManager
+from utils.cola_recalculo import ColaRecalculo
 from utils.button_utils import style_button
 
 class AnioContableWindow(QWidget):
@@ -134,8 +134,8 @@ class AnioContableWindow(QWidget):
 
         confirmar = QMessageBox.warning(self, "Confirmar Cierre de Año",
             f"¿Está seguro de que desea cerrar el año {anio_str}?\n\n"
-            "Esta acción calculará los saldos finales y los transferirá como saldos iniciales al siguiente año. "
-            "Una vez cerrado, no se podrán registrar nuevos movimientos.",
+            "Esta acción guardará los saldos finales de cada producto y almacén, desde los cuales "
+            "parte el año siguiente. Una vez cerrado, no se podrán registrar nuevos movimientos.",
             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
 
         if confirmar == QMessageBox.StandardButton.No:
@@ -145,22 +145,9 @@ class AnioContableWindow(QWidget):
             anio_numero = int(anio_str)
             anio_siguiente = anio_numero + 1
 
-            # 1. Obtener saldos finales
-            subquery = self.session.query(
-                MovimientoStock.producto_id,
-                MovimientoStock.almacen_id,
-                func.max(MovimientoStock.id).label('max_id')
-            ).filter(
-                extract('year', MovimientoStock.fecha_documento) == anio_numero
-            ).group_by(
-                MovimientoStock.producto_id,
-                MovimientoStock.almacen_id
-            ).subquery()
-
-            saldos_finales = self.session.query(MovimientoStock).join(
-                subquery,
-                MovimientoStock.id == subquery.c.max_id
-            ).all()
+            # 1. Guardar los saldos (y capas PEPS/UEPS) al 31 de diciembre
+            kardex = KardexManager(self.session)
+            cierres_generados = kardex.generar_cierre_anual(anio_numero)
 
             # 2. Asegurar que el año siguiente exista
             anio_siguiente_obj = self.session.query(AnioContable).filter_by(anio=anio_siguiente).first()
@@ -168,43 +155,27 @@ class AnioContableWindow(QWidget):
                 anio_siguiente_obj = AnioContable(anio=anio_siguiente, estado=EstadoAnio.ABIERTO)
                 self.session.add(anio_siguiente_obj)
 
-            # 3. Eliminar stock inicial previo del año siguiente para evitar duplicados
-            self.session.query(MovimientoStock).filter(
-                extract('year', MovimientoStock.fecha_documento) == anio_siguiente,
+            # 3. El saldo inicial del año siguiente es el cierre: se eliminan los movimientos
+            #    de stock inicial que generaban los cierres anteriores (sumaban dos veces el saldo)
+            inicio_siguiente = date(anio_siguiente, 1, 1)
+            stock_inicial_previo = self.session.query(MovimientoStock).filter(
+                MovimientoStock.fecha_documento == inicio_siguiente,
                 MovimientoStock.tipo == TipoMovimiento.STOCK_INICIAL
-            ).delete()
-
-            # 4. Crear nuevos movimientos de stock inicial
-            nuevos_movimientos = []
-            for saldo in saldos_finales:
-                if saldo.saldo_cantidad > 0:
-                    costo_unitario_final = (Decimal(str(saldo.saldo_costo_total)) / Decimal(str(saldo.saldo_cantidad))).quantize(Decimal('0.000001'), rounding=ROUND_HALF_UP)
-
-                    nuevo_movimiento = MovimientoStock(
-                        empresa_id=saldo.empresa_id,
-                        producto_id=saldo.producto_id,
-                        almacen_id=saldo.almacen_id,
-                        tipo=TipoMovimiento.STOCK_INICIAL,
-                        fecha_documento=date(anio_siguiente, 1, 1),
-                        cantidad_entrada=saldo.saldo_cantidad,
-                        cantidad_salida=0,
-                        costo_unitario=float(costo_unitario_final),
-                        costo_total=saldo.saldo_costo_total,
-                        saldo_cantidad=saldo.saldo_cantidad,
-                        saldo_costo_total=saldo.saldo_costo_total,
-                        observaciones=f"Saldo inicial del año {anio_numero}"
-                    )
-                    nuevos_movimientos.append(nuevo_movimiento)
-
-            self.session.add_all(nuevos_movimientos)
-
-            # 5. Cerrar el año
+            )
+            pares_afectados = {
+                (prod_id, alm_id) for prod_id, alm_id in
+                stock_inicial_previo.with_entities(MovimientoStock.producto_id, MovimientoStock.almacen_id)
+            }
+            stock_inicial_previo.delete(synchronize_session=False)
+            ColaRecalculo(self.session).encolar(pares_afectados, inicio_siguiente)
+
+            # 4. Cerrar el año
             anio_a_cerrar_obj.estado = EstadoAnio.CERRADO
             self.session.commit()
 
             QMessageBox.information(self, "Éxito",
                 f"El año {anio_str} ha sido cerrado exitosamente.\n"
-                f"Se han generado {len(nuevos_movimientos)} registros de saldo inicial para el año {anio_siguiente}.")
+                f"Se han guardado {cierres_generados} saldos de cierre como saldo inicial del año {anio_siguiente}.")
 
             self.cargar_anios()
 
@@ -228,10 +199,13 @@ class AnioContableWindow(QWidget):
             return
 
         confirmar = QMessageBox.question(self, "Confirmar Reapertura",
-                                         f"¿Desea reabrir el año contable {anio_str}?",
+                                         f"¿Desea reabrir el año contable {anio_str}?\n\n"
+                                         "Se descartarán los saldos de cierre de este año y de los siguientes.",
                                          QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
 
         if confirmar == QMessageBox.StandardButton.Yes:
+            # Los movimientos del año pueden cambiar: sus saldos de cierre ya no valen
+            KardexManager(self.session).invalidar_cierres_desde(anio_a_reabrir.anio)
             anio_a_reabrir.estado = EstadoAnio.ABIERTO
             self.session.commit()
             QMessageBox.information(self, "Éxito", f"El año {anio_str} ha sido reabierto.")
@@ -14,27 +14,32 @@ from pathlib import Path
 # Adjust path to import from parent directory if needed
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from models.database_model import obtener_session
+from utils.sesiones import sesion_de_hilo, unidad_de_trabajo
+from utils.consulta_paginada import LectorPaginado
 from utils.widgets import UpperLineEdit
 from utils.button_utils import style_button
 from views.dialogs.delete_range_dialog import DeleteRangeDialog
-from utils.async_worker import Worker
-from PyQt6.QtCore import QThreadPool, QSize
-from PyQt6.QtGui import QMovie
+from views.crud_table_model import TablaPaginada
 
 class BaseCRUDView(QWidget):
     """
     Clase base para vistas CRUD (Clientes, Proveedores, Productos, etc.)
+
+    La ventana no retiene una sesión. La tabla (TablaPaginada) se lee por páginas en un hilo
+    de trabajo, con keyset sobre ORDEN, y recibe filas congeladas (FilaSoloLectura); la
+    búsqueda y los filtros extra se aplican en la consulta. Los diálogos y las eliminaciones
+    trabajan en una unidad de trabajo propia (utils/sesiones.py), releyendo la fila por su id.
     """
+
+    # Orden de la tabla: columnas del modelo, o columna.desc(); se desempata por id
+    ORDEN = ()
+
     def __init__(self, title, model_class, dialog_class, parent=None):
         super().__init__(parent)
         self.title = title
         self.model_class = model_class
         self.dialog_class = dialog_class
-        self.session = obtener_session()
-        self.data_shown = []
-        self.threadpool = QThreadPool()
-        
+
         self.init_ui()
         self.load_data()
 
@@ -83,7 +88,11 @@ class BaseCRUDView(QWidget):
         self.lbl_contador.setStyleSheet("color: #666; font-size: 11px; padding: 5px;")
 
         # Table
-        self.tabla = QTableWidget()
+        self.tabla = TablaPaginada()
+        self.tabla.modelo.rowsInserted.connect(self._filas_insertadas)
+        self.tabla.modelo.total_contado.connect(self._actualizar_contador)
+        self.tabla.modelo.carga_terminada.connect(self._actualizar_contador)
+        self.tabla.modelo.error.connect(self.handle_error)
         self.setup_table_columns()
         self.tabla.setAlternatingRowColors(True)
         self.tabla.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
@@ -110,60 +119,48 @@ class BaseCRUDView(QWidget):
         raise NotImplementedError("Subclasses must implement setup_table_columns")
 
     def load_data(self):
-        """Load data asynchronously using Worker"""
+        """Recarga la tabla con la búsqueda y los filtros actuales; las páginas llegan de un hilo"""
+        lector = LectorPaginado(self._consulta(self.txt_buscar.text().strip()),
+                                self.model_class.id, self.ORDEN)
         self.show_loading(True)
-        worker = Worker(self._fetch_data)
-        worker.signals.result.connect(self.show_data)
-        worker.signals.finished.connect(lambda: self.show_loading(False))
-        worker.signals.error.connect(self.handle_error)
-        self.threadpool.start(worker)
-
-    def _fetch_data(self):
-        """Executed in background thread"""
-        try:
-            # Handle cases where session might be expired or closed
-            # Note: SQLAlchemy sessions are not thread-safe. 
-            # Ideally we should create a new session for the thread or be very careful.
-            # For reading, reusing might be 'okay' if no concurrent writes, but better to use a scoped session or new session.
-            # For simplicity in this refactor, we'll try to use the existing one but handle errors.
-            # A safer approach for threading is creating a new session here.
-            
-            local_session = obtener_session()
-            
-            query = self.get_base_query(local_session)
-            query = self.apply_ordering(query)
-            
-            # Limit results for optimization (Pagination Phase)
-            # query = query.limit(100) 
-            
-            items = query.all()
-            
-            # Detach items from session so they can be used in main thread
-            local_session.expunge_all()
-            local_session.close() 
-            
-            return items 
-            # If we close, we can't access lazy attributes.
-            # For this MVP optimization, let's assume we fetch what we need or use the main session to re-merge if needed.
-            # Actually, passing ORM objects across threads is risky.
-            # Let's try to use the main session in the worker for READ ONLY operations, 
-            # assuming no other thread is writing to it.
-            # But SQLite might complain.
-            
-            # REVISION: To avoid complexity, we will use the main session but ensure we don't write concurrently.
-            # OR better: The worker returns IDs, and main thread fetches objects.
-            # Let's try fetching objects with a new session and expunging them.
-            
-            return items
-        except Exception as e:
-            raise e
-
-    def get_base_query(self, session=None):
-        """Returns the base query. Accepts session argument."""
-        sess = session if session else self.session
-        if hasattr(self.model_class, 'activo'):
-            return sess.query(self.model_class).filter_by(activo=True)
-        return sess.query(self.model_class)
+        self.lbl_contador.setText("📊 Total: ...")
+        self.tabla.modelo.cargar(lector)
+
+    def _consulta(self, texto=None):
+        """
+        Consulta de la tabla con la búsqueda y los filtros extra, sin ejecutar. Se arma en el
+        hilo de la interfaz porque los filtros extra leen widgets.
+        """
+        with sesion_de_hilo(lectura=True) as session:
+            query = self.get_base_query(session)
+            if texto:
+                query = self.apply_search_filters(query, texto)
+            query = self.apply_extra_filters(query)
+            return query.statement
+
+    def _filas_insertadas(self, parent, primera, ultima):
+        filas = self.tabla.modelo.filas
+        for row in range(primera, ultima + 1):
+            self.fill_row(row, filas[row])
+            self.add_action_buttons(row, filas[row])
+        self.show_loading(False)
+        self._actualizar_contador()
+
+    def _actualizar_contador(self, *args):
+        modelo = self.tabla.modelo
+        if not modelo.cargando():
+            self.show_loading(False)
+        if modelo.total is None:
+            return
+        texto = f"📊 Total: {modelo.total}"
+        if modelo.rowCount() < modelo.total:
+            texto += f" (cargados {modelo.rowCount()})"
+        self.lbl_contador.setText(texto)
+
+    @property
+    def data_shown(self):
+        """Filas congeladas cargadas en la tabla; para modificarlas se releen en una unidad de trabajo"""
+        return self.tabla.modelo.filas
 
     def show_loading(self, show):
         if show:
@@ -176,36 +173,16 @@ class BaseCRUDView(QWidget):
             self.tabla.setEnabled(True)
             self.loading_label.hide()
 
-    def handle_error(self, error_tuple):
-        exctype, value, traceback_str = error_tuple
-        print(f"Error loading data in {self.title}: {value}")
-        # self.session.rollback() # Not needed if we used local session
-        QMessageBox.critical(self, "Error", f"Error al cargar datos:\n{str(value)}")
+    def handle_error(self, mensaje):
+        self.show_loading(False)
+        print(f"Error loading data in {self.title}: {mensaje}")
+        QMessageBox.critical(self, "Error", f"Error al cargar datos:\n{mensaje}")
 
-    def get_base_query(self, session=None):
+    def get_base_query(self, session):
         """Returns the base query, filtering by active status if applicable."""
-        sess = session if session else self.session
         if hasattr(self.model_class, 'activo'):
-            return sess.query(self.model_class).filter_by(activo=True)
-        return sess.query(self.model_class)
-
-    def apply_ordering(self, query):
-        """Override to apply default ordering"""
-        return query
-
-    def show_data(self, items):
-        # Re-attach items to main session if needed, or just use them if they are simple
-        # For safety with SQLite and threads, we might need to merge them back to main session
-        # if we plan to edit them.
-        # For display, detached objects are fine usually.
-        
-        self.data_shown = items
-        self.tabla.setRowCount(len(items))
-        self.lbl_contador.setText(f"📊 Total: {len(items)}")
-
-        for row, item in enumerate(items):
-            self.fill_row(row, item)
-            self.add_action_buttons(row, item)
+            return session.query(self.model_class).filter_by(activo=True)
+        return session.query(self.model_class)
 
     def fill_row(self, row, item):
         """Override to fill specific columns"""
@@ -240,20 +217,9 @@ class BaseCRUDView(QWidget):
         pass
 
     def search_data(self):
-        """Override to implement search logic"""
-        text = self.txt_buscar.text().strip()
-
+        """Search runs on the server: the table is reloaded with the current text and filters"""
         try:
-            query = self.get_base_query()
-
-            if text:
-                query = self.apply_search_filters(query, text)
-
-            # Apply extra filters from subclasses
-            query = self.apply_extra_filters(query)
-
-            query = self.apply_ordering(query)
-            self.show_data(query.all())
+            self.load_data()
         except Exception as e:
             print(f"Error searching data: {e}")
 
@@ -266,18 +232,24 @@ class BaseCRUDView(QWidget):
         return query
 
     def create_item(self):
-        self._open_dialog(None)
+        with unidad_de_trabajo(confirmar=False) as session:
+            self._open_dialog(None, session)
 
     def edit_item(self, item):
-        self._open_dialog(item)
-
-    def _open_dialog(self, item=None):
-        """Opens the dialog. Subclasses must implement how to instantiate the dialog if it has custom args."""
+        # El diálogo edita el objeto releído en su propia sesión, no la fila congelada
+        with unidad_de_trabajo(confirmar=False) as session:
+            self._open_dialog(session.get(self.model_class, item.id), session)
+
+    def _open_dialog(self, item=None, session=None):
+        """
+        Opens the dialog. Subclasses must implement how to instantiate the dialog if it has custom args.
+        `item` belongs to `session`, a short-lived session the dialog commits on save.
+        """
         # This default implementation assumes a common signature: Dialog(parent, session=session, item=item)
         # But based on existing code:
         # ClienteDialog(parent, session=session) / (parent, cliente=cliente, session=session)
         # ProveedorDialog(parent, session=session) / (parent, proveedor=proveedor, session=session)
-        # ProductoDialog(parent, producto=producto) -> session inside
+        # ProductoDialog(parent, producto=producto, session=session)
 
         # We will rely on subclass override for instantiation, OR try to be smart.
         # For now, let's force subclasses to override `open_dialog_instance` or just `create/edit_item`.
@@ -296,15 +268,15 @@ class BaseCRUDView(QWidget):
 
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                if hasattr(item, 'activo'):
-                    item.activo = False
-                else:
-                    self.session.delete(item)
-                self.session.commit()
+                with unidad_de_trabajo() as session:
+                    item = session.get(self.model_class, item.id)
+                    if hasattr(item, 'activo'):
+                        item.activo = False
+                    else:
+                        session.delete(item)
                 QMessageBox.information(self, "Éxito", "Elemento eliminado correctamente")
                 self.load_data()
             except Exception as e:
-                self.session.rollback()
                 QMessageBox.critical(self, "Error", f"Error al eliminar:\n{str(e)}")
 
     def eliminar_rango(self):
@@ -330,30 +302,29 @@ class BaseCRUDView(QWidget):
             
             if confirm == QMessageBox.StandardButton.Yes:
                 try:
-                    query = self.session.query(self.model_class).filter(
-                        self.model_class.id >= id_desde,
-                        self.model_class.id <= id_hasta
-                    )
-                    
-                    items = query.all()
-                    count = len(items)
-                    
+                    with unidad_de_trabajo() as session:
+                        query = session.query(self.model_class).filter(
+                            self.model_class.id >= id_desde,
+                            self.model_class.id <= id_hasta
+                        )
+
+                        items = query.all()
+                        count = len(items)
+
+                        for item in items:
+                            if hasattr(item, 'activo'):
+                                item.activo = False
+                            else:
+                                session.delete(item)
+
                     if count == 0:
                         QMessageBox.information(self, "Aviso", "No se encontraron registros en ese rango.")
                         return
-                        
-                    for item in items:
-                        if hasattr(item, 'activo'):
-                            item.activo = False
-                        else:
-                            self.session.delete(item)
-                            
-                    self.session.commit()
+
                     QMessageBox.information(self, "Éxito", f"Se han eliminado {count} registros correctamente.")
                     self.load_data()
                     
                 except Exception as e:
-                    self.session.rollback()
                     QMessageBox.critical(self, "Error", f"Error al eliminar rango:\n{str(e)}")
 
     def keyPressEvent(self, event):
@@ -365,9 +336,3 @@ class BaseCRUDView(QWidget):
                 self.edit_item(self.data_shown[row])
         else:
             super().keyPressEvent(event)
-
-    def closeEvent(self, event):
-        try:
-            self.session.close()
-        finally:
-            event.accept()
@@ -16,10 +16,11 @@ import re
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from models.database_model import obtener_session, Cliente
-from sqlalchemy import or_
 from utils.widgets import UpperLineEdit
 from utils.button_utils import style_button
 from views.base_crud_view import BaseCRUDView
+from utils.sesiones import unidad_de_trabajo
+from utils.busqueda import condicion_busqueda
 
 
 class ClienteDialog(QDialog):
@@ -206,6 +207,8 @@ class ClienteDialog(QDialog):
 
 
 class ClientesWindow(BaseCRUDView):
+    ORDEN = (Cliente.razon_social,)
+
     def __init__(self):
         super().__init__("Gestión de Clientes", Cliente, ClienteDialog)
 
@@ -230,9 +233,6 @@ class ClientesWindow(BaseCRUDView):
         header.setSectionResizeMode(7, QHeaderView.ResizeMode.Fixed)
         self.tabla.setColumnWidth(7, 180)
 
-    def apply_ordering(self, query):
-        return query.order_by(Cliente.razon_social)
-
     def fill_row(self, row, cli):
         print(f"DEBUG: cli type: {type(cli)}, dir: {dir(cli)}")
         self.tabla.setItem(row, 0, QTableWidgetItem(str(cli.id)))
@@ -244,19 +244,11 @@ class ClientesWindow(BaseCRUDView):
         self.tabla.setItem(row, 6, QTableWidgetItem(cli.direccion or ""))
 
     def apply_search_filters(self, query, text):
-        filtro_texto = f"%{text}%"
-        return query.filter(or_(
-            Cliente.numero_documento.ilike(filtro_texto),
-            Cliente.razon_social.ilike(filtro_texto),
-            Cliente.contacto.ilike(filtro_texto)
-        ))
-
-    def _open_dialog(self, item=None):
-        # Si es edición, asegurarnos de que el item esté adjunto a la sesión actual
-        if item:
-            item = self.session.merge(item)
-            
-        dialog = ClienteDialog(self, cliente=item, session=self.session)
+        # Documento, razón social y contacto (utils/busqueda.py)
+        return query.filter(condicion_busqueda(query, Cliente, text))
+
+    def _open_dialog(self, item=None, session=None):
+        dialog = ClienteDialog(self, cliente=item, session=session)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             # No necesitamos refresh explícito porque load_data recargará todo
             self.load_data()
@@ -269,10 +261,9 @@ class ClientesWindow(BaseCRUDView):
 
         if respuesta == QMessageBox.StandardButton.Yes:
             try:
-                cliente.activo = False
-                self.session.commit()
+                with unidad_de_trabajo() as session:
+                    session.get(Cliente, cliente.id).activo = False
                 QMessageBox.information(self, "Éxito", "Cliente eliminado correctamente")
                 self.load_data()
             except Exception as e:
-                self.session.rollback()
                 QMessageBox.critical(self, "Error", f"Error al eliminar:\n{str(e)}")
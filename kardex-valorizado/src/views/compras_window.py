@@ -442,7 +442,10 @@ class CompraDialog(QDialog):
             # 3. Llamar al manager
             compra_id = self.compra_a_editar.id if self.compra_a_editar else None
             
-            self.compras_manager.guardar_compra(datos_cabecera, self.detalles_compra, compra_id=compra_id)
+            self.compras_manager.guardar_compra(
+                datos_cabecera, self.detalles_compra, compra_id=compra_id,
+                usuario_id=self.user_info.get('id') if self.user_info else None
+            )
             
             self.accept()
             
@@ -0,0 +1,196 @@
+"""
+Modelo de tabla paginado de las vistas CRUD (BaseCRUDView).
+Archivo: src/views/crud_table_model.py
+
+Las filas se piden por páginas a un LectorPaginado desde un WorkerThread cuando la vista
+necesita más (canFetchMore / fetchMore); el total llega aparte, de un COUNT en otro hilo.
+Cada vista sigue llenando sus celdas con fill_row(row, item) a través de TablaPaginada, que
+ofrece la parte de la interfaz de QTableWidget que usan (setItem, item, setCellWidget...).
+"""
+
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, pyqtSignal
+from PyQt6.QtWidgets import QTableView
+from utils.worker import WorkerThread
+
+
+class CrudTableModel(QAbstractTableModel):
+    """Filas congeladas de una vista CRUD, cargadas por páginas desde un hilo de trabajo."""
+
+    total_contado = pyqtSignal(int)   # total de filas de la consulta (COUNT)
+    carga_terminada = pyqtSignal()    # ya no quedan páginas
+    error = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._filas = []
+        self._celdas = {}          # (fila, columna) -> QTableWidgetItem llenado por fill_row
+        self._encabezados = []
+        self._lector = None
+        self._worker = None
+        self._conteos = set()      # hilos de COUNT en curso (se retienen hasta que terminan)
+        self.total = None
+
+    # === Carga ===
+
+    def cargar(self, lector):
+        """Reemplaza las filas por las del lector, pide la primera página y el total."""
+        self.beginResetModel()
+        self._descartar_lector()
+        self._filas = []
+        self._celdas = {}
+        self._lector = lector
+        self.total = None
+        self.endResetModel()
+
+        conteo = WorkerThread(lector.contar)
+        self._conteos.add(conteo)
+        conteo.finished.connect(lambda total: self._recibir_total(conteo, lector, total))
+        conteo.error.connect(lambda mensaje: self._conteos.discard(conteo))
+        conteo.start()
+        self.fetchMore(QModelIndex())
+
+    def limpiar(self):
+        self.beginResetModel()
+        self._descartar_lector()
+        self._filas = []
+        self._celdas = {}
+        self._lector = None
+        self.total = None
+        self.endResetModel()
+
+    def _descartar_lector(self):
+        # Si hay una página en curso, el lector se cierra cuando el hilo termina
+        if self._lector is not None and self._worker is None:
+            self._lector.cerrar()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._lector is None:
+            return False
+        return not self._lector.agotado and self._worker is None
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        lector = self._lector
+        self._worker = WorkerThread(lector.siguiente_pagina)
+        self._worker.finished.connect(lambda pagina: self._agregar_pagina(lector, pagina))
+        self._worker.error.connect(lambda mensaje: self._error_carga(lector, mensaje))
+        self._worker.start()
+
+    def _agregar_pagina(self, lector, pagina):
+        self._worker = None
+        if lector is not self._lector:
+            # Página de una consulta anterior (se buscó otra cosa mientras se leía)
+            lector.cerrar()
+            self.fetchMore(QModelIndex())
+            return
+
+        if pagina:
+            inicio = len(self._filas)
+            self.beginInsertRows(QModelIndex(), inicio, inicio + len(pagina) - 1)
+            self._filas.extend(pagina)
+            self.endInsertRows()
+
+        if lector.agotado:
+            self.carga_terminada.emit()
+
+    def _error_carga(self, lector, mensaje):
+        self._worker = None
+        if lector is not self._lector:
+            lector.cerrar()
+            self.fetchMore(QModelIndex())
+            return
+        self.error.emit(mensaje)
+
+    def _recibir_total(self, conteo, lector, total):
+        self._conteos.discard(conteo)
+        if lector is self._lector:
+            self.total = total
+            self.total_contado.emit(total)
+
+    def cargando(self):
+        return self._worker is not None
+
+    @property
+    def filas(self):
+        """Filas cargadas hasta el momento."""
+        return self._filas
+
+    # === Celdas (las llena la vista con fill_row) ===
+
+    def set_encabezados(self, encabezados):
+        self.beginResetModel()
+        self._encabezados = list(encabezados)
+        self.endResetModel()
+
+    def set_columnas(self, cantidad):
+        self.set_encabezados((self._encabezados + [""] * cantidad)[:cantidad])
+
+    def set_celda(self, fila, columna, item):
+        self._celdas[(fila, columna)] = item
+        indice = self.index(fila, columna)
+        self.dataChanged.emit(indice, indice)
+
+    def celda(self, fila, columna):
+        return self._celdas.get((fila, columna))
+
+    # === Presentación ===
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._filas)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._encabezados)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self._encabezados[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self._celdas.get((index.row(), index.column()))
+        return item.data(role) if item is not None else None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+
+
+class TablaPaginada(QTableView):
+    """
+    QTableView sobre un CrudTableModel con los métodos de QTableWidget que usan las vistas
+    CRUD, para que fill_row y las acciones por fila no cambien.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.modelo = CrudTableModel(self)
+        self.setModel(self.modelo)
+
+    def setColumnCount(self, cantidad):
+        self.modelo.set_columnas(cantidad)
+
+    def setHorizontalHeaderLabels(self, encabezados):
+        self.modelo.set_encabezados(encabezados)
+
+    def columnCount(self):
+        return self.modelo.columnCount()
+
+    def rowCount(self):
+        return self.modelo.rowCount()
+
+    def setItem(self, fila, columna, item):
+        self.modelo.set_celda(fila, columna, item)
+
+    def item(self, fila, columna):
+        return self.modelo.celda(fila, columna)
+
+    def setCellWidget(self, fila, columna, widget):
+        self.setIndexWidget(self.modelo.index(fila, columna), widget)
+
+    def currentRow(self):
+        indice = self.currentIndex()
+        return indice.row() if indice.isValid() else -1
@@ -21,7 +21,7 @@ from matplotlib.figure import Figure
 # Agregar src al path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from models.database_model import (obtener_session, Venta, Compra, Producto,
+from models.database_model import (obtener_session_lectura, Venta, Compra, Producto,
                                    OrdenCompra, EstadoOrden)
 from utils.app_context import app_context
 
@@ -144,7 +144,8 @@ class DashboardWidget(QWidget):
 
     def cargar_datos(self):
         """Recupera los datos de la BD y actualiza los widgets."""
-        session = obtener_session()
+        # Sesión de solo lectura: los KPIs salen de una misma instantánea y no bloquean a quien registra
+        session = obtener_session_lectura()
         try:
             hoy = date.today()
             anio_actual = hoy.year
@@ -186,30 +187,21 @@ class DashboardWidget(QWidget):
             ).all()
 
             # Optimización: Consulta masiva de stocks
-            # Subquery para obtener el último movimiento de cada producto en cada almacén
-            from models.database_model import MovimientoStock
+            # Stock vigente materializado (una fila por producto y almacén)
+            from models.database_model import SaldoActual
             
             product_ids = [p.id for p in prods_con_minimo]
             
             criticos_count = 0
             if product_ids:
-                subquery = (
-                    session.query(
-                        func.max(MovimientoStock.id).label('max_id')
-                    )
-                    .filter(MovimientoStock.producto_id.in_(product_ids))
-                    .group_by(MovimientoStock.producto_id, MovimientoStock.almacen_id)
-                    .subquery()
-                )
-
                 # Sumar saldo de todos los almacenes por producto
                 stocks_query = (
                     session.query(
-                        MovimientoStock.producto_id,
-                        func.sum(MovimientoStock.saldo_cantidad)
+                        SaldoActual.producto_id,
+                        func.sum(SaldoActual.cantidad)
                     )
-                    .join(subquery, MovimientoStock.id == subquery.c.max_id)
-                    .group_by(MovimientoStock.producto_id)
+                    .filter(SaldoActual.producto_id.in_(product_ids))
+                    .group_by(SaldoActual.producto_id)
                     .all()
                 )
                 
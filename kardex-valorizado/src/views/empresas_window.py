@@ -17,7 +17,7 @@ import re
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from models.database_model import (obtener_session, Empresa, Almacen,
-                                   MetodoValuacion)
+                                   MetodoValuacion, AmbitoPromedio)
 from utils.widgets import UpperLineEdit, SearchableComboBox
 from utils.button_utils import style_button
 
@@ -251,6 +251,16 @@ class EmpresaDialog(QDialog):
         self.cmb_metodo.addItem("Promedio Ponderado", MetodoValuacion.PROMEDIO_PONDERADO.value)
 
         grupo_layout.addWidget(self.cmb_metodo)
+
+        info_ambito = QLabel("Costo promedio (Promedio Ponderado):")
+        info_ambito.setStyleSheet("color: #666; font-size: 10px;")
+        grupo_layout.addWidget(info_ambito)
+
+        self.cmb_ambito = QComboBox()
+        self.cmb_ambito.addItem("Por almacén - cada almacén promedia sus entradas", AmbitoPromedio.ALMACEN.value)
+        self.cmb_ambito.addItem("Global de la empresa - un promedio por producto", AmbitoPromedio.EMPRESA.value)
+
+        grupo_layout.addWidget(self.cmb_ambito)
         grupo_valuacion.setLayout(grupo_layout)
         layout.addWidget(grupo_valuacion)
 
@@ -346,6 +356,11 @@ class EmpresaDialog(QDialog):
                 self.cmb_metodo.setCurrentIndex(i)
                 break
 
+        for i in range(self.cmb_ambito.count()):
+            if self.cmb_ambito.itemData(i) == self.empresa.ambito_promedio.value:
+                self.cmb_ambito.setCurrentIndex(i)
+                break
+
     def guardar(self):
         """Guarda la empresa"""
         ruc = self.txt_ruc.text().strip()
@@ -357,6 +372,7 @@ class EmpresaDialog(QDialog):
 
         metodo_str = self.cmb_metodo.currentData()
         metodo = MetodoValuacion(metodo_str)
+        ambito = AmbitoPromedio(self.cmb_ambito.currentData())
 
         try:
             if not self.empresa:
@@ -366,7 +382,8 @@ class EmpresaDialog(QDialog):
                     direccion=self.txt_direccion.toPlainText() or None,
                     telefono=self.txt_telefono.text().strip() or None,
                     email=self.txt_email.text().strip() or None,
-                    metodo_valuacion=metodo
+                    metodo_valuacion=metodo,
+                    ambito_promedio=ambito
                 )
 
                 self.session.add(empresa)
@@ -388,6 +405,7 @@ class EmpresaDialog(QDialog):
                 self.empresa.telefono = self.txt_telefono.text().strip() or None
                 self.empresa.email = self.txt_email.text().strip() or None
                 self.empresa.metodo_valuacion = metodo
+                self.empresa.ambito_promedio = ambito
 
                 mensaje = "Empresa actualizada exitosamente"
 
@@ -16,6 +16,8 @@ from models.database_model import obtener_session, Equipo, Almacen, NivelEquipo,
 from utils.widgets import SearchableComboBox, UpperLineEdit
 from utils.file_manager import FileManager
 from views.base_crud_view import BaseCRUDView
+from utils.sesiones import unidad_de_trabajo
+from utils.busqueda import condicion_busqueda
 from utils.styles import STYLE_CUADRADO_VERDE, STYLE_CHECKBOX_CUSTOM
 
 # Try import ProveedorDialog from proveedores_window
@@ -194,9 +196,9 @@ class EquipoDialog(QDialog):
     
     equipo_guardado = pyqtSignal()
 
-    def __init__(self, parent=None, equipo=None):
+    def __init__(self, parent=None, equipo=None, session=None):
         super().__init__(parent)
-        self.session = obtener_session()
+        self.session = session or obtener_session()
         # Si se pasa un equipo (desde la ventana principal), lo recargamos en esta sesión
         # para asegurar que esté adjunto y se puedan guardar los cambios.
         self.equipo = self.session.get(Equipo, equipo.id) if equipo else None
@@ -858,14 +860,17 @@ class EquiposWindow(BaseCRUDView):
         self.tabla.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         self.tabla.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
 
-    def get_base_query(self, session=None):
-        sess = session if session else self.session
-        return sess.query(Equipo).options(
+    def get_base_query(self, session):
+        return session.query(Equipo).options(
             joinedload(Equipo.tipo_equipo),
             joinedload(Equipo.subtipo_equipo),
             joinedload(Equipo.almacen)
         ).filter_by(activo=True)
-        
+
+    def apply_search_filters(self, query, text):
+        # Códigos, nombre, marca, modelo y serie (utils/busqueda.py)
+        return query.filter(condicion_busqueda(query, Equipo, text))
+
     def setup_table_columns(self):
         self.tabla.setColumnCount(9)
         self.tabla.setHorizontalHeaderLabels([
@@ -919,8 +924,8 @@ class EquiposWindow(BaseCRUDView):
         else:
             self.tabla.setItem(row, 7, QTableWidgetItem("N/A"))
 
-    def _open_dialog(self, item=None):
-        dialog = EquipoDialog(self, equipo=item)
+    def _open_dialog(self, item=None, session=None):
+        dialog = EquipoDialog(self, equipo=item, session=session)
         dialog.equipo_guardado.connect(self.load_data)
         dialog.exec()
 
@@ -942,19 +947,18 @@ class EquiposWindow(BaseCRUDView):
                 eliminados = 0
                 errores = []
                 
-                for row in selected_rows:
-                    # El código único está en la columna 0, el código normal en la 1
-                    # Usamos el código normal para buscar por ahora, o el único si está disponible
-                    codigo = self.tabla.item(row, 1).text() # Columna 1 es Código Original
-                    equipo = self.session.query(Equipo).filter_by(codigo=codigo).first()
-                    
-                    if equipo:
-                        self.session.delete(equipo)
-                        eliminados += 1
-                    else:
-                        errores.append(f"No se encontró el equipo con código {codigo}")
-
-                self.session.commit()
+                with unidad_de_trabajo() as session:
+                    for row in selected_rows:
+                        # El código único está en la columna 0, el código normal en la 1
+                        # Usamos el código normal para buscar por ahora, o el único si está disponible
+                        codigo = self.tabla.item(row, 1).text() # Columna 1 es Código Original
+                        equipo = session.query(Equipo).filter_by(codigo=codigo).first()
+
+                        if equipo:
+                            session.delete(equipo)
+                            eliminados += 1
+                        else:
+                            errores.append(f"No se encontró el equipo con código {codigo}")
                 
                 if errores:
                     QMessageBox.warning(self, "Advertencia", f"Se eliminaron {eliminados} equipos, pero hubo errores:\n" + "\n".join(errores))
@@ -964,7 +968,6 @@ class EquiposWindow(BaseCRUDView):
                 self.load_data()
                 
             except Exception as e:
-                self.session.rollback()
                 QMessageBox.critical(self, "Error", f"Error al eliminar equipos: {str(e)}")
 
     def eliminar_rango(self):
@@ -998,30 +1001,30 @@ class EquiposWindow(BaseCRUDView):
                     cod_desde = f"EQ{num_desde:05d}"
                     cod_hasta = f"EQ{num_hasta:05d}"
                     
-                    equipos_a_eliminar = self.session.query(Equipo).filter(
-                        Equipo.codigo_unico >= cod_desde,
-                        Equipo.codigo_unico <= cod_hasta
-                    ).all()
-                    
-                    if not equipos_a_eliminar:
-                        QMessageBox.information(self, "Aviso", "No se encontraron equipos en ese rango.")
-                        return
-                        
-                    count = len(equipos_a_eliminar)
-                    confirm2 = QMessageBox.question(self, "Confirmar", f"Se encontraron {count} equipos en el rango.\n¿Proceder a eliminar?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
-                    
-                    if confirm2 == QMessageBox.StandardButton.Yes:
+                    with unidad_de_trabajo() as session:
+                        equipos_a_eliminar = session.query(Equipo).filter(
+                            Equipo.codigo_unico >= cod_desde,
+                            Equipo.codigo_unico <= cod_hasta
+                        ).all()
+
+                        if not equipos_a_eliminar:
+                            QMessageBox.information(self, "Aviso", "No se encontraron equipos en ese rango.")
+                            return
+
+                        count = len(equipos_a_eliminar)
+                        confirm2 = QMessageBox.question(self, "Confirmar", f"Se encontraron {count} equipos en el rango.\n¿Proceder a eliminar?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+                        if confirm2 != QMessageBox.StandardButton.Yes:
+                            return
+
                         eliminados = 0
                         for eq in equipos_a_eliminar:
-                            self.session.delete(eq)
+                            session.delete(eq)
                             eliminados += 1
-                            
-                        self.session.commit()
-                        QMessageBox.information(self, "Éxito", f"Se eliminaron {eliminados} equipos.")
-                        self.load_data()
+
+                    QMessageBox.information(self, "Éxito", f"Se eliminaron {eliminados} equipos.")
+                    self.load_data()
 
                 except Exception as e:
-                    self.session.rollback()
                     QMessageBox.critical(self, "Error", f"Error al eliminar rango:\n{str(e)}")
 
         
@@ -1081,8 +1084,8 @@ class EquiposWindow(BaseCRUDView):
         else:
             self.tabla.setItem(row, 7, QTableWidgetItem("N/A"))
 
-    def _open_dialog(self, item=None):
-        dialog = EquipoDialog(self, equipo=item)
+    def _open_dialog(self, item=None, session=None):
+        dialog = EquipoDialog(self, equipo=item, session=session)
         dialog.equipo_guardado.connect(self.load_data)
         dialog.exec()
 
@@ -1104,19 +1107,18 @@ class EquiposWindow(BaseCRUDView):
                 eliminados = 0
                 errores = []
                 
-                for row in selected_rows:
-                    # El código único está en la columna 0, el código normal en la 1
-                    # Usamos el código normal para buscar por ahora, o el único si está disponible
-                    codigo = self.tabla.item(row, 1).text() # Columna 1 es Código Original
-                    equipo = self.session.query(Equipo).filter_by(codigo=codigo).first()
-                    
-                    if equipo:
-                        self.session.delete(equipo)
-                        eliminados += 1
-                    else:
-                        errores.append(f"No se encontró el equipo con código {codigo}")
-
-                self.session.commit()
+                with unidad_de_trabajo() as session:
+                    for row in selected_rows:
+                        # El código único está en la columna 0, el código normal en la 1
+                        # Usamos el código normal para buscar por ahora, o el único si está disponible
+                        codigo = self.tabla.item(row, 1).text() # Columna 1 es Código Original
+                        equipo = session.query(Equipo).filter_by(codigo=codigo).first()
+
+                        if equipo:
+                            session.delete(equipo)
+                            eliminados += 1
+                        else:
+                            errores.append(f"No se encontró el equipo con código {codigo}")
                 
                 if errores:
                     QMessageBox.warning(self, "Advertencia", f"Se eliminaron {eliminados} equipos, pero hubo errores:\n" + "\n".join(errores))
@@ -1126,7 +1128,6 @@ class EquiposWindow(BaseCRUDView):
                 self.load_data()
                 
             except Exception as e:
-                self.session.rollback()
                 QMessageBox.critical(self, "Error", f"Error al eliminar equipos: {str(e)}")
 
     def eliminar_rango(self):
@@ -1160,30 +1161,30 @@ class EquiposWindow(BaseCRUDView):
                     cod_desde = f"EQ{num_desde:05d}"
                     cod_hasta = f"EQ{num_hasta:05d}"
                     
-                    equipos_a_eliminar = self.session.query(Equipo).filter(
-                        Equipo.codigo_unico >= cod_desde,
-                        Equipo.codigo_unico <= cod_hasta
-                    ).all()
-                    
-                    if not equipos_a_eliminar:
-                        QMessageBox.information(self, "Aviso", "No se encontraron equipos en ese rango.")
-                        return
-                        
-                    count = len(equipos_a_eliminar)
-                    confirm2 = QMessageBox.question(self, "Confirmar", f"Se encontraron {count} equipos en el rango.\n¿Proceder a eliminar?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
-                    
-                    if confirm2 == QMessageBox.StandardButton.Yes:
+                    with unidad_de_trabajo() as session:
+                        equipos_a_eliminar = session.query(Equipo).filter(
+                            Equipo.codigo_unico >= cod_desde,
+                            Equipo.codigo_unico <= cod_hasta
+                        ).all()
+
+                        if not equipos_a_eliminar:
+                            QMessageBox.information(self, "Aviso", "No se encontraron equipos en ese rango.")
+                            return
+
+                        count = len(equipos_a_eliminar)
+                        confirm2 = QMessageBox.question(self, "Confirmar", f"Se encontraron {count} equipos en el rango.\n¿Proceder a eliminar?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+                        if confirm2 != QMessageBox.StandardButton.Yes:
+                            return
+
                         eliminados = 0
                         for eq in equipos_a_eliminar:
-                            self.session.delete(eq)
+                            session.delete(eq)
                             eliminados += 1
-                            
-                        self.session.commit()
-                        QMessageBox.information(self, "Éxito", f"Se eliminaron {eliminados} equipos.")
-                        self.load_data()
+
+                    QMessageBox.information(self, "Éxito", f"Se eliminaron {eliminados} equipos.")
+                    self.load_data()
 
                 except Exception as e:
-                    self.session.rollback()
                     QMessageBox.critical(self, "Error", f"Error al eliminar rango:\n{str(e)}")
 
     def abrir_checklist(self):
@@ -1193,16 +1194,16 @@ class EquiposWindow(BaseCRUDView):
             return
 
         equipo_id = int(self.table.item(selected_row, 0).text())
-        equipo = self.session.get(Equipo, equipo_id)
-        
-        if not equipo:
-            return
-            
         user_info = app_context.get_user_info()
         usuario_id = user_info.get('id') if user_info else 1 # Fallback to admin if no user info
-        
-        dialog = ChecklistFillDialog(self.session, equipo, usuario_id, self)
-        dialog.exec()
+
+        with unidad_de_trabajo(confirmar=False) as session:
+            equipo = session.get(Equipo, equipo_id)
+            if not equipo:
+                return
+
+            dialog = ChecklistFillDialog(session, equipo, usuario_id, self)
+            dialog.exec()
 
     def abrir_historial(self):
         selected_row = self.table.currentRow()
@@ -0,0 +1,165 @@
+"""
+Modelo de tabla del Kardex Valorizado (KardexWindow).
+Archivo: src/views/kardex_table_model.py
+
+Las filas se piden por páginas a un LectorKardex desde un WorkerThread cuando la vista
+necesita más (canFetchMore / fetchMore), y se agregan ya valorizadas sin bloquear la UI.
+"""
+
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, pyqtSignal
+from utils.worker import WorkerThread
+
+
+class KardexTableModel(QAbstractTableModel):
+    """Kardex de un producto cargado por páginas desde un hilo de trabajo."""
+
+    COLUMNAS = [
+        "Fecha", "Documento", "Detalle",
+        "Entrada Cant.", "Entrada C.U.", "Entrada Total",
+        "Salida Cant.", "Salida C.U.", "Salida Total",
+        "Saldo Cant.", "Saldo Total"
+    ]
+
+    pagina_cargada = pyqtSignal(int)   # filas cargadas hasta el momento
+    carga_terminada = pyqtSignal()     # ya no quedan páginas
+    error = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._filas = []
+        self._lector = None
+        self._worker = None
+        self._moneda_simbolo = "S/"
+
+    # === Carga ===
+
+    def cargar(self, lector):
+        """Reemplaza el kardex mostrado por el del lector y pide la primera página."""
+        self.beginResetModel()
+        self._descartar_lector()
+        self._filas = []
+        self._lector = lector
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def limpiar(self):
+        self.beginResetModel()
+        self._descartar_lector()
+        self._filas = []
+        self._lector = None
+        self.endResetModel()
+
+    def _descartar_lector(self):
+        # Si hay una página en curso, el lector se cierra cuando el hilo termina
+        if self._lector is not None and self._worker is None:
+            self._lector.cerrar()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._lector is None:
+            return False
+        return not self._lector.agotado and self._worker is None
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        lector = self._lector
+        self._worker = WorkerThread(lector.siguiente_pagina)
+        self._worker.finished.connect(lambda pagina: self._agregar_pagina(lector, pagina))
+        self._worker.error.connect(lambda mensaje: self._error_carga(lector, mensaje))
+        self._worker.start()
+
+    def _agregar_pagina(self, lector, pagina):
+        self._worker = None
+        if lector is not self._lector:
+            # Página de un kardex anterior (se generó otro mientras se leía)
+            lector.cerrar()
+            return
+
+        if pagina:
+            inicio = len(self._filas)
+            self.beginInsertRows(QModelIndex(), inicio, inicio + len(pagina) - 1)
+            self._filas.extend(pagina)
+            self.endInsertRows()
+            self.pagina_cargada.emit(len(self._filas))
+
+        if lector.agotado:
+            self.carga_terminada.emit()
+
+    def _error_carga(self, lector, mensaje):
+        self._worker = None
+        if lector is not self._lector:
+            lector.cerrar()
+            return
+        self.error.emit(mensaje)
+
+    def cargando(self):
+        return self._worker is not None
+
+    def set_moneda_simbolo(self, simbolo):
+        self.beginResetModel()
+        self._moneda_simbolo = simbolo
+        self.endResetModel()
+
+    @property
+    def movimientos(self):
+        """Movimientos cargados hasta el momento."""
+        return self._filas
+
+    # === Presentación ===
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._filas)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNAS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.COLUMNAS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self._texto(self._filas[index.row()], index.column())
+        if role == Qt.ItemDataRole.TextAlignmentRole and index.column() >= 3:
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+    def _texto(self, mov, columna):
+        simbolo = self._moneda_simbolo
+        if columna == 0:
+            return mov.fecha_documento.strftime('%d/%m/%Y')
+        if columna == 1:
+            return f"{mov.tipo_documento.value if mov.tipo_documento else ''} {mov.numero_documento or ''}"
+        if columna == 2:
+            detalle = mov.tipo.value
+            if mov.proveedor_id:
+                detalle += f" - {mov.proveedor_id}"
+            elif mov.destino_id:
+                detalle += f" - {mov.destino_id}"
+            return detalle
+
+        if columna in (3, 4, 5):
+            if not mov.cantidad_entrada > 0:
+                return ""
+            cu = getattr(mov, 'costo_unitario_calculado', mov.costo_unitario)
+            if columna == 3:
+                return f"{mov.cantidad_entrada:,.2f}"
+            if columna == 4:
+                return f"{simbolo} {cu:,.2f}"
+            return f"{simbolo} {mov.cantidad_entrada * cu:,.2f}"
+
+        if columna in (6, 7, 8):
+            if not mov.cantidad_salida > 0:
+                return ""
+            if columna == 6:
+                return f"{mov.cantidad_salida:,.2f}"
+            if columna == 7:
+                return f"{simbolo} {getattr(mov, 'costo_unitario_calculado', 0):,.2f}"
+            return f"{simbolo} {getattr(mov, 'costo_total_calculado', 0):,.2f}"
+
+        if columna == 9:
+            return f"{getattr(mov, 'saldo_cantidad_calculado', mov.saldo_cantidad):,.2f}"
+        return f"{simbolo} {getattr(mov, 'saldo_valor_calculado', mov.saldo_costo_total):,.2f}"
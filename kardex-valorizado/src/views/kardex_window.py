@@ -4,24 +4,25 @@ Archivo: src/views/kardex_window.py
 """
 
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
-                              QPushButton, QTableWidget, QTableWidgetItem,
+                              QPushButton, QTableView,
                               QDateEdit, QMessageBox, QHeaderView, QComboBox,
                               QRadioButton, QButtonGroup, QFileDialog)
 from PyQt6.QtCore import Qt, QDate
 from PyQt6.QtGui import QFont
 import sys
 from pathlib import Path
-from datetime import datetime
-from decimal import Decimal
-from sqlalchemy import extract
+from datetime import datetime, date
+from sqlalchemy import or_
 from utils.app_context import app_context
 import xlsxwriter
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from models.database_model import (obtener_session, Producto, Empresa, Almacen,
-                                   MovimientoStock, Moneda, MetodoValuacion, AnioContable)
+                                   MovimientoStock, Moneda, MetodoValuacion, AnioContable, CierreKardex)
 from utils.widgets import SearchableComboBox, MoneyDelegate
+from utils.kardex_paginado import LectorKardex
+from views.kardex_table_model import KardexTableModel
 from utils.report_utils import BaseReport
 from reportlab.platypus import Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet
@@ -35,7 +36,9 @@ class KardexWindow(QWidget):
     def __init__(self):
         super().__init__()
         self.session = obtener_session()
-        self.movimientos = []
+        # Filtros del kardex generado (LectorKardex) y sus totales
+        self.parametros_kardex = None
+        self.totales = None
         self.init_ui()
         self.cargar_empresas()
     
@@ -184,14 +187,16 @@ class KardexWindow(QWidget):
         layout.addWidget(self.lbl_metodo)
         
         # === TABLA KARDEX ===
-        self.tabla = QTableWidget()
-        self.tabla.setColumnCount(11)
-        self.tabla.setHorizontalHeaderLabels([
-            "Fecha", "Documento", "Detalle", 
-            "Entrada Cant.", "Entrada C.U.", "Entrada Total",
-            "Salida Cant.", "Salida C.U.", "Salida Total",
-            "Saldo Cant.", "Saldo Total"
-        ])
+        # Modelo paginado: las filas se leen y valorizan por páginas en un hilo de trabajo
+        self.modelo = KardexTableModel(self)
+        self.modelo.pagina_cargada.connect(self.actualizar_resumen)
+        self.modelo.carga_terminada.connect(self.actualizar_resumen)
+        self.modelo.error.connect(
+            lambda mensaje: QMessageBox.critical(self, "Error", f"Error al cargar el kardex:\n{mensaje}")
+        )
+
+        self.tabla = QTableView()
+        self.tabla.setModel(self.modelo)
         
         # SE ELIMINA EL STYLESHEET EXPLICITO PARA QUE HEREDE EL TEMA GLOBAL (PLOMO/GRIS)
         # self.tabla.setStyleSheet(...)
@@ -267,13 +272,19 @@ class KardexWindow(QWidget):
             QMessageBox.critical(self, "Error Fatal", f"No se encontró la configuración para el año {anio_numero} en la base de datos.")
             return
 
-        # Subconsulta para obtener IDs de productos con movimiento en el año
+        # Productos con movimiento en el año (rango de fechas, resuelto con el índice)
+        # o con saldo en el cierre del año anterior
         subquery = self.session.query(MovimientoStock.producto_id).filter(
-            extract('year', MovimientoStock.fecha_documento) == anio_seleccionado.anio
+            MovimientoStock.fecha_documento >= date(anio_seleccionado.anio, 1, 1),
+            MovimientoStock.fecha_documento <= date(anio_seleccionado.anio, 12, 31)
         ).distinct()
+        con_saldo_inicial = self.session.query(CierreKardex.producto_id).filter(
+            CierreKardex.anio == anio_seleccionado.anio - 1,
+            CierreKardex.cantidad > 0
+        )
 
         productos = self.session.query(Producto).filter(
-            Producto.id.in_(subquery)
+            or_(Producto.id.in_(subquery), Producto.id.in_(con_saldo_inicial))
         ).filter_by(activo=True).order_by(Producto.nombre).all()
         
         for prod in productos:
@@ -306,255 +317,74 @@ class KardexWindow(QWidget):
         
         # Obtener empresa y método
         empresa = self.session.query(Empresa).get(empresa_id)
-        producto = self.session.query(Producto).get(producto_id)
-        
-        # Consultar movimientos
-        query = self.session.query(MovimientoStock).filter(
-            MovimientoStock.empresa_id == empresa_id,
-            MovimientoStock.producto_id == producto_id,
-            MovimientoStock.fecha_documento >= fecha_desde,
-            MovimientoStock.fecha_documento <= fecha_hasta
+
+        self.parametros_kardex = dict(
+            empresa_id=empresa_id,
+            producto_id=producto_id,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            almacen_id=almacen_id,
+            metodo=empresa.metodo_valuacion
         )
-        
-        if almacen_id:
-            query = query.filter_by(almacen_id=almacen_id)
-        
-        self.movimientos = query.order_by(MovimientoStock.fecha_documento, MovimientoStock.id).all()
-        
-        if not self.movimientos:
+
+        # Totales del periodo: una consulta agregada (no requiere leer las filas)
+        lector = LectorKardex(**self.parametros_kardex)
+        try:
+            self.totales = lector.totales()
+        finally:
+            lector.cerrar()
+        if not self.totales['movimientos']:
             QMessageBox.information(self, "Sin datos", "No hay movimientos para los filtros seleccionados")
-            self.tabla.setRowCount(0)
+            self.modelo.limpiar()
+            self.lbl_resumen.setText("")
             return
-        
-        # Recalcular según método (esto es crítico)
-        self.recalcular_kardex(empresa.metodo_valuacion, producto)
-        
-        # Mostrar en tabla
-        self.mostrar_kardex()
-    
-    def recalcular_kardex(self, metodo, producto):
+
+        # Las páginas se leen y valorizan (según el método, desde el saldo inicial del
+        # periodo) en un hilo de trabajo con su propia sesión
+        moneda_simbolo = "S/" if self.cmb_moneda_vista.currentData() == "SOLES" else "$"
+        self.modelo.set_moneda_simbolo(moneda_simbolo)
+        self.modelo.cargar(LectorKardex(**self.parametros_kardex))
+        self.actualizar_resumen()
+
+    def actualizar_resumen(self, *args):
+        """Muestra los totales del periodo y, cuando terminó la carga, el saldo final"""
+        if not self.totales:
+            return
+
+        moneda_simbolo = "S/" if self.cmb_moneda_vista.currentData() == "SOLES" else "$"
+        movimientos = self.modelo.movimientos
+
+        resumen = f"📊 Total Movimientos: {self.totales['movimientos']} | "
+        resumen += f"Total Entradas: {self.totales['entradas']:,.2f} | "
+        resumen += f"Total Salidas: {self.totales['salidas']:,.2f} | "
+
+        if movimientos and not self.modelo.canFetchMore() and not self.modelo.cargando():
+            ultimo = movimientos[-1]
+            resumen += f"<strong>Saldo Final: {ultimo.saldo_cantidad_calculado:,.2f} unidades = {moneda_simbolo} {ultimo.saldo_valor_calculado:,.2f}</strong>"
+        else:
+            resumen += f"⏳ Cargados {len(movimientos):,} de {self.totales['movimientos']:,}"
+
+        self.lbl_resumen.setText(resumen)
+
+    def movimientos_exportacion(self):
         """
-        Recalcula el kardex según el método de valuación
-        ESTE ES EL ALGORITMO MÁS IMPORTANTE DEL SISTEMA
+        Todos los movimientos valorizados del kardex generado: los ya cargados en la tabla
+        o, si aún faltan páginas, una lectura completa con otro lector (sesión de solo lectura).
         """
-        if metodo == MetodoValuacion.PROMEDIO_PONDERADO:
-            self.calcular_promedio_ponderado()
-        elif metodo == MetodoValuacion.PEPS:
-            self.calcular_peps()
-        elif metodo == MetodoValuacion.UEPS:
-            self.calcular_ueps()
-    
-    def calcular_promedio_ponderado(self):
-        """Calcula kardex con método Promedio Ponderado"""
-        saldo_cantidad = Decimal('0')
-        saldo_valor = Decimal('0')
-        
-        for mov in self.movimientos:
-            if mov.cantidad_entrada > 0:
-                # Entrada: agregar al inventario
-                saldo_cantidad += Decimal(str(mov.cantidad_entrada))
-                saldo_valor += Decimal(str(mov.costo_total))
-                
-                # Calcular nuevo costo promedio
-                if saldo_cantidad > 0:
-                    costo_promedio = saldo_valor / saldo_cantidad
-                else:
-                    costo_promedio = Decimal('0')
-                
-                mov.costo_unitario_calculado = float(costo_promedio)
-                mov.saldo_cantidad_calculado = float(saldo_cantidad)
-                mov.saldo_valor_calculado = float(saldo_valor)
-                
-            else:
-                # Salida: usar costo promedio actual
-                if saldo_cantidad > 0:
-                    costo_promedio = saldo_valor / saldo_cantidad
-                else:
-                    costo_promedio = Decimal('0')
-                
-                cantidad_salida = Decimal(str(mov.cantidad_salida))
-                valor_salida = cantidad_salida * costo_promedio
-                
-                saldo_cantidad -= cantidad_salida
-                saldo_valor -= valor_salida
-                
-                if saldo_cantidad < 0:
-                    saldo_cantidad = Decimal('0')
-                    saldo_valor = Decimal('0')
-                
-                mov.costo_unitario_calculado = float(costo_promedio)
-                mov.costo_total_calculado = float(valor_salida)
-                mov.saldo_cantidad_calculado = float(saldo_cantidad)
-                mov.saldo_valor_calculado = float(saldo_valor)
-    
-    def calcular_peps(self):
-        """Calcula kardex con método PEPS (FIFO)"""
-        # Cola de lotes (los primeros en entrar)
-        lotes = []
-        
-        for mov in self.movimientos:
-            if mov.cantidad_entrada > 0:
-                # Entrada: agregar nuevo lote
-                lotes.append({
-                    'cantidad': Decimal(str(mov.cantidad_entrada)),
-                    'costo_unitario': Decimal(str(mov.costo_unitario))
-                })
-                
-                mov.costo_unitario_calculado = float(mov.costo_unitario)
-                
-            else:
-                # Salida: tomar de los primeros lotes
-                cantidad_pendiente = Decimal(str(mov.cantidad_salida))
-                costo_total_salida = Decimal('0')
-                
-                while cantidad_pendiente > 0 and lotes:
-                    lote = lotes[0]
-                    
-                    if lote['cantidad'] <= cantidad_pendiente:
-                        # Consumir lote completo
-                        costo_total_salida += lote['cantidad'] * lote['costo_unitario']
-                        cantidad_pendiente -= lote['cantidad']
-                        lotes.pop(0)
-                    else:
-                        # Consumir parte del lote
-                        costo_total_salida += cantidad_pendiente * lote['costo_unitario']
-                        lote['cantidad'] -= cantidad_pendiente
-                        cantidad_pendiente = Decimal('0')
-                
-                if mov.cantidad_salida > 0:
-                    costo_promedio_salida = costo_total_salida / Decimal(str(mov.cantidad_salida))
-                else:
-                    costo_promedio_salida = Decimal('0')
-                
-                mov.costo_unitario_calculado = float(costo_promedio_salida)
-                mov.costo_total_calculado = float(costo_total_salida)
-            
-            # Calcular saldo actual
-            saldo_cantidad = sum(lote['cantidad'] for lote in lotes)
-            saldo_valor = sum(lote['cantidad'] * lote['costo_unitario'] for lote in lotes)
-            
-            mov.saldo_cantidad_calculado = float(saldo_cantidad)
-            mov.saldo_valor_calculado = float(saldo_valor)
-    
-    def calcular_ueps(self):
-        """Calcula kardex con método UEPS (LIFO)"""
-        # Pila de lotes (los últimos en entrar)
-        lotes = []
-        
-        for mov in self.movimientos:
-            if mov.cantidad_entrada > 0:
-                # Entrada: agregar nuevo lote al final
-                lotes.append({
-                    'cantidad': Decimal(str(mov.cantidad_entrada)),
-                    'costo_unitario': Decimal(str(mov.costo_unitario))
-                })
-                
-                mov.costo_unitario_calculado = float(mov.costo_unitario)
-                
-            else:
-                # Salida: tomar de los últimos lotes
-                cantidad_pendiente = Decimal(str(mov.cantidad_salida))
-                costo_total_salida = Decimal('0')
-                
-                while cantidad_pendiente > 0 and lotes:
-                    lote = lotes[-1]  # Último lote (LIFO)
-                    
-                    if lote['cantidad'] <= cantidad_pendiente:
-                        # Consumir lote completo
-                        costo_total_salida += lote['cantidad'] * lote['costo_unitario']
-                        cantidad_pendiente -= lote['cantidad']
-                        lotes.pop()
-                    else:
-                        # Consumir parte del lote
-                        costo_total_salida += cantidad_pendiente * lote['costo_unitario']
-                        lote['cantidad'] -= cantidad_pendiente
-                        cantidad_pendiente = Decimal('0')
-                
-                if mov.cantidad_salida > 0:
-                    costo_promedio_salida = costo_total_salida / Decimal(str(mov.cantidad_salida))
-                else:
-                    costo_promedio_salida = Decimal('0')
-                
-                mov.costo_unitario_calculado = float(costo_promedio_salida)
-                mov.costo_total_calculado = float(costo_total_salida)
-            
-            # Calcular saldo actual
-            saldo_cantidad = sum(lote['cantidad'] for lote in lotes)
-            saldo_valor = sum(lote['cantidad'] * lote['costo_unitario'] for lote in lotes)
-            
-            mov.saldo_cantidad_calculado = float(saldo_cantidad)
-            mov.saldo_valor_calculado = float(saldo_valor)
-    
-    def mostrar_kardex(self):
-        """Muestra el kardex en la tabla"""
-        self.tabla.setRowCount(len(self.movimientos))
-        
-        moneda_simbolo = "S/" if self.cmb_moneda_vista.currentData() == "SOLES" else "$"
-        
-        for row, mov in enumerate(self.movimientos):
-            # Fecha
-            self.tabla.setItem(row, 0, QTableWidgetItem(mov.fecha_documento.strftime('%d/%m/%Y')))
-            
-            # Documento
-            doc = f"{mov.tipo_documento.value if mov.tipo_documento else ''} {mov.numero_documento or ''}"
-            self.tabla.setItem(row, 1, QTableWidgetItem(doc))
-            
-            # Detalle
-            detalle = mov.tipo.value
-            if mov.proveedor_id:
-                detalle += f" - {mov.proveedor_id}"
-            elif mov.destino_id:
-                detalle += f" - {mov.destino_id}"
-            self.tabla.setItem(row, 2, QTableWidgetItem(detalle))
-            
-            # Entrada
-            if mov.cantidad_entrada > 0:
-                self.tabla.setItem(row, 3, QTableWidgetItem(f"{mov.cantidad_entrada:,.2f}"))
-                cu = getattr(mov, 'costo_unitario_calculado', mov.costo_unitario)
-                self.tabla.setItem(row, 4, QTableWidgetItem(f"{moneda_simbolo} {cu:,.2f}"))
-                self.tabla.setItem(row, 5, QTableWidgetItem(f"{moneda_simbolo} {mov.cantidad_entrada * cu:,.2f}"))
-            else:
-                self.tabla.setItem(row, 3, QTableWidgetItem(""))
-                self.tabla.setItem(row, 4, QTableWidgetItem(""))
-                self.tabla.setItem(row, 5, QTableWidgetItem(""))
-            
-            # Salida
-            if mov.cantidad_salida > 0:
-                self.tabla.setItem(row, 6, QTableWidgetItem(f"{mov.cantidad_salida:,.2f}"))
-                cu = getattr(mov, 'costo_unitario_calculado', 0)
-                ct = getattr(mov, 'costo_total_calculado', 0)
-                self.tabla.setItem(row, 7, QTableWidgetItem(f"{moneda_simbolo} {cu:,.2f}"))
-                self.tabla.setItem(row, 8, QTableWidgetItem(f"{moneda_simbolo} {ct:,.2f}"))
-            else:
-                self.tabla.setItem(row, 6, QTableWidgetItem(""))
-                self.tabla.setItem(row, 7, QTableWidgetItem(""))
-                self.tabla.setItem(row, 8, QTableWidgetItem(""))
-            
-            # Saldo
-            saldo_cant = getattr(mov, 'saldo_cantidad_calculado', mov.saldo_cantidad)
-            saldo_val = getattr(mov, 'saldo_valor_calculado', mov.saldo_costo_total)
-            self.tabla.setItem(row, 9, QTableWidgetItem(f"{saldo_cant:,.2f}"))
-            self.tabla.setItem(row, 10, QTableWidgetItem(f"{moneda_simbolo} {saldo_val:,.2f}"))
-        
-        # Resumen
-        if self.movimientos:
-            ultimo = self.movimientos[-1]
-            saldo_final_cant = getattr(ultimo, 'saldo_cantidad_calculado', ultimo.saldo_cantidad)
-            saldo_final_val = getattr(ultimo, 'saldo_valor_calculado', ultimo.saldo_costo_total)
-            
-            total_entradas = sum(m.cantidad_entrada for m in self.movimientos)
-            total_salidas = sum(m.cantidad_salida for m in self.movimientos)
-            
-            resumen = f"📊 Total Movimientos: {len(self.movimientos)} | "
-            resumen += f"Total Entradas: {total_entradas:,.2f} | "
-            resumen += f"Total Salidas: {total_salidas:,.2f} | "
-            resumen += f"<strong>Saldo Final: {saldo_final_cant:,.2f} unidades = {moneda_simbolo} {saldo_final_val:,.2f}</strong>"
-            
-            self.lbl_resumen.setText(resumen)
+        if not self.parametros_kardex:
+            return []
+        if not self.modelo.canFetchMore() and not self.modelo.cargando():
+            return self.modelo.movimientos
+        lector = LectorKardex(**self.parametros_kardex)
+        try:
+            return list(lector.recorrer())
+        finally:
+            lector.cerrar()
     
     def exportar_excel(self):
         """Exporta el kardex a Excel"""
-        if not self.movimientos:
+        movimientos = self.movimientos_exportacion()
+        if not movimientos:
             QMessageBox.warning(self, "Error", "Genere primero el kardex")
             return
         
@@ -592,7 +422,7 @@ class KardexWindow(QWidget):
                 worksheet.write(0, col, header, header_format)
             
             # Datos
-            for row, mov in enumerate(self.movimientos, start=1):
+            for row, mov in enumerate(movimientos, start=1):
                 worksheet.write(row, 0, mov.fecha_documento.strftime('%d/%m/%Y'))
                 worksheet.write(row, 1, f"{mov.tipo_documento.value if mov.tipo_documento else ''} {mov.numero_documento or ''}")
                 worksheet.write(row, 2, mov.tipo.value)
@@ -624,7 +454,8 @@ class KardexWindow(QWidget):
 
     def exportar_pdf(self):
         """Exporta el kardex a PDF"""
-        if not self.movimientos:
+        movimientos = self.movimientos_exportacion()
+        if not movimientos:
             QMessageBox.warning(self, "Error", "Genere primero el kardex")
             return
 
@@ -664,7 +495,7 @@ class KardexWindow(QWidget):
                 ["Fecha", "Documento", "Detalle", "Entrada", "Salida", "Saldo"]
             ]
 
-            for mov in self.movimientos:
+            for mov in movimientos:
                 fecha = mov.fecha_documento.strftime('%d/%m/%Y')
                 doc = f"{mov.tipo_documento.value if mov.tipo_documento else ''} {mov.numero_documento or ''}"
                 detalle = mov.tipo.value
@@ -697,6 +528,12 @@ class KardexWindow(QWidget):
             QMessageBox.critical(self, "Error", f"Error al exportar a PDF:\n{str(e)}")
 
 
+    def closeEvent(self, event):
+        """Libera el lector del kardex (y su sesión) al cerrar la ventana."""
+        self.modelo.limpiar()
+        super().closeEvent(event)
+
+
 # PRUEBA STANDALONE
 if __name__ == "__main__":
     from PyQt6.QtWidgets import QApplication
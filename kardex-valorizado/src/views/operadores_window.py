@@ -10,9 +10,9 @@ from datetime import date
 class OperadorDialog(QDialog):
     operador_guardado = pyqtSignal()
 
-    def __init__(self, parent=None, operador=None):
+    def __init__(self, parent=None, operador=None, session=None):
         super().__init__(parent)
-        self.session = obtener_session()
+        self.session = session or obtener_session()
         self.operador = operador
         self.init_ui()
         if self.operador:
@@ -127,7 +127,7 @@ class OperadoresWindow(BaseCRUDView):
             
         self.tabla.setItem(row, 4, item_venc)
 
-    def _open_dialog(self, item=None):
-        dialog = OperadorDialog(self, operador=item)
+    def _open_dialog(self, item=None, session=None):
+        dialog = OperadorDialog(self, operador=item, session=session)
         dialog.operador_guardado.connect(self.load_data)
         dialog.exec()
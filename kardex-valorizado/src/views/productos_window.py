@@ -23,7 +23,7 @@ except ImportError:
     print("Por favor, instálela con: pip install openpyxl")
     sys.exit(1)
 
-from sqlalchemy import or_, func
+from sqlalchemy import func
 from sqlalchemy.orm import joinedload
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -36,6 +36,8 @@ except ImportError:
 from utils.widgets import UpperLineEdit, SearchableComboBox
 from utils.button_utils import style_button
 from views.base_crud_view import BaseCRUDView
+from utils.sesiones import sesion_de_hilo
+from utils.busqueda import condicion_busqueda
 from pydantic import ValidationError
 from schemas.product_schema import ProductCreate
 
@@ -65,9 +67,9 @@ class ProductoDialog(QDialog):
 
     producto_guardado = pyqtSignal()
 
-    def __init__(self, parent=None, producto=None):
+    def __init__(self, parent=None, producto=None, session=None):
         super().__init__(parent)
-        self.session = obtener_session()
+        self.session = session or obtener_session()
         self.producto = producto
         self.nuevo_producto_id = None
         self.init_ui()
@@ -499,6 +501,8 @@ class ProductoDialog(QDialog):
 class ProductosWindow(BaseCRUDView):
     """Ventana principal de gestión de productos"""
 
+    ORDEN = (Producto.nombre,)
+
     def __init__(self, user_info=None):
         self.user_info = user_info
         # BaseCRUDView constructor calls init_ui and load_data.
@@ -530,8 +534,8 @@ class ProductosWindow(BaseCRUDView):
         self.cmb_categoria_filtro.clear()
         self.cmb_categoria_filtro.addItem("Todas las categorías", None)
         try:
-            # Use a fresh session or the current one
-            categorias = self.session.query(Categoria).filter_by(activo=True).order_by(Categoria.nombre).all()
+            with sesion_de_hilo(lectura=True) as session:
+                categorias = session.query(Categoria.id, Categoria.nombre).filter_by(activo=True).order_by(Categoria.nombre).all()
             for cat in categorias:
                 self.cmb_categoria_filtro.addItem(cat.nombre, cat.id)
         except Exception as e:
@@ -551,15 +555,12 @@ class ProductosWindow(BaseCRUDView):
         header.setSectionResizeMode(7, QHeaderView.ResizeMode.Fixed)
         self.tabla.setColumnWidth(7, 180)
 
-    def get_base_query(self):
+    def get_base_query(self, session):
         """Override to eager load category."""
-        return self.session.query(Producto).options(
+        return session.query(Producto).options(
             joinedload(Producto.categoria)
         ).filter_by(activo=True)
 
-    def apply_ordering(self, query):
-        return query.order_by(Producto.nombre)
-
     def fill_row(self, row, prod):
         self.tabla.setItem(row, 0, QTableWidgetItem(prod.codigo))
         self.tabla.setItem(row, 1, QTableWidgetItem(prod.nombre))
@@ -585,17 +586,8 @@ class ProductosWindow(BaseCRUDView):
             btn_delete.setEnabled(False)
 
     def apply_search_filters(self, query, text):
-        search_text = f"%{text}%"
-        # We need to join Categoria again if not already joined?
-        # get_base_query already does joinedload, but for filtering we might need explicit join if we filter by category name.
-        # SQLAlchemy is smart enough usually.
-        return query.join(Categoria).filter(
-            or_(
-                Producto.codigo.ilike(search_text),
-                Producto.nombre.ilike(search_text),
-                Categoria.nombre.ilike(search_text)
-            )
-        )
+        # Código, nombre y nombre de la categoría (utils/busqueda.py)
+        return query.filter(condicion_busqueda(query, Producto, text))
 
     def apply_extra_filters(self, query):
         categoria_id = self.cmb_categoria_filtro.currentData()
@@ -603,9 +595,9 @@ class ProductosWindow(BaseCRUDView):
             query = query.filter(Producto.categoria_id == categoria_id)
         return query
 
-    def _open_dialog(self, item=None):
+    def _open_dialog(self, item=None, session=None):
         """Override to connect the signal and handle dialog execution."""
-        dialog = ProductoDialog(self, producto=item)
+        dialog = ProductoDialog(self, producto=item, session=session)
 
         # We connect the signal, but BaseCRUDView logic just calls exec().
         # In original code: dialog.producto_guardado.connect(self.recargar_datos)
@@ -644,7 +636,8 @@ class ProductosWindow(BaseCRUDView):
             print("Advertencia: No se pudo importar 'MovimientoStock'.")
         else:
             try:
-                movimiento_existente = self.session.query(MovimientoStock).filter_by(producto_id=producto.id).first()
+                with sesion_de_hilo(lectura=True) as session:
+                    movimiento_existente = session.query(MovimientoStock.id).filter_by(producto_id=producto.id).first()
                 if movimiento_existente:
                     QMessageBox.warning(self, "Eliminación Bloqueada",
                         f"No se puede eliminar el producto '{producto.nombre}'.\n\n"
@@ -652,7 +645,6 @@ class ProductosWindow(BaseCRUDView):
                         "Desactivarlo podría causar inconsistencias en los reportes.")
                     return
             except Exception as e:
-                self.session.rollback()
                 QMessageBox.critical(self, "Error de Validación",
                     f"No se pudo verificar la existencia de movimientos:\n{str(e)}")
                 return
@@ -25,10 +25,11 @@ except ImportError:
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from models.database_model import obtener_session, Proveedor
-from sqlalchemy import or_
 from utils.widgets import UpperLineEdit
 from utils.button_utils import style_button
 from views.base_crud_view import BaseCRUDView
+from utils.sesiones import unidad_de_trabajo
+from utils.busqueda import condicion_busqueda
 
 
 class ProveedorDialog(QDialog):
@@ -303,6 +304,8 @@ class ProveedorDialog(QDialog):
 class ProveedoresWindow(BaseCRUDView):
     """Ventana principal de gestión de proveedores"""
 
+    ORDEN = (Proveedor.razon_social,)
+
     def __init__(self):
         super().__init__("Gestión de Proveedores", Proveedor, ProveedorDialog)
 
@@ -328,9 +331,6 @@ class ProveedoresWindow(BaseCRUDView):
         header.setSectionResizeMode(7, QHeaderView.ResizeMode.Fixed)
         self.tabla.setColumnWidth(7, 180)
 
-    def apply_ordering(self, query):
-        return query.order_by(Proveedor.razon_social)
-
     def fill_row(self, row, prov):
         item_id = QTableWidgetItem(str(prov.id))
         item_id.setFlags(item_id.flags() & ~Qt.ItemFlag.ItemIsEditable)
@@ -345,20 +345,12 @@ class ProveedoresWindow(BaseCRUDView):
         self.tabla.setItem(row, 6, QTableWidgetItem(prov.direccion or ""))
 
     def apply_search_filters(self, query, text):
-        filtro_texto = f"%{text}%"
-        return query.filter(
-            or_(
-                Proveedor.ruc.ilike(filtro_texto),
-                Proveedor.razon_social.ilike(filtro_texto),
-                Proveedor.contacto.ilike(filtro_texto),
-                Proveedor.email.ilike(filtro_texto)
-            )
-        )
+        # RUC, razón social, contacto y email (utils/busqueda.py)
+        return query.filter(condicion_busqueda(query, Proveedor, text))
 
-    def _open_dialog(self, item=None):
-        dialog = ProveedorDialog(self, proveedor=item, session=self.session)
+    def _open_dialog(self, item=None, session=None):
+        dialog = ProveedorDialog(self, proveedor=item, session=session)
         if dialog.exec() == QDialog.DialogCode.Accepted:
-            if item: self.session.refresh(item)
             self.load_data()
 
     def delete_item(self, proveedor):
@@ -373,12 +365,11 @@ class ProveedoresWindow(BaseCRUDView):
 
         if respuesta == QMessageBox.StandardButton.Yes:
             try:
-                proveedor.activo = False
-                self.session.commit()
+                with unidad_de_trabajo() as session:
+                    session.get(Proveedor, proveedor.id).activo = False
                 QMessageBox.information(self, "Éxito", "Proveedor eliminado correctamente")
                 self.load_data()
             except Exception as e:
-                self.session.rollback()
                 QMessageBox.critical(self, "Error", f"Error al eliminar:\n{str(e)}")
 
 # PRUEBA STANDALONE
@@ -18,9 +18,11 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from models.database_model import obtener_session, Proyecto, Cliente, Empresa, EstadoProyecto
 from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
 from utils.widgets import UpperLineEdit
 from utils.button_utils import style_button
 from views.base_crud_view import BaseCRUDView
+from utils.sesiones import unidad_de_trabajo
 
 
 class ProyectoDialog(QDialog):
@@ -242,6 +244,8 @@ class ProyectoDialog(QDialog):
 
 
 class ProyectosWindow(BaseCRUDView):
+    ORDEN = (Proyecto.fecha_inicio.desc(), Proyecto.id.desc())
+
     def __init__(self):
         super().__init__("Gestión de Proyectos", Proyecto, ProyectoDialog)
 
@@ -262,8 +266,9 @@ class ProyectosWindow(BaseCRUDView):
         header.setSectionResizeMode(6, QHeaderView.ResizeMode.Fixed) # Acciones
         self.tabla.setColumnWidth(6, 180)
 
-    def apply_ordering(self, query):
-        return query.order_by(Proyecto.fecha_inicio.desc())
+    def get_base_query(self, session):
+        # El cliente se carga con la fila: la tabla recibe filas congeladas
+        return session.query(Proyecto).options(joinedload(Proyecto.cliente)).filter_by(activo=True)
 
     def fill_row(self, row, proj):
         self.tabla.setItem(row, 0, QTableWidgetItem(str(proj.id)))
@@ -293,10 +298,9 @@ class ProyectosWindow(BaseCRUDView):
             Cliente.razon_social.ilike(filtro_texto)
         ))
 
-    def _open_dialog(self, item=None):
-        dialog = ProyectoDialog(self, proyecto=item, session=self.session)
+    def _open_dialog(self, item=None, session=None):
+        dialog = ProyectoDialog(self, proyecto=item, session=session)
         if dialog.exec() == QDialog.DialogCode.Accepted:
-            if item: self.session.refresh(item)
             self.load_data()
 
     def delete_item(self, item):
@@ -306,10 +310,9 @@ class ProyectosWindow(BaseCRUDView):
 
         if respuesta == QMessageBox.StandardButton.Yes:
             try:
-                item.activo = False
-                self.session.commit()
+                with unidad_de_trabajo() as session:
+                    session.get(Proyecto, item.id).activo = False
                 QMessageBox.information(self, "Éxito", "Proyecto eliminado correctamente")
                 self.load_data()
             except Exception as e:
-                self.session.rollback()
                 QMessageBox.critical(self, "Error", f"Error al eliminar:\n{str(e)}")
@@ -4,13 +4,13 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
 from PyQt6.QtCore import QDate, Qt
 from datetime import date
 from services.report_service import ReportService
-from models.database_model import obtener_session
+from models.database_model import obtener_session_lectura
 import os
 
 class ReportesWindow(QWidget):
     def __init__(self):
         super().__init__()
-        self.session = obtener_session()
+        self.session = obtener_session_lectura()
         self.report_service = ReportService(self.session)
         self.init_ui()
 
@@ -21,7 +21,8 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from models.database_model import (obtener_session, Requisicion, RequisicionDetalle,
                                    Producto, Almacen, Empresa, Destino,
-                                   MovimientoStock, TipoMovimiento, MetodoValuacion)
+                                   MovimientoStock, TipoMovimiento, MetodoValuacion,
+                                   SaldoActual)
 from utils.widgets import UpperLineEdit, SearchableComboBox, MoneyDelegate
 from utils.app_context import app_context
 from utils.button_utils import style_button
@@ -244,6 +245,9 @@ class RequisicionDialog(QDialog):
 
         # Cargar detalles
         self.detalles_originales_obj = self.session.query(RequisicionDetalle).filter_by(requisicion_id=self.requisicion_original.id).all()
+        stock = self.kardex_manager.obtener_stock_bulk(
+            (det.producto_id, det.almacen_id) for det in self.detalles_originales_obj
+        )
         for det_obj in self.detalles_originales_obj:
             producto = self.session.query(Producto).get(det_obj.producto_id)
             almacen = self.session.query(Almacen).get(det_obj.almacen_id)
@@ -259,7 +263,7 @@ class RequisicionDialog(QDialog):
                 'producto_nombre': f"{producto.codigo} - {producto.nombre}",
                 'almacen_id': det_obj.almacen_id,
                 'almacen_nombre': almacen.nombre,
-                'stock_disponible': 0, # No es crítico para la edición
+                'stock_disponible': stock[(det_obj.producto_id, det_obj.almacen_id)],
                 'cantidad': float(det_obj.cantidad),
                 'costo_unitario': costo_unitario,
                 'costo_total': costo_total,
@@ -297,26 +301,15 @@ class RequisicionDialog(QDialog):
             self.cmb_destino.addItem(dest.nombre, dest.id)
         
         # Productos: Cargar solo productos con stock > 0
-        # 1. Statement para obtener el ID del último movimiento para cada producto/almacén.
-        #    No se usa .subquery() para evitar un SAWarning. La Query se pasa directamente a IN().
-        subquery_ultimo_mov_id_stmt = self.session.query(
-            func.max(MovimientoStock.id)
-        ).group_by(
-            MovimientoStock.producto_id,
-            MovimientoStock.almacen_id
-        )
-
-        # 2. Subconsulta para obtener el saldo total de cada producto sumando los saldos de cada almacén
+        # 1. Subconsulta con el saldo total de cada producto sumando el saldo vigente de cada almacén
         subquery_stock_total = self.session.query(
-            MovimientoStock.producto_id,
-            func.sum(MovimientoStock.saldo_cantidad).label('stock_total')
-        ).filter(
-            MovimientoStock.id.in_(subquery_ultimo_mov_id_stmt)
+            SaldoActual.producto_id,
+            func.sum(SaldoActual.cantidad).label('stock_total')
         ).group_by(
-            MovimientoStock.producto_id
+            SaldoActual.producto_id
         ).subquery()
 
-        # 3. Consulta principal para obtener productos activos con stock total > 0
+        # 2. Consulta principal para obtener productos activos con stock total > 0
         productos_con_stock = self.session.query(
             Producto
         ).join(
@@ -466,13 +459,7 @@ class RequisicionDialog(QDialog):
 
         # Verificar stock
         almacen = self.session.query(Almacen).get(alm_id)
-        ultimo_mov = self.session.query(MovimientoStock).filter_by(
-            empresa_id=almacen.empresa_id,
-            producto_id=prod_id,
-            almacen_id=alm_id
-        ).order_by(MovimientoStock.id.desc()).first()
-        
-        stock_disponible = ultimo_mov.saldo_cantidad if ultimo_mov else 0
+        stock_disponible = self.kardex_manager.obtener_stock_actual(prod_id, alm_id)
         
         if cantidad > stock_disponible:
             QMessageBox.warning(
@@ -549,6 +536,9 @@ class RequisicionDialog(QDialog):
 
         es_edicion = self.requisicion_original is not None
 
+        if not self.verificar_stock_suficiente():
+            return
+
         try:
             if es_edicion:
                 requisicion = self.session.get(Requisicion, self.requisicion_original.id)
@@ -574,18 +564,22 @@ class RequisicionDialog(QDialog):
             detalles_a_anadir_ui = [det for det in self.detalles_requisicion if not det.get('detalle_original_id')]
             detalles_a_modificar_ui = [det for det in self.detalles_requisicion if det.get('detalle_original_id') in ids_detalles_originales]
 
+            # Movimientos del documento: se registran juntos al final, con saldos encadenados
+            movimientos = []
+
             # 1. Eliminar detalles y revertir movimientos
             for detalle_id in detalles_a_eliminar_ids:
                 detalle_obj = self.session.get(RequisicionDetalle, detalle_id)
                 if detalle_obj:
                     almacen = self.session.get(Almacen, detalle_obj.almacen_id)
                     costo_unitario, costo_total = self.kardex_manager.calcular_costo_salida(
-                        self.session.get(Empresa, almacen.empresa_id),
+                        almacen.empresa_id,
                         detalle_obj.producto_id,
                         detalle_obj.almacen_id,
-                        float(detalle_obj.cantidad)
+                        float(detalle_obj.cantidad),
+                        forzar_recalculo=True
                     )
-                    self.kardex_manager.registrar_movimiento(
+                    movimientos.append(dict(
                         empresa_id=almacen.empresa_id,
                         producto_id=detalle_obj.producto_id,
                         almacen_id=detalle_obj.almacen_id,
@@ -597,12 +591,12 @@ class RequisicionDialog(QDialog):
                         numero_documento=requisicion.numero_requisicion,
                         fecha_documento=requisicion.fecha,
                         observaciones=f"Reversión por edición de Requisición ID {requisicion.id}"
-                    )
+                    ))
                     self.session.delete(detalle_obj)
 
             # 2. Añadir nuevos detalles
             for det_ui in detalles_a_anadir_ui:
-                self.crear_detalle_y_movimiento(requisicion, det_ui, "Nueva línea en edición")
+                movimientos.append(self.crear_detalle_y_movimiento(requisicion, det_ui, "Nueva línea en edición"))
 
             # 3. Modificar detalles existentes
             for det_ui in detalles_a_modificar_ui:
@@ -617,9 +611,10 @@ class RequisicionDialog(QDialog):
                         almacen.empresa_id,
                         detalle_obj.producto_id,
                         detalle_obj.almacen_id,
-                        float(abs(diferencia))
+                        float(abs(diferencia)),
+                        forzar_recalculo=True
                     )
-                    self.kardex_manager.registrar_movimiento(
+                    movimientos.append(dict(
                         empresa_id=almacen.empresa_id,
                         producto_id=detalle_obj.producto_id,
                         almacen_id=detalle_obj.almacen_id,
@@ -631,7 +626,7 @@ class RequisicionDialog(QDialog):
                         numero_documento=requisicion.numero_requisicion,
                         fecha_documento=requisicion.fecha,
                         observaciones=f"Ajuste por edición de Req. ID {requisicion.id}"
-                    )
+                    ))
 
                 detalle_obj.cantidad = cantidad_nueva
                 detalle_obj.producto_id = det_ui['producto_id']
@@ -639,8 +634,11 @@ class RequisicionDialog(QDialog):
 
             if not es_edicion:
                 for det in self.detalles_requisicion:
-                    self.crear_detalle_y_movimiento(requisicion, det, f"Requisición {requisicion.numero_requisicion}")
+                    movimientos.append(self.crear_detalle_y_movimiento(
+                        requisicion, det, f"Requisición {requisicion.numero_requisicion}"
+                    ))
 
+            self.kardex_manager.registrar_movimientos(movimientos)
             self.session.commit()
             QMessageBox.information(self, "Éxito", f"Requisición {'actualizada' if es_edicion else 'registrada'} exitosamente.")
             self.accept()
@@ -651,8 +649,42 @@ class RequisicionDialog(QDialog):
             traceback.print_exc()
             QMessageBox.critical(self, "Error", f"Error al guardar requisición:\n{str(e)}")
 
+    def verificar_stock_suficiente(self):
+        """
+        Comprueba, con una sola consulta de stock, que alcance para las cantidades que la
+        requisición retira de más: líneas nuevas completas y aumentos de las existentes.
+        """
+        originales = {det.id: ((det.producto_id, det.almacen_id), float(det.cantidad))
+                      for det in self.detalles_originales_obj}
+        solicitado = {}
+        for det in self.detalles_requisicion:
+            par = (det['producto_id'], det['almacen_id'])
+            par_original, cantidad_original = originales.get(det.get('detalle_original_id'), (None, 0))
+            cantidad = det['cantidad'] - (cantidad_original if par_original == par else 0)
+            if cantidad > 0:
+                solicitado[par] = solicitado.get(par, 0) + cantidad
+
+        if not solicitado:
+            return True
+
+        stock = self.kardex_manager.obtener_stock_bulk(solicitado)
+        faltantes = [
+            f"{det['producto_nombre']}: Stock {stock[par]:,.2f}, Solicitado {solicitado[par]:,.2f}"
+            for det in self.detalles_requisicion
+            for par in [(det['producto_id'], det['almacen_id'])]
+            if par in solicitado and solicitado[par] > stock[par]
+        ]
+        if faltantes:
+            QMessageBox.warning(self, "Stock Insuficiente",
+                                "No hay suficiente stock para esta salida:\n\n" + "\n".join(dict.fromkeys(faltantes)))
+            return False
+        return True
+
     def crear_detalle_y_movimiento(self, requisicion, det_dict, observacion):
-        """Crea un RequisicionDetalle y su MovimientoStock asociado."""
+        """
+        Crea un RequisicionDetalle y devuelve los datos de su MovimientoStock, para
+        registrarlo con los demás movimientos del documento.
+        """
         detalle = RequisicionDetalle(
             requisicion_id=requisicion.id,
             producto_id=det_dict['producto_id'],
@@ -664,10 +696,11 @@ class RequisicionDialog(QDialog):
         almacen = self.session.query(Almacen).get(det_dict['almacen_id'])
         empresa = self.session.query(Empresa).get(almacen.empresa_id)
         costo_unitario, costo_total = self.kardex_manager.calcular_costo_salida(
-            empresa.id, det_dict['producto_id'], det_dict['almacen_id'], det_dict['cantidad']
+            empresa.id, det_dict['producto_id'], det_dict['almacen_id'], det_dict['cantidad'],
+            forzar_recalculo=True
         )
 
-        self.kardex_manager.registrar_movimiento(
+        return dict(
             empresa_id=almacen.empresa_id,
             producto_id=det_dict['producto_id'],
             almacen_id=det_dict['almacen_id'],
@@ -868,16 +901,18 @@ class RequisicionesWindow(QWidget):
             return
 
         try:
-            # Revertir cada movimiento
+            # Revertir cada movimiento (se registran juntos, con saldos encadenados)
+            movimientos = []
             for detalle in requisicion.detalles:
                 almacen = self.session.get(Almacen, detalle.almacen_id)
                 empresa = self.session.get(Empresa, almacen.empresa_id)
 
                 costo_unitario, costo_total = self.kardex_manager.calcular_costo_salida(
-                    empresa.id, detalle.producto_id, detalle.almacen_id, float(detalle.cantidad)
+                    empresa.id, detalle.producto_id, detalle.almacen_id, float(detalle.cantidad),
+                    forzar_recalculo=True
                 )
 
-                self.kardex_manager.registrar_movimiento(
+                movimientos.append(dict(
                     empresa_id=almacen.empresa_id,
                     producto_id=detalle.producto_id,
                     almacen_id=detalle.almacen_id,
@@ -889,7 +924,8 @@ class RequisicionesWindow(QWidget):
                     numero_documento=requisicion.numero_requisicion,
                     fecha_documento=requisicion.fecha,
                     observaciones=f"Reversión por eliminación de Requisición ID {requisicion.id}"
-                )
+                ))
+            self.kardex_manager.registrar_movimientos(movimientos)
 
             # Eliminar detalles y la requisición
             self.session.query(RequisicionDetalle).filter_by(requisicion_id=requisicion.id).delete()
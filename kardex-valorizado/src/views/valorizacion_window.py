@@ -26,6 +26,9 @@ from PyQt6.QtWidgets import QProgressBar
 
 
 from utils.dependency_injector import ServiceContainer
+from services.regeneracion_service import RegeneracionService
+from utils.verificador_kardex import VerificadorKardex
+from utils.sesiones import sesion_de_hilo
 
 class ValorizacionWindow(QWidget):
     """Ventana de Valorización de Inventario"""
@@ -338,38 +341,112 @@ class ValorizacionWindow(QWidget):
             self.lbl_totales.setText(texto_totales)
     
     def regenerar_saldos(self):
-        """Regenera los saldos de todos los productos de la empresa seleccionada"""
+        """
+        Verifica la integridad del kardex de la empresa seleccionada (solo los movimientos
+        nuevos desde la última verificación) y regenera los saldos de los productos con
+        inconsistencias.
+        """
         empresa_id = self.cmb_empresa.currentData()
         if not empresa_id:
             QMessageBox.warning(self, "Error", "Seleccione una empresa")
             return
 
+        # UI Update
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setVisible(True)
+        self.lbl_resumen.setText("⏳ Verificando integridad del kardex...")
+        self.setEnabled(False)
+
+        def verificar():
+            with sesion_de_hilo() as session:
+                return VerificadorKardex(session).verificar(empresa_id)
+
+        self.worker = WorkerThread(verificar)
+        self.worker.finished.connect(lambda reporte: self.on_verificacion_finished(empresa_id, reporte))
+        self.worker.error.connect(self.on_regeneracion_error)
+        self.worker.start()
+
+    def on_verificacion_finished(self, empresa_id, reporte):
+        """Propone regenerar solo los productos con inconsistencias (o todos, si no hay)"""
+        self.setEnabled(True)
+        self.progress_bar.setVisible(False)
+        resumen = (f"Se verificaron {reporte['pares_verificados']} productos/almacenes "
+                   f"({reporte['movimientos_revisados']} movimientos revisados).")
+        if reporte['pendientes']:
+            resumen += f"\n{len(reporte['pendientes'])} tienen un recálculo pendiente y no se verificaron."
+
+        producto_ids = reporte['productos_a_reparar']
+        if producto_ids:
+            detalle = "\n".join(
+                f"• Producto {prod_id}, almacén {alm_id}: {problema['motivo']}"
+                for (prod_id, alm_id), problema in list(reporte['a_reparar'].items())[:10]
+            )
+            mensaje = (f"{resumen}\n\nSe encontraron inconsistencias en {len(producto_ids)} productos:\n"
+                       f"{detalle}\n\n¿Desea recalcular sus saldos y costos desde el historial de movimientos?")
+        else:
+            producto_ids = [p.id for p in self.session.query(Producto.id).filter_by(activo=True).all()]
+            mensaje = (f"{resumen}\n\nNo se encontraron inconsistencias en los saldos.\n\n"
+                       "¿Desea recalcular de todos modos todos los saldos y costos promedios desde cero? "
+                       "(Esto puede tardar unos segundos)")
+
+        self.lbl_resumen.setText("")
         reply = QMessageBox.question(
-            self, 
+            self,
             "Confirmar Regeneración",
-            "Esta acción recalculará todos los saldos y costos promedios desde cero basándose en el historial de movimientos.\n\n"
-            "Úselo si detecta inconsistencias en los saldos.\n"
-            "¿Desea continuar? (Esto puede tardar unos segundos)",
+            mensaje,
             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
         )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
 
-        if reply == QMessageBox.StandardButton.Yes:
+        # UI Update
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setVisible(True)
+        self.lbl_resumen.setText("⏳ Regenerando saldos...")
+        self.setEnabled(False)
+
+        # La regeneración se reparte por producto entre varios procesos; el hilo solo
+        # coordina y escribe los resultados con su propia sesión.
+        def regenerar():
+            servicio = RegeneracionService()
             try:
-                # Obtener productos de la empresa (o todos los activos)
-                # Idealmente esto debería estar en el servicio también para no iterar en UI
-                # Por ahora iteramos aquí para mostrar progreso si fuera necesario
-                productos = self.session.query(Producto).filter_by(activo=True).all()
-                
-                count = 0
-                for prod in productos:
-                    self.service.recalculate_kardex(prod.id, empresa_id)
-                    count += 1
-                
-                QMessageBox.information(self, "Éxito", f"Se han regenerado los saldos de {count} productos correctamente.")
-                self.generar_valorizacion() # Refrescar tabla
-                
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Error al regenerar saldos: {str(e)}")
+                return servicio.regenerar_saldos_empresa(
+                    empresa_id,
+                    producto_ids=producto_ids,
+                    progreso=lambda hechas, total: self.worker.progress.emit(f"{hechas}/{total}")
+                )
+            finally:
+                servicio.session.close()
+
+        self.worker = WorkerThread(regenerar)
+        self.worker.progress.connect(self.on_regeneracion_progress)
+        self.worker.finished.connect(self.on_regeneracion_finished)
+        self.worker.error.connect(self.on_regeneracion_error)
+        self.worker.start()
+
+    def on_regeneracion_progress(self, avance):
+        """Actualiza la barra con las particiones terminadas ("hechas/total")"""
+        hechas, total = (int(x) for x in avance.split("/"))
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(hechas)
+        self.lbl_resumen.setText(f"⏳ Regenerando saldos... {hechas} de {total} lotes de productos")
+
+    def on_regeneracion_finished(self, count):
+        """Callback cuando termina la regeneración"""
+        self.setEnabled(True)
+        self.progress_bar.setVisible(False)
+        self.progress_bar.setRange(0, 0)
+        self.session.expire_all()
+        QMessageBox.information(self, "Éxito", f"Se han regenerado los saldos de {count} productos correctamente.")
+        self.generar_valorizacion() # Refrescar tabla
+
+    def on_regeneracion_error(self, error_msg):
+        """Callback cuando falla la regeneración"""
+        self.setEnabled(True)
+        self.progress_bar.setVisible(False)
+        self.progress_bar.setRange(0, 0)
+        self.lbl_resumen.setText("❌ Error")
+        QMessageBox.critical(self, "Error", f"Error al regenerar saldos: {error_msg}")
 
     def exportar_excel(self):
         """Exporta la valorización a Excel"""
@@ -593,7 +593,10 @@ class VentaDialog(QDialog):
             venta_id = self.venta_original.id if es_edicion else None
 
             # Guardar
-            self.ventas_manager.guardar_venta(datos_cabecera, self.detalles_venta, venta_id)
+            self.ventas_manager.guardar_venta(
+                datos_cabecera, self.detalles_venta, venta_id,
+                usuario_id=self.user_info.get('id') if self.user_info else None
+            )
             
             QMessageBox.information(self, "Éxito", f"Venta {'actualizada' if es_edicion else 'registrada'} exitosamente.")
             self.accept()
@@ -0,0 +1,36 @@
+from datetime import date
+from utils.anomalias_kardex import AnalizadorAnomaliasKardex
+from test_kardex_manager import crear_movimiento
+
+
+def test_episodios_negativos_y_costos_atipicos(session, sample_data):
+    movimientos = [
+        crear_movimiento(session, sample_data, date(2024, 1, 1), entrada=10, costo_unitario=5),
+        crear_movimiento(session, sample_data, date(2024, 1, 2), salida=4),
+        crear_movimiento(session, sample_data, date(2024, 1, 3), salida=8),     # -2
+        crear_movimiento(session, sample_data, date(2024, 1, 4), salida=1),     # -3
+        crear_movimiento(session, sample_data, date(2024, 1, 5), entrada=5, costo_unitario=6),
+        crear_movimiento(session, sample_data, date(2024, 1, 6), salida=4),     # -2, sin cerrar
+    ]
+    # Saldos guardados como los deja el recálculo (recortados a cero), con una salida mal costeada
+    saldos = [(10, 50), (6, 30), (0, 0), (0, 0), (5, 30), (0, 0)]
+    for mov, (cantidad, valor) in zip(movimientos, saldos):
+        mov.saldo_cantidad, mov.saldo_costo_total = cantidad, valor
+    movimientos[1].costo_unitario = movimientos[2].costo_unitario = 5.0
+    movimientos[5].costo_unitario = 15.0
+    session.flush()
+
+    reporte = AnalizadorAnomaliasKardex(session).escanear(sample_data["empresa"].id)
+
+    primero, segundo = reporte["episodios_negativos"]
+    assert (primero["desde"], primero["hasta"]) == (date(2024, 1, 3), date(2024, 1, 5))
+    assert primero["saldo_minimo"] == -3.0
+    assert primero["movimientos"] == 2
+    assert (primero["movimiento_inicio_id"], primero["movimiento_fin_id"]) == (movimientos[2].id, movimientos[4].id)
+    assert segundo["desde"] == date(2024, 1, 6)
+    assert segundo["hasta"] is None and segundo["documento_fin"] is None
+
+    (atipico,) = reporte["costos_atipicos"]
+    assert atipico["movimiento_id"] == movimientos[5].id
+    assert atipico["costo_promedio"] == 6.0
+    assert atipico["desviacion"] == 1.5
@@ -0,0 +1,59 @@
+from sqlalchemy import text
+from utils.busqueda import condicion_busqueda, crear_indices_busqueda, plegar
+from models.database_model import Producto, Cliente
+
+
+def buscar(session, modelo, texto):
+    query = session.query(modelo)
+    return sorted(f.id for f in query.filter(condicion_busqueda(query, modelo, texto)))
+
+
+def test_busqueda_sin_tildes_ni_mayusculas_sigue_a_las_escrituras(session, sample_data):
+    categoria_id = sample_data['categoria'].id
+    tuberia = Producto(codigo="TUB-0001", nombre="Cañería PVC ½\"", categoria_id=categoria_id, unidad_medida="UND")
+    codo = Producto(codigo="COD-0001", nombre="CODO DE CAÑERÍA", categoria_id=categoria_id, unidad_medida="UND")
+    session.add_all([tuberia, codo])
+    session.flush()
+
+    assert plegar("CAÑERÍA") == "caneria"
+    assert buscar(session, Producto, "caneria") == sorted([tuberia.id, codo.id])
+    assert buscar(session, Producto, "CAÑERÍA pvc") == [tuberia.id]
+    assert buscar(session, Producto, "tub-00") == [tuberia.id]
+    # Menos de 3 caracteres: sin índice, ILIKE sobre las columnas
+    assert buscar(session, Producto, "ñ") == [tuberia.id]
+    assert buscar(session, Producto, "de") == [codo.id]
+    assert buscar(session, Producto, "%") == []
+
+    # El nombre de la categoría también se busca, y sigue a sus cambios
+    assert tuberia.id in buscar(session, Producto, "test categ")
+    sample_data['categoria'].nombre = "Gasfitería"
+    session.flush()
+    assert buscar(session, Producto, "GASFITERIA") == sorted([sample_data['producto'].id, tuberia.id, codo.id])
+    assert buscar(session, Producto, "test categ") == []
+
+    codo.nombre = "Codo galvanizado"
+    session.flush()
+    assert buscar(session, Producto, "caneria") == [tuberia.id]
+    session.delete(tuberia)
+    session.flush()
+    assert buscar(session, Producto, "caneria") == []
+
+    # Escrituras fuera del ORM: las mantienen los triggers
+    session.execute(text("INSERT INTO clientes (numero_documento, razon_social, activo) "
+                         "VALUES ('20999999999', 'Constructora Peñaranda SAC', 1)"))
+    cliente_id = session.execute(text("SELECT id FROM clientes WHERE numero_documento = '20999999999'")).scalar()
+    assert buscar(session, Cliente, "penaranda") == [cliente_id]
+    assert buscar(session, Cliente, "0999999") == [cliente_id]
+
+    # Volver a crear los índices no duplica filas
+    crear_indices_busqueda(session.connection())
+    assert buscar(session, Cliente, "penaranda") == [cliente_id]
+
+
+def test_busqueda_usa_el_indice_fts(session):
+    query = session.query(Producto)
+    compilada = query.filter(condicion_busqueda(query, Producto, "cemento")).statement.compile(
+        session.get_bind(), compile_kwargs={'literal_binds': True})
+    plan = [fila[-1] for fila in session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compilada}")]
+    assert any('productos_busqueda VIRTUAL TABLE INDEX' in paso for paso in plan), plan
+    assert not any(paso.split()[:2] == ['SCAN', 'productos'] for paso in plan), plan
@@ -0,0 +1,92 @@
+from datetime import date
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload
+from utils.consulta_paginada import LectorPaginado
+from models.database_model import Producto, Cliente, Proyecto, Categoria
+
+
+def leer_todo(lector):
+    filas = []
+    while not lector.agotado:
+        filas.extend(lector.siguiente_pagina())
+    return filas
+
+
+def test_paginas_siguen_el_orden_sin_repetir_filas(session, sample_data):
+    categoria = sample_data['categoria']
+    # Nombres repetidos: el id desempata entre páginas
+    for i, nombre in enumerate(["Cemento", "Arena", "Cemento", "Acero", "Cemento", "Yeso", "Arena"]):
+        session.add(Producto(codigo=f"TEST0-{i + 2:06d}", nombre=nombre, categoria_id=categoria.id,
+                             unidad_medida="UND", activo=True))
+    session.add(Producto(codigo="TEST0-000099", nombre="Inactivo", categoria_id=categoria.id,
+                         unidad_medida="UND", activo=False))
+    session.flush()
+
+    consulta = session.query(Producto).options(joinedload(Producto.categoria)).filter_by(activo=True)
+    lector = LectorPaginado(consulta.statement, Producto.id, (Producto.nombre,),
+                            tamanio_pagina=3, session=session)
+    filas = leer_todo(lector)
+
+    esperado = consulta.order_by(Producto.nombre, Producto.id).all()
+    assert [f.id for f in filas] == [p.id for p in esperado]
+    assert filas[0].categoria.nombre == "Test Category"
+    assert lector.contar(session) == len(esperado) == 8
+
+    # La búsqueda se aplica en la consulta, también al contar
+    buscada = consulta.join(Categoria).filter(Producto.nombre.ilike("%cem%"))
+    lector = LectorPaginado(buscada.statement, Producto.id, (Producto.nombre,),
+                            tamanio_pagina=2, session=session)
+    assert [f.nombre for f in leer_todo(lector)] == ["Cemento"] * 3
+    assert lector.contar(session) == 3
+
+
+def test_orden_descendente_y_columnas_vacias(session, sample_data):
+    cliente = Cliente(numero_documento="20111111111", razon_social="Cliente SA")
+    session.add(cliente)
+    session.flush()
+    fechas = [date(2026, 3, 1), date(2026, 5, 1), date(2026, 3, 1), date(2026, 1, 1), date(2026, 5, 1)]
+    for i, fecha in enumerate(fechas):
+        session.add(Proyecto(empresa_id=sample_data['empresa'].id, cliente_id=cliente.id,
+                             codigo=f"PRY-{i}", nombre=f"Proyecto {i}", fecha_inicio=fecha,
+                             fecha_fin_estimada=None if i % 2 else fecha))
+    session.flush()
+    consulta = session.query(Proyecto).statement
+
+    lector = LectorPaginado(consulta, Proyecto.id, (Proyecto.fecha_inicio.desc(), Proyecto.id.desc()),
+                            tamanio_pagina=2, session=session)
+    filas = leer_todo(lector)
+    esperado = session.query(Proyecto).order_by(Proyecto.fecha_inicio.desc(), Proyecto.id.desc()).all()
+    assert [f.id for f in filas] == [p.id for p in esperado]
+
+    # Columna que admite vacíos: van al final, también al cruzar de página
+    lector = LectorPaginado(consulta, Proyecto.id, (Proyecto.fecha_fin_estimada,),
+                            tamanio_pagina=2, session=session)
+    filas = leer_todo(lector)
+    assert len(filas) == 5
+    assert [f.fecha_fin_estimada for f in filas] == sorted(fechas[0::2]) + [None, None]
+
+
+def test_paginas_recorren_el_indice_del_orden(session):
+    lector = LectorPaginado(session.query(Cliente).filter_by(activo=True).statement,
+                            Cliente.id, (Cliente.razon_social,), session=session)
+    for posicion in (None, ("Cliente SA", 1)):
+        consulta = lector.consulta
+        if posicion is not None:
+            consulta = consulta.where(lector._despues_de(posicion))
+        compilada = consulta.order_by(*lector._orden()).limit(lector.tamanio_pagina).compile(
+            session.get_bind(), compile_kwargs={'literal_binds': True})
+        plan = [fila[-1] for fila in session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compilada}")]
+        assert not any('TEMP B-TREE' in paso for paso in plan), plan
+        assert any('idx_cliente_razon_social' in paso for paso in plan), plan
+
+
+def test_sesion_recibida_no_se_confirma_entre_paginas(session, sample_data):
+    confirmaciones = []
+    event.listen(session, 'after_commit', lambda s: confirmaciones.append(s))
+    # Cambio pendiente de quien llama: no debe confirmarse al leer las páginas
+    sample_data['producto'].nombre = "Pendiente"
+
+    lector = LectorPaginado(session.query(Producto).statement, Producto.id, (Producto.nombre,),
+                            tamanio_pagina=1, session=session)
+    leer_todo(lector)
+    assert confirmaciones == []
@@ -0,0 +1,89 @@
+from datetime import date
+import pytest
+from utils import compras_manager
+from utils.compras_manager import ComprasManager
+from utils.kardex_manager import KardexManager
+from utils.fusion_reversiones import FusionReversiones
+from models.database_model import (MovimientoStock, Proveedor, AnioContable, EstadoAnio, Auditoria,
+                                   CompraDetalle, TipoMovimiento, RecalculoPendiente, CapaCosto, Compra,
+                                   MetodoValuacion)
+
+
+@pytest.fixture
+def compra(session, sample_data, monkeypatch):
+    # verificar_estado_anio abre su propia sesión: aquí el año se valida con la de la prueba
+    monkeypatch.setattr(compras_manager, 'verificar_estado_anio', lambda fecha: None)
+    session.add(AnioContable(anio=2024, estado=EstadoAnio.ABIERTO))
+    proveedor = Proveedor(ruc="20999999991", razon_social="Proveedor de prueba")
+    session.add(proveedor)
+    session.flush()
+
+    cabecera = dict(proveedor_id=proveedor.id, numero_documento="F001-1", fecha=date(2024, 3, 1),
+                    fecha_registro_contable=date(2024, 3, 1), subtotal=0, total=0, incluye_igv=False)
+    linea = dict(producto_id=sample_data["producto"].id, almacen_id=sample_data["almacen"].id)
+    manager = ComprasManager(session)
+    compra = manager.guardar_compra(cabecera, [dict(linea, cantidad=10, precio_unitario=5)])
+    detalle_id = session.query(CompraDetalle.id).filter_by(compra_id=compra.id).scalar()
+
+    def editar(cantidad, precio_unitario):
+        manager.guardar_compra(cabecera, [dict(linea, cantidad=cantidad, precio_unitario=precio_unitario,
+                                               detalle_original_id=detalle_id)], compra_id=compra.id)
+    return manager, editar
+
+
+def test_edicion_en_sitio_corrige_el_movimiento_original(session, compra):
+    manager, editar = compra
+    editar(12, 6)
+
+    movimiento = session.query(MovimientoStock).one()
+    assert (movimiento.cantidad_entrada, movimiento.costo_total) == (12.0, 72.0)
+    auditoria = session.query(Auditoria).filter_by(tabla='movimientos_stock', registro_id=movimiento.id).one()
+    assert auditoria.accion == 'UPDATE' and '"cantidad_entrada": [10.0, 12.0]' in auditoria.detalles
+    assert session.query(RecalculoPendiente).count() == 1
+
+
+def test_fusion_de_reversiones(session, compra):
+    manager, editar = compra
+    manager.EDICION_EN_SITIO = False
+    editar(12, 5)
+    editar(12, 6)
+    assert session.query(MovimientoStock).count() == 3
+
+    simulado = FusionReversiones(session).fusionar(aplicar=False)
+    assert session.query(MovimientoStock).count() == 3
+    assert simulado["movimientos_eliminados"] == 2
+
+    reporte = FusionReversiones(session).fusionar()
+    assert len(reporte["pares_fusionados"]) == 1 and reporte["pares_omitidos"] == {}
+    movimiento = session.query(MovimientoStock).one()
+    assert movimiento.tipo == TipoMovimiento.COMPRA
+    assert movimiento.cantidad_entrada == pytest.approx(12.0)
+    assert movimiento.costo_total == pytest.approx(72.0)
+
+    # Tras la fusión, la siguiente edición ya se corrige en sitio
+    manager.EDICION_EN_SITIO = True
+    editar(8, 6)
+    assert session.query(MovimientoStock).one().cantidad_entrada == 8.0
+
+
+def test_eliminar_compra_quita_su_capa_de_costo(session, sample_data, compra, monkeypatch):
+    manager, _ = compra
+    sample_data["empresa"].metodo_valuacion = MetodoValuacion.PEPS
+    kardex = manager.kardex_manager
+    par = (sample_data["producto"].id, sample_data["almacen"].id)
+    kardex.reconstruir_capas_costo({par})
+    linea = dict(empresa_id=sample_data["empresa"].id, producto_id=par[0], almacen_id=par[1])
+    kardex.registrar_movimiento(**linea, tipo=TipoMovimiento.COMPRA, cantidad_entrada=10, cantidad_salida=0,
+                                costo_unitario=3, costo_total=30, numero_documento="F001-2",
+                                fecha_documento=date(2024, 4, 1))
+    session.flush()
+
+    manager.eliminar_compra(session.query(Compra.id).filter_by(numero_documento="F001-1").scalar())
+    assert [capa.costo_unitario for capa in session.query(CapaCosto)] == [3.0]
+
+    # La venta se registra antes de que corra la cola: solo quedan las capas de compras vigentes
+    monkeypatch.setattr(KardexManager, "procesar_recalculos_pendientes", lambda self, pares=None: None)
+    venta = kardex.registrar_movimiento(**linea, tipo=TipoMovimiento.VENTA, cantidad_entrada=0, cantidad_salida=5,
+                                        costo_unitario=0, costo_total=0, numero_documento="B001-1",
+                                        fecha_documento=date(2024, 5, 1))
+    assert venta.costo_total == pytest.approx(15.0)
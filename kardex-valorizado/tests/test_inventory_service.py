@@ -1,7 +1,8 @@
 import pytest
 from datetime import date
 from services.inventory_service import InventoryService
-from models.database_model import MovimientoStock, TipoMovimiento
+from utils.kardex_manager import KardexManager
+from models.database_model import MovimientoStock, TipoMovimiento, Almacen, AmbitoPromedio
 
 def test_get_stock_actual_empty(session, sample_data):
     """Test stock is 0 for new product"""
@@ -45,6 +46,8 @@ def test_get_valorization_report(session, sample_data):
         saldo_costo_total=200.0
     )
     session.add(mov2)
+    # Movimientos insertados directamente: se materializa el stock vigente
+    KardexManager(session).reconstruir_saldo_actual()
     session.commit()
     
     # Get report
@@ -56,3 +59,60 @@ def test_get_valorization_report(session, sample_data):
     assert item["cantidad"] == 15.0
     assert item["valor_total"] == 200.0
     assert item["costo_unitario"] == 13.333333333333334 # 200 / 15
+
+
+def _movimiento(data, almacen, fecha, entrada=0.0, salida=0.0, costo_unitario=0.0):
+    return MovimientoStock(
+        empresa_id=data["empresa"].id, producto_id=data["producto"].id, almacen_id=almacen.id,
+        tipo=TipoMovimiento.COMPRA if entrada else TipoMovimiento.VENTA, fecha_documento=fecha,
+        cantidad_entrada=entrada, cantidad_salida=salida, costo_unitario=costo_unitario,
+        costo_total=entrada * costo_unitario, saldo_cantidad=0, saldo_costo_total=0
+    )
+
+
+def _saldos(session):
+    session.expire_all()
+    return [(m.costo_total, m.saldo_cantidad, m.saldo_costo_total)
+            for m in session.query(MovimientoStock).order_by(MovimientoStock.id)]
+
+
+def test_recalculate_kardex_una_pasada_informa_divergencia(session, sample_data):
+    """Dos almacenes con costos distintos: se escribe el ámbito configurado y se compara con el otro"""
+    almacen_a = sample_data["almacen"]
+    almacen_b = Almacen(empresa_id=sample_data["empresa"].id, codigo="ALM02", nombre="Almacen Secundario")
+    session.add(almacen_b)
+    session.flush()
+    session.add_all([
+        _movimiento(sample_data, almacen_a, date(2024, 1, 1), entrada=10, costo_unitario=10),
+        _movimiento(sample_data, almacen_b, date(2024, 1, 2), entrada=10, costo_unitario=20),
+        _movimiento(sample_data, almacen_a, date(2024, 1, 3), salida=5),
+        _movimiento(sample_data, almacen_b, date(2024, 1, 4), salida=5),
+    ])
+    session.flush()
+    service = InventoryService(session)
+    producto_id, empresa_id = sample_data["producto"].id, sample_data["empresa"].id
+
+    # Por almacén: los mismos saldos que el recálculo incremental de cada par
+    reporte = service.recalculate_kardex(producto_id, empresa_id)
+    assert _saldos(session) == [(100.0, 10.0, 100.0), (200.0, 10.0, 200.0), (50.0, 5.0, 50.0), (100.0, 5.0, 100.0)]
+    KardexManager(session).recalcular_kardex_posterior(
+        {(producto_id, almacen_a.id), (producto_id, almacen_b.id)}, date(2024, 1, 1))
+    assert _saldos(session) == [(100.0, 10.0, 100.0), (200.0, 10.0, 200.0), (50.0, 5.0, 50.0), (100.0, 5.0, 100.0)]
+
+    assert reporte["movimientos"] == 4
+    assert reporte["costo_ventas"] == {AmbitoPromedio.ALMACEN: 150.0, AmbitoPromedio.EMPRESA: 150.0}
+    assert reporte["diferencia_unitaria_maxima"] == 5.0
+    assert reporte["valor_final"] == {
+        almacen_a.id: {AmbitoPromedio.ALMACEN: 50.0, AmbitoPromedio.EMPRESA: 75.0},
+        almacen_b.id: {AmbitoPromedio.ALMACEN: 100.0, AmbitoPromedio.EMPRESA: 75.0},
+    }
+    assert reporte["diferencia_valor_final"] == 50.0
+
+    # Global de la empresa: la misma lectura escribe el promedio global
+    sample_data["empresa"].ambito_promedio = AmbitoPromedio.EMPRESA
+    assert service.recalculate_kardex(producto_id, empresa_id) == reporte
+    assert _saldos(session) == [(100.0, 10.0, 100.0), (200.0, 10.0, 150.0), (75.0, 5.0, 75.0), (75.0, 5.0, 75.0)]
+
+    # La comparación no escribe nada
+    assert service.comparar_modelos_promedio(empresa_id) == [reporte]
+    assert _saldos(session)[3] == (75.0, 5.0, 75.0)
@@ -0,0 +1,580 @@
+import pytest
+from datetime import date, timedelta
+from decimal import Decimal
+from sqlalchemy.orm.exc import StaleDataError
+from utils.kardex_manager import KardexManager
+from utils.cola_lotes import ColaLotes
+from utils.cola_recalculo import ColaRecalculo
+from utils import kardex_entero
+from models.database_model import (MovimientoStock, TipoMovimiento, CheckpointKardex, CapaCosto, MetodoValuacion,
+                                   SaldoActual, RecalculoPendiente, CierreKardex)
+
+
+def crear_movimiento(session, data, fecha, entrada=0.0, salida=0.0, costo_unitario=0.0):
+    mov = MovimientoStock(
+        empresa_id=data["empresa"].id,
+        producto_id=data["producto"].id,
+        almacen_id=data["almacen"].id,
+        tipo=TipoMovimiento.COMPRA if entrada else TipoMovimiento.VENTA,
+        fecha_documento=fecha,
+        cantidad_entrada=entrada,
+        cantidad_salida=salida,
+        costo_unitario=costo_unitario,
+        costo_total=round(entrada * costo_unitario, 2),
+        saldo_cantidad=0,
+        saldo_costo_total=0
+    )
+    session.add(mov)
+    return mov
+
+
+@pytest.fixture
+def historial(session, sample_data, monkeypatch):
+    """Doce movimientos alternando compras y ventas, con checkpoints cada 3 movimientos."""
+    monkeypatch.setattr(KardexManager, "INTERVALO_CHECKPOINT", 3)
+    inicio = date(2024, 1, 1)
+    movimientos = []
+    for i in range(12):
+        fecha = inicio + timedelta(days=i)
+        if i % 2 == 0:
+            movimientos.append(crear_movimiento(session, sample_data, fecha, entrada=10, costo_unitario=10 + i))
+        else:
+            movimientos.append(crear_movimiento(session, sample_data, fecha, salida=4))
+    session.flush()
+
+    manager = KardexManager(session)
+    manager.recalcular_kardex_posterior({(sample_data["producto"].id, sample_data["almacen"].id)}, inicio)
+    session.flush()
+    return manager, movimientos
+
+
+def test_recalculo_crea_checkpoints(session, historial):
+    _, movimientos = historial
+    checkpoints = session.query(CheckpointKardex).order_by(CheckpointKardex.movimiento_id).all()
+
+    assert [cp.movimiento_id for cp in checkpoints] == [movimientos[i].id for i in (2, 5, 8, 11)]
+    for cp in checkpoints:
+        mov = session.get(MovimientoStock, cp.movimiento_id)
+        assert cp.saldo_cantidad == mov.saldo_cantidad
+        assert cp.saldo_costo_total == mov.saldo_costo_total
+
+    assert movimientos[-1].saldo_cantidad == 36.0
+    # Primera salida al costo promedio del primer lote
+    assert movimientos[1].costo_unitario == 10.0
+    assert movimientos[1].costo_total == 40.0
+
+
+def test_recalculo_se_detiene_en_checkpoint_coincidente(session, sample_data, historial):
+    manager, movimientos = historial
+    fecha_edicion = movimientos[3].fecha_documento
+
+    # Una edición neutra (entrada y salida al mismo costo) no altera los saldos posteriores
+    crear_movimiento(session, sample_data, fecha_edicion, entrada=5, costo_unitario=movimientos[3].costo_unitario)
+    crear_movimiento(session, sample_data, fecha_edicion, salida=5)
+    # Marca en un movimiento lejano: si el recálculo llegara hasta aquí, la sobrescribiría
+    movimientos[10].saldo_costo_total = -1.0
+    session.flush()
+
+    manager.recalcular_kardex_posterior({(sample_data["producto"].id, sample_data["almacen"].id)}, fecha_edicion)
+    session.flush()
+
+    assert movimientos[10].saldo_costo_total == -1.0
+
+
+def test_recalculo_continua_si_el_saldo_cambia(session, sample_data, historial):
+    manager, movimientos = historial
+    fecha_edicion = movimientos[3].fecha_documento
+
+    crear_movimiento(session, sample_data, fecha_edicion, entrada=5, costo_unitario=100)
+    session.flush()
+
+    manager.recalcular_kardex_posterior({(sample_data["producto"].id, sample_data["almacen"].id)}, fecha_edicion)
+    session.flush()
+
+    assert movimientos[-1].saldo_cantidad == 41.0
+    ultimo_checkpoint = session.query(CheckpointKardex).filter_by(movimiento_id=movimientos[11].id).one()
+    assert ultimo_checkpoint.saldo_cantidad == 41.0
+
+
+def _historial_aleatorio(semilla, n):
+    """Movimientos sintéticos con agotamientos de stock y salidas sin saldo."""
+    import random
+    from types import SimpleNamespace
+    rnd = random.Random(semilla)
+    movimientos = []
+    for _ in range(n):
+        if rnd.random() < 0.3:
+            cantidad = round(rnd.uniform(1, 50), 2)
+            costo = round(rnd.uniform(1, 100), 4)
+            movimientos.append(SimpleNamespace(cantidad_entrada=cantidad, cantidad_salida=0.0,
+                                               costo_unitario=costo, costo_total=round(cantidad * costo, 2)))
+        else:
+            movimientos.append(SimpleNamespace(cantidad_entrada=0.0, cantidad_salida=round(rnd.uniform(0, 20), 2),
+                                               costo_unitario=0.0, costo_total=0.0))
+    return movimientos
+
+
+@pytest.mark.parametrize("semilla", [1, 2, 3, 4, 5])
+def test_motor_vectorizado_coincide_con_decimal(semilla):
+    np = pytest.importorskip("numpy")
+    from utils import kardex_vectorizado
+
+    movimientos = _historial_aleatorio(semilla, 2000)
+    columnas = [np.array([getattr(m, campo) for m in movimientos], dtype=np.float64)
+                for campo in ("cantidad_entrada", "cantidad_salida", "costo_unitario", "costo_total")]
+
+    cu, ct, saldo_cant, saldo_val = kardex_vectorizado.calcular_promedio_ponderado(*columnas)
+    KardexManager(None)._calcular_promedio_ponderado(movimientos)
+
+    for i, mov in enumerate(movimientos):
+        assert round(cu[i], 6) == pytest.approx(round(mov.costo_unitario, 6), abs=1e-6)
+        assert round(ct[i], 2) == pytest.approx(round(mov.costo_total, 2), abs=0.01)
+        assert round(saldo_cant[i], 2) == pytest.approx(round(mov.saldo_cantidad, 2), abs=0.01)
+        assert round(saldo_val[i], 2) == pytest.approx(round(mov.saldo_costo_total, 2), abs=0.01)
+
+
+def test_recalculo_global_vectorizado_escribe_saldos(session, sample_data):
+    pytest.importorskip("numpy")
+    inicio = date(2024, 1, 1)
+    crear_movimiento(session, sample_data, inicio, entrada=10, costo_unitario=10)
+    compra2 = crear_movimiento(session, sample_data, inicio + timedelta(days=1), entrada=10, costo_unitario=20)
+    venta = crear_movimiento(session, sample_data, inicio + timedelta(days=2), salida=5)
+    session.commit()
+
+    KardexManager(session).recalcular_saldos_globales(sample_data["empresa"].id, motor=KardexManager.MOTOR_NUMPY)
+
+    assert venta.costo_unitario == 15.0
+    assert venta.costo_total == 75.0
+    assert venta.saldo_cantidad == 15.0
+    assert venta.saldo_costo_total == 225.0
+    assert compra2.saldo_cantidad == 20.0
+
+
+@pytest.mark.parametrize("motor", [KardexManager.MOTOR_DECIMAL, KardexManager.MOTOR_NUMPY])
+def test_recalculo_global_solo_escribe_filas_modificadas(session, sample_data, monkeypatch, motor):
+    if motor == KardexManager.MOTOR_NUMPY:
+        pytest.importorskip("numpy")
+    inicio = date(2024, 1, 1)
+    crear_movimiento(session, sample_data, inicio, entrada=10, costo_unitario=10)
+    crear_movimiento(session, sample_data, inicio + timedelta(days=1), salida=5)
+    session.commit()
+
+    manager = KardexManager(session)
+    escritas = []
+    original = KardexManager.escribir_valorizacion_masiva
+    monkeypatch.setattr(KardexManager, "escribir_valorizacion_masiva",
+                        lambda self, filas: escritas.append(original(self, filas)))
+
+    manager.recalcular_saldos_globales(sample_data["empresa"].id, motor=motor)
+    assert sum(escritas) == 2
+    versiones = [m.version_id for m in session.query(MovimientoStock).order_by(MovimientoStock.id)]
+
+    # Un segundo recálculo no encuentra diferencias: no escribe ni cambia versiones
+    escritas.clear()
+    manager.recalcular_saldos_globales(sample_data["empresa"].id, motor=motor)
+    assert sum(escritas) == 0
+    assert [m.version_id for m in session.query(MovimientoStock).order_by(MovimientoStock.id)] == versiones
+
+
+def test_recalculo_vectorizado_no_reescribe_saldos_redondeados(session, sample_data, monkeypatch):
+    pytest.importorskip("numpy")
+    inicio = date(2024, 1, 1)
+    crear_movimiento(session, sample_data, inicio, entrada=2, costo_unitario=10)
+    crear_movimiento(session, sample_data, inicio + timedelta(days=1), entrada=1, costo_unitario=11)
+    crear_movimiento(session, sample_data, inicio + timedelta(days=2), salida=1)
+    session.commit()
+
+    manager = KardexManager(session)
+    manager.recalcular_saldos_globales(sample_data["empresa"].id, motor=KardexManager.MOTOR_DECIMAL)
+    escritas = []
+    original = KardexManager.escribir_valorizacion_masiva
+    monkeypatch.setattr(KardexManager, "escribir_valorizacion_masiva",
+                        lambda self, filas: escritas.append(original(self, filas)))
+
+    # Los saldos redondeados por el motor Decimal no cuentan como cambio para NumPy
+    manager.recalcular_saldos_globales(sample_data["empresa"].id, motor=KardexManager.MOTOR_NUMPY)
+    assert sum(escritas) == 0
+
+
+def test_escritura_masiva_detecta_version_desactualizada(session, sample_data):
+    mov = crear_movimiento(session, sample_data, date(2024, 1, 1), entrada=10, costo_unitario=10)
+    session.flush()
+    version_leida = mov.version_id
+
+    # Otro proceso modifica el movimiento después de leerlo
+    mov.observaciones = "editado"
+    session.flush()
+
+    with pytest.raises(StaleDataError):
+        KardexManager(session).escribir_valorizacion_masiva([(mov.id, 10.0, 100.0, 10.0, 100.0, version_leida)])
+
+
+def test_motor_vectorizado_reinicia_saldo_por_producto():
+    np = pytest.importorskip("numpy")
+    from utils import kardex_vectorizado
+
+    producto_a = _historial_aleatorio(10, 300)
+    producto_b = _historial_aleatorio(11, 300)
+    todos = producto_a + producto_b
+    columnas = [np.array([getattr(m, campo) for m in todos], dtype=np.float64)
+                for campo in ("cantidad_entrada", "cantidad_salida", "costo_unitario", "costo_total")]
+    inicio_grupo = np.zeros(len(todos), dtype=bool)
+    inicio_grupo[[0, len(producto_a)]] = True
+
+    _, _, saldo_cant, saldo_val = kardex_vectorizado.calcular_promedio_ponderado(*columnas, inicio_grupo=inicio_grupo)
+    KardexManager(None)._calcular_promedio_ponderado(producto_a)
+    KardexManager(None)._calcular_promedio_ponderado(producto_b)
+
+    for i, mov in enumerate(todos):
+        assert saldo_cant[i] == pytest.approx(mov.saldo_cantidad, abs=0.01)
+        assert saldo_val[i] == pytest.approx(mov.saldo_costo_total, abs=0.01)
+
+
+def test_aritmetica_entera_coincide_con_decimal(session, sample_data, monkeypatch):
+    import random
+    rnd = random.Random(3)
+    inicio = date(2024, 1, 1)
+    for i in range(400):
+        fecha = inicio + timedelta(days=i // 3)
+        if rnd.random() < 0.4:
+            crear_movimiento(session, sample_data, fecha, entrada=round(rnd.uniform(0.01, 80), 2),
+                             costo_unitario=round(rnd.uniform(0.1, 90), 4))
+        else:
+            crear_movimiento(session, sample_data, fecha, salida=round(rnd.uniform(0.01, 30), 2))
+    session.flush()
+
+    par = {(sample_data["producto"].id, sample_data["almacen"].id)}
+    campos = ("costo_unitario", "costo_total", "saldo_cantidad", "saldo_costo_total")
+
+    resultados = {}
+    for modo in (kardex_entero.ARITMETICA_DECIMAL, kardex_entero.ARITMETICA_ENTERA):
+        monkeypatch.setattr(KardexManager, "ARITMETICA", modo)
+        session.query(CheckpointKardex).delete()
+        session.query(MovimientoStock).update({"saldo_cantidad": 0, "saldo_costo_total": 0})
+        KardexManager(session).recalcular_kardex_posterior(par, inicio)
+        resultados[modo] = [
+            tuple(getattr(m, c) for c in campos)
+            for m in session.query(MovimientoStock).order_by(MovimientoStock.id)
+        ]
+
+    assert resultados[kardex_entero.ARITMETICA_ENTERA] == resultados[kardex_entero.ARITMETICA_DECIMAL]
+
+
+def registrar(manager, data, fecha, entrada=0, salida=0, costo_unitario=0):
+    if salida:
+        costo_unitario, costo_total = manager.calcular_costo_salida(
+            data["empresa"].id, data["producto"].id, data["almacen"].id, salida, forzar_recalculo=True
+        )
+    else:
+        costo_total = entrada * costo_unitario
+    manager.registrar_movimiento(
+        empresa_id=data["empresa"].id, producto_id=data["producto"].id, almacen_id=data["almacen"].id,
+        tipo=TipoMovimiento.COMPRA if entrada else TipoMovimiento.VENTA,
+        cantidad_entrada=entrada, cantidad_salida=salida,
+        costo_unitario=costo_unitario, costo_total=costo_total,
+        numero_documento="T-1", fecha_documento=fecha
+    )
+
+
+def capas(session, data):
+    return [
+        (c.cantidad_restante, c.costo_unitario)
+        for c in session.query(CapaCosto).filter_by(producto_id=data["producto"].id)
+        .order_by(CapaCosto.fecha_documento, CapaCosto.movimiento_id)
+    ]
+
+
+@pytest.mark.parametrize("metodo, costo_esperado, capas_esperadas", [
+    (MetodoValuacion.PEPS, 10 * 5 + 5 * 8, [(5.0, 8.0), (10.0, 9.0)]),
+    (MetodoValuacion.UEPS, 10 * 9 + 5 * 8, [(10.0, 5.0), (5.0, 8.0)]),
+])
+def test_capas_costo_peps_ueps(session, sample_data, monkeypatch, metodo, costo_esperado, capas_esperadas):
+    sample_data["empresa"].metodo_valuacion = metodo
+    # Una capa por lectura: la salida consume capas de dos páginas
+    monkeypatch.setattr(KardexManager, "TAMANIO_PAGINA_CAPAS", 1)
+    manager = KardexManager(session)
+    inicio = date(2024, 1, 1)
+    for i, costo in enumerate((5, 8, 9)):
+        registrar(manager, sample_data, inicio + timedelta(days=i), entrada=10, costo_unitario=costo)
+
+    _, costo_total = manager.calcular_costo_salida(
+        sample_data["empresa"].id, sample_data["producto"].id, sample_data["almacen"].id, 15
+    )
+    assert costo_total == pytest.approx(costo_esperado)
+
+    registrar(manager, sample_data, inicio + timedelta(days=5), salida=15)
+    session.flush()
+
+    ultimo = session.query(MovimientoStock).order_by(MovimientoStock.id.desc()).first()
+    assert ultimo.costo_total == pytest.approx(costo_esperado)
+    assert ultimo.saldo_costo_total == pytest.approx(10 * 5 + 10 * 8 + 10 * 9 - costo_esperado)
+    assert capas(session, sample_data) == capas_esperadas
+
+    # Reconstruir desde el historial deja las mismas capas que el mantenimiento incremental
+    manager.reconstruir_capas_costo({(sample_data["producto"].id, sample_data["almacen"].id)})
+    session.flush()
+    assert capas(session, sample_data) == capas_esperadas
+
+
+@pytest.mark.parametrize("metodo, costo_salida, capas_esperadas", [
+    (MetodoValuacion.PEPS, 4 * 1 + 10 * 5 + 1 * 7, [(9.0, 7.0)]),
+    (MetodoValuacion.UEPS, 10 * 7 + 5 * 5, [(4.0, 1.0), (5.0, 5.0)]),
+])
+def test_recalculo_peps_ueps_con_entrada_anterior(session, sample_data, monkeypatch, metodo, costo_salida,
+                                                   capas_esperadas):
+    sample_data["empresa"].metodo_valuacion = metodo
+    # Páginas de dos movimientos: los lotes pasan de una página a la siguiente
+    monkeypatch.setattr(KardexManager, "INTERVALO_CHECKPOINT", 2)
+    manager = KardexManager(session)
+    inicio = date(2024, 1, 10)
+    registrar(manager, sample_data, inicio, entrada=10, costo_unitario=5)
+    registrar(manager, sample_data, inicio + timedelta(days=1), entrada=10, costo_unitario=7)
+    registrar(manager, sample_data, inicio + timedelta(days=2), salida=15)
+    # Entrada con fecha anterior: el recálculo reordena los lotes que consumió la salida
+    registrar(manager, sample_data, inicio - timedelta(days=5), entrada=4, costo_unitario=1)
+    manager.procesar_recalculos_pendientes()
+    session.flush()
+
+    salida = session.query(MovimientoStock).filter(MovimientoStock.cantidad_salida > 0).one()
+    assert salida.costo_total == pytest.approx(costo_salida)
+    ultimo = session.query(MovimientoStock).order_by(
+        MovimientoStock.fecha_documento.desc(), MovimientoStock.id.desc()).first()
+    assert ultimo.saldo_costo_total == pytest.approx(4 * 1 + 10 * 5 + 10 * 7 - costo_salida)
+    # Los saldos de los movimientos coinciden con las capas reconstruidas
+    assert capas(session, sample_data) == capas_esperadas
+    assert sum(c * cu for c, cu in capas_esperadas) == pytest.approx(ultimo.saldo_costo_total)
+
+
+@pytest.mark.parametrize("metodo", [MetodoValuacion.PEPS, MetodoValuacion.UEPS])
+def test_cola_lotes_saldos_acumulados(metodo):
+    lotes = ColaLotes(metodo)
+    lotes.agregar(10, 5)
+    lotes.agregar(10, 8)
+    lotes.agregar(10, 9)
+
+    costo = lotes.consumir(15)
+    assert costo == (Decimal("90") if metodo == MetodoValuacion.PEPS else Decimal("130"))
+    assert lotes.cantidad == sum(c for _, c, _ in lotes) == 15
+    assert lotes.valor == sum(c * cu for _, c, cu in lotes)
+
+    # Una salida mayor al saldo consume todo y deja la cola en cero
+    lotes.consumir(100)
+    assert len(lotes) == 0 and lotes.cantidad == 0 and lotes.valor == 0
+
+
+def saldo_actual(session, data):
+    saldo = session.get(SaldoActual, (data["empresa"].id, data["producto"].id, data["almacen"].id))
+    return (saldo.cantidad, saldo.valor_total, saldo.ultimo_movimiento_id) if saldo else None
+
+
+def test_saldo_actual_registrar_y_recalcular(session, sample_data):
+    manager = KardexManager(session)
+    registrar(manager, sample_data, date(2024, 1, 10), entrada=10, costo_unitario=5)
+    registrar(manager, sample_data, date(2024, 1, 20), salida=4)
+    session.flush()
+
+    ultimo = session.query(MovimientoStock).order_by(MovimientoStock.id.desc()).first()
+    assert saldo_actual(session, sample_data) == (6.0, 30.0, ultimo.id)
+    assert manager.obtener_stock_global_producto(sample_data["producto"].id) == 6.0
+
+    # Un movimiento con fecha anterior no es el saldo vigente hasta el recálculo posterior
+    registrar(manager, sample_data, date(2024, 1, 5), entrada=10, costo_unitario=2)
+    session.flush()
+    assert saldo_actual(session, sample_data)[2] == ultimo.id
+
+    manager.recalcular_kardex_posterior({(sample_data["producto"].id, sample_data["almacen"].id)}, date(2024, 1, 5))
+    session.flush()
+    session.refresh(ultimo)
+    assert ultimo.saldo_cantidad == 16.0
+    assert saldo_actual(session, sample_data) == (16.0, ultimo.saldo_costo_total, ultimo.id)
+
+    # La reconstrucción desde los movimientos deja la misma fila
+    esperado = saldo_actual(session, sample_data)
+    assert manager.reconstruir_saldo_actual() == 1
+    assert saldo_actual(session, sample_data) == esperado
+
+    assert manager.obtener_saldos_al(date(2024, 1, 15)) == {
+        (sample_data["empresa"].id, sample_data["producto"].id, sample_data["almacen"].id): (20.0, 70.0)
+    }
+
+
+def test_cola_recalculo_fusiona_por_par(session, sample_data):
+    cola = ColaRecalculo(session)
+    par = (sample_data["producto"].id, sample_data["almacen"].id)
+    cola.encolar({par}, date(2024, 3, 1))
+    cola.encolar({par}, date(2024, 1, 15))
+    cola.encolar({par}, date(2024, 2, 1))
+
+    (entrada,) = cola.pendientes()
+    assert entrada.fecha_desde == date(2024, 1, 15)
+    assert entrada.fecha_hasta == date(2024, 3, 1)
+    assert entrada.version == 3
+
+    # Una edición registrada mientras se recalculaba deja la entrada pendiente
+    cola.encolar({par}, date(2024, 2, 1))
+    cola.descartar(entrada)
+    assert [e.version for e in cola.pendientes({par})] == [4]
+
+
+def test_cola_fusionada_no_se_detiene_antes_de_la_ultima_edicion(session, sample_data, monkeypatch):
+    monkeypatch.setattr(KardexManager, "INTERVALO_CHECKPOINT", 2)
+    manager = KardexManager(session)
+    par = (sample_data["producto"].id, sample_data["almacen"].id)
+    crear_movimiento(session, sample_data, date(2024, 1, 1), entrada=10, costo_unitario=10)
+    crear_movimiento(session, sample_data, date(2024, 1, 2), salida=5)
+    crear_movimiento(session, sample_data, date(2024, 1, 4), entrada=5, costo_unitario=10)
+    crear_movimiento(session, sample_data, date(2024, 1, 6), salida=5)
+    ultima = crear_movimiento(session, sample_data, date(2024, 1, 16), entrada=10, costo_unitario=5)
+    session.flush()
+    manager.recalcular_kardex_posterior({par}, date(2024, 1, 1))
+    session.flush()
+    assert ultima.saldo_costo_total == 100.0
+
+    # Se edita el costo del día 16 y luego otro documento del día 2, que no cambia el saldo:
+    # el checkpoint del día 6 coincide, pero el día 16 sigue pendiente
+    ultima.costo_unitario, ultima.costo_total = 15, 150
+    session.flush()
+    cola = ColaRecalculo(session)
+    cola.encolar({par}, date(2024, 1, 16))
+    cola.encolar({par}, date(2024, 1, 2))
+
+    assert manager.procesar_recalculos_pendientes() == 1
+    session.flush()
+    assert ultima.saldo_costo_total == 200.0
+
+
+def test_recalculo_pendiente_se_procesa_antes_de_registrar(session, sample_data):
+    manager = KardexManager(session)
+    par = (sample_data["producto"].id, sample_data["almacen"].id)
+    crear_movimiento(session, sample_data, date(2024, 1, 10), entrada=10, costo_unitario=5)
+    crear_movimiento(session, sample_data, date(2024, 1, 20), salida=4)
+    session.flush()
+    # Como un documento guardado: movimientos sin saldo y el rango en la cola
+    ColaRecalculo(session).encolar({par}, date(2024, 1, 10))
+
+    registrar(manager, sample_data, date(2024, 1, 25), salida=1)
+    session.flush()
+
+    ultimo = session.query(MovimientoStock).order_by(MovimientoStock.id.desc()).first()
+    assert (ultimo.saldo_cantidad, ultimo.saldo_costo_total) == (5.0, 25.0)
+    assert session.query(RecalculoPendiente).count() == 0
+
+    # Un movimiento con fecha anterior deja pendientes los posteriores
+    registrar(manager, sample_data, date(2024, 1, 5), entrada=2, costo_unitario=5)
+    session.flush()
+    (entrada,) = ColaRecalculo(session).pendientes()
+    assert entrada.fecha_desde == date(2024, 1, 5)
+    assert manager.procesar_recalculos_pendientes() == 1
+    session.flush()
+    session.refresh(ultimo)
+    assert ultimo.saldo_cantidad == 7.0
+
+
+def valores_kardex(session, data, desde=None):
+    query = session.query(MovimientoStock).filter_by(producto_id=data["producto"].id)
+    if desde:
+        query = query.filter(MovimientoStock.fecha_documento >= desde)
+    return [
+        (m.costo_unitario, m.costo_total, m.saldo_cantidad, m.saldo_costo_total)
+        for m in query.order_by(MovimientoStock.fecha_documento, MovimientoStock.id)
+    ]
+
+
+@pytest.mark.parametrize("metodo, motores", [
+    (MetodoValuacion.PROMEDIO_PONDERADO, [KardexManager.MOTOR_DECIMAL, KardexManager.MOTOR_NUMPY, None]),
+    (MetodoValuacion.PEPS, [KardexManager.MOTOR_DECIMAL]),
+])
+def test_cierre_anual_recalculos_parten_del_cierre(session, sample_data, metodo, motores):
+    sample_data["empresa"].metodo_valuacion = metodo
+    manager = KardexManager(session)
+    par = (sample_data["producto"].id, sample_data["almacen"].id)
+    registrar(manager, sample_data, date(2023, 3, 1), entrada=10, costo_unitario=5)
+    registrar(manager, sample_data, date(2023, 6, 1), entrada=10, costo_unitario=8)
+    registrar(manager, sample_data, date(2023, 9, 1), salida=12)
+    registrar(manager, sample_data, date(2024, 2, 1), salida=3)
+    registrar(manager, sample_data, date(2024, 3, 1), entrada=5, costo_unitario=9)
+    registrar(manager, sample_data, date(2024, 4, 1), salida=4)
+    session.flush()
+
+    manager.recalcular_saldos_globales(sample_data["empresa"].id, motor=KardexManager.MOTOR_DECIMAL)
+    esperado = valores_kardex(session, sample_data, desde=date(2024, 1, 1))
+    capas_esperadas = capas(session, sample_data)
+
+    assert manager.generar_cierre_anual(2023) == 1
+    session.flush()
+    cierre = session.get(CierreKardex, (2023, *par))
+    assert cierre.cantidad == 8.0
+    if metodo == MetodoValuacion.PEPS:
+        assert [(c.cantidad, c.costo_unitario) for c in cierre.capas] == [(8.0, 8.0)]
+
+    # Los movimientos del año cerrado no se vuelven a leer: alterarlos no cambia el resultado
+    session.execute(
+        MovimientoStock.__table__.update()
+        .where(MovimientoStock.fecha_documento <= date(2023, 12, 31))
+        .values(cantidad_entrada=1000, costo_unitario=1000, costo_total=10 ** 6, saldo_cantidad=-1)
+    )
+    session.expire_all()
+
+    for motor in motores:
+        if motor is None:
+            manager.recalcular_kardex_posterior({par}, date(2023, 1, 1))
+        else:
+            manager.recalcular_saldos_globales(sample_data["empresa"].id, motor=motor)
+        session.flush()
+        session.expire_all()
+        assert valores_kardex(session, sample_data, desde=date(2024, 1, 1)) == esperado
+        assert capas(session, sample_data) == capas_esperadas
+        # Ni se reescriben
+        assert {v[2] for v in valores_kardex(session, sample_data)[:3]} == {-1}
+
+    # El kardex de 2024 abre con el saldo del cierre
+    apertura = manager.apertura_kardex(sample_data["empresa"].id, par[0], date(2024, 3, 1))
+    assert sum(m.cantidad_entrada - m.cantidad_salida for m in apertura) == 5.0
+
+    # Reabrir el año descarta su cierre y los siguientes
+    manager.invalidar_cierres_desde(2023)
+    assert session.query(CierreKardex).count() == 0
+
+
+def test_stock_bulk_a_fecha(session, sample_data, monkeypatch):
+    manager = KardexManager(session)
+    producto_id, almacen_id = sample_data["producto"].id, sample_data["almacen"].id
+    registrar(manager, sample_data, date(2024, 1, 10), entrada=10, costo_unitario=5)
+    registrar(manager, sample_data, date(2024, 2, 10), salida=4)
+    registrar(manager, sample_data, date(2024, 1, 5), entrada=5, costo_unitario=3)
+    manager.procesar_recalculos_pendientes()
+    session.flush()
+
+    pares = [(producto_id, almacen_id), (producto_id + 1, almacen_id)]
+    assert manager.obtener_stock_bulk(pares) == {pares[0]: 11.0, pares[1]: 0.0}
+    assert manager.obtener_stock_bulk(pares, date(2024, 1, 7)) == {pares[0]: 5.0, pares[1]: 0.0}
+    assert manager.obtener_stock_bulk(pares, date(2024, 1, 31)) == {pares[0]: 15.0, pares[1]: 0.0}
+    assert manager.obtener_stock_bulk(pares, date(2023, 12, 31)) == {pares[0]: 0.0, pares[1]: 0.0}
+
+    # Varios lotes de pares
+    monkeypatch.setattr(KardexManager, "TAMANIO_LOTE_PARES", 1)
+    assert manager.obtener_stock_bulk(pares + [pares[0]]) == {pares[0]: 11.0, pares[1]: 0.0}
+    assert manager.obtener_stock_bulk([]) == {}
+
+
+def test_registrar_movimientos_encadena_lineas_del_documento(session, sample_data):
+    sample_data["empresa"].metodo_valuacion = MetodoValuacion.PEPS
+    manager = KardexManager(session)
+    registrar(manager, sample_data, date(2024, 1, 5), entrada=4, costo_unitario=2)
+    session.flush()
+
+    linea = dict(empresa_id=sample_data["empresa"].id, producto_id=sample_data["producto"].id,
+                 almacen_id=sample_data["almacen"].id, numero_documento="F-1", fecha_documento=date(2024, 1, 10))
+    movimientos = manager.registrar_movimientos([
+        dict(linea, tipo=TipoMovimiento.COMPRA, cantidad_entrada=10, cantidad_salida=0, costo_unitario=5, costo_total=50),
+        dict(linea, tipo=TipoMovimiento.COMPRA, cantidad_entrada=5, cantidad_salida=0, costo_unitario=8, costo_total=40),
+        dict(linea, tipo=TipoMovimiento.VENTA, cantidad_entrada=0, cantidad_salida=16, costo_unitario=0, costo_total=0),
+    ])
+    session.flush()
+
+    assert [m.saldo_cantidad for m in movimientos] == [14.0, 19.0, 3.0]
+    # La salida consume la capa anterior y las dos entradas del mismo documento
+    assert movimientos[2].costo_total == 4 * 2 + 10 * 5 + 2 * 8
+    assert movimientos[2].saldo_costo_total == 24.0
+    assert capas(session, sample_data) == [(3.0, 8.0)]
+    assert saldo_actual(session, sample_data) == (3.0, 24.0, movimientos[2].id)
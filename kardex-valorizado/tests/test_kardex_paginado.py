@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import event
+from datetime import date, timedelta
+from utils.kardex_manager import KardexManager
+from utils.kardex_paginado import LectorKardex
+from models.database_model import MetodoValuacion
+from test_kardex_manager import registrar
+
+
+def lector(session, data, desde, hasta, metodo):
+    return LectorKardex(data["empresa"].id, data["producto"].id, desde, hasta,
+                        metodo=metodo, session=session)
+
+
+@pytest.mark.parametrize("metodo", [MetodoValuacion.PROMEDIO_PONDERADO, MetodoValuacion.PEPS])
+def test_paginas_continuan_la_valorizacion(session, sample_data, monkeypatch, metodo):
+    sample_data["empresa"].metodo_valuacion = metodo
+    manager = KardexManager(session)
+    inicio = date(2024, 1, 1)
+    for i in range(14):
+        fecha = inicio + timedelta(days=i)
+        if i % 3 == 2:
+            registrar(manager, sample_data, fecha, salida=6)
+        else:
+            registrar(manager, sample_data, fecha, entrada=5, costo_unitario=10 + i)
+    session.flush()
+
+    desde, hasta = date(2024, 1, 4), date(2024, 1, 31)
+    completo = list(lector(session, sample_data, desde, hasta, metodo).recorrer())
+
+    monkeypatch.setattr(LectorKardex, "TAMANIO_PAGINA", 3)
+    paginado = lector(session, sample_data, desde, hasta, metodo)
+    paginas = []
+    while not paginado.agotado:
+        paginas.append(paginado.siguiente_pagina())
+
+    assert [len(p) for p in paginas] == [3, 3, 3, 2]
+    filas = [mov for pagina in paginas for mov in pagina]
+    assert [vars(m) for m in filas] == [vars(m) for m in completo]
+
+    # El saldo inicial son los tres movimientos anteriores a fecha_desde
+    assert paginado.saldo_inicial[0] == 4.0
+    # Y el kardex termina en el saldo guardado por registrar_movimiento
+    assert filas[-1].saldo_cantidad_calculado == filas[-1].saldo_cantidad
+    assert filas[-1].saldo_valor_calculado == pytest.approx(filas[-1].saldo_costo_total, abs=0.01)
+
+    totales = paginado.totales()
+    assert totales == {'movimientos': 11, 'entradas': 40.0, 'salidas': 18.0}
+
+
+def test_sesion_recibida_no_se_confirma_entre_paginas(session, sample_data, monkeypatch):
+    registrar(KardexManager(session), sample_data, date(2024, 1, 1), entrada=5, costo_unitario=10)
+    confirmaciones = []
+    event.listen(session, 'after_commit', lambda s: confirmaciones.append(s))
+
+    monkeypatch.setattr(LectorKardex, "TAMANIO_PAGINA", 1)
+    paginado = LectorKardex(sample_data["empresa"].id, sample_data["producto"].id,
+                            date(2024, 1, 1), date(2024, 1, 31), session=session)
+    while not paginado.agotado:
+        paginado.siguiente_pagina()
+    paginado.totales()
+    assert confirmaciones == []
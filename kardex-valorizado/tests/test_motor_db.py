@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from utils.motor_db import crear_engine, crear_engine_lectura
+
+
+def leer_pragmas(engine):
+    with engine.connect() as conn:
+        return {nombre: conn.execute(text(f"PRAGMA {nombre}")).scalar()
+                for nombre in ('journal_mode', 'synchronous', 'temp_store', 'busy_timeout', 'cache_size')}
+
+
+def test_perfil_sqlite_se_aplica_a_cada_conexion(tmp_path):
+    engine = crear_engine(f"sqlite:///{tmp_path / 'perfil.db'}")
+    try:
+        assert leer_pragmas(engine) == {'journal_mode': 'wal', 'synchronous': 1, 'temp_store': 2,
+                                        'busy_timeout': 5000, 'cache_size': -65536}
+        assert engine.pool.size() == 20
+    finally:
+        engine.dispose()
+
+    engine = crear_engine(f"sqlite:///{tmp_path / 'sin_pragmas.db'}", pragmas={})
+    try:
+        assert leer_pragmas(engine)['journal_mode'] == 'delete'
+    finally:
+        engine.dispose()
+
+
+def test_sesion_de_lectura_usa_una_instantanea_y_no_escribe(tmp_path):
+    url = f"sqlite:///{tmp_path / 'lectura.db'}"
+    escritura, lectura = crear_engine(url), crear_engine_lectura(url)
+    try:
+        with escritura.begin() as conn:
+            conn.execute(text("CREATE TABLE t (x INTEGER)"))
+            conn.execute(text("INSERT INTO t VALUES (1)"))
+
+        with Session(lectura) as session:
+            assert session.execute(text("SELECT count(*) FROM t")).scalar() == 1
+            # Lo que se confirma durante la lectura no entra en su instantánea
+            with escritura.begin() as conn:
+                conn.execute(text("INSERT INTO t VALUES (2)"))
+            assert session.execute(text("SELECT count(*) FROM t")).scalar() == 1
+            session.commit()
+            assert session.execute(text("SELECT count(*) FROM t")).scalar() == 2
+
+            with pytest.raises(OperationalError, match="readonly"):
+                session.execute(text("INSERT INTO t VALUES (3)"))
+    finally:
+        escritura.dispose()
+        lectura.dispose()
+
+    assert crear_engine_lectura("sqlite://") is None
+
+
+def test_importar_los_modelos_no_crea_el_motor(tmp_path):
+    # En un proceso aparte: en este los modelos ya están importados
+    src = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src'))
+    subprocess.run([sys.executable, "-c", "import models.database_model, utils.sesiones"],
+                   cwd=tmp_path, env={**os.environ, "PYTHONPATH": src}, check=True)
+    assert not (tmp_path / "config.json").exists()
@@ -0,0 +1,182 @@
+"""
+Regresión de planes de consulta: cada consulta que emiten KardexManager e InventoryService
+debe resolverse con índices, sin recorrer tablas completas ni ordenar en un B-tree temporal.
+
+Las sentencias se capturan al ejecutar los métodos sobre la base de prueba y se vuelven a
+pasar por EXPLAIN QUERY PLAN con los mismos parámetros.
+"""
+import pytest
+from contextlib import contextmanager
+from datetime import date
+from sqlalchemy import event
+from services.inventory_service import InventoryService
+from utils.kardex_manager import KardexManager
+from models.database_model import Base, MetodoValuacion, TipoMovimiento, TipoDocumento
+
+# "SCAN tabla" recorre la tabla completa y "USE TEMP B-TREE" ordena filas en una estructura
+# temporal. "SCAN tabla USING [COVERING] INDEX" recorre un índice completo en orden: solo se
+# acepta en las lecturas de la tabla entera (recálculos globales), marcadas con
+# Captura.lectura_completa(). "SCAN (subquery)" recorre un resultado intermedio ya calculado.
+TABLAS = set(Base.metadata.tables)
+ORDEN_TEMPORAL = 'USE TEMP B-TREE'
+
+
+class Captura:
+    """Sentencias ejecutadas por la sesión, con su indicador de lectura completa."""
+
+    def __init__(self):
+        self.sentencias = []
+        self.completa = False
+
+    def registrar(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'INSERT INTO SALDO_ACTUAL (')):
+            if executemany:
+                parameters = parameters[0]
+            self.sentencias.append((statement, parameters, self.completa))
+
+    @contextmanager
+    def lectura_completa(self):
+        self.completa = True
+        try:
+            yield
+        finally:
+            self.completa = False
+
+
+@pytest.fixture
+def capturar(session):
+    captura = Captura()
+    conexion = session.connection()
+    event.listen(conexion, 'before_cursor_execute', captura.registrar)
+    yield captura
+    event.remove(conexion, 'before_cursor_execute', captura.registrar)
+
+
+def es_recorrido_completo(paso, completa):
+    partes = paso.split()
+    if len(partes) < 2 or partes[0] != 'SCAN' or partes[1] not in TABLAS:
+        return False
+    return 'USING' not in partes or not completa
+
+
+def es_orden_temporal(paso, statement):
+    # El orden de presentación de un reporte agregado (una fila por producto) se aplica
+    # sobre el resultado, no sobre las filas de las tablas
+    if paso == 'USE TEMP B-TREE FOR ORDER BY' and 'GROUP BY' in statement:
+        return False
+    return ORDEN_TEMPORAL in paso
+
+
+def problemas_de_plan(session, captura):
+    conexion = session.connection().connection.driver_connection
+    problemas = []
+    for statement, parameters, completa in captura.sentencias:
+        plan = [fila[3] for fila in conexion.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+        for paso in plan:
+            if es_recorrido_completo(paso, completa) or es_orden_temporal(paso, statement):
+                problemas.append(f"{paso}\n    en: {' '.join(statement.split())}")
+    return problemas
+
+
+def registrar(manager, data, fecha, entrada=0, salida=0, costo_unitario=0):
+    costo_total = entrada * costo_unitario
+    if salida:
+        costo_unitario, costo_total = manager.calcular_costo_salida(
+            data["empresa"].id, data["producto"].id, data["almacen"].id, salida
+        )
+    manager.registrar_movimiento(
+        empresa_id=data["empresa"].id, producto_id=data["producto"].id, almacen_id=data["almacen"].id,
+        tipo=TipoMovimiento.COMPRA if entrada else TipoMovimiento.VENTA,
+        cantidad_entrada=entrada, cantidad_salida=salida,
+        costo_unitario=costo_unitario, costo_total=costo_total,
+        numero_documento="T-1", fecha_documento=fecha
+    )
+
+
+@pytest.mark.parametrize("metodo", [MetodoValuacion.PROMEDIO_PONDERADO, MetodoValuacion.PEPS])
+def test_consultas_kardex_manager_usan_indices(session, sample_data, capturar, metodo):
+    sample_data["empresa"].metodo_valuacion = metodo
+    manager = KardexManager(session)
+    producto_id, almacen_id = sample_data["producto"].id, sample_data["almacen"].id
+    par = {(producto_id, almacen_id)}
+
+    registrar(manager, sample_data, date(2024, 1, 10), entrada=10, costo_unitario=5)
+    registrar(manager, sample_data, date(2024, 2, 10), salida=4)
+    registrar(manager, sample_data, date(2024, 1, 5), entrada=5, costo_unitario=3)
+    session.flush()
+
+    manager.recalcular_kardex_posterior(par, date(2024, 1, 5))
+    manager.obtener_stock_actual(producto_id, almacen_id)
+    manager.obtener_stock_actual(producto_id, almacen_id, fecha=date(2024, 1, 31))
+    manager.obtener_stock_bulk([(producto_id, almacen_id), (producto_id + 1, almacen_id)], fecha=date(2024, 1, 31))
+    manager.obtener_costo_promedio_actual(producto_id, almacen_id, fecha=date(2024, 1, 31))
+    manager.obtener_stock_global_producto(producto_id)
+    manager.obtener_saldos_al(date(2024, 1, 31), empresa_id=sample_data["empresa"].id)
+    manager.reconstruir_saldo_actual(sample_data["empresa"].id)
+    with capturar.lectura_completa():
+        manager.recalcular_saldos_globales(sample_data["empresa"].id, motor=KardexManager.MOTOR_DECIMAL)
+        manager.recalcular_saldos_globales(sample_data["empresa"].id, motor=KardexManager.MOTOR_NUMPY)
+        session.flush()
+
+    assert capturar.sentencias
+    assert problemas_de_plan(session, capturar) == []
+
+
+@pytest.mark.parametrize("metodo", [MetodoValuacion.PROMEDIO_PONDERADO, MetodoValuacion.PEPS])
+def test_consultas_desde_cierre_anual_usan_indices(session, sample_data, capturar, metodo):
+    sample_data["empresa"].metodo_valuacion = metodo
+    manager = KardexManager(session)
+    producto_id, almacen_id = sample_data["producto"].id, sample_data["almacen"].id
+
+    registrar(manager, sample_data, date(2023, 6, 10), entrada=10, costo_unitario=5)
+    registrar(manager, sample_data, date(2023, 9, 10), salida=4)
+    registrar(manager, sample_data, date(2024, 2, 10), salida=1)
+    manager.generar_cierre_anual(2023)
+    session.flush()
+    # El cierre recorre una vez saldo_actual y la cola completas; se revisa lo que parte de él
+    capturar.sentencias.clear()
+
+    manager.recalcular_kardex_posterior({(producto_id, almacen_id)}, date(2024, 1, 5))
+    manager.apertura_kardex(sample_data["empresa"].id, producto_id, date(2024, 3, 1))
+    manager.apertura_kardex(sample_data["empresa"].id, producto_id, date(2024, 3, 1), almacen_id=almacen_id)
+    with capturar.lectura_completa():
+        manager.recalcular_saldos_globales(sample_data["empresa"].id, motor=KardexManager.MOTOR_DECIMAL)
+        manager.recalcular_saldos_globales(sample_data["empresa"].id, motor=KardexManager.MOTOR_NUMPY)
+        session.flush()
+    manager.invalidar_cierres_desde(2023)
+
+    assert capturar.sentencias
+    assert problemas_de_plan(session, capturar) == []
+
+
+def test_consultas_inventory_service_usan_indices(session, sample_data, capturar):
+    service = InventoryService(session)
+    manager = KardexManager(session)
+    registrar(manager, sample_data, date(2024, 1, 10), entrada=10, costo_unitario=5)
+    registrar(manager, sample_data, date(2024, 2, 10), salida=4)
+    session.flush()
+    capturar.sentencias.clear()
+
+    service.get_valorization_report(sample_data["empresa"].id)
+    service.get_valorization_report(sample_data["empresa"].id, almacen_id=sample_data["almacen"].id,
+                                    categoria_id=sample_data["categoria"].id)
+    service.get_stock_producto(sample_data["producto"].id)
+    service.get_stock_producto(sample_data["producto"].id, sample_data["almacen"].id)
+    service.recalculate_kardex(sample_data["producto"].id, sample_data["empresa"].id)
+
+    assert capturar.sentencias
+    assert problemas_de_plan(session, capturar) == []
+
+
+def test_movimientos_de_un_documento_usan_indice(session, sample_data, capturar):
+    manager = KardexManager(session)
+    registrar(manager, sample_data, date(2024, 1, 10), entrada=10, costo_unitario=5)
+    session.flush()
+    capturar.sentencias.clear()
+
+    manager.movimientos_documento(
+        (TipoMovimiento.COMPRA, TipoMovimiento.DEVOLUCION_COMPRA), TipoDocumento.FACTURA, "T-1"
+    )
+
+    assert capturar.sentencias
+    assert problemas_de_plan(session, capturar) == []
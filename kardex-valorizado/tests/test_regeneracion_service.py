@@ -0,0 +1,114 @@
+import random
+import pytest
+from datetime import date, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models.database_model import (Base, Empresa, Almacen, Categoria, Producto, MovimientoStock,
+                                   TipoMovimiento, MetodoValuacion, RecalculoPendiente)
+from services.regeneracion_service import RegeneracionService
+from services.inventory_service import InventoryService
+from utils.kardex_manager import KardexManager
+from utils.cola_recalculo import ColaRecalculo
+
+
+@pytest.fixture
+def session_archivo(tmp_path):
+    """Base SQLite en disco: los procesos trabajadores abren su propia conexión."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'kardex_test.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def poblar(session, metodo):
+    empresa = Empresa(ruc="20123456789", razon_social="Test Company", metodo_valuacion=metodo)
+    categoria = Categoria(nombre="Test Category")
+    session.add_all([empresa, categoria])
+    session.flush()
+    almacenes = [Almacen(empresa_id=empresa.id, codigo=f"ALM0{i}", nombre=f"Almacen {i}") for i in range(2)]
+    productos = [
+        Producto(codigo=f"TEST0-00000{i}", nombre=f"Producto {i}", categoria_id=categoria.id, unidad_medida="UND")
+        for i in range(6)
+    ]
+    session.add_all(almacenes + productos)
+    session.flush()
+
+    rnd = random.Random(7)
+    for producto in productos:
+        stock = 0
+        for dia in range(40):
+            almacen = rnd.choice(almacenes)
+            if stock < 5 or rnd.random() < 0.5:
+                cantidad, costo = rnd.randint(1, 20), round(rnd.uniform(1, 50), 2)
+                stock += cantidad
+                valores = dict(tipo=TipoMovimiento.COMPRA, cantidad_entrada=cantidad, cantidad_salida=0,
+                               costo_unitario=costo, costo_total=round(cantidad * costo, 2))
+            else:
+                cantidad = rnd.randint(1, stock)
+                stock -= cantidad
+                valores = dict(tipo=TipoMovimiento.VENTA, cantidad_entrada=0, cantidad_salida=cantidad,
+                               costo_unitario=0, costo_total=0)
+            session.add(MovimientoStock(
+                empresa_id=empresa.id, producto_id=producto.id, almacen_id=almacen.id,
+                fecha_documento=date(2024, 1, 1) + timedelta(days=dia),
+                saldo_cantidad=0, saldo_costo_total=0, **valores
+            ))
+    session.commit()
+    return empresa, productos
+
+
+def saldos(session):
+    session.expire_all()
+    return [
+        (m.id, m.costo_unitario, m.costo_total, m.saldo_cantidad, m.saldo_costo_total)
+        for m in session.query(MovimientoStock).order_by(MovimientoStock.id)
+    ]
+
+
+def borrar_saldos(session):
+    session.query(MovimientoStock).filter(MovimientoStock.cantidad_salida > 0).update(
+        {"costo_unitario": 0, "costo_total": 0}, synchronize_session=False)
+    session.query(MovimientoStock).update({"saldo_cantidad": 0, "saldo_costo_total": 0}, synchronize_session=False)
+    session.commit()
+
+
+@pytest.mark.parametrize("metodo", [MetodoValuacion.PEPS, MetodoValuacion.PROMEDIO_PONDERADO])
+def test_kardex_global_paralelo_igual_al_serial(session_archivo, metodo):
+    empresa, _ = poblar(session_archivo, metodo)
+
+    KardexManager(session_archivo).recalcular_saldos_globales(empresa.id, motor=KardexManager.MOTOR_DECIMAL)
+    esperado = saldos(session_archivo)
+
+    borrar_saldos(session_archivo)
+    movimiento = session_archivo.query(MovimientoStock).first()
+    ColaRecalculo(session_archivo).encolar({(movimiento.producto_id, movimiento.almacen_id)}, date(2024, 1, 1))
+    session_archivo.commit()
+    avances = []
+    KardexManager(session_archivo).recalcular_saldos_globales(
+        empresa.id, motor=KardexManager.MOTOR_PARALELO, procesos=2,
+        progreso=lambda hechas, total: avances.append((hechas, total))
+    )
+
+    assert saldos(session_archivo) == esperado
+    assert avances and avances[-1][0] == avances[-1][1]
+    # La regeneración cubre los rangos que estaban pendientes
+    assert session_archivo.query(RecalculoPendiente).count() == 0
+
+
+def test_saldos_empresa_paralelo_igual_a_recalculate_kardex(session_archivo):
+    empresa, productos = poblar(session_archivo, MetodoValuacion.PROMEDIO_PONDERADO)
+
+    servicio = InventoryService(session_archivo)
+    for producto in productos:
+        servicio.recalculate_kardex(producto.id, empresa.id)
+    esperado = saldos(session_archivo)
+
+    borrar_saldos(session_archivo)
+    regenerados = RegeneracionService(session_archivo).regenerar_saldos_empresa(
+        empresa.id, producto_ids=[p.id for p in productos], procesos=2
+    )
+
+    assert regenerados == len(productos)
+    assert saldos(session_archivo) == esperado
@@ -0,0 +1,44 @@
+import threading
+import pytest
+from sqlalchemy.orm import joinedload, scoped_session, sessionmaker
+from utils import sesiones
+from utils.sesiones import congelar, sesion_de_hilo
+from models.database_model import Producto, Cliente
+
+
+def test_congelar_copia_columnas_y_relaciones_cargadas(session, sample_data):
+    session.add(Cliente(numero_documento="20111111111", razon_social="Cliente SA"))
+    session.flush()
+    session.expire_all()
+
+    producto, = congelar(session.query(Producto).options(joinedload(Producto.categoria)).all())
+    cliente, = congelar(session.query(Cliente).all())
+    session.close()
+
+    assert producto.codigo == "TEST0-000001"
+    assert producto.categoria.nombre == "Test Category"
+    assert cliente.razon_social_o_nombre == "Cliente SA"
+    with pytest.raises(AttributeError):
+        producto.nombre = "Otro"
+    # Una relación que no se cargó con la fila no se consulta después
+    with pytest.raises(AttributeError, match="no se cargó"):
+        cliente.ventas
+
+
+def test_sesion_de_hilo_es_propia_de_cada_hilo(engine, monkeypatch):
+    monkeypatch.setattr(sesiones, 'sesiones_hilo', scoped_session(sessionmaker(bind=engine)))
+    vistas = {}
+
+    def trabajo(nombre):
+        with sesion_de_hilo() as session:
+            with sesion_de_hilo() as anidada:
+                assert anidada is session
+            vistas[nombre] = session
+        assert not sesiones.sesiones_hilo.registry.has()
+
+    hilos = [threading.Thread(target=trabajo, args=(n,)) for n in ('a', 'b')]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert vistas['a'] is not vistas['b']
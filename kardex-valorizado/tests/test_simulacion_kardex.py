@@ -0,0 +1,50 @@
+import hashlib
+import pytest
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from utils.kardex_manager import KardexManager
+from utils.simulacion_kardex import SimulacionKardex
+from models.database_model import Base, Empresa, Almacen, Categoria, Producto, MetodoValuacion
+from test_kardex_manager import registrar
+
+
+def test_simulacion_no_modifica_produccion(tmp_path):
+    ruta = tmp_path / "kardex.db"
+    engine = create_engine(f"sqlite:///{ruta}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    empresa = Empresa(ruc="20123456789", razon_social="Test Company")
+    session.add(empresa)
+    session.flush()
+    categoria = Categoria(nombre="Test Category")
+    almacen = Almacen(empresa_id=empresa.id, codigo="ALM01", nombre="Almacen Principal")
+    session.add_all([categoria, almacen])
+    session.flush()
+    producto = Producto(codigo="TEST0-000001", nombre="Test Product", categoria_id=categoria.id, unidad_medida="UND")
+    session.add(producto)
+    session.commit()
+
+    data = {"empresa": empresa, "almacen": almacen, "producto": producto}
+    manager = KardexManager(session)
+    registrar(manager, data, date(2024, 1, 1), entrada=10, costo_unitario=5)
+    registrar(manager, data, date(2024, 1, 2), entrada=10, costo_unitario=8)
+    registrar(manager, data, date(2024, 1, 3), salida=12)
+    session.commit()
+    empresa_id = empresa.id
+    session.close()
+    engine.dispose()
+    firma = hashlib.sha256(ruta.read_bytes()).hexdigest()
+
+    reporte = SimulacionKardex(str(ruta)).simular(empresa_id, metodo=MetodoValuacion.PEPS)
+
+    (fila,) = reporte["filas"]
+    assert fila["codigo"] == "TEST0-000001"
+    assert fila["valor_actual"] == pytest.approx(52.0)
+    # PEPS: quedan 8 unidades del segundo lote
+    assert fila["valor_simulado"] == pytest.approx(64.0)
+    assert reporte["diferencia_total"] == pytest.approx(12.0)
+    assert reporte["metodo_actual"] == MetodoValuacion.PROMEDIO_PONDERADO
+
+    # Producción intacta
+    assert hashlib.sha256(ruta.read_bytes()).hexdigest() == firma
@@ -0,0 +1,50 @@
+from datetime import date
+from utils.kardex_manager import KardexManager
+from utils.cola_recalculo import ColaRecalculo
+from utils.verificador_kardex import VerificadorKardex
+from models.database_model import MovimientoStock
+from test_kardex_manager import registrar
+
+
+def test_verificacion_incremental(session, sample_data):
+    manager = KardexManager(session)
+    par = (sample_data["producto"].id, sample_data["almacen"].id)
+    registrar(manager, sample_data, date(2024, 1, 5), entrada=10, costo_unitario=5)
+    registrar(manager, sample_data, date(2024, 1, 10), entrada=5, costo_unitario=8)
+    registrar(manager, sample_data, date(2024, 1, 15), salida=4)
+    session.flush()
+
+    verificador = VerificadorKardex(session)
+    reporte = verificador.verificar(sample_data["empresa"].id)
+    assert reporte["a_reparar"] == {}
+    assert reporte["movimientos_revisados"] == 3
+
+    # Solo se revisa el tramo desde el movimiento nuevo
+    registrar(manager, sample_data, date(2024, 1, 20), entrada=2, costo_unitario=6)
+    session.flush()
+    reporte = verificador.verificar(sample_data["empresa"].id)
+    assert reporte["a_reparar"] == {}
+    assert reporte["movimientos_revisados"] == 1
+
+    # Eliminar un movimiento ya verificado y recalcular: el checksum se reajusta sin reportarlo
+    segundo = session.query(MovimientoStock).filter_by(fecha_documento=date(2024, 1, 10)).one()
+    session.delete(segundo)
+    session.flush()
+    manager.recalcular_kardex_posterior({par}, date(2024, 1, 10))
+    session.flush()
+    assert VerificadorKardex(session).verificar()["a_reparar"] == {}
+
+    # Un saldo alterado se reporta hasta que se repare
+    ultimo = session.query(MovimientoStock).filter_by(fecha_documento=date(2024, 1, 20)).one()
+    ultimo.saldo_cantidad += 3
+    session.flush()
+    for _ in range(2):
+        reporte = verificador.verificar(sample_data["empresa"].id)
+        assert reporte["productos_a_reparar"] == [sample_data["producto"].id]
+        assert reporte["a_reparar"][par]["movimiento_id"] == ultimo.id
+
+    # Con un recálculo pendiente, el par no se verifica todavía
+    ColaRecalculo(session).encolar({par}, date(2024, 1, 1))
+    reporte = verificador.verificar(sample_data["empresa"].id)
+    assert reporte["pendientes"] == {par}
+    assert reporte["a_reparar"] == {}